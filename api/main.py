@@ -10,20 +10,21 @@ from contextlib import asynccontextmanager
 import time
 
 from api.routes import recommendations, forecasting, segmentation, pricing, visual_search, webhooks, auth, pool_monitoring, usage_monitoring, plan_limits, feature_gates, stripe_webhooks, billing, admin_billing, metering, admin_features, logs, model_versions, anomalies, db_monitoring, batch, undo, bot_detection, rate_limit, api_logs, slow_queries, deprecated_apis, analytics, security_logs, admin_tenants, admin_portal, rbac, demo, admin_plans, admin_coupons, admin_webhooks, admin_email_templates, admin_stats, admin_maintenance, admin_settings, admin_support_usage, admin_support_tickets, admin_users, admin_audit_logs, admin_sessions, admin_widgets, admin_reports, admin_api_keys, admin_batch_jobs, admin_anomalies
-from api.middleware.rate_limiter import RateLimitMiddleware
-from api.middleware.auth import AuthMiddleware
-from api.middleware.validation import InputValidationMiddleware
-from api.middleware.logging import RequestLoggingMiddleware
-from api.middleware.error_tracking import ErrorTrackingMiddleware
-from api.middleware.tenant_context import TenantContextMiddleware
-from api.middleware.tenant_isolation import TenantIsolationMiddleware
-from api.middleware.csrf import CSRFMiddleware
-from api.middleware.usage_tracking import UsageTrackingMiddleware
-from api.middleware.plan_limits import PlanLimitsMiddleware
-from api.middleware.request_id import RequestIDMiddleware
-from api.middleware.deprecation import DeprecationMiddleware
-from api.middleware.performance import PerformanceMiddleware
-from api.middleware.bot_detection import BotDetectionMiddleware
+from api.middleware.pipeline import RequestPipeline
+from api.middleware.request_id import RequestIDStage
+from api.middleware.performance import PerformanceStage
+from api.middleware.security_headers import SecurityHeadersStage
+from api.middleware.deprecation import DeprecationStage
+from api.middleware.bot_detection import BotDetectionStage
+from api.middleware.rate_limiter import RateLimitStage
+from api.middleware.validation import InputValidationStage
+from api.middleware.logging import RequestLoggingStage
+from api.middleware.auth import AuthStage
+from api.middleware.tenant_context import TenantContextStage
+from api.middleware.tenant_isolation import TenantIsolationStage
+from api.middleware.csrf import CSRFStage
+from api.middleware.plan_limits import PlanLimitsStage
+from api.middleware.usage_tracking import UsageTrackingStage
 from config.settings import settings
 import os
 
@@ -41,6 +42,10 @@ async def lifespan(app: FastAPI):
     from api.utils.usage_scheduler import start_scheduler, stop_scheduler
     start_scheduler()
     
+    # Start the batched writer for API/security log rows
+    from api.utils.log_sink import log_sink
+    log_sink.start()
+    
     yield
     
     # Graceful shutdown
@@ -49,6 +54,16 @@ async def lifespan(app: FastAPI):
     # Stop scheduler
     stop_scheduler()
     
+    # Flush queued log rows before the connection pool goes away
+    log_sink.stop()
+    print(f"✅ Log sink flushed ({log_sink.get_stats()['dropped']} rows dropped)")
+    
+    # Close this loop's Redis connections
+    from api.utils.job_notifier import batch_notifier
+    await batch_notifier.close()
+    from config.redis_client import close_async_redis
+    await close_async_redis()
+    
     # Close database connections
     from config.database import engine
     engine.dispose()
@@ -89,46 +104,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Security Headers Middleware
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["X-XSS-Protection"] = "1; mode=block"
-    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-    response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' 'unsafe-inline'; style-src 'self' 'unsafe-inline'"
-    return response
-
 # GZip Compression Middleware
 from fastapi.middleware.gzip import GZipMiddleware
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 
-# Custom Middleware (order matters - last added runs first)
-app.add_middleware(AuthMiddleware)
-app.add_middleware(RateLimitMiddleware)
-app.add_middleware(InputValidationMiddleware)
-app.add_middleware(TenantContextMiddleware)
-app.add_middleware(RequestLoggingMiddleware)
-app.add_middleware(CSRFMiddleware)
-app.add_middleware(TenantIsolationMiddleware)
-app.add_middleware(ErrorTrackingMiddleware)
-app.add_middleware(PlanLimitsMiddleware)
-app.add_middleware(UsageTrackingMiddleware)
-app.add_middleware(RequestIDMiddleware)
-app.add_middleware(BotDetectionMiddleware)
-app.add_middleware(PerformanceMiddleware, slow_threshold=1.0)
-app.add_middleware(DeprecationMiddleware)
-
-
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    """Add processing time to response headers"""
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
+# Request pipeline: one ASGI middleware, stages run in order over a shared context
+app.add_middleware(RequestPipeline, stages=[
+    RequestIDStage(),
+    PerformanceStage(slow_threshold=1.0),
+    SecurityHeadersStage(),
+    DeprecationStage(),
+    BotDetectionStage(),
+    RateLimitStage(),
+    InputValidationStage(),
+    RequestLoggingStage(),
+    AuthStage(),
+    TenantContextStage(),
+    TenantIsolationStage(),
+    CSRFStage(),
+    PlanLimitsStage(),
+    UsageTrackingStage(),
+])
 
 
 @app.get("/")
@@ -159,20 +155,14 @@ async def database_health_check():
 async def readiness_probe():
     """Readiness probe for Kubernetes"""
     from config.database import get_db_health
-    import redis
+    from config.redis_client import check_health_async
     
     checks = {
         "database": get_db_health(),
-        "redis": {"status": "healthy"},
+        "redis": await check_health_async(),
         "ml_models": {"status": "healthy"}
     }
     
-    try:
-        redis_client = redis.from_url("redis://localhost:6379/0")
-        redis_client.ping()
-    except:
-        checks["redis"] = {"status": "unhealthy"}
-    
     all_healthy = all(c["status"] == "healthy" for c in checks.values())
     status_code = 200 if all_healthy else 503
     
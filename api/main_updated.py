@@ -13,8 +13,10 @@ from api.routes import (
     recommendations, forecasting, segmentation, 
     pricing, visual_search, webhooks, chatbot, metrics
 )
-from api.middleware.rate_limiter import RateLimitMiddleware
-from api.middleware.auth import AuthMiddleware
+from api.middleware.pipeline import RequestPipeline
+from api.middleware.performance import PerformanceStage
+from api.middleware.rate_limiter import RateLimitStage
+from api.middleware.auth import AuthStage
 from config.settings import settings
 
 
@@ -23,8 +25,15 @@ async def lifespan(app: FastAPI):
     """Application lifespan events"""
     print("🚀 LuxeBrain AI starting up...")
     print("💰 Revenue optimization engine active")
+    from api.utils.log_sink import log_sink
+    log_sink.start()
     yield
     print("🛑 LuxeBrain AI shutting down...")
+    log_sink.stop()
+    from api.utils.job_notifier import batch_notifier
+    await batch_notifier.close()
+    from config.redis_client import close_async_redis
+    await close_async_redis()
 
 
 app = FastAPI(
@@ -46,18 +55,11 @@ app.add_middleware(
 )
 
 # Custom Middleware
-app.add_middleware(RateLimitMiddleware)
-app.add_middleware(AuthMiddleware)
-
-
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    """Add processing time to response headers"""
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
+app.add_middleware(RequestPipeline, stages=[
+    PerformanceStage(),
+    RateLimitStage(),
+    AuthStage(),
+])
 
 
 @app.get("/")
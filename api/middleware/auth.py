@@ -3,72 +3,38 @@ Authentication Middleware
 Copyright © 2024 Paksa IT Solutions
 """
 
-from fastapi import Request, HTTPException, Depends
-from starlette.middleware.base import BaseHTTPMiddleware
-from jose import jwt, JWTError
-from config.settings import settings
+from fastapi import Request, HTTPException
+from api.middleware.pipeline import RequestContext, Stage, error_response
 
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    """JWT Authentication Middleware"""
+class AuthStage(Stage):
+    """JWT Authentication"""
     
-    EXCLUDED_PATHS = [
+    EXCLUDED_PATHS = {
         "/", "/health", "/docs", "/redoc", "/openapi.json",
         "/ready", "/alive", "/startup", "/health/db"
-    ]
+    }
     
-    async def dispatch(self, request: Request, call_next):
+    def before(self, ctx: RequestContext):
         # Skip auth for OPTIONS requests (CORS preflight)
-        if request.method == "OPTIONS":
-            return await call_next(request)
+        if ctx.method == "OPTIONS":
+            return None
         
         # Skip auth for excluded paths
-        if request.url.path in self.EXCLUDED_PATHS:
-            return await call_next(request)
+        if ctx.path in self.EXCLUDED_PATHS:
+            return None
         
-        # Skip auth for all auth endpoints
-        if request.url.path.startswith("/api/v1/auth/"):
-            return await call_next(request)
+        # Admin endpoints require JWT token (API endpoints use API keys, webhooks are signed)
+        if ctx.path.startswith("/api/admin/") and "/webhooks" not in ctx.path:
+            if not ctx.bearer_token:
+                return error_response(401, "Missing or invalid token")
+            
+            payload = ctx.claims
+            if payload is None:
+                return error_response(401, "Invalid token")
+            ctx.state["user"] = payload
         
-        # Skip auth for webhooks and API endpoints with API key
-        if "/webhooks" in request.url.path or request.url.path.startswith("/api/v1/"):
-            return await call_next(request)
-        
-        # Admin endpoints require JWT token
-        if request.url.path.startswith("/api/admin/"):
-            try:
-                auth_header = request.headers.get("Authorization")
-                if not auth_header or not auth_header.startswith("Bearer "):
-                    token = request.cookies.get("token")
-                    if not token:
-                        from fastapi.responses import JSONResponse
-                        return JSONResponse(
-                            status_code=401,
-                            content={"detail": "Missing or invalid token"}
-                        )
-                else:
-                    token = auth_header.split(" ")[1]
-                
-                payload = jwt.decode(
-                    token,
-                    settings.JWT_SECRET_KEY,
-                    algorithms=[settings.JWT_ALGORITHM]
-                )
-                request.state.user = payload
-            except JWTError:
-                from fastapi.responses import JSONResponse
-                return JSONResponse(
-                    status_code=401,
-                    content={"detail": "Invalid token"}
-                )
-            except Exception as e:
-                from fastapi.responses import JSONResponse
-                return JSONResponse(
-                    status_code=500,
-                    content={"detail": f"Authentication error: {str(e)}"}
-                )
-        
-        return await call_next(request)
+        return None
 
 
 async def verify_admin(request: Request):
@@ -3,28 +3,27 @@ CSRF Protection Middleware
 Copyright © 2024 Paksa IT Solutions
 """
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from starlette.datastructures import MutableHeaders
 from starlette.responses import JSONResponse
+from api.middleware.pipeline import RequestContext, Stage
 import secrets
-import hashlib
 
 CSRF_TOKENS = {}
 
-class CSRFMiddleware(BaseHTTPMiddleware):
-    EXCLUDED_PATHS = ["/api/v1/auth/", "/api/v1/webhooks/", "/webhooks/", "/api/admin/", "/api/demo/"]
+class CSRFStage(Stage):
+    EXCLUDED_PATHS = ("/api/v1/auth/", "/api/v1/webhooks/", "/webhooks/", "/api/admin/", "/api/demo/")
     
-    async def dispatch(self, request: Request, call_next):
+    def before(self, ctx: RequestContext):
         # Skip CSRF for OPTIONS (CORS preflight)
-        if request.method == 'OPTIONS':
-            return await call_next(request)
+        if ctx.method == 'OPTIONS':
+            return None
         
         # Skip CSRF for excluded paths
-        if any(request.url.path.startswith(path) for path in self.EXCLUDED_PATHS):
-            return await call_next(request)
+        if ctx.path.startswith(self.EXCLUDED_PATHS):
+            return None
         
-        if request.method in ['POST', 'PUT', 'DELETE', 'PATCH']:
-            csrf_token = request.headers.get('X-CSRF-Token')
+        if ctx.method in ['POST', 'PUT', 'DELETE', 'PATCH']:
+            csrf_token = ctx.headers.get('x-csrf-token')
             
             if not csrf_token or csrf_token not in CSRF_TOKENS:
                 return JSONResponse(
@@ -32,11 +31,10 @@ class CSRFMiddleware(BaseHTTPMiddleware):
                     status_code=403
                 )
         
-        response = await call_next(request)
-        
-        if request.method == 'GET':
+        return None
+    
+    def after(self, ctx: RequestContext, headers: MutableHeaders):
+        if ctx.method == 'GET' and not ctx.path.startswith(self.EXCLUDED_PATHS):
             token = secrets.token_urlsafe(32)
             CSRF_TOKENS[token] = True
-            response.headers['X-CSRF-Token'] = token
-        
-        return response
+            headers['X-CSRF-Token'] = token
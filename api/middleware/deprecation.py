@@ -2,8 +2,10 @@
 API Deprecation Middleware
 Copyright © 2024 Paksa IT Solutions. All Rights Reserved.
 """
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from datetime import datetime
+from starlette.datastructures import MutableHeaders
+from api.middleware.pipeline import RequestContext, Stage
+from api.utils.log_sink import log_sink
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,54 +24,35 @@ DEPRECATED_ENDPOINTS = {
     }
 }
 
-class DeprecationMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        endpoint = request.url.path
-        
-        if endpoint in DEPRECATED_ENDPOINTS:
-            deprecation_info = DEPRECATED_ENDPOINTS[endpoint]
-            
+class DeprecationStage(Stage):
+    def after(self, ctx: RequestContext, headers: MutableHeaders):
+        deprecation_info = DEPRECATED_ENDPOINTS.get(ctx.path)
+        if deprecation_info:
             # Add deprecation headers
-            response.headers["X-API-Deprecated"] = "true"
-            response.headers["X-API-Sunset-Date"] = deprecation_info["sunset_date"]
-            response.headers["X-API-Replacement"] = deprecation_info["replacement"]
+            headers["X-API-Deprecated"] = "true"
+            headers["X-API-Sunset-Date"] = deprecation_info["sunset_date"]
+            headers["X-API-Replacement"] = deprecation_info["replacement"]
             
-            # Log usage
-            self._log_deprecated_usage(request, deprecation_info)
-        
-        return response
+            self._log_deprecated_usage(ctx, deprecation_info)
     
-    def _log_deprecated_usage(self, request: Request, deprecation_info: dict):
-        """Log deprecated endpoint usage"""
-        tenant_id = request.headers.get('X-Tenant-ID', 'unknown')
+    def _log_deprecated_usage(self, ctx: RequestContext, deprecation_info: dict):
+        """Log deprecated endpoint usage; the row is queued on the log sink"""
+        from api.models.database_models import DeprecatedApiLog
+        
+        tenant_id = ctx.headers.get('x-tenant-id', 'unknown')
         
         logger.warning(
-            f"DEPRECATED API USAGE: {request.method} {request.url.path} | "
+            f"DEPRECATED API USAGE: {ctx.method} {ctx.path} | "
             f"Tenant: {tenant_id} | Sunset: {deprecation_info['sunset_date']}"
         )
         
-        try:
-            from api.models.database_models import DeprecatedApiLog
-            from config.database import SessionLocal
-            from datetime import datetime
-            
-            db = SessionLocal()
-            try:
-                log = DeprecatedApiLog(
-                    endpoint=str(request.url.path),
-                    method=request.method,
-                    tenant_id=tenant_id if tenant_id != 'unknown' else None,
-                    sunset_date=deprecation_info["sunset_date"],
-                    replacement=deprecation_info["replacement"],
-                    ip_address=request.client.host if request.client else None,
-                    user_agent=request.headers.get('user-agent', ''),
-                    created_at=datetime.utcnow()
-                )
-                db.add(log)
-                db.commit()
-            finally:
-                db.close()
-        except Exception:
-            pass
+        log_sink.write(DeprecatedApiLog, {
+            "endpoint": ctx.path,
+            "method": ctx.method,
+            "tenant_id": tenant_id if tenant_id != 'unknown' else None,
+            "sunset_date": deprecation_info["sunset_date"],
+            "replacement": deprecation_info["replacement"],
+            "ip_address": ctx.peer_ip if ctx.scope.get("client") else None,
+            "user_agent": ctx.user_agent,
+            "created_at": datetime.utcnow()
+        })
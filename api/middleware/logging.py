@@ -4,10 +4,10 @@ Copyright © 2024 Paksa IT Solutions
 """
 
 import logging
-import time
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-import json
+from datetime import datetime
+from starlette.datastructures import MutableHeaders
+from api.middleware.pipeline import RequestContext, Stage
+from api.utils.log_sink import log_sink
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,58 +21,41 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        
-        request_id = getattr(request.state, 'request_id', 'unknown')
-        tenant_id = request.headers.get('X-Tenant-ID', 'unknown')
-        user_id = request.headers.get('X-User-ID', 'unknown')
-        
+class RequestLoggingStage(Stage):
+    def before(self, ctx: RequestContext):
         logger.info(
-            f"Request: {request.method} {request.url.path} | "
-            f"Tenant: {tenant_id} | User: {user_id}",
-            extra={'request_id': request_id}
+            f"Request: {ctx.method} {ctx.path} | "
+            f"Tenant: {self._tenant_id(ctx)} | User: {ctx.headers.get('x-user-id', 'unknown')}",
+            extra={'request_id': ctx.state.get('request_id', 'unknown')}
         )
-        
-        response = await call_next(request)
-        
-        process_time = time.time() - start_time
+    
+    def after(self, ctx: RequestContext, headers: MutableHeaders):
         logger.info(
-            f"Response: {response.status_code} | "
-            f"Time: {process_time:.3f}s | "
-            f"Path: {request.url.path}",
-            extra={'request_id': request_id}
+            f"Response: {ctx.status_code} | "
+            f"Time: {ctx.response_time:.3f}s | "
+            f"Path: {ctx.path}",
+            extra={'request_id': ctx.state.get('request_id', 'unknown')}
         )
         
         # Store in database for admin UI
-        self._store_api_log(request, response, process_time, tenant_id, user_id)
-        
-        return response
+        self._store_api_log(ctx, ctx.response_time, self._tenant_id(ctx), ctx.headers.get('x-user-id', 'unknown'))
     
-    def _store_api_log(self, request, response, process_time, tenant_id, user_id):
-        """Store API log in database"""
-        try:
-            from api.models.database_models import ApiLog
-            from config.database import SessionLocal
-            from datetime import datetime
-            
-            db = SessionLocal()
-            try:
-                log = ApiLog(
-                    method=request.method,
-                    endpoint=str(request.url.path),
-                    status_code=response.status_code,
-                    response_time=process_time,
-                    tenant_id=tenant_id if tenant_id != 'unknown' else None,
-                    user_id=user_id if user_id != 'unknown' else None,
-                    ip_address=request.client.host if request.client else None,
-                    user_agent=request.headers.get('user-agent', ''),
-                    created_at=datetime.utcnow()
-                )
-                db.add(log)
-                db.commit()
-            finally:
-                db.close()
-        except Exception:
-            pass  # Don't fail request if logging fails
+    @staticmethod
+    def _tenant_id(ctx: RequestContext) -> str:
+        return ctx.headers.get('x-tenant-id') or ctx.tenant_id or 'unknown'
+    
+    def _store_api_log(self, ctx, process_time, tenant_id, user_id):
+        """Queue the API log row; the log sink inserts it in bulk off the request path"""
+        from api.models.database_models import ApiLog
+        
+        log_sink.write(ApiLog, {
+            "method": ctx.method,
+            "endpoint": ctx.path,
+            "status_code": ctx.status_code,
+            "response_time": process_time,
+            "tenant_id": tenant_id if tenant_id != 'unknown' else None,
+            "user_id": user_id if user_id != 'unknown' else None,
+            "ip_address": ctx.peer_ip if ctx.scope.get("client") else None,
+            "user_agent": ctx.user_agent,
+            "created_at": datetime.utcnow()
+        })
@@ -0,0 +1,213 @@
+"""
+Request Pipeline
+Copyright © 2024 Paksa IT Solutions
+
+A single pure-ASGI middleware that runs an ordered list of stages over one
+shared RequestContext. Headers, client IP, user agent and the bearer token's
+claims are parsed once per request instead of once per middleware, and no
+stage wraps the response body in extra tasks or streams.
+
+Each stage may implement:
+    before(ctx)            -> return a Response to short-circuit the request
+    after(ctx, headers)    -> adjust headers as the response starts
+
+before() may be a coroutine function; stages that need Redis on every
+request make it async and use the event loop's redis.asyncio pool rather
+than blocking the loop on a sync round trip.
+
+after() runs for every stage whose before() ran, innermost first, so a
+request rejected by a later stage still gets e.g. its X-Request-ID header.
+Blocking work (DB logging, usage counters) is queued with ctx.defer() and
+run in one worker thread after the response has been sent; requests that
+queue nothing never leave the event loop.
+"""
+
+import inspect
+import logging
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qsl
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse, Response
+from api.utils.jwt_claims import JWTClaims
+
+logger = logging.getLogger(__name__)
+
+
+class RequestContext:
+    """Per-request values shared by every stage"""
+
+    def __init__(self, scope: Dict):
+        self.scope = scope
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        self.state = scope.setdefault("state", {})
+        self.started = time.perf_counter()
+        self.status_code: Optional[int] = None
+        self.response_time: Optional[float] = None
+        self.tenant_id: Optional[str] = None
+        self.user_id: Optional[str] = None
+        self._client_ip = None
+        self._query_params = None
+        self._cookies = None
+        self._claims = None
+        self._claims_parsed = False
+        self._deferred = []
+
+    @property
+    def client_ip(self) -> str:
+        """First X-Forwarded-For hop, else the socket peer"""
+        if self._client_ip is None:
+            forwarded = self.headers.get("x-forwarded-for")
+            if forwarded:
+                self._client_ip = forwarded.split(",")[0].strip()
+            else:
+                client = self.scope.get("client")
+                self._client_ip = client[0] if client else "unknown"
+        return self._client_ip
+
+    @property
+    def peer_ip(self) -> str:
+        """Socket peer address (ignores X-Forwarded-For)"""
+        client = self.scope.get("client")
+        return client[0] if client else "unknown"
+
+    @property
+    def user_agent(self) -> str:
+        return self.headers.get("user-agent", "")
+
+    @property
+    def query_params(self) -> Dict[str, str]:
+        if self._query_params is None:
+            self._query_params = dict(parse_qsl(self.scope.get("query_string", b"").decode("latin-1")))
+        return self._query_params
+
+    @property
+    def cookies(self) -> Dict[str, str]:
+        if self._cookies is None:
+            from starlette.requests import cookie_parser
+            self._cookies = cookie_parser(self.headers.get("cookie", ""))
+        return self._cookies
+
+    @property
+    def bearer_token(self) -> Optional[str]:
+        """Token from the Authorization header, falling back to the token cookie"""
+        auth_header = self.headers.get("authorization", "")
+        if auth_header.startswith("Bearer "):
+            return auth_header.split(" ")[1]
+        return self.cookies.get("token")
+
+    @property
+    def claims(self) -> Optional[Dict]:
+        """Verified JWT claims (also exposed as request.state.claims), or None if missing/invalid"""
+        if not self._claims_parsed:
+            self._claims_parsed = True
+            self._claims = JWTClaims.verify(self.bearer_token)
+            if self._claims is not None:
+                self.state["claims"] = self._claims
+        return self._claims
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def defer(self, func: Callable, *args):
+        """Run func(*args) in a worker thread once the response has been sent"""
+        self._deferred.append((func, args))
+
+    def run_deferred(self):
+        for func, args in self._deferred:
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Deferred request task {getattr(func, '__qualname__', func)} failed: {e}")
+
+
+class Stage:
+    """One step of the request pipeline; override only the hooks you need"""
+
+    def before(self, ctx: RequestContext) -> Optional[Response]:
+        """May also be declared async def"""
+        return None
+
+    def after(self, ctx: RequestContext, headers: MutableHeaders):
+        pass
+
+
+def error_response(status_code: int, detail: str) -> JSONResponse:
+    """Short-circuit response in the same shape as FastAPI's HTTPException handler"""
+    return JSONResponse(status_code=status_code, content={"detail": detail})
+
+
+class RequestPipeline:
+    """Pure ASGI middleware running the stages around the application"""
+
+    def __init__(self, app, stages: List[Stage]):
+        self.app = app
+        self.stages = stages
+        self._async_before = [inspect.iscoroutinefunction(s.before) for s in stages]
+        # Only stages that override after() are visited when the response starts
+        self._after = [(i, s) for i, s in reversed(list(enumerate(stages))) if type(s).after is not Stage.after]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        ctx = RequestContext(scope)
+        ran = 0
+        response_started = False
+
+        async def send_with_headers(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                ctx.status_code = message["status"]
+                ctx.response_time = ctx.elapsed
+                headers = MutableHeaders(scope=message)
+                for index, stage in self._after:
+                    if index < ran:
+                        stage.after(ctx, headers)
+            await send(message)
+
+        try:
+            try:
+                response = None
+                for stage, is_async in zip(self.stages, self._async_before):
+                    ran += 1
+                    response = await stage.before(ctx) if is_async else stage.before(ctx)
+                    if response is not None:
+                        break
+
+                if response is None:
+                    await self.app(scope, receive, send_with_headers)
+                else:
+                    await response(scope, receive, send_with_headers)
+            except Exception as e:
+                if response_started:
+                    raise
+                await self._error_response(ctx, e)(scope, receive, send_with_headers)
+        finally:
+            if ctx._deferred:
+                await run_in_threadpool(ctx.run_deferred)
+
+    @staticmethod
+    def _error_response(ctx: RequestContext, error: Exception) -> JSONResponse:
+        """Log an unhandled application error and hide its details from the client"""
+        error_id = id(error)
+        logger.error(
+            f"Error ID: {error_id} | "
+            f"Path: {ctx.path} | "
+            f"Method: {ctx.method} | "
+            f"Error: {str(error)} | "
+            f"Traceback: {traceback.format_exc()}"
+        )
+
+        # Alert on critical errors
+        if isinstance(error, (SystemError, MemoryError)):
+            logger.critical(f"CRITICAL ERROR {error_id}: {str(error)} at {ctx.path}")
+
+        return JSONResponse({"error": "Internal server error", "error_id": error_id}, status_code=500)
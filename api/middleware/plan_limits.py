@@ -3,35 +3,31 @@ Plan Limits Middleware
 Copyright © 2024 Paksa IT Solutions
 """
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
 from starlette.responses import JSONResponse
+from api.middleware.pipeline import RequestContext, Stage
 from api.utils.plan_limits import PlanLimitsEnforcer
 
 
-class PlanLimitsMiddleware(BaseHTTPMiddleware):
+class PlanLimitsStage(Stage):
     """Enforces plan limits before processing requests"""
     
     # Endpoints that don't require limit checks
-    EXEMPT_PATHS = [
+    EXEMPT_PATHS = (
         "/api/auth/",
         "/health",
         "/docs",
         "/redoc",
         "/openapi.json"
-    ]
+    )
     
-    async def dispatch(self, request: Request, call_next):
+    async def before(self, ctx: RequestContext):
         # Skip limit checks for exempt paths
-        if any(request.url.path.startswith(path) for path in self.EXEMPT_PATHS):
-            return await call_next(request)
+        if ctx.path.startswith(self.EXEMPT_PATHS):
+            return None
         
-        # Get tenant_id from request state
-        tenant_id = getattr(request.state, 'tenant_id', None)
-        
-        if tenant_id:
+        if ctx.tenant_id:
             # Check plan limits
-            within_limits, error_message = PlanLimitsEnforcer.check_limits(tenant_id)
+            within_limits, error_message = await PlanLimitsEnforcer.check_limits_async(ctx.tenant_id)
             
             if not within_limits:
                 return JSONResponse(
@@ -43,5 +39,4 @@ class PlanLimitsMiddleware(BaseHTTPMiddleware):
                     }
                 )
         
-        response = await call_next(request)
-        return response
+        return None
@@ -2,124 +2,108 @@
 IP-based rate limiting middleware for DDoS protection
 Copyright © 2024 Paksa IT Solutions. All Rights Reserved.
 """
-from fastapi import Request, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
-from datetime import datetime, timedelta
-from collections import defaultdict
-import asyncio
+from starlette.datastructures import MutableHeaders
+from api.middleware.pipeline import RequestContext, Stage, error_response
+from api.utils.sliding_window import SlidingWindowLimiter
+from api.utils.log_sink import log_sink
 
 class RateLimiter:
+    """Per-IP limits shared by all workers through Redis"""
+    
     def __init__(self):
-        # IP -> [timestamps]
-        self.requests = defaultdict(list)
-        # IP -> block_until timestamp
-        self.blocked_ips = {}
         # Limits
         self.max_requests = 100  # requests per window
         self.window_seconds = 60  # 1 minute window
         self.block_duration = 900  # 15 minutes
+        self.limiter = SlidingWindowLimiter(
+            "ip",
+            limit=self.max_requests,
+            window_seconds=self.window_seconds,
+            block_seconds=self.block_duration
+        )
         
     def is_blocked(self, ip: str) -> bool:
-        if ip in self.blocked_ips:
-            if datetime.utcnow() < self.blocked_ips[ip]:
-                return True
-            else:
-                del self.blocked_ips[ip]
-        return False
+        return self.limiter.is_blocked(ip)
+    
+    async def is_blocked_async(self, ip: str) -> bool:
+        return await self.limiter.is_blocked_async(ip)
     
     def check_rate_limit(self, ip: str) -> tuple[bool, int]:
         """Returns (allowed, remaining_requests)"""
-        now = datetime.utcnow()
-        cutoff = now - timedelta(seconds=self.window_seconds)
-        
-        # Clean old requests
-        self.requests[ip] = [ts for ts in self.requests[ip] if ts > cutoff]
-        
-        current_count = len(self.requests[ip])
-        
-        if current_count >= self.max_requests:
-            # Block IP and log to database
-            self.blocked_ips[ip] = now + timedelta(seconds=self.block_duration)
-            self._log_rate_limit_block(ip, current_count)
+        return self._result(ip, *self.limiter.hit(ip))
+    
+    async def check_rate_limit_async(self, ip: str) -> tuple[bool, int]:
+        """check_rate_limit on the event loop's Redis pool"""
+        return self._result(ip, *await self.limiter.hit_async(ip))
+    
+    def _result(self, ip: str, allowed: bool, count: int, blocked_now: bool) -> tuple[bool, int]:
+        if blocked_now:
+            # Log the block to the database once, when it is imposed
+            self._log_rate_limit_block(ip, count)
+        if not allowed:
             return False, 0
         
-        # Add current request
-        self.requests[ip].append(now)
-        remaining = self.max_requests - current_count - 1
-        
-        return True, remaining
+        return True, max(self.max_requests - count, 0)
+    
+    def unblock(self, ip: str) -> bool:
+        return self.limiter.unblock(ip)
     
     def _log_rate_limit_block(self, ip: str, request_count: int):
         """Log rate limit block to database"""
-        try:
-            from api.models.database_models import RateLimitLog
-            from config.database import SessionLocal
-            db = SessionLocal()
-            try:
-                log = RateLimitLog(
-                    ip_address=ip,
-                    user_agent="",
-                    endpoint="",
-                    request_count=request_count
-                )
-                db.add(log)
-                db.commit()
-            finally:
-                db.close()
-        except Exception:
-            pass  # Don't fail request if logging fails
+        from api.models.database_models import RateLimitLog
+        
+        log_sink.write(RateLimitLog, {
+            "ip_address": ip,
+            "user_agent": "",
+            "endpoint": "",
+            "request_count": request_count
+        })
     
     def get_stats(self):
         """Get rate limiter statistics"""
-        now = datetime.utcnow()
-        active_blocks = sum(1 for block_until in self.blocked_ips.values() if block_until > now)
+        blocked = self.limiter.blocked()
+        limiter_stats = self.limiter.get_stats()
         
         return {
-            "total_ips_tracked": len(self.requests),
-            "blocked_ips": active_blocks,
+            "total_ips_tracked": limiter_stats["local_keys"],
+            "blocked_ips": len(blocked),
             "blocked_ip_list": [
                 {"ip": ip, "blocked_until": block_until.isoformat()}
-                for ip, block_until in self.blocked_ips.items()
-                if block_until > now
-            ]
+                for ip, block_until in blocked.items()
+            ],
+            "limiter": limiter_stats
         }
 
 # Global rate limiter instance
 rate_limiter = RateLimiter()
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+class RateLimitStage(Stage):
+    async def before(self, ctx: RequestContext):
         # Skip rate limiting for health checks
-        if request.url.path in ["/health", "/api/health"]:
-            return await call_next(request)
+        if ctx.path in ["/health", "/api/health"]:
+            return None
         
         # Get client IP
-        client_ip = request.client.host
-        if "x-forwarded-for" in request.headers:
-            client_ip = request.headers["x-forwarded-for"].split(",")[0].strip()
+        client_ip = ctx.client_ip
         
-        # Check if IP is blocked
-        if rate_limiter.is_blocked(client_ip):
-            raise HTTPException(
-                status_code=429,
-                detail="Too many requests. Your IP has been temporarily blocked. Please try again later."
-            )
-        
-        # Check rate limit
-        allowed, remaining = rate_limiter.check_rate_limit(client_ip)
+        # Check rate limit (blocked IPs are rejected by the same round trip)
+        allowed, remaining = await rate_limiter.check_rate_limit_async(client_ip)
         
         if not allowed:
-            raise HTTPException(
-                status_code=429,
-                detail=f"Rate limit exceeded. Maximum {rate_limiter.max_requests} requests per {rate_limiter.window_seconds} seconds. Try again in 15 minutes."
+            return error_response(
+                429,
+                f"Rate limit exceeded. Maximum {rate_limiter.max_requests} requests per {rate_limiter.window_seconds} seconds. Try again in 15 minutes."
             )
         
-        # Process request
-        response = await call_next(request)
+        ctx.state["rate_limit_remaining"] = remaining
+        return None
+    
+    def after(self, ctx: RequestContext, headers: MutableHeaders):
+        remaining = ctx.state.get("rate_limit_remaining")
+        if remaining is None:
+            return
         
         # Add rate limit headers
-        response.headers["X-RateLimit-Limit"] = str(rate_limiter.max_requests)
-        response.headers["X-RateLimit-Remaining"] = str(remaining)
-        response.headers["X-RateLimit-Reset"] = str(rate_limiter.window_seconds)
-        
-        return response
+        headers["X-RateLimit-Limit"] = str(rate_limiter.max_requests)
+        headers["X-RateLimit-Remaining"] = str(remaining)
+        headers["X-RateLimit-Reset"] = str(rate_limiter.window_seconds)
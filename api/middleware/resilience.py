@@ -8,8 +8,7 @@ Graceful degradation, cost control, security
 from functools import wraps
 from typing import Any, Callable
 import time
-import redis
-from config.settings import settings
+from config.redis_client import get_redis
 
 
 class CircuitBreaker:
@@ -18,7 +17,7 @@ class CircuitBreaker:
     def __init__(self, failure_threshold: int = 5, timeout: int = 60):
         self.failure_threshold = failure_threshold
         self.timeout = timeout
-        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.redis_client = get_redis()
     
     def __call__(self, func: Callable) -> Callable:
         @wraps(func)
@@ -78,7 +77,7 @@ class RateLimiter:
     """Advanced rate limiting with cost control"""
     
     def __init__(self):
-        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.redis_client = get_redis()
     
     def check_limit(
         self,
@@ -166,12 +165,11 @@ class SecurityValidator:
         """Validate input data"""
         
         # Check for SQL injection patterns
-        dangerous_patterns = ["'", '"', '--', ';', 'DROP', 'DELETE', 'UPDATE']
+        from api.utils.input_screen import sql_fragment_screen
         
         for value in data.values():
-            if isinstance(value, str):
-                if any(pattern in value.upper() for pattern in dangerous_patterns):
-                    return False
+            if isinstance(value, str) and sql_fragment_screen.match(value):
+                return False
         
         return True
     
@@ -192,7 +190,7 @@ class CostOptimizer:
     """Optimize API costs"""
     
     def __init__(self):
-        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.redis_client = get_redis()
     
     def should_use_ai(self, customer_id: int = None, feature: str = 'recommendation') -> bool:
         """Decide if AI should be used based on cost/benefit"""
@@ -0,0 +1,21 @@
+"""
+Security Headers Middleware
+Copyright © 2024 Paksa IT Solutions
+"""
+
+from starlette.datastructures import MutableHeaders
+from api.middleware.pipeline import RequestContext, Stage
+
+SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block",
+    "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
+    "Content-Security-Policy": "default-src 'self'; script-src 'self' 'unsafe-inline'; style-src 'self' 'unsafe-inline'",
+}
+
+
+class SecurityHeadersStage(Stage):
+    def after(self, ctx: RequestContext, headers: MutableHeaders):
+        for name, value in SECURITY_HEADERS.items():
+            headers[name] = value
@@ -3,46 +3,30 @@ Tenant Context Middleware
 Copyright © 2024 Paksa IT Solutions
 """
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import JSONResponse
-import jwt
-import os
+from api.middleware.pipeline import RequestContext, Stage, error_response
 from api.utils.tenant_resolver import TenantResolver
 
 
-class TenantContextMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        auth_header = request.headers.get('Authorization')
+class TenantContextStage(Stage):
+    async def before(self, ctx: RequestContext):
+        payload = ctx.claims
+        if payload is None:
+            return None
         
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
+        tenant_id = payload.get('tenant_id')
+        
+        # Validate tenant if present
+        if tenant_id:
+            is_valid, error = await TenantResolver.validate_tenant_async(tenant_id)
+            if not is_valid:
+                return error_response(403, error)
             
-            try:
-                secret = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
-                payload = jwt.decode(token, secret, algorithms=['HS256'])
-                
-                tenant_id = payload.get('tenant_id')
-                
-                # Validate tenant if present
-                if tenant_id:
-                    is_valid, error = TenantResolver.validate_tenant(tenant_id)
-                    if not is_valid:
-                        return JSONResponse(
-                            status_code=403,
-                            content={"detail": error}
-                        )
-                    
-                    # Get tenant metadata
-                    tenant = TenantResolver.get_tenant(tenant_id)
-                    request.state.tenant = tenant
-                
-                request.state.tenant_id = tenant_id
-                request.state.user_id = payload.get('user_id')
-                request.state.role = payload.get('role')
-                
-            except jwt.InvalidTokenError:
-                pass
+            # Get tenant metadata
+            ctx.state["tenant"] = await TenantResolver.get_tenant_async(tenant_id)
         
-        response = await call_next(request)
-        return response
+        ctx.tenant_id = tenant_id
+        ctx.user_id = payload.get('user_id')
+        ctx.state["tenant_id"] = tenant_id
+        ctx.state["user_id"] = ctx.user_id
+        ctx.state["role"] = payload.get('role')
+        return None
@@ -3,30 +3,25 @@ Tenant Isolation Middleware
 Copyright © 2024 Paksa IT Solutions
 """
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
 from starlette.responses import JSONResponse
+from api.middleware.pipeline import RequestContext, Stage
 
 
-class TenantIsolationMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+class TenantIsolationStage(Stage):
+    def before(self, ctx: RequestContext):
         # Skip for auth endpoints
-        if '/auth/' in request.url.path:
-            return await call_next(request)
+        if '/auth/' in ctx.path:
+            return None
         
-        # Get tenant_id from request state (set by TenantContextMiddleware)
-        tenant_id = getattr(request.state, 'tenant_id', None)
-        
-        # Validate tenant_id exists for protected endpoints
-        if request.method in ['POST', 'PUT', 'DELETE', 'PATCH']:
-            if not tenant_id:
+        # Validate tenant_id exists for protected endpoints (set by TenantContextStage)
+        if ctx.method in ['POST', 'PUT', 'DELETE', 'PATCH']:
+            if not ctx.tenant_id:
                 return JSONResponse(
                     {'error': 'Tenant ID required'},
                     status_code=403
                 )
         
-        response = await call_next(request)
-        return response
+        return None
 
 
 def validate_tenant_access(request_tenant_id: str, resource_tenant_id: str) -> bool:
@@ -3,28 +3,37 @@ Usage Tracking Middleware
 Copyright © 2024 Paksa IT Solutions
 """
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+import asyncio
+from api.middleware.pipeline import RequestContext, Stage
 from api.utils.usage_tracker import UsageTracker
 from api.utils.anomaly_detector import AnomalyDetector
 
 detector = AnomalyDetector()
 
+# Strong references so in-flight anomaly checks are not garbage collected
+_pending_checks = set()
+MAX_PENDING_CHECKS = 1000  # skip checks rather than pile up tasks while Redis is slow
 
-class UsageTrackingMiddleware(BaseHTTPMiddleware):
-    """Tracks API usage per tenant"""
+
+class UsageTrackingStage(Stage):
+    """Tracks API usage per tenant; anomaly checks run as event-loop tasks the request never awaits"""
+    
+    def before(self, ctx: RequestContext):
+        # Track API call if tenant_id exists (an in-memory increment, flushed to Redis in batches)
+        if ctx.tenant_id and ctx.method in ['GET', 'POST', 'PUT', 'DELETE', 'PATCH']:
+            UsageTracker.track_api_call(ctx.tenant_id, ctx.path)
+            if len(_pending_checks) >= MAX_PENDING_CHECKS:
+                return None
+            task = asyncio.get_running_loop().create_task(self._check_anomalies(ctx.tenant_id))
+            _pending_checks.add(task)
+            task.add_done_callback(_pending_checks.discard)
+        return None
     
-    async def dispatch(self, request: Request, call_next):
-        # Track API call if tenant_id exists
-        tenant_id = getattr(request.state, 'tenant_id', None)
-        
-        if tenant_id and request.method in ['GET', 'POST', 'PUT', 'DELETE', 'PATCH']:
-            UsageTracker.track_api_call(tenant_id, request.url.path)
-            
-            # Check for anomalies
-            anomaly = detector.check_api_rate_anomaly(tenant_id)
+    @staticmethod
+    async def _check_anomalies(tenant_id: str):
+        try:
+            anomaly = await detector.check_api_rate_anomaly_async(tenant_id)
             if anomaly:
-                detector.flag_anomaly(anomaly)
-        
-        response = await call_next(request)
-        return response
+                await detector.flag_anomaly_async(anomaly)
+        except Exception as e:
+            print(f"Anomaly check failed for {tenant_id}: {e}")
@@ -3,7 +3,7 @@ Database Models
 Copyright © 2024 Paksa IT Solutions
 """
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, JSON, ForeignKey, Text
+from sqlalchemy import Column, BigInteger, Integer, String, Float, Date, DateTime, Boolean, JSON, ForeignKey, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from config.database import Base
@@ -76,6 +76,22 @@ class OrderItem(Base):
     product = relationship("Product", back_populates="order_items")
 
 
+class ProductDailySales(Base):
+    __tablename__ = "product_daily_sales"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "product_id", "sales_date", name="uq_product_daily_sales"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String, nullable=False, default="default")
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
+    category = Column(String, nullable=True, index=True)
+    sales_date = Column(Date, index=True)
+    units = Column(Integer, default=0)
+    order_lines = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0)
+
+
 class UserInteraction(Base):
     __tablename__ = "user_interactions"
     
@@ -522,6 +538,21 @@ class Tenant(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class TenantUsageDaily(Base):
+    __tablename__ = "tenant_usage_daily"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "usage_date", name="uq_tenant_usage_daily"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String, nullable=False, index=True)
+    usage_date = Column(Date, index=True)
+    api_calls = Column(BigInteger, default=0)
+    ml_inferences = Column(Integer, default=0)
+    storage_bytes = Column(BigInteger, default=0)  # over 2 GiB on premium/enterprise plans
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
 class DemoRequest(Base):
     __tablename__ = "demo_requests"
     
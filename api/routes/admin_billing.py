@@ -9,7 +9,8 @@ from sqlalchemy.orm import Session
 from api.middleware.auth import verify_admin
 from config.database import get_db
 from api.models.database_models import Tenant, RevenueRecord
-from api.utils.usage_tracker import UsageTracker
+from api.utils.usage_tracker import UsageTracker, USAGE_HISTORY_DAYS
+from api.utils.tenant_resolver import TenantResolver
 
 router = APIRouter(prefix="/api/admin/billing", tags=["admin"])
 
@@ -351,6 +352,7 @@ async def update_subscription(
     )
     db.add(activity)
     db.commit()
+    TenantResolver.invalidate_cache(tenant_id)
     
     return {"message": message}
 
@@ -529,6 +531,7 @@ async def suspend_for_failed_payment(payment_id: int, db: Session = Depends(get_
     if tenant:
         tenant.status = "suspended"
         db.commit()
+        TenantResolver.invalidate_cache(tenant.tenant_id)
     
     return {"message": "Account suspended"}
 
@@ -690,7 +693,7 @@ async def get_tenant_billing(tenant_id: str, db: Session = Depends(get_db), admi
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
     
-    usage = UsageTracker.get_usage(tenant_id)
+    usage = UsageTracker.get_usage(tenant_id, history_days=USAGE_HISTORY_DAYS)
     
     return {
         "tenant": {
@@ -717,6 +720,7 @@ async def update_tenant_plan(tenant_id: str, plan: str, db: Session = Depends(ge
     
     tenant.plan = plan
     db.commit()
+    TenantResolver.invalidate_cache(tenant_id)
     
     return {"message": f"Plan updated to {plan}", "tenant_id": tenant_id}
 
@@ -733,6 +737,7 @@ async def update_tenant_status(tenant_id: str, status: str, db: Session = Depend
     
     tenant.status = status
     db.commit()
+    TenantResolver.invalidate_cache(tenant_id)
     
     return {"message": f"Status updated to {status}", "tenant_id": tenant_id}
 
@@ -297,21 +297,22 @@ async def bulk_action(
     if req.action == "suspend":
         for t in tenants:
             t.status = "suspended"
-            TenantResolver.invalidate_cache(t.tenant_id)
     elif req.action == "activate":
         for t in tenants:
             t.status = "active"
-            TenantResolver.invalidate_cache(t.tenant_id)
     elif req.action == "change_plan":
         if not req.plan:
             raise HTTPException(status_code=400, detail="Plan required")
         for t in tenants:
             t.plan = req.plan
-            TenantResolver.invalidate_cache(t.tenant_id)
     else:
         raise HTTPException(status_code=400, detail="Invalid action")
     
     db.commit()
+    
+    # Invalidate after the commit so other workers cannot re-cache the old rows
+    for t in tenants:
+        TenantResolver.invalidate_cache(t.tenant_id)
     return {"message": f"{req.action} applied to {len(tenants)} tenants"}
 
 
@@ -581,7 +582,7 @@ async def impersonate_tenant(
 ):
     """Impersonate tenant (admin support feature)"""
     from datetime import datetime, timedelta
-    from jose import jwt
+    import jwt
     from config.settings import settings
     from api.models.database_models import SecurityAuditLog
     
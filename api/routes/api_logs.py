@@ -82,6 +82,12 @@ async def get_api_stats():
     finally:
         db.close()
 
+@router.get("/sink")
+async def get_sink_stats():
+    """Get batched log writer statistics (queued, written, dropped rows)"""
+    from api.utils.log_sink import log_sink
+    return log_sink.get_stats()
+
 @router.get("/endpoints")
 async def get_top_endpoints(limit: int = 10):
     """Get most called endpoints"""
@@ -14,13 +14,14 @@ from sqlalchemy.orm import Session
 from config.database import get_db
 from api.models.database_models import User, PasswordHistory, LoginAttempt, SecurityAuditLog, Session as SessionModel, UserActivity
 from config.settings import settings
+from api.utils.jwt_claims import JWTClaims
 import hashlib
 
 router = APIRouter(prefix="/api/v1/auth", tags=["Authentication"])
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = settings.JWT_SECRET_KEY
-ALGORITHM = "HS256"
+ALGORITHM = settings.JWT_ALGORITHM
 LOCKOUT_THRESHOLD = 5
 LOCKOUT_DURATION = 15  # minutes
 
@@ -359,7 +360,7 @@ async def update_password(request: PasswordUpdateRequest, req: Request, db: Sess
     
     token = auth_header[7:]
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = JWTClaims.decode(token)
         email = payload.get("sub")
         user = db.query(User).filter(User.email == email).first()
         
@@ -477,7 +478,8 @@ async def logout(req: Request, db: Session = Depends(get_db)):
     if auth_header.startswith("Bearer "):
         token = auth_header[7:]
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            payload = JWTClaims.decode(token)
+            JWTClaims.invalidate(token)
             user_id = payload.get("user_id")
             tenant_id = payload.get("tenant_id")
             
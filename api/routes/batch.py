@@ -4,9 +4,11 @@ Copyright © 2024 Paksa IT Solutions
 """
 
 from fastapi import APIRouter, Depends
+from starlette.concurrency import run_in_threadpool
 from api.middleware.auth import verify_admin
-import redis
-import json
+from api.utils.reliable_queue import batch_jobs
+from config.redis_client import get_async_redis
+from ml_models.recommendation.batch_supervisor import WORKERS_KEY, parse_worker_stats
 
 router = APIRouter()
 
@@ -14,65 +16,42 @@ router = APIRouter()
 async def get_batch_stats(admin=Depends(verify_admin)):
     """Get batch queue statistics"""
     try:
-        r = redis.from_url("redis://localhost:6379/0")
-        
-        # Get queue length
-        queue_length = r.llen("batch:queue") or 0
-        
-        # Get processing count
-        processing = r.scard("batch:processing") or 0
-        
-        # Get failed jobs
-        failed_jobs = []
-        failed_keys = r.keys("batch:failed:*")
-        for key in failed_keys[:10]:  # Limit to 10
-            data = r.get(key)
-            if data:
-                failed_jobs.append(json.loads(data))
-        
-        # Get completed count (last hour)
-        completed = r.get("batch:completed:count") or 0
-        
-        # Calculate processing rate (jobs per minute)
-        rate = float(completed) / 60 if completed else 0
-        
+        r = get_async_redis()
+        stats = await batch_jobs.get_stats_async(r)
+        worker_pools = parse_worker_stats(await r.hgetall(WORKERS_KEY))
+
         return {
-            "queue_length": queue_length,
-            "processing": processing,
-            "failed_count": len(failed_keys),
-            "failed_jobs": failed_jobs,
-            "completed_last_hour": int(completed),
-            "processing_rate": round(rate, 2)
+            "queue_length": stats["queue_length"],
+            "processing": stats["processing"],
+            "retrying": stats["retrying"],
+            "failed_count": max(0, stats["counters"]["dead_lettered"] - stats["counters"]["requeued"]),
+            "failed_jobs": stats["dead_letters"],
+            "completed_last_hour": stats["completed_last_hour"],
+            "processing_rate": round(stats["completed_last_hour"] / 60, 2),  # jobs per minute
+            "counters": stats["counters"],
+            "worker_pools": worker_pools
         }
     except Exception as e:
         return {
             "queue_length": 0,
             "processing": 0,
+            "retrying": 0,
             "failed_count": 0,
             "failed_jobs": [],
             "completed_last_hour": 0,
             "processing_rate": 0,
+            "worker_pools": [],
             "error": str(e)
         }
 
 
 @router.post("/api/admin/batch/retry/{job_id}")
 async def retry_failed_job(job_id: str, admin=Depends(verify_admin)):
-    """Retry a failed batch job"""
+    """Retry a dead-lettered batch job"""
     try:
-        r = redis.from_url("redis://localhost:6379/0")
-        
-        # Get failed job data
-        key = f"batch:failed:{job_id}"
-        data = r.get(key)
-        
-        if not data:
+        if not await run_in_threadpool(batch_jobs.requeue, job_id):
             return {"error": "Job not found"}
-        
-        # Re-queue the job
-        r.rpush("batch:queue", data)
-        r.delete(key)
-        
+
         return {"status": "requeued", "job_id": job_id}
     except Exception as e:
         return {"error": str(e)}
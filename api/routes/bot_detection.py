@@ -8,7 +8,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
 from config.database import get_db
 from api.models.database_models import BotDetection
-from api.middleware.bot_detection import get_bot_stats, BLOCKED_IPS
+from api.middleware.bot_detection import get_bot_stats, flood_limiter
 from datetime import datetime
 
 router = APIRouter(prefix="/api/admin/bot-detection", tags=["Bot Detection"])
@@ -60,11 +60,9 @@ async def get_recent_detections(limit: int = 50, db: Session = Depends(get_db)):
 @router.get("/blocked-ips")
 async def get_blocked_ips():
     """Get currently blocked IPs"""
-    now = datetime.utcnow()
     active_blocks = {
         ip: exp.isoformat()
-        for ip, exp in BLOCKED_IPS.items()
-        if exp > now
+        for ip, exp in flood_limiter.blocked().items()
     }
     
     return {
@@ -76,8 +74,7 @@ async def get_blocked_ips():
 @router.delete("/unblock/{ip}")
 async def unblock_ip(ip: str):
     """Unblock an IP address"""
-    if ip in BLOCKED_IPS:
-        del BLOCKED_IPS[ip]
+    if flood_limiter.unblock(ip):
         return {"message": f"IP {ip} unblocked"}
     
     return {"message": "IP not found in block list"}
@@ -4,7 +4,7 @@ Copyright © 2024 Paksa IT Solutions
 """
 
 from fastapi import APIRouter, HTTPException
-from api.schemas.schemas import ForecastRequest, ForecastResponse
+from api.schemas.schemas import ForecastRequest, ForecastResponse, BatchForecastRequest, BatchForecastResponse
 from ml_models.forecasting.inference import ForecastingEngine
 from typing import List
 
@@ -26,6 +26,26 @@ async def forecast_demand(request: ForecastRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/demand/batch", response_model=BatchForecastResponse)
+async def forecast_demand_batch(request: BatchForecastRequest):
+    """Forecast many products in one pass (product rows x forecast days)"""
+    try:
+        batch = forecasting_engine.predict_many(
+            product_ids=request.product_ids,
+            category=request.category,
+            days_ahead=request.days_ahead
+        )
+        return {
+            "start_date": batch.start_date,
+            "product_ids": batch.product_ids.tolist(),
+            "predicted_demand": batch.predicted.round(2).tolist(),
+            "lower": batch.lower.round(2).tolist(),
+            "upper": batch.upper.round(2).tolist()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/seasonal-trends/{category}")
 async def get_seasonal_trends(category: str):
     """Get seasonal trends for a category"""
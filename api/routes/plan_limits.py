@@ -26,5 +26,5 @@ async def get_limits_status(request: Request):
         "limits": limits,
         "usage": usage,
         "usage_percentage": percentages,
-        "within_limits": PlanLimitsEnforcer.check_limits(tenant_id)[0]
+        "within_limits": (await PlanLimitsEnforcer.check_limits_async(tenant_id, consume=False))[0]
     }
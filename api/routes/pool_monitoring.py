@@ -5,6 +5,7 @@ Copyright © 2024 Paksa IT Solutions
 
 from fastapi import APIRouter, Depends
 from config.tenant_pool import TenantConnectionPool
+from config.redis_client import check_health_async, get_pool_stats as get_redis_pool_stats
 from api.middleware.auth import verify_admin
 
 router = APIRouter(prefix="/api/admin/pools", tags=["monitoring"])
@@ -19,6 +20,15 @@ async def get_pool_stats(admin=Depends(verify_admin)):
     }
 
 
+@router.get("/redis")
+async def get_redis_pool(admin=Depends(verify_admin)):
+    """Get shared Redis connection pool statistics and health"""
+    return {
+        "health": await check_health_async(),
+        "pools": get_redis_pool_stats()
+    }
+
+
 @router.get("/stats/{tenant_id}")
 async def get_tenant_pool_stats(tenant_id: str, admin=Depends(verify_admin)):
     """Get connection pool statistics for specific tenant"""
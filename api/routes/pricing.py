@@ -30,3 +30,12 @@ async def get_slow_moving_products(threshold_days: int = 30):
         return products
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/catalog-sweep")
+async def sweep_catalog_pricing(incremental: bool = False):
+    """Re-price the whole catalog and store the recommendations"""
+    try:
+        return pricing_engine.price_catalog(incremental=incremental)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
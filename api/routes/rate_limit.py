@@ -54,8 +54,7 @@ async def get_recent_blocks(limit: int = 50):
 @router.post("/unblock/{ip}")
 async def unblock_ip(ip: str):
     """Manually unblock an IP address"""
-    if ip in rate_limiter.blocked_ips:
-        del rate_limiter.blocked_ips[ip]
+    if rate_limiter.unblock(ip):
         return {"message": f"IP {ip} has been unblocked"}
     return {"message": f"IP {ip} was not blocked"}
 
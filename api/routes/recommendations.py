@@ -3,16 +3,22 @@ Recommendations API
 Copyright © 2024 Paksa IT Solutions
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+import json
+from contextlib import aclosing
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from api.schemas.schemas import RecommendationRequest, RecommendationResponse
+from api.utils.job_notifier import batch_notifier
 from config.database import get_db
+from config.settings import settings
 from ml_models.recommendation.inference import RecommendationEngine
 from ml_models.recommendation.batch_inference import BatchInferenceQueue
 
 router = APIRouter()
 recommendation_engine = RecommendationEngine()
-batch_queue = BatchInferenceQueue()
+batch_queue = BatchInferenceQueue(engine=recommendation_engine)
 
 
 @router.post("/", response_model=RecommendationResponse)
@@ -24,7 +30,9 @@ async def get_recommendations(
     """Get personalized product recommendations"""
     try:
         tenant_id = getattr(req.state, 'tenant_id', None)
-        recommendations = recommendation_engine.predict(
+        # predict blocks on the cache, quota lease and model; keep it off the event loop
+        recommendations = await run_in_threadpool(
+            recommendation_engine.predict,
             customer_id=request.customer_id,
             session_id=request.session_id,
             limit=request.limit,
@@ -40,7 +48,7 @@ async def get_recommendations(
 async def get_cross_sell(product_id: int, limit: int = 5):
     """Get cross-sell recommendations for a product"""
     try:
-        recommendations = recommendation_engine.cross_sell(product_id, limit)
+        recommendations = await run_in_threadpool(recommendation_engine.cross_sell, product_id, limit)
         return recommendations
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -50,7 +58,7 @@ async def get_cross_sell(product_id: int, limit: int = 5):
 async def get_outfit_recommendations(product_id: int, limit: int = 3):
     """Get outfit matching recommendations"""
     try:
-        recommendations = recommendation_engine.outfit_match(product_id, limit)
+        recommendations = await run_in_threadpool(recommendation_engine.outfit_match, product_id, limit)
         return recommendations
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -65,7 +73,8 @@ async def batch_recommendations(
     """Queue recommendation request for batch processing"""
     try:
         tenant_id = getattr(req.state, 'tenant_id', None)
-        job_id = batch_queue.enqueue(
+        job_id = await run_in_threadpool(
+            batch_queue.enqueue,
             customer_id=request.customer_id,
             session_id=request.session_id,
             limit=request.limit,
@@ -77,11 +86,62 @@ async def batch_recommendations(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _sse(event: str, data: dict, event_id: str = None) -> str:
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+@router.get("/batch/stream")
+async def stream_batch_results(
+    job_ids: str = Query(..., description="Comma-separated job IDs"),
+    timeout: float = Query(60.0, ge=0, description="Seconds to keep the stream open")
+):
+    """Stream batch job results as server-sent events, each as soon as its job finishes"""
+    ids = list(dict.fromkeys(job_id.strip() for job_id in job_ids.split(",") if job_id.strip()))
+    if not ids:
+        raise HTTPException(status_code=400, detail="No job IDs given")
+    if len(ids) > settings.BATCH_STREAM_MAX_JOBS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_STREAM_MAX_JOBS} job IDs per stream")
+    timeout = min(timeout, settings.BATCH_STREAM_MAX_SECONDS)
+
+    async def events():
+        delivered = set()
+        try:
+            async with aclosing(batch_notifier.watch(ids, timeout, heartbeat=15.0)) as updates:
+                async for update in updates:
+                    if update is None:
+                        yield ": keep-alive\n\n"
+                        continue
+                    job_id, job = update
+                    delivered.add(job_id)
+                    yield _sse("result", batch_queue.format_result(job_id, job), job_id)
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+        # Tells EventSource clients to close rather than reconnect
+        yield _sse("end", {"pending": [job_id for job_id in ids if job_id not in delivered]})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/batch/{job_id}")
-async def get_batch_result(job_id: str):
-    """Get result of batch recommendation job"""
+async def get_batch_result(
+    job_id: str,
+    wait: float = Query(0.0, ge=0, description="Seconds to wait for the job to finish")
+):
+    """Get result of batch recommendation job, optionally waiting for it to finish"""
     try:
-        result = batch_queue.get_result(job_id)
-        return result
+        job = await batch_notifier.wait(job_id, min(wait, settings.BATCH_RESULT_MAX_WAIT))
+        return batch_queue.format_result(job_id, job)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Recommendation cache hit/miss counters and latency"""
+    return recommendation_engine.cache.get_stats()
@@ -4,7 +4,7 @@ Copyright © 2024 Paksa IT Solutions
 """
 
 from fastapi import APIRouter, Depends
-from api.utils.usage_tracker import UsageTracker
+from api.utils.usage_tracker import UsageTracker, USAGE_HISTORY_DAYS
 from api.middleware.auth import verify_admin
 
 router = APIRouter(prefix="/api/admin/usage", tags=["monitoring"])
@@ -19,7 +19,7 @@ async def get_all_usage(admin=Depends(verify_admin)):
 @router.get("/{tenant_id}")
 async def get_tenant_usage(tenant_id: str, admin=Depends(verify_admin)):
     """Get usage statistics for specific tenant"""
-    return UsageTracker.get_usage(tenant_id)
+    return UsageTracker.get_usage(tenant_id, history_days=USAGE_HISTORY_DAYS)
 
 
 @router.get("/{tenant_id}/daily")
@@ -28,8 +28,18 @@ async def get_daily_usage(tenant_id: str, date: str = None, admin=Depends(verify
     return UsageTracker.get_daily_usage(tenant_id, date)
 
 
+@router.get("/quota/stats")
+async def get_quota_stats(admin=Depends(verify_admin)):
+    """Get this worker's quota lease statistics"""
+    from api.utils.quota import tenant_quota
+    return tenant_quota.get_stats()
+
+
 @router.post("/{tenant_id}/reset")
 async def reset_tenant_usage(tenant_id: str, admin=Depends(verify_admin)):
     """Reset usage counters for tenant"""
     UsageTracker.reset_usage(tenant_id)
+    
+    from api.utils.quota import tenant_quota
+    tenant_quota.reset(tenant_id)
     return {"message": f"Usage reset for tenant {tenant_id}"}
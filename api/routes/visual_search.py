@@ -5,11 +5,11 @@ Copyright © 2024 Paksa IT Solutions
 
 from fastapi import APIRouter, HTTPException, UploadFile, File, Request
 from api.schemas.schemas import VisualSearchRequest
-from ml_models.visual_search.inference import VisualSearchEngine
+from ml_models.visual_search.inference import get_visual_search_engine
 from api.utils.feature_decorator import require_feature
 
 router = APIRouter()
-visual_search_engine = VisualSearchEngine()
+visual_search_engine = get_visual_search_engine()
 
 
 @router.post("/search")
@@ -44,6 +44,20 @@ class ForecastResponse(BaseModel):
     confidence_interval: Dict[str, float]
 
 
+class BatchForecastRequest(BaseModel):
+    product_ids: Optional[List[int]] = None
+    category: Optional[str] = None
+    days_ahead: int = 30
+
+
+class BatchForecastResponse(BaseModel):
+    start_date: datetime
+    product_ids: List[int]
+    predicted_demand: List[List[float]]
+    lower: List[List[float]]
+    upper: List[List[float]]
+
+
 class CustomerSegmentResponse(BaseModel):
     customer_id: int
     segment: str
@@ -1,22 +1,104 @@
 """
 Anomaly Detection System
 Copyright © 2024 Paksa IT Solutions
+
+Rate checks are a single Lua round trip (INCR, and EXPIRE when the window
+opens). The request pipeline uses the redis.asyncio variant so the event loop
+never blocks on Redis. Alert fan-out (log file, email, Slack) runs on a
+background dispatcher thread with retries, so nothing on the request path
+waits on disk or third-party APIs.
 """
 
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 from config.database import SessionLocal
-import redis
+from config.redis_client import get_async_redis, get_redis
+import queue
+import threading
 import json
 import os
 import requests
 
+# KEYS: counter; ARGV: window seconds. Returns the count within the current window.
+WINDOW_COUNT_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return count
+"""
+
+ALERT_RETRY_DELAYS = (1, 5, 30)  # seconds before each retry of a failed delivery
+
+
+class AlertDispatcher:
+    """Background thread delivering alerts with retries; never blocks the caller"""
+    
+    def __init__(self, max_queue: int = 1000):
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {"queued": 0, "delivered": 0, "retried": 0, "failed": 0, "dropped": 0}
+    
+    def submit(self, name: str, deliver: Callable[[], None]):
+        """Queue deliver() to run in the background, retried on exception"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((name, deliver, 0))
+        except queue.Full:
+            self._count("dropped")
+            print(f"Alert queue full, dropped {name}")
+            return
+        self._count("queued")
+    
+    def _run(self):
+        while True:
+            name, deliver, attempt = self._queue.get()
+            try:
+                deliver()
+                self._count("delivered")
+            except Exception as e:
+                if attempt < len(ALERT_RETRY_DELAYS):
+                    # Requeue after a backoff without holding up other alerts
+                    self._count("retried")
+                    retry = threading.Timer(ALERT_RETRY_DELAYS[attempt], self._requeue, ((name, deliver, attempt + 1),))
+                    retry.daemon = True
+                    retry.start()
+                else:
+                    self._count("failed")
+                    print(f"Alert delivery {name} failed after {attempt + 1} attempts: {e}")
+    
+    def _requeue(self, job):
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._count("dropped")
+    
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+
+alert_dispatcher = AlertDispatcher()
+
 
 class AnomalyDetector:
     """Detect unusual patterns and suspicious activity"""
     
     def __init__(self):
-        self.redis_client = redis.from_url("redis://localhost:6379/0")
+        self.redis_client = get_redis()
+        self._window_count = self.redis_client.register_script(WINDOW_COUNT_SCRIPT)
+        self._async_client = None
+        self._async_window_count = None
         self.thresholds = {
             "api_calls_per_minute": 100,
             "failed_auth_attempts": 5,
@@ -27,10 +109,20 @@ class AnomalyDetector:
     
     def check_api_rate_anomaly(self, tenant_id: str) -> Optional[Dict]:
         """Detect unusual API call rate"""
-        key = f"anomaly:api:{tenant_id}"
-        count = self.redis_client.incr(key)
-        self.redis_client.expire(key, 60)
-        
+        count = self._window_count(keys=[f"anomaly:api:{tenant_id}"], args=[60])
+        return self._api_rate_anomaly(tenant_id, count)
+    
+    async def check_api_rate_anomaly_async(self, tenant_id: str) -> Optional[Dict]:
+        """check_api_rate_anomaly for the event loop (redis.asyncio, one round trip)"""
+        client = get_async_redis()
+        if client is not self._async_client:
+            # Scripts are bound to a client, and each event loop has its own
+            self._async_client = client
+            self._async_window_count = client.register_script(WINDOW_COUNT_SCRIPT)
+        count = await self._async_window_count(keys=[f"anomaly:api:{tenant_id}"], args=[60])
+        return self._api_rate_anomaly(tenant_id, count)
+    
+    def _api_rate_anomaly(self, tenant_id: str, count: int) -> Optional[Dict]:
         if count > self.thresholds["api_calls_per_minute"]:
             return {
                 "type": "high_api_rate",
@@ -47,9 +139,7 @@ class AnomalyDetector:
             self.redis_client.delete(f"anomaly:auth:{tenant_id}")
             return None
         
-        key = f"anomaly:auth:{tenant_id}"
-        count = self.redis_client.incr(key)
-        self.redis_client.expire(key, 300)
+        count = self._window_count(keys=[f"anomaly:auth:{tenant_id}"], args=[300])
         
         if count >= self.thresholds["failed_auth_attempts"]:
             return {
@@ -74,9 +164,7 @@ class AnomalyDetector:
     
     def check_rapid_orders(self, tenant_id: str) -> Optional[Dict]:
         """Detect rapid order creation"""
-        key = f"anomaly:orders:{tenant_id}"
-        count = self.redis_client.incr(key)
-        self.redis_client.expire(key, 300)
+        count = self._window_count(keys=[f"anomaly:orders:{tenant_id}"], args=[300])
         
         if count > self.thresholds["rapid_order_creation"]:
             return {
@@ -103,32 +191,54 @@ class AnomalyDetector:
         """Flag anomaly for review"""
         key = f"anomalies:{anomaly['tenant_id']}"
         anomaly["timestamp"] = datetime.utcnow().isoformat()
-        self.redis_client.lpush(key, json.dumps(anomaly))
-        self.redis_client.ltrim(key, 0, 99)  # Keep last 100
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.lpush(key, json.dumps(anomaly))
+        pipe.ltrim(key, 0, 99)  # Keep last 100
+        pipe.execute()
         
         # Alert if high severity
         if anomaly.get("severity") == "high":
             self.alert_admin(anomaly)
     
+    async def flag_anomaly_async(self, anomaly: Dict):
+        """flag_anomaly for the event loop"""
+        key = f"anomalies:{anomaly['tenant_id']}"
+        anomaly["timestamp"] = datetime.utcnow().isoformat()
+        pipe = get_async_redis().pipeline(transaction=False)
+        pipe.lpush(key, json.dumps(anomaly))
+        pipe.ltrim(key, 0, 99)
+        if anomaly.get("severity") == "high":
+            pipe.lpush("admin:alerts", json.dumps(self._dispatch_alert(anomaly)))
+            pipe.ltrim("admin:alerts", 0, 49)
+        await pipe.execute()
+    
     def alert_admin(self, anomaly: Dict):
         """Send alert to admin team"""
-        alert_key = "admin:alerts"
+        alert = self._dispatch_alert(anomaly)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.lpush("admin:alerts", json.dumps(alert))
+        pipe.ltrim("admin:alerts", 0, 49)
+        pipe.execute()
+    
+    def _dispatch_alert(self, anomaly: Dict) -> Dict:
+        """Queue the file log and (for high severity) email and Slack delivery"""
         alert = {
             "type": "security_anomaly",
             "data": anomaly,
             "timestamp": datetime.utcnow().isoformat()
         }
-        self.redis_client.lpush(alert_key, json.dumps(alert))
-        self.redis_client.ltrim(alert_key, 0, 49)
-        
-        # Log to file
-        with open("logs/anomalies.log", "a") as f:
-            f.write(f"{json.dumps(alert)}\n")
+        alert_dispatcher.submit("anomaly_log", lambda: self._append_alert_log(alert))
         
         # Send email and Slack alerts for high severity
         if anomaly.get("severity") == "high":
-            self.send_email_alert(anomaly)
-            self.send_slack_alert(anomaly)
+            alert_dispatcher.submit("email_alert", lambda: self._post_email_alert(anomaly))
+            alert_dispatcher.submit("slack_alert", lambda: self._post_slack_alert(anomaly))
+        return alert
+    
+    @staticmethod
+    def _append_alert_log(alert: Dict):
+        with open("logs/anomalies.log", "a") as f:
+            f.write(f"{json.dumps(alert)}\n")
     
     def get_anomalies(self, tenant_id: str, limit: int = 20) -> List[Dict]:
         """Get recent anomalies for tenant"""
@@ -160,58 +270,68 @@ class AnomalyDetector:
     
     def send_email_alert(self, anomaly: Dict):
         """Send email alert for high severity anomalies"""
+        try:
+            self._post_email_alert(anomaly)
+        except Exception as e:
+            print(f"Failed to send email alert: {e}")
+    
+    @staticmethod
+    def _post_email_alert(anomaly: Dict):
+        """Deliver the email alert; raises so the dispatcher can retry"""
         email_api_key = os.getenv("EMAIL_API_KEY")
         if not email_api_key:
             return
         
-        try:
-            # Using SendGrid API
-            url = "https://api.sendgrid.com/v3/mail/send"
-            headers = {
-                "Authorization": f"Bearer {email_api_key}",
-                "Content-Type": "application/json"
-            }
-            data = {
-                "personalizations": [{"to": [{"email": os.getenv("ADMIN_EMAIL", "admin@luxebrain.ai")}]}],
-                "from": {"email": "alerts@luxebrain.ai"},
-                "subject": f"[ALERT] High Severity Anomaly - {anomaly['type']}",
-                "content": [{
-                    "type": "text/plain",
-                    "value": f"Anomaly detected:\n\nType: {anomaly['type']}\nTenant: {anomaly['tenant_id']}\nSeverity: {anomaly['severity']}\nDetails: {json.dumps(anomaly, indent=2)}"
-                }]
-            }
-            requests.post(url, headers=headers, json=data, timeout=5)
-        except Exception as e:
-            print(f"Failed to send email alert: {e}")
+        # Using SendGrid API
+        url = "https://api.sendgrid.com/v3/mail/send"
+        headers = {
+            "Authorization": f"Bearer {email_api_key}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "personalizations": [{"to": [{"email": os.getenv("ADMIN_EMAIL", "admin@luxebrain.ai")}]}],
+            "from": {"email": "alerts@luxebrain.ai"},
+            "subject": f"[ALERT] High Severity Anomaly - {anomaly['type']}",
+            "content": [{
+                "type": "text/plain",
+                "value": f"Anomaly detected:\n\nType: {anomaly['type']}\nTenant: {anomaly['tenant_id']}\nSeverity: {anomaly['severity']}\nDetails: {json.dumps(anomaly, indent=2)}"
+            }]
+        }
+        requests.post(url, headers=headers, json=data, timeout=5).raise_for_status()
     
     def send_slack_alert(self, anomaly: Dict):
         """Send Slack alert for high severity anomalies"""
+        try:
+            self._post_slack_alert(anomaly)
+        except Exception as e:
+            print(f"Failed to send Slack alert: {e}")
+    
+    @staticmethod
+    def _post_slack_alert(anomaly: Dict):
+        """Deliver the Slack alert; raises so the dispatcher can retry"""
         webhook_url = os.getenv("SLACK_WEBHOOK_URL")
         if not webhook_url:
             return
         
-        try:
-            data = {
-                "text": f":warning: *High Severity Anomaly Detected*",
-                "blocks": [
-                    {
-                        "type": "header",
-                        "text": {"type": "plain_text", "text": "Security Anomaly Alert"}
-                    },
-                    {
-                        "type": "section",
-                        "fields": [
-                            {"type": "mrkdwn", "text": f"*Type:*\n{anomaly['type']}"},
-                            {"type": "mrkdwn", "text": f"*Severity:*\n{anomaly['severity'].upper()}"},
-                            {"type": "mrkdwn", "text": f"*Tenant:*\n{anomaly['tenant_id']}"},
-                            {"type": "mrkdwn", "text": f"*Time:*\n{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC"}
-                        ]
-                    }
-                ]
-            }
-            requests.post(webhook_url, json=data, timeout=5)
-        except Exception as e:
-            print(f"Failed to send Slack alert: {e}")
+        data = {
+            "text": f":warning: *High Severity Anomaly Detected*",
+            "blocks": [
+                {
+                    "type": "header",
+                    "text": {"type": "plain_text", "text": "Security Anomaly Alert"}
+                },
+                {
+                    "type": "section",
+                    "fields": [
+                        {"type": "mrkdwn", "text": f"*Type:*\n{anomaly['type']}"},
+                        {"type": "mrkdwn", "text": f"*Severity:*\n{anomaly['severity'].upper()}"},
+                        {"type": "mrkdwn", "text": f"*Tenant:*\n{anomaly['tenant_id']}"},
+                        {"type": "mrkdwn", "text": f"*Time:*\n{datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC"}
+                    ]
+                }
+            ]
+        }
+        requests.post(webhook_url, json=data, timeout=5).raise_for_status()
     
     def get_anomaly_count(self) -> int:
         """Get total count of unresolved anomalies"""
@@ -0,0 +1,178 @@
+"""
+Input Screening
+Copyright © 2024 Paksa IT Solutions
+
+One compiled screening engine for the request pipeline. Each rule table is
+compiled at import into a single case-insensitive alternation with a named
+group per rule, so screening a value is one regex scan regardless of how
+many rules there are, and the matching rule is read from `lastgroup`.
+Matches are counted per rule. User-agent verdicts (bot, scraper, suspicious)
+are computed once per distinct agent string and kept in a bounded LRU.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Query parameter keys and values
+INJECTION_RULES = {
+    "script_tag": r"<script",
+    "javascript_uri": r"javascript:",
+    "onerror_handler": r"onerror=",
+    "onload_handler": r"onload=",
+    "path_traversal": r"\.\./",
+    "union_select": r"union\s+select",
+    "drop_table": r"drop\s+table",
+    "exec_call": r"exec\s*\(",
+    "eval_call": r"eval\s*\(",
+}
+
+# SecurityValidator: SQL metacharacters and statements anywhere in a value
+SQL_FRAGMENT_RULES = {
+    "single_quote": r"'",
+    "double_quote": r'"',
+    "sql_comment": r"--",
+    "statement_separator": r";",
+    "drop": r"drop",
+    "delete": r"delete",
+    "update": r"update",
+}
+
+# Bot detection: automated clients
+BOT_RULES = {
+    "bot": r"bot",
+    "crawler": r"crawler",
+    "spider": r"spider",
+    "scraper": r"scraper",
+    "curl": r"curl",
+    "wget": r"wget",
+    "python_requests": r"python-requests",
+    "scrapy": r"scrapy",
+    "headless": r"headless",
+    "phantom": r"phantom",
+    "selenium": r"selenium",
+}
+
+# Input validation: scripted clients rejected unless they are a known good bot
+SCRAPER_AGENT_RULES = {
+    "curl": r"curl",
+    "wget": r"wget",
+    "python_requests": r"python-requests",
+    "scrapy": r"scrapy",
+    "bot": r"bot",
+}
+GOOD_BOT_RULES = {
+    "googlebot": r"googlebot",
+    "bingbot": r"bingbot",
+    "slackbot": r"slackbot",
+}
+
+# Agents that are not blocked but earn a warning under heavy traffic
+SUSPICIOUS_AGENTS = frozenset(['', 'mozilla/5.0', 'python', 'java', 'go-http-client'])
+
+MAX_CACHED_AGENTS = 10_000
+
+
+class Screen:
+    """A rule table compiled into one alternation"""
+
+    def __init__(self, name: str, rules: Dict[str, str]):
+        self.name = name
+        self.rules = list(rules)
+        self._pattern = re.compile(
+            "|".join(f"(?P<r{i}>{pattern})" for i, pattern in enumerate(rules.values())),
+            re.IGNORECASE
+        )
+        self._hits = dict.fromkeys(self.rules, 0)
+        self._lock = threading.Lock()
+
+    def match(self, value: str, count: bool = True) -> Optional[str]:
+        """Name of the first rule that matches value, or None"""
+        if not value:
+            return None
+        found = self._pattern.search(value)
+        if found is None:
+            return None
+        rule = self.rules[int(found.lastgroup[1:])]
+        if count:
+            self.record(rule)
+        return rule
+
+    def record(self, rule: str):
+        with self._lock:
+            self._hits[rule] += 1
+
+    def is_clean(self, value: str) -> bool:
+        return self.match(value) is None
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._hits)
+
+
+injection_screen = Screen("injection", INJECTION_RULES)
+sql_fragment_screen = Screen("sql_fragment", SQL_FRAGMENT_RULES)
+bot_screen = Screen("bot", BOT_RULES)
+scraper_agent_screen = Screen("scraper_agent", SCRAPER_AGENT_RULES)
+good_bot_screen = Screen("good_bot", GOOD_BOT_RULES)
+
+
+class UserAgentVerdict:
+    """Screening result for one user-agent string"""
+
+    __slots__ = ("bot_rule", "scraper_rule", "suspicious")
+
+    def __init__(self, bot_rule: Optional[str], scraper_rule: Optional[str], suspicious: bool):
+        self.bot_rule = bot_rule
+        self.scraper_rule = scraper_rule
+        self.suspicious = suspicious
+
+
+_agent_verdicts: "OrderedDict[str, UserAgentVerdict]" = OrderedDict()
+_agent_lock = threading.Lock()
+_agent_stats = {"hits": 0, "misses": 0}
+
+
+def screen_user_agent(user_agent: str) -> UserAgentVerdict:
+    """Cached verdict for a user agent; rule hits are counted on every request, not just cache misses"""
+    with _agent_lock:
+        verdict = _agent_verdicts.get(user_agent)
+        if verdict is not None:
+            _agent_verdicts.move_to_end(user_agent)
+            _agent_stats["hits"] += 1
+
+    if verdict is None:
+        scraper_rule = scraper_agent_screen.match(user_agent, count=False)
+        if scraper_rule and good_bot_screen.match(user_agent, count=False):
+            scraper_rule = None
+        verdict = UserAgentVerdict(
+            bot_screen.match(user_agent, count=False),
+            scraper_rule,
+            user_agent.lower() in SUSPICIOUS_AGENTS or len(user_agent) < 10
+        )
+        with _agent_lock:
+            _agent_stats["misses"] += 1
+            _agent_verdicts[user_agent] = verdict
+            while len(_agent_verdicts) > MAX_CACHED_AGENTS:
+                _agent_verdicts.popitem(last=False)
+
+    if verdict.bot_rule:
+        bot_screen.record(verdict.bot_rule)
+    if verdict.scraper_rule:
+        scraper_agent_screen.record(verdict.scraper_rule)
+    return verdict
+
+
+def get_screen_stats() -> Dict:
+    """Per-rule hit counters for every screen and the user-agent cache"""
+    with _agent_lock:
+        agents = dict(_agent_stats)
+        agents["cached"] = len(_agent_verdicts)
+    return {
+        "injection": injection_screen.get_stats(),
+        "sql_fragment": sql_fragment_screen.get_stats(),
+        "bot": bot_screen.get_stats(),
+        "scraper_agent": scraper_agent_screen.get_stats(),
+        "user_agent_cache": agents
+    }
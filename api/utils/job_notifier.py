@@ -0,0 +1,181 @@
+"""
+Job Completion Notifier
+Copyright © 2024 Paksa IT Solutions
+
+Lets API requests wait for reliable-queue jobs instead of polling them.
+Workers publish the ID of every job that finishes (completed or
+dead-lettered) on the queue's done channel. Each event loop holds one
+subscription to that channel and wakes the requests waiting on those job
+IDs, so any number of waiting clients cost one Redis connection.
+
+A waiter registers before it reads the job's state, so a job that finishes
+in between still wakes it. If the subscription drops, every waiter re-reads
+its job, and waits return at their timeout with the state read then.
+"""
+
+import asyncio
+import weakref
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from api.utils.reliable_queue import ReliableQueue, batch_jobs, _text
+from config.redis_client import get_async_redis
+
+FINISHED = ("completed", "dead")
+RESUBSCRIBE_DELAY = 1.0
+
+
+class _LoopState:
+    """Waiters and the subscription task of one event loop"""
+
+    __slots__ = ("waiters", "listener", "subscribed")
+
+    def __init__(self):
+        self.waiters: Dict[str, Set[asyncio.Future]] = {}
+        self.listener: Optional[asyncio.Task] = None
+        self.subscribed = asyncio.Event()
+
+
+class JobNotifier:
+    """Wait for queue jobs to finish over a shared pub/sub subscription"""
+
+    def __init__(self, queue: ReliableQueue):
+        self.queue = queue
+        # event loop -> _LoopState; futures and connections belong to the loop that made them
+        self._loops: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = self._loops[loop] = _LoopState()
+        if state.listener is None or state.listener.done():
+            state.listener = loop.create_task(self._listen(state))
+        return state
+
+    async def _listen(self, state: _LoopState):
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(self.queue.done_channel)
+                state.subscribed.set()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message:
+                        self._wake(state, _text(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job notifier subscription error: {e}")
+                state.subscribed.clear()
+                # Anything published while disconnected was missed; have every waiter re-read
+                for job_id in list(state.waiters):
+                    self._wake(state, job_id)
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+    @staticmethod
+    def _wake(state: _LoopState, job_id: str):
+        for future in state.waiters.pop(job_id, ()):
+            if not future.done():
+                future.set_result(None)
+
+    @staticmethod
+    def _register(state: _LoopState, job_id: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        state.waiters.setdefault(job_id, set()).add(future)
+        return future
+
+    @staticmethod
+    def _unregister(state: _LoopState, job_id: str, future: asyncio.Future):
+        futures = state.waiters.get(job_id)
+        if futures is not None:
+            futures.discard(future)
+            if not futures:
+                del state.waiters[job_id]
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        """Current job state, without waiting"""
+        return (await self.queue.get_many_async([job_id], get_async_redis()))[0]
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict]:
+        """Job state as soon as it finishes, or as it stands after timeout seconds"""
+        if timeout > 0:
+            async with aclosing(self.watch([job_id], timeout)) as updates:
+                async for update in updates:
+                    return update[1]
+        return await self.get(job_id)
+
+    async def watch(
+        self,
+        job_ids: List[str],
+        timeout: float,
+        heartbeat: Optional[float] = None
+    ) -> AsyncIterator[Optional[Tuple[str, Optional[Dict]]]]:
+        """
+        Yield (job_id, state) for each job as it finishes, for up to timeout
+        seconds. Expired jobs are yielded with state None. With heartbeat set,
+        yields None after every heartbeat seconds in which nothing finished.
+        """
+        state = self._state()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        waiting: Dict[str, asyncio.Future] = {}
+        to_read = list(dict.fromkeys(job_ids))
+
+        try:
+            while True:
+                if to_read:
+                    for job_id in to_read:
+                        if job_id in waiting:
+                            self._unregister(state, job_id, waiting[job_id])
+                        waiting[job_id] = self._register(state, job_id)
+                    jobs = await self.queue.get_many_async(to_read, get_async_redis())
+                    for job_id, job in zip(to_read, jobs):
+                        if job is None or job["status"] in FINISHED:
+                            self._unregister(state, job_id, waiting.pop(job_id))
+                            yield job_id, job
+
+                remaining = deadline - loop.time()
+                if not waiting or remaining <= 0:
+                    return
+
+                if not state.subscribed.is_set():
+                    try:
+                        await asyncio.wait_for(state.subscribed.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        return
+                    # A job may have finished before the subscription was up
+                    to_read = list(waiting)
+                    continue
+
+                await asyncio.wait(
+                    list(waiting.values()),
+                    timeout=min(remaining, heartbeat) if heartbeat else remaining,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                to_read = [job_id for job_id, future in waiting.items() if future.done()]
+                if not to_read and heartbeat and loop.time() < deadline:
+                    yield None
+        finally:
+            for job_id, future in waiting.items():
+                self._unregister(state, job_id, future)
+
+    async def close(self):
+        """Stop the running loop's subscription (call on shutdown)"""
+        state = self._loops.pop(asyncio.get_running_loop(), None)
+        if state is not None and state.listener is not None:
+            state.listener.cancel()
+            try:
+                await state.listener
+            except asyncio.CancelledError:
+                pass
+
+
+# Waits on recommendation batch jobs (GET /batch/{job_id}?wait=, GET /batch/stream)
+batch_notifier = JobNotifier(batch_jobs)
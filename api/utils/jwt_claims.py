@@ -0,0 +1,98 @@
+"""
+Verified JWT Claims
+Copyright © 2024 Paksa IT Solutions
+
+One place to verify bearer tokens (PyJWT, settings.JWT_SECRET_KEY). Verified
+claims are kept in a bounded LRU keyed by the token's SHA-256 until the
+token's own `exp`, so repeat requests from the same client skip signature
+verification and JSON decoding. Invalid tokens are never cached.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+import jwt
+from config.settings import settings
+
+MAX_CACHED_TOKENS = 10_000
+NO_EXPIRY_TTL = 300  # seconds to cache tokens that carry no exp claim
+
+_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalid": 0, "verify_seconds": 0.0}
+
+
+class JWTClaims:
+    """Cached bearer-token verification"""
+
+    @staticmethod
+    def decode(token: str) -> Dict:
+        """Verified claims for token; raises jwt.InvalidTokenError like jwt.decode"""
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        with _cache_lock:
+            entry = _cache.get(key)
+            if entry is not None and entry[0] > now:
+                _cache.move_to_end(key)
+                _stats["hits"] += 1
+                return dict(entry[1])
+
+        started = time.perf_counter()
+        try:
+            claims = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        except jwt.InvalidTokenError:
+            with _cache_lock:
+                _stats["invalid"] += 1
+                _stats["verify_seconds"] += time.perf_counter() - started
+            raise
+
+        expires_at = claims.get("exp") or now + NO_EXPIRY_TTL
+        with _cache_lock:
+            _stats["misses"] += 1
+            _stats["verify_seconds"] += time.perf_counter() - started
+            _cache[key] = (expires_at, claims)
+            _cache.move_to_end(key)
+            while len(_cache) > MAX_CACHED_TOKENS:
+                _cache.popitem(last=False)
+        return dict(claims)
+
+    @staticmethod
+    def verify(token: Optional[str]) -> Optional[Dict]:
+        """Verified claims, or None if the token is missing or invalid"""
+        if not token:
+            return None
+        try:
+            return JWTClaims.decode(token)
+        except jwt.InvalidTokenError:
+            return None
+
+    @staticmethod
+    def from_request(request) -> Optional[Dict]:
+        """Claims already verified by the request pipeline, else from the Authorization header"""
+        claims = getattr(request.state, "claims", None)
+        if claims is not None:
+            return claims
+        auth_header = request.headers.get("authorization", "")
+        if auth_header.startswith("Bearer "):
+            return JWTClaims.verify(auth_header[7:])
+        return None
+
+    @staticmethod
+    def invalidate(token: str):
+        """Forget a cached token (e.g. on logout)"""
+        with _cache_lock:
+            _cache.pop(hashlib.sha256(token.encode()).digest(), None)
+
+    @staticmethod
+    def get_stats() -> Dict:
+        """Cache hit rate and time spent verifying signatures"""
+        with _cache_lock:
+            stats = dict(_stats)
+            stats["cached_tokens"] = len(_cache)
+        verified = stats["misses"] + stats["invalid"]
+        lookups = stats["hits"] + verified
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["avg_verify_ms"] = round(stats["verify_seconds"] / verified * 1000, 3) if verified else 0.0
+        return stats
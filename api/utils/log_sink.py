@@ -0,0 +1,147 @@
+"""
+Batched Log Sink
+Copyright © 2024 Paksa IT Solutions
+
+In-process sink for high-volume audit rows (ApiLog, SlowQueryLog,
+RateLimitLog, BotDetection, DeprecatedApiLog). Request handlers only
+enqueue a dict; a single background thread drains the queue and writes
+each table with one executemany INSERT every `batch_size` rows or
+`flush_interval` seconds, whichever comes first. The queue is bounded: when the database falls behind,
+new rows are dropped and counted rather than slowing requests down.
+"""
+
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Optional
+
+
+class LogSink:
+    """Bounded queue of rows flushed to the database in bulk by one worker thread"""
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable] = None,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        max_queue: int = 50_000
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"queued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+
+    def write(self, model, row: Dict) -> bool:
+        """Queue one row for model's table; False if the sink is full and the row was dropped"""
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait((model, row))
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["dropped"] += 1
+            return False
+        with self._stats_lock:
+            self._stats["queued"] += 1
+        return True
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Flush everything queued so far and stop the worker (call on shutdown)"""
+        with self._start_lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stopping.set()
+            thread.join(timeout)
+            self._thread = None
+        # Rows queued after the worker's last drain
+        self._flush(self._drain(self._queue.qsize()))
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+        self._flush(self._drain(self._queue.qsize()))
+
+    def _collect(self) -> list:
+        """Block for the first row, then gather up to batch_size rows within flush_interval"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self, count: int) -> list:
+        batch = []
+        for _ in range(count):
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: list):
+        if not batch:
+            return
+        by_model = defaultdict(list)
+        for model, row in batch:
+            by_model[model].append(row)
+
+        if self.session_factory is None:
+            from config.database import SessionLocal
+            self.session_factory = SessionLocal
+
+        from sqlalchemy import insert
+        db = self.session_factory()
+        try:
+            for model, rows in by_model.items():
+                try:
+                    db.execute(insert(model), rows)
+                    db.commit()
+                    self._count("written", len(rows))
+                except Exception as e:
+                    db.rollback()
+                    self._count("failed", len(rows))
+                    print(f"Log sink failed to write {len(rows)} {model.__tablename__} rows: {e}")
+            self._count("batches", 1)
+        finally:
+            db.close()
+
+    def _count(self, name: str, amount: int):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["pending"] = self._queue.qsize()
+        stats["running"] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+
+# Global sink shared by the request pipeline stages
+log_sink = LogSink()
@@ -6,6 +6,7 @@ Copyright © 2024 Paksa IT Solutions
 from typing import Dict, Optional
 from api.utils.usage_tracker import UsageTracker
 from api.utils.tenant_resolver import TenantResolver
+from api.utils.quota import tenant_quota
 
 # Plan limits configuration
 PLAN_LIMITS = {
@@ -34,34 +35,20 @@ class PlanLimitsEnforcer:
     """Enforces subscription plan limits"""
     
     @staticmethod
-    def check_limits(tenant_id: str) -> tuple[bool, Optional[str]]:
-        """Check if tenant is within plan limits"""
+    def check_limits(tenant_id: str, consume: bool = True) -> tuple[bool, Optional[str]]:
+        """Check if tenant is within plan limits (spends one API call of quota unless consume=False)"""
         if not tenant_id:
             return True, None
         
-        # Get tenant plan
-        plan = TenantResolver.get_plan(tenant_id)
-        if not plan:
-            return False, "Invalid subscription plan"
-        
-        limits = PLAN_LIMITS.get(plan, PLAN_LIMITS["basic"])
-        usage = UsageTracker.get_usage(tenant_id)
-        
-        # Check API calls
-        daily_usage = UsageTracker.get_daily_usage(tenant_id)
-        if daily_usage.get("api_calls", 0) >= limits["api_calls_per_day"]:
-            return False, f"Daily API call limit exceeded ({limits['api_calls_per_day']})"
-        
-        # Check ML inferences
-        if daily_usage.get("ml_inferences", 0) >= limits["ml_inferences_per_day"]:
-            return False, f"Daily ML inference limit exceeded ({limits['ml_inferences_per_day']})"
-        
-        # Check storage
-        storage_mb = usage.get("storage_bytes", 0) / (1024 * 1024)
-        if storage_mb >= limits["storage_mb"]:
-            return False, f"Storage limit exceeded ({limits['storage_mb']} MB)"
+        return tenant_quota.check(tenant_id, consume=consume)
+    
+    @staticmethod
+    async def check_limits_async(tenant_id: str, consume: bool = True) -> tuple[bool, Optional[str]]:
+        """check_limits without blocking the event loop"""
+        if not tenant_id:
+            return True, None
         
-        return True, None
+        return await tenant_quota.check_async(tenant_id, consume=consume)
     
     @staticmethod
     def check_product_limit(tenant_id: str, current_count: int) -> tuple[bool, Optional[str]]:
@@ -93,10 +80,9 @@ class PlanLimitsEnforcer:
         plan = TenantResolver.get_plan(tenant_id)
         limits = PLAN_LIMITS.get(plan, PLAN_LIMITS["basic"])
         daily_usage = UsageTracker.get_daily_usage(tenant_id)
-        usage = UsageTracker.get_usage(tenant_id)
         
         return {
             "api_calls": (daily_usage.get("api_calls", 0) / limits["api_calls_per_day"]) * 100,
             "ml_inferences": (daily_usage.get("ml_inferences", 0) / limits["ml_inferences_per_day"]) * 100,
-            "storage": ((usage.get("storage_bytes", 0) / (1024 * 1024)) / limits["storage_mb"]) * 100
+            "storage": ((daily_usage.get("storage_bytes", 0) / (1024 * 1024)) / limits["storage_mb"]) * 100
         }
@@ -0,0 +1,348 @@
+"""
+Tenant Quota Leases
+Copyright © 2024 Paksa IT Solutions
+
+Cluster-wide plan-limit enforcement without a shared lookup per request.
+Each worker leases a block of a tenant's daily quota from a Redis counter
+(quota:{tenant}:{day}:{metric}) and spends it locally, so the hot path is a
+dict lookup and an integer decrement. The lease script never grants beyond
+the limit, and blocks shrink as the remaining quota does, so the cluster can
+never exceed a limit; at worst a tenant is refused slightly early while
+other workers still hold unspent leases.
+
+Whether a quota is used up is read from the shared counter (a GET, cached
+for PEEK_TTL seconds per worker), so a worker that never leased a metric
+still refuses a tenant whose quota other workers have spent. check() uses
+it for ML inferences and for the non-spending status check.
+
+Plan limits are compiled per tenant (plan -> integer limits, plus current
+storage) and refreshed every LIMITS_TTL seconds, or as soon as the tenant is
+invalidated through TenantResolver.
+
+check_async()/consume_async() lease from the running event loop's
+redis.asyncio pool and recompile limits in a worker thread, so the request
+pipeline never blocks the loop on Redis.
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from api.utils.tenant_resolver import TenantResolver
+
+LIMITS_TTL = 60.0  # seconds before a tenant's compiled limits are reloaded
+EXHAUSTED_RECHECK = 5.0  # seconds before re-asking Redis for an exhausted quota (plan upgrades, resets)
+PEEK_TTL = 1.0  # seconds a worker trusts its last read of a shared counter
+MAX_LEASE = 100
+
+# KEYS: leased counter
+# ARGV: limit, wanted, ttl seconds
+LEASE_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local leased = tonumber(redis.call('GET', KEYS[1]) or '0')
+local remaining = limit - leased
+if remaining <= 0 then
+    return 0
+end
+local grant = math.min(tonumber(ARGV[2]), math.max(1, math.floor(remaining / 4)))
+redis.call('INCRBY', KEYS[1], grant)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return grant
+"""
+
+METRIC_MESSAGES = {
+    "api_calls": "Daily API call limit exceeded ({limit})",
+    "ml_inferences": "Daily ML inference limit exceeded ({limit})"
+}
+
+
+class TenantQuota:
+    """Per-worker quota leases over a shared Redis counter"""
+
+    def __init__(self, redis_client=None, max_lease: int = MAX_LEASE, async_redis_client=None):
+        if redis_client is None:
+            from config.redis_client import get_redis
+            redis_client = get_redis()
+
+        self.redis_client = redis_client
+        self.max_lease = max_lease
+        self._script = redis_client.register_script(LEASE_SCRIPT)
+        # None: the running loop's client from get_async_redis()
+        self.async_redis_client = async_redis_client
+        self._async_script = None
+
+        # tenant -> (refresh_at, {metric: limit}, storage_limit_bytes, storage_bytes) or (refresh_at, None) for no plan
+        self._limits: Dict[str, tuple] = {}
+        # (tenant, metric) -> [day, remaining, recheck_at]; recheck_at is set once Redis refuses a lease
+        self._leases: Dict[Tuple[str, str], list] = {}
+        # (tenant, metric) -> (day, expires_at, exhausted) from the last read of the shared counter
+        self._peeks: Dict[Tuple[str, str], tuple] = {}
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "leases": 0, "refused": 0, "peeks": 0, "redis_errors": 0}
+
+    def limits(self, tenant_id: str) -> Optional[tuple]:
+        """Compiled limits for tenant: ({metric: limit}, storage_limit_bytes, storage_bytes), None without a plan"""
+        compiled = self._limits.get(tenant_id)
+        if compiled is None or compiled[0] < time.monotonic():
+            compiled = self._compile(tenant_id)
+            self._limits[tenant_id] = compiled
+        return compiled[1:] if compiled[1] is not None else None
+
+    async def limits_async(self, tenant_id: str) -> Optional[tuple]:
+        """limits(), recompiling in a worker thread (the plan lookup may hit the database)"""
+        compiled = self._limits.get(tenant_id)
+        if compiled is None or compiled[0] < time.monotonic():
+            return await run_in_threadpool(self.limits, tenant_id)
+        return compiled[1:] if compiled[1] is not None else None
+
+    def _compile(self, tenant_id: str) -> tuple:
+        from api.utils.plan_limits import PLAN_LIMITS
+
+        refresh_at = time.monotonic() + LIMITS_TTL
+        plan = TenantResolver.get_plan(tenant_id)
+        if not plan:
+            return (refresh_at, None)
+
+        plan_limits = PLAN_LIMITS.get(plan, PLAN_LIMITS["basic"])
+        try:
+            storage_bytes = int(self.redis_client.hget(f"usage:{tenant_id}:total", "storage_bytes") or 0)
+        except Exception:
+            storage_bytes = 0
+        return (
+            refresh_at,
+            {"api_calls": plan_limits["api_calls_per_day"], "ml_inferences": plan_limits["ml_inferences_per_day"]},
+            plan_limits["storage_mb"] * 1024 * 1024,
+            storage_bytes
+        )
+
+    def check(self, tenant_id: str, consume: bool = True) -> Tuple[bool, Optional[str]]:
+        """Whether the tenant may make a request; spends one API call unless consume=False"""
+        compiled = self.limits(tenant_id)
+        refused = self._refusal(compiled, compiled is not None and self.exhausted(tenant_id, "ml_inferences"))
+        if refused is not None:
+            return refused
+
+        allowed = self.consume(tenant_id, "api_calls") if consume else not self.exhausted(tenant_id, "api_calls")
+        return self._verdict(compiled, allowed)
+
+    async def check_async(self, tenant_id: str, consume: bool = True) -> Tuple[bool, Optional[str]]:
+        """check() without blocking the event loop"""
+        compiled = await self.limits_async(tenant_id)
+        refused = self._refusal(
+            compiled, compiled is not None and await self.exhausted_async(tenant_id, "ml_inferences")
+        )
+        if refused is not None:
+            return refused
+
+        if consume:
+            allowed = await self.consume_async(tenant_id, "api_calls")
+        else:
+            allowed = not await self.exhausted_async(tenant_id, "api_calls")
+        return self._verdict(compiled, allowed)
+
+    @staticmethod
+    def _refusal(compiled: Optional[tuple], ml_exhausted: bool) -> Optional[Tuple[bool, str]]:
+        """Refusal that does not depend on the API call quota, if any"""
+        if compiled is None:
+            return False, "Invalid subscription plan"
+        metric_limits, storage_limit, storage_bytes = compiled
+
+        if storage_bytes >= storage_limit:
+            return False, f"Storage limit exceeded ({storage_limit // (1024 * 1024)} MB)"
+        if ml_exhausted:
+            return False, METRIC_MESSAGES["ml_inferences"].format(limit=metric_limits["ml_inferences"])
+        return None
+
+    @staticmethod
+    def _verdict(compiled: tuple, allowed: bool) -> Tuple[bool, Optional[str]]:
+        if not allowed:
+            return False, METRIC_MESSAGES["api_calls"].format(limit=compiled[0]["api_calls"])
+        return True, None
+
+    @staticmethod
+    def _counter_key(tenant_id: str, day: str, metric: str) -> str:
+        return f"quota:{tenant_id}:{day}:{metric}"
+
+    def _known_exhausted(self, key: Tuple[str, str], day: str) -> Optional[bool]:
+        """Answer from this worker's lease or a recent read of the counter; None when Redis must be read"""
+        now = time.monotonic()
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease[0] == day:
+                if lease[1] > 0:
+                    return False
+                if lease[2] > now:
+                    return True
+            peek = self._peeks.get(key)
+            if peek is not None and peek[0] == day and peek[1] > now:
+                return peek[2]
+        return None
+
+    def _record_peek(self, key: Tuple[str, str], day: str, leased, limit: int) -> bool:
+        exhausted = int(leased or 0) >= limit
+        with self._lock:
+            self._stats["peeks"] += 1
+            self._peeks[key] = (day, time.monotonic() + PEEK_TTL, exhausted)
+        return exhausted
+
+    def _peek_failed(self, tenant_id: str, error: Exception) -> bool:
+        # Fail open, as consume() does
+        with self._lock:
+            self._stats["redis_errors"] += 1
+        print(f"Quota read failed for {tenant_id}: {error}")
+        return False
+
+    def exhausted(self, tenant_id: str, metric: str) -> bool:
+        """Whether the tenant's shared daily quota for the metric is used up, without spending any"""
+        day = datetime.utcnow().date().isoformat()
+        key = (tenant_id, metric)
+        known = self._known_exhausted(key, day)
+        if known is not None:
+            return known
+
+        compiled = self.limits(tenant_id)
+        if compiled is None:
+            return True
+        try:
+            leased = self.redis_client.get(self._counter_key(tenant_id, day, metric))
+        except Exception as e:
+            return self._peek_failed(tenant_id, e)
+        return self._record_peek(key, day, leased, compiled[0][metric])
+
+    async def exhausted_async(self, tenant_id: str, metric: str) -> bool:
+        """exhausted() without blocking the event loop"""
+        day = datetime.utcnow().date().isoformat()
+        key = (tenant_id, metric)
+        known = self._known_exhausted(key, day)
+        if known is not None:
+            return known
+
+        compiled = await self.limits_async(tenant_id)
+        if compiled is None:
+            return True
+        try:
+            leased = await self._async_redis().get(self._counter_key(tenant_id, day, metric))
+        except Exception as e:
+            return self._peek_failed(tenant_id, e)
+        return self._record_peek(key, day, leased, compiled[0][metric])
+
+    def _spend_local(self, key: Tuple[str, str], day: str, amount: int) -> Optional[bool]:
+        """Spend from the local lease; None when Redis has to be asked for another block"""
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease[0] == day:
+                if lease[1] >= amount:
+                    lease[1] -= amount
+                    self._stats["local_hits"] += 1
+                    return True
+                if lease[2] > time.monotonic():
+                    self._stats["refused"] += 1
+                    return False
+        return None
+
+    def _lease_request(self, tenant_id: str, metric: str, day: str, amount: int, limit: int) -> dict:
+        return {
+            "keys": [self._counter_key(tenant_id, day, metric)],
+            "args": [limit, max(amount, min(self.max_lease, limit // 50)), 2 * 86400]
+        }
+
+    def _lease_failed(self, tenant_id: str, error: Exception) -> bool:
+        # Fail open: losing Redis must not lock every tenant out
+        with self._lock:
+            self._stats["redis_errors"] += 1
+        print(f"Quota lease failed for {tenant_id}: {error}")
+        return True
+
+    def _settle(self, key: Tuple[str, str], day: str, amount: int, granted: int) -> bool:
+        """Add a granted block to the local lease and spend from it"""
+        with self._lock:
+            self._stats["leases"] += 1
+            lease = self._leases.get(key)
+            remaining = granted + (lease[1] if lease is not None and lease[0] == day else 0)
+            if remaining >= amount:
+                self._leases[key] = [day, remaining - amount, 0.0]
+                return True
+            self._leases[key] = [day, remaining, time.monotonic() + EXHAUSTED_RECHECK]
+            self._stats["refused"] += 1
+            return False
+
+    def consume(self, tenant_id: str, metric: str, amount: int = 1) -> bool:
+        """Spend quota from the local lease, leasing another block from Redis when it runs out"""
+        day = datetime.utcnow().date().isoformat()
+        key = (tenant_id, metric)
+        spent = self._spend_local(key, day, amount)
+        if spent is not None:
+            return spent
+
+        compiled = self.limits(tenant_id)
+        if compiled is None:
+            return False
+        try:
+            granted = int(self._script(**self._lease_request(tenant_id, metric, day, amount, compiled[0][metric])))
+        except Exception as e:
+            return self._lease_failed(tenant_id, e)
+        return self._settle(key, day, amount, granted)
+
+    async def consume_async(self, tenant_id: str, metric: str, amount: int = 1) -> bool:
+        """consume() without blocking the event loop"""
+        day = datetime.utcnow().date().isoformat()
+        key = (tenant_id, metric)
+        spent = self._spend_local(key, day, amount)
+        if spent is not None:
+            return spent
+
+        compiled = await self.limits_async(tenant_id)
+        if compiled is None:
+            return False
+        try:
+            client = self._async_redis()
+            granted = int(await self._async_script(
+                **self._lease_request(tenant_id, metric, day, amount, compiled[0][metric]), client=client
+            ))
+        except Exception as e:
+            return self._lease_failed(tenant_id, e)
+        return self._settle(key, day, amount, granted)
+
+    def _async_redis(self):
+        """redis.asyncio client for the running loop (the script is registered once and run on any client)"""
+        client = self.async_redis_client
+        if client is None:
+            from config.redis_client import get_async_redis
+            client = get_async_redis()
+        if self._async_script is None:
+            self._async_script = client.register_script(LEASE_SCRIPT)
+        return client
+
+    def forget_limits(self, tenant_id: str):
+        """Recompile the tenant's limits on next use (plan change, suspension)"""
+        with self._lock:
+            self._limits.pop(tenant_id, None)
+            for key, lease in self._leases.items():
+                if key[0] == tenant_id:
+                    lease[2] = 0.0
+            for key in [k for k in self._peeks if k[0] == tenant_id]:
+                del self._peeks[key]
+
+    def reset(self, tenant_id: str):
+        """Drop today's leases for a tenant (after an admin usage reset or plan change)"""
+        day = datetime.utcnow().date().isoformat()
+        with self._lock:
+            self._limits.pop(tenant_id, None)
+            for key in [k for k in self._leases if k[0] == tenant_id]:
+                del self._leases[key]
+            for key in [k for k in self._peeks if k[0] == tenant_id]:
+                del self._peeks[key]
+        self.redis_client.delete(*[self._counter_key(tenant_id, day, metric) for metric in METRIC_MESSAGES])
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["leased_keys"] = len(self._leases)
+        stats["compiled_tenants"] = len(self._limits)
+        return stats
+
+
+# Global quota engine for this worker
+tenant_quota = TenantQuota()
+TenantResolver.on_invalidate(tenant_quota.forget_limits)
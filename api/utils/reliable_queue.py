@@ -0,0 +1,350 @@
+"""
+Reliable Job Queue
+Copyright © 2024 Paksa IT Solutions
+
+Crash-safe job queue on a Redis Stream consumer group. Per queue `name`:
+
+    {name}:stream            jobs ready to run (entries carry only the job ID)
+    {name}:job:{id}          hash with all job state: status, payload, attempts, result, error
+    {name}:retry             sorted set of failed jobs waiting out their backoff (score = due time)
+    {name}:dead              capped dead-letter stream of jobs that ran out of attempts
+    {name}:stats             counters (enqueued, completed, retried, dead_lettered, requeued)
+    {name}:completed:{hour}  completions per hour, for the admin dashboard
+    {name}:done              pub/sub channel carrying the ID of every job that finishes
+
+A claimed job stays in the group's pending list until it is completed or
+failed. If its worker dies, the entry is reclaimed by another worker once it
+has been idle for `visibility_timeout` seconds. Every delivery counts as an
+attempt. A failed job is retried after RETRY_DELAYS, and after
+`max_attempts` it moves to the dead-letter stream, where an admin can
+requeue it. Completed and dead-lettered job IDs are published on the done
+channel so API requests can wait for a result (api.utils.job_notifier)
+instead of polling it. Admin stats are read from counters and O(1) lengths, never from
+keyspace scans.
+"""
+
+import json
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+RETRY_DELAYS = (5, 30, 120)  # seconds before the 2nd, 3rd, ... attempt
+MAINTENANCE_INTERVAL = 1.0  # seconds between retry promotion / stale-entry reclaim passes
+
+# KEYS: retry zset, stream; ARGV: now, max jobs. Moves due retries back onto the stream.
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, job_id in ipairs(due) do
+    redis.call('XADD', KEYS[2], '*', 'job', job_id)
+end
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return #due
+"""
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class QueuedJob:
+    """One claimed delivery of a job"""
+
+    __slots__ = ("job_id", "entry_id", "payload", "attempts")
+
+    def __init__(self, job_id: str, entry_id: str, payload: Dict, attempts: int):
+        self.job_id = job_id
+        self.entry_id = entry_id
+        self.payload = payload
+        self.attempts = attempts
+
+
+class ReliableQueue:
+    """Redis Streams job queue with visibility timeouts, retries and a dead-letter stream"""
+
+    def __init__(
+        self,
+        name: str,
+        redis_client=None,
+        consumer: Optional[str] = None,
+        visibility_timeout: int = 60,
+        max_attempts: int = 3,
+        job_ttl: int = 3600,
+        dead_letter_max: int = 10_000
+    ):
+        if redis_client is None:
+            from config.redis_client import get_redis
+            redis_client = get_redis()
+
+        self.name = name
+        self.redis_client = redis_client
+        self.group = "workers"
+        self.consumer = consumer or f"{socket.gethostname()}:{os.getpid()}"
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.job_ttl = job_ttl
+        self.dead_letter_max = dead_letter_max
+
+        self.stream_key = f"{name}:stream"
+        self.retry_key = f"{name}:retry"
+        self.dead_key = f"{name}:dead"
+        self.stats_key = f"{name}:stats"
+        self.done_channel = f"{name}:done"
+
+        self._promote = redis_client.register_script(PROMOTE_SCRIPT)
+        self._group_ready = False
+        self._next_maintenance = 0.0
+
+    def job_key(self, job_id: str) -> str:
+        return f"{self.name}:job:{job_id}"
+
+    def _completed_key(self, hour: datetime) -> str:
+        return f"{self.name}:completed:{hour.strftime('%Y%m%d%H')}"
+
+    def enqueue(self, payload: Dict, job_id: str) -> str:
+        """Store the job's state and make it available to workers"""
+        key = self.job_key(job_id)
+        now = datetime.utcnow().isoformat()
+        pipe = self.redis_client.pipeline()
+        pipe.hset(key, mapping={
+            "status": "pending",
+            "payload": json.dumps(payload),
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now
+        })
+        pipe.expire(key, self.job_ttl)
+        pipe.xadd(self.stream_key, {"job": job_id})
+        pipe.hincrby(self.stats_key, "enqueued", 1)
+        pipe.execute()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Job state hash (payload and result decoded), None once expired"""
+        return self._decode(self.redis_client.hgetall(self.job_key(job_id)))
+
+    async def get_many_async(self, job_ids: List[str], redis_client) -> List[Optional[Dict]]:
+        """get for several jobs through a redis.asyncio client, in one round trip"""
+        pipe = redis_client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hgetall(self.job_key(job_id))
+        return [self._decode(raw) for raw in await pipe.execute()]
+
+    @staticmethod
+    def _decode(raw: Dict) -> Optional[Dict]:
+        if not raw:
+            return None
+        job = {_text(k): _text(v) for k, v in raw.items()}
+        for field in ("payload", "result"):
+            if job.get(field):
+                job[field] = json.loads(job[field])
+        job["attempts"] = int(job.get("attempts", 0))
+        return job
+
+    def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            self.redis_client.xgroup_create(self.stream_key, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    def claim(self, count: int, block_ms: int = 0) -> List[QueuedJob]:
+        """Up to count jobs: stale deliveries first, then new ones, waiting up to block_ms for the first"""
+        self._ensure_group()
+        entries = []
+
+        if time.monotonic() >= self._next_maintenance:
+            self._next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+            self._promote(keys=[self.retry_key, self.stream_key], args=[time.time(), 1000])
+            reclaimed = self.redis_client.xautoclaim(
+                self.stream_key, self.group, self.consumer,
+                min_idle_time=self.visibility_timeout * 1000, count=count
+            )
+            entries.extend(reclaimed[1])
+
+        if len(entries) < count:
+            # BLOCK 0 means forever; None means don't block
+            response = self.redis_client.xreadgroup(
+                self.group, self.consumer, {self.stream_key: ">"},
+                count=count - len(entries), block=max(1, block_ms) if block_ms else None
+            )
+            for _, stream_entries in response or []:
+                entries.extend(stream_entries)
+
+        return self._start([(_text(entry_id), fields) for entry_id, fields in entries if fields])
+
+    def _start(self, entries: List[Tuple[str, Dict]]) -> List[QueuedJob]:
+        """Count the delivery as an attempt and mark the jobs processing"""
+        if not entries:
+            return []
+        now = datetime.utcnow().isoformat()
+        pipe = self.redis_client.pipeline(transaction=False)
+        job_ids = []
+        for _, fields in entries:
+            job_id = _text(fields.get(b"job", fields.get("job")))
+            job_ids.append(job_id)
+            key = self.job_key(job_id)
+            pipe.hincrby(key, "attempts", 1)
+            pipe.hset(key, mapping={"status": "processing", "updated_at": now})
+            pipe.hget(key, "payload")
+        results = pipe.execute()
+
+        jobs, expired, exhausted = [], [], []
+        for i, (entry_id, _) in enumerate(entries):
+            attempts, payload = int(results[3 * i]), results[3 * i + 2]
+            if payload is None:
+                # State expired while queued; nothing left to run
+                expired.append((job_ids[i], entry_id))
+                continue
+            job = QueuedJob(job_ids[i], entry_id, json.loads(payload), attempts)
+            if attempts > self.max_attempts:
+                # Redelivered after a visibility timeout on its last attempt (e.g. it crashes workers)
+                exhausted.append((job, "visibility timeout exceeded"))
+            else:
+                jobs.append(job)
+
+        if expired:
+            pipe = self.redis_client.pipeline()
+            # The attempt counter just recreated the hash without a TTL
+            pipe.delete(*[self.job_key(job_id) for job_id, _ in expired])
+            pipe.xack(self.stream_key, self.group, *[entry_id for _, entry_id in expired])
+            pipe.xdel(self.stream_key, *[entry_id for _, entry_id in expired])
+            pipe.execute()
+        if exhausted:
+            self.fail_many(exhausted)
+        return jobs
+
+    def complete_many(self, results: List[Tuple[QueuedJob, Dict]]):
+        """Store results and acknowledge the deliveries in one transaction"""
+        if not results:
+            return
+        now = datetime.utcnow()
+        pipe = self.redis_client.pipeline()
+        for job, result in results:
+            key = self.job_key(job.job_id)
+            pipe.hset(key, mapping={"status": "completed", "result": json.dumps(result), "updated_at": now.isoformat()})
+            pipe.expire(key, self.job_ttl)
+            pipe.publish(self.done_channel, job.job_id)
+        entry_ids = [job.entry_id for job, _ in results]
+        pipe.xack(self.stream_key, self.group, *entry_ids)
+        pipe.xdel(self.stream_key, *entry_ids)
+        pipe.hincrby(self.stats_key, "completed", len(results))
+        pipe.incrby(self._completed_key(now), len(results))
+        pipe.expire(self._completed_key(now), 7200)
+        pipe.execute()
+
+    def fail_many(self, failures: List[Tuple[QueuedJob, str]]):
+        """Schedule retries with backoff, dead-lettering jobs that used their last attempt"""
+        if not failures:
+            return
+        now = datetime.utcnow().isoformat()
+        pipe = self.redis_client.pipeline()
+        for job, error in failures:
+            key = self.job_key(job.job_id)
+            if job.attempts >= self.max_attempts:
+                pipe.xadd(
+                    self.dead_key,
+                    {"job": job.job_id, "error": error[:500], "attempts": job.attempts},
+                    maxlen=self.dead_letter_max
+                )
+                pipe.hset(key, mapping={"status": "dead", "error": error, "updated_at": now})
+                pipe.hincrby(self.stats_key, "dead_lettered", 1)
+                pipe.publish(self.done_channel, job.job_id)
+            else:
+                delay = RETRY_DELAYS[min(job.attempts, len(RETRY_DELAYS)) - 1]
+                pipe.zadd(self.retry_key, {job.job_id: time.time() + delay})
+                pipe.hset(key, mapping={"status": "retrying", "error": error, "updated_at": now})
+                pipe.hincrby(self.stats_key, "retried", 1)
+            pipe.expire(key, self.job_ttl)
+        entry_ids = [job.entry_id for job, _ in failures]
+        pipe.xack(self.stream_key, self.group, *entry_ids)
+        pipe.xdel(self.stream_key, *entry_ids)
+        pipe.execute()
+
+    def requeue(self, job_id: str) -> bool:
+        """Give a dead-lettered job a fresh set of attempts; False if it isn't dead"""
+        key = self.job_key(job_id)
+        if _text(self.redis_client.hget(key, "status")) != "dead":
+            return False
+        pipe = self.redis_client.pipeline()
+        pipe.hset(key, mapping={"status": "pending", "attempts": 0, "updated_at": datetime.utcnow().isoformat()})
+        pipe.expire(key, self.job_ttl)
+        pipe.xadd(self.stream_key, {"job": job_id})
+        pipe.hincrby(self.stats_key, "requeued", 1)
+        pipe.execute()
+        return True
+
+    def backlog(self) -> Tuple[int, float]:
+        """Jobs not yet acknowledged (queued or in progress) and the age in seconds of the oldest"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.xlen(self.stream_key)
+        pipe.xrange(self.stream_key, count=1)
+        length, oldest = pipe.execute()
+        if not oldest:
+            return int(length), 0.0
+        # Stream IDs start with the millisecond timestamp they were added at
+        added_at = int(_text(oldest[0][0]).split("-")[0]) / 1000
+        return int(length), max(0.0, time.time() - added_at)
+
+    def _stats_commands(self, pipe, dead_letters: int):
+        now = datetime.utcnow()
+        pipe.hgetall(self.stats_key)
+        pipe.xlen(self.stream_key)
+        pipe.zcard(self.retry_key)
+        pipe.xlen(self.dead_key)
+        pipe.mget(self._completed_key(now), self._completed_key(now - timedelta(hours=1)))
+        pipe.xrevrange(self.dead_key, count=dead_letters)
+        return pipe
+
+    def _stats_from(self, results: list, pending: int) -> Dict:
+        counters, stream_length, retrying, dead_size, (this_hour, last_hour), dead = results
+        counters = {_text(k): int(v) for k, v in (counters or {}).items()}
+        # Sliding estimate: this hour's bucket plus the unexpired share of the previous one
+        minute = datetime.utcnow().minute
+        completed_last_hour = int(int(this_hour or 0) + int(last_hour or 0) * (60 - minute) / 60)
+        return {
+            "counters": {name: counters.get(name, 0) for name in ("enqueued", "completed", "retried", "dead_lettered", "requeued")},
+            # Entries stay on the stream while delivered but unacknowledged
+            "queue_length": max(0, stream_length - pending),
+            "processing": pending,
+            "retrying": retrying,
+            "dead_letter_size": dead_size,
+            "completed_last_hour": completed_last_hour,
+            "dead_letters": [
+                {
+                    "job_id": _text(fields.get(b"job")),
+                    "error": _text(fields.get(b"error")),
+                    "attempts": int(fields.get(b"attempts") or 0),
+                    "failed_at": datetime.utcfromtimestamp(int(_text(entry_id).split("-")[0]) / 1000).isoformat()
+                }
+                for entry_id, fields in dead
+            ]
+        }
+
+    def get_stats(self, dead_letters: int = 10) -> Dict:
+        """Counters, queue depths and the most recent dead letters"""
+        self._ensure_group()
+        pending = int(self.redis_client.xpending(self.stream_key, self.group)["pending"])
+        pipe = self._stats_commands(self.redis_client.pipeline(transaction=False), dead_letters)
+        return self._stats_from(pipe.execute(), pending)
+
+    async def get_stats_async(self, redis_client, dead_letters: int = 10) -> Dict:
+        """get_stats through a redis.asyncio client"""
+        try:
+            pending = int((await redis_client.xpending(self.stream_key, self.group))["pending"])
+        except Exception as e:
+            if "NOGROUP" not in str(e):
+                raise
+            pending = 0  # no worker has started yet
+        pipe = self._stats_commands(redis_client.pipeline(transaction=False), dead_letters)
+        return self._stats_from(await pipe.execute(), pending)
+
+
+# Recommendation batch jobs (BatchInferenceQueue and the batch admin routes)
+batch_jobs = ReliableQueue("batch")
@@ -0,0 +1,253 @@
+"""
+Distributed Sliding-Window Limiter
+Copyright © 2024 Paksa IT Solutions
+
+Sliding-window-log limiter shared by every uvicorn worker and node through
+Redis. Each check is one Lua round trip: trim the identity's sorted set to
+the window, count, record the hit (or set a block key once over the limit),
+and refresh the key's TTL so idle identities expire on their own. Timestamps
+come from the Redis clock, so nodes with skewed clocks agree.
+
+Clients that are far below the limit take a local token-bucket fast path:
+after a Redis check showing the identity under half its limit, the process
+may admit up to `local_burst` further hits without a round trip. Those hits
+are recorded in Redis with the next check (at most `sync_interval` seconds
+later), so the worst-case over-admission is processes x local_burst.
+
+hit_async()/is_blocked_async()/block_async() make the same calls on the
+running event loop's redis.asyncio pool, for request-pipeline stages.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+# KEYS: window log, block key, blocked index
+# ARGV: limit, window_ms, block_ms, identity, member prefix, ages (ms) of locally admitted hits...
+SLIDING_WINDOW_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local blocked_ttl = redis.call('PTTL', KEYS[2])
+if blocked_ttl > 0 then
+    return {-1, blocked_ttl}
+end
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+for i = 6, #ARGV do
+    redis.call('ZADD', KEYS[1], now - tonumber(ARGV[i]), ARGV[5] .. ':' .. i)
+end
+local count = redis.call('ZCARD', KEYS[1])
+if count >= limit then
+    local block = tonumber(ARGV[3])
+    if block > 0 then
+        redis.call('SET', KEYS[2], 1, 'PX', block)
+        redis.call('ZADD', KEYS[3], now + block, ARGV[4])
+        redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+    end
+    redis.call('PEXPIRE', KEYS[1], window)
+    return {0, count}
+end
+redis.call('ZADD', KEYS[1], now, ARGV[5])
+redis.call('PEXPIRE', KEYS[1], window)
+return {1, count + 1}
+"""
+
+ALLOWED, REJECTED, BLOCKED = 1, 0, -1
+
+
+class SlidingWindowLimiter:
+    """Redis sliding-window-log limiter with a local fast path"""
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        window_seconds: int = 60,
+        block_seconds: int = 0,
+        redis_client=None,
+        async_redis_client=None,
+        local_burst: Optional[int] = None,
+        sync_interval: float = 1.0,
+        max_local_keys: int = 100_000
+    ):
+        if redis_client is None:
+            from config.redis_client import get_redis
+            redis_client = get_redis()
+
+        self.name = name
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.block_seconds = block_seconds
+        self.local_burst = limit // 20 if local_burst is None else local_burst
+        self.sync_interval = sync_interval
+        self.max_local_keys = max_local_keys
+        self.redis_client = redis_client
+        self._script = redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+        # None: the running loop's client from get_async_redis()
+        self.async_redis_client = async_redis_client
+        self._async_script = None
+
+        # identity -> [tokens, synced_at, pending hit times, last count]
+        self._local: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "redis_checks": 0, "rejected": 0, "redis_errors": 0}
+
+    def _keys(self, identity: str) -> list:
+        return [
+            f"ratelimit:{self.name}:log:{identity}",
+            f"ratelimit:{self.name}:block:{identity}",
+            f"ratelimit:{self.name}:blocked"
+        ]
+
+    def _async_redis(self):
+        """redis.asyncio client for the running loop (the script is registered once and run on any client)"""
+        client = self.async_redis_client
+        if client is None:
+            from config.redis_client import get_async_redis
+            client = get_async_redis()
+        if self._async_script is None:
+            self._async_script = client.register_script(SLIDING_WINDOW_SCRIPT)
+        return client
+
+    def _take_local(self, identity: str, now: float) -> Tuple[Optional[Tuple[bool, int, bool]], list]:
+        """(result, None) when the local bucket admits the hit, else (None, hit times to sync)"""
+        with self._lock:
+            bucket = self._local.pop(identity, None)
+            if bucket is not None and bucket[0] > 0 and now - bucket[1] < self.sync_interval:
+                bucket[0] -= 1
+                bucket[2].append(now)
+                self._local[identity] = bucket
+                self._stats["local_hits"] += 1
+                return (True, bucket[3] + len(bucket[2]), False), None
+            return None, bucket[2] if bucket is not None else []
+
+    def _script_args(self, identity: str, now: float, pending: list) -> list:
+        ages = [int((now - t) * 1000) for t in pending]
+        return [self.limit, self.window_seconds * 1000, self.block_seconds * 1000,
+                identity, uuid.uuid4().hex, *ages]
+
+    def _fail_open(self, error: Exception) -> Tuple[bool, int, bool]:
+        # Fail open: losing Redis must not take the API down with it
+        with self._lock:
+            self._stats["redis_errors"] += 1
+        print(f"Rate limiter {self.name} unavailable: {error}")
+        return True, 0, False
+
+    def _settle(self, identity: str, now: float, status: int, value: int) -> Tuple[bool, int, bool]:
+        """Record the script's verdict and refill the local bucket"""
+        with self._lock:
+            self._stats["redis_checks"] += 1
+            if status != ALLOWED:
+                self._stats["rejected"] += 1
+                return False, int(value) if status == REJECTED else self.limit, status == REJECTED and self.block_seconds > 0
+
+            # Obviously under the limit: allow a few hits locally before the next check
+            tokens = self.local_burst if value + self.local_burst <= self.limit // 2 else 0
+            self._local[identity] = [tokens, now, [], int(value)]
+            while len(self._local) > self.max_local_keys:
+                self._local.popitem(last=False)
+            return True, int(value), False
+
+    def hit(self, identity: str) -> Tuple[bool, int, bool]:
+        """Record one request: (allowed, requests in window, blocked by this request)"""
+        now = time.monotonic()
+        result, pending = self._take_local(identity, now)
+        if result is not None:
+            return result
+        try:
+            status, value = self._script(keys=self._keys(identity), args=self._script_args(identity, now, pending))
+        except Exception as e:
+            return self._fail_open(e)
+        return self._settle(identity, now, status, value)
+
+    async def hit_async(self, identity: str) -> Tuple[bool, int, bool]:
+        """hit() without blocking the event loop"""
+        now = time.monotonic()
+        result, pending = self._take_local(identity, now)
+        if result is not None:
+            return result
+        try:
+            client = self._async_redis()
+            status, value = await self._async_script(
+                keys=self._keys(identity), args=self._script_args(identity, now, pending), client=client
+            )
+        except Exception as e:
+            return self._fail_open(e)
+        return self._settle(identity, now, status, value)
+
+    def is_blocked(self, identity: str) -> bool:
+        try:
+            return bool(self.redis_client.exists(self._keys(identity)[1]))
+        except Exception:
+            return False
+
+    async def is_blocked_async(self, identity: str) -> bool:
+        try:
+            return bool(await self._async_redis().exists(self._keys(identity)[1]))
+        except Exception:
+            return False
+
+    def _block_failed(self, identity: str, error: Exception):
+        with self._lock:
+            self._stats["redis_errors"] += 1
+        print(f"Rate limiter {self.name} could not block {identity}: {error}")
+
+    def block(self, identity: str, seconds: Optional[int] = None):
+        """Block an identity immediately (e.g. a known bot user agent)"""
+        seconds = seconds or self.block_seconds
+        log_key, block_key, index_key = self._keys(identity)
+        with self._lock:
+            self._local.pop(identity, None)
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.set(block_key, 1, px=seconds * 1000)
+            pipe.zadd(index_key, {identity: (time.time() + seconds) * 1000})
+            pipe.execute()
+        except Exception as e:
+            self._block_failed(identity, e)
+
+    async def block_async(self, identity: str, seconds: Optional[int] = None):
+        """block() without blocking the event loop"""
+        seconds = seconds or self.block_seconds
+        log_key, block_key, index_key = self._keys(identity)
+        with self._lock:
+            self._local.pop(identity, None)
+        try:
+            async with self._async_redis().pipeline() as pipe:
+                pipe.set(block_key, 1, px=seconds * 1000)
+                pipe.zadd(index_key, {identity: (time.time() + seconds) * 1000})
+                await pipe.execute()
+        except Exception as e:
+            self._block_failed(identity, e)
+
+    def unblock(self, identity: str) -> bool:
+        """Lift a block and reset the identity's window; False if it was not blocked"""
+        log_key, block_key, index_key = self._keys(identity)
+        with self._lock:
+            self._local.pop(identity, None)
+        pipe = self.redis_client.pipeline()
+        pipe.delete(block_key)
+        pipe.delete(log_key)
+        pipe.zrem(index_key, identity)
+        removed = pipe.execute()
+        return bool(removed[0])
+
+    def blocked(self) -> Dict[str, datetime]:
+        """Currently blocked identities and when their block ends"""
+        index_key = self._keys("")[2]
+        now_ms = time.time() * 1000
+        self.redis_client.zremrangebyscore(index_key, "-inf", now_ms)
+        return {
+            (member.decode() if isinstance(member, bytes) else member): datetime.utcfromtimestamp(score / 1000)
+            for member, score in self.redis_client.zrangebyscore(index_key, now_ms, "+inf", withscores=True)
+        }
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["local_keys"] = len(self._local)
+        return stats
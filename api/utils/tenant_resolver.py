@@ -1,97 +1,316 @@
 """
 Tenant Resolver - Validates and caches tenant metadata
 Copyright © 2024 Paksa IT Solutions
+
+Tenant metadata is cached in two tiers: a bounded in-process LRU (L1) in
+front of a Redis copy shared by all workers (L2, 15 minutes). invalidate_cache
+deletes the L2 copy and publishes the tenant ID on TENANT_INVALIDATION_CHANNEL;
+every worker's subscriber thread drops its L1 entry, so suspensions and plan
+changes take effect cluster-wide within a second. L1_TTL bounds staleness if
+the subscriber is disconnected. Concurrent misses for the same tenant share
+one Redis/database lookup.
+
+Code on the event loop uses the *_async variants: L1 hits are served inline,
+the L2 GET goes through the loop's redis.asyncio pool, and only database
+loads are handed to a worker thread.
 """
 
-from typing import Optional, Dict
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from datetime import timedelta
+from starlette.concurrency import run_in_threadpool
 from config.database import SessionLocal
+from config.redis_client import get_async_redis
 from api.models.database_models import Tenant
 
-# In-memory cache (use Redis in production)
-_tenant_cache: Dict[str, Dict] = {}
-_cache_ttl = timedelta(minutes=15)
+MAX_CACHED_TENANTS = 10_000
+L1_TTL = 60.0  # seconds
+TENANT_INVALIDATION_CHANNEL = "tenant:invalidate"
+
+_cache_ttl = timedelta(minutes=15)  # L2 (Redis) lifetime
+
+# tenant_id -> (expires_at monotonic, tenant dict or None for unknown tenants)
+_tenant_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+_invalidations = 0  # bumped per invalidation so in-flight lookups don't re-cache stale data
+_flights: Dict[str, "_Flight"] = {}
+_invalidation_hooks: List[Callable[[str], None]] = []
+_subscriber: Optional[threading.Thread] = None
+_redis = None
+_stats = {"l1_hits": 0, "l2_hits": 0, "db_loads": 0, "invalidations": 0, "redis_errors": 0}
+
+_TENANT_COLUMNS = (
+    Tenant.tenant_id, Tenant.name, Tenant.email, Tenant.status, Tenant.plan, Tenant.api_key,
+    Tenant.company_name, Tenant.company_website, Tenant.company_phone, Tenant.industry,
+    Tenant.address, Tenant.poc, Tenant.tax_info, Tenant.woocommerce, Tenant.created_at
+)
+
+
+class _Flight:
+    """One in-progress tenant lookup that concurrent callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        from config.redis_client import get_redis
+        _redis = get_redis()
+    return _redis
+
+
+def _l1_get(tenant_id: str) -> Optional[tuple]:
+    """Live L1 entry for tenant_id, or None (call with _cache_lock held)"""
+    cached = _tenant_cache.get(tenant_id)
+    if cached and cached[0] > time.monotonic():
+        _tenant_cache.move_to_end(tenant_id)
+        _stats["l1_hits"] += 1
+        return cached
+    return None
+
+
+def _l1_store(tenant_id: str, value: Optional[Dict], generation: int):
+    """Cache a lookup in L1 unless the tenant was invalidated while it ran"""
+    with _cache_lock:
+        if generation == _invalidations:
+            _tenant_cache[tenant_id] = (time.monotonic() + L1_TTL, value)
+            _tenant_cache.move_to_end(tenant_id)
+            while len(_tenant_cache) > MAX_CACHED_TENANTS:
+                _tenant_cache.popitem(last=False)
+
+
+def _drop_local(tenant_id: str):
+    global _invalidations
+    with _cache_lock:
+        _invalidations += 1
+        _stats["invalidations"] += 1
+        _tenant_cache.pop(tenant_id, None)
+    for hook in _invalidation_hooks:
+        try:
+            hook(tenant_id)
+        except Exception as e:
+            print(f"Tenant invalidation hook failed: {e}")
+
+
+def _listen():
+    """Drop L1 entries invalidated by any worker; reconnects after Redis errors"""
+    while True:
+        try:
+            pubsub = _redis_client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(TENANT_INVALIDATION_CHANNEL)
+            while True:
+                # Poll rather than listen(): a quiet channel must not trip the pool's socket timeout
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    tenant_id = message["data"]
+                    _drop_local(tenant_id.decode() if isinstance(tenant_id, bytes) else tenant_id)
+        except Exception as e:
+            with _cache_lock:
+                _stats["redis_errors"] += 1
+            print(f"Tenant invalidation subscriber disconnected: {e}")
+            time.sleep(5)
 
 
 class TenantResolver:
     """Resolves and validates tenant context"""
-    
+
     @staticmethod
     def get_tenant(tenant_id: str) -> Optional[Dict]:
         """Get tenant metadata with caching"""
         if not tenant_id:
             return None
-        
-        # Check cache
-        cached = _tenant_cache.get(tenant_id)
-        if cached and cached.get('expires_at', datetime.min) > datetime.utcnow():
-            return cached['data']
-        
+
+        # L1
+        with _cache_lock:
+            cached = _l1_get(tenant_id)
+            if cached is not None:
+                return cached[1]
+
+            # Coalesce concurrent misses: one caller loads, the rest wait for it
+            flight = _flights.get(tenant_id)
+            leader = flight is None
+            if leader:
+                flight = _flights[tenant_id] = _Flight()
+                generation = _invalidations
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            TenantResolver._ensure_subscriber()
+            flight.value = TenantResolver._load(tenant_id, generation)
+            _l1_store(tenant_id, flight.value, generation)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with _cache_lock:
+                _flights.pop(tenant_id, None)
+            flight.done.set()
+
+    @staticmethod
+    async def get_tenant_async(tenant_id: str) -> Optional[Dict]:
+        """get_tenant without blocking the event loop"""
+        if not tenant_id:
+            return None
+
+        with _cache_lock:
+            cached = _l1_get(tenant_id)
+            if cached is not None:
+                return cached[1]
+            generation = _invalidations
+
+        TenantResolver._ensure_subscriber()
+        try:
+            raw = await get_async_redis().get(f"tenant:{tenant_id}")
+        except Exception:
+            raw = None
+            with _cache_lock:
+                _stats["redis_errors"] += 1
+        if raw:
+            with _cache_lock:
+                _stats["l2_hits"] += 1
+            tenant = json.loads(raw)
+            _l1_store(tenant_id, tenant, generation)
+            return tenant
+
+        # Not in Redis: the coalesced database load runs in a worker thread
+        return await run_in_threadpool(TenantResolver.get_tenant, tenant_id)
+
+    @staticmethod
+    def _load(tenant_id: str, generation: int) -> Optional[Dict]:
+        """L2, then the database (filling L2 unless the tenant was invalidated during the load)"""
+        key = f"tenant:{tenant_id}"
+        try:
+            raw = _redis_client().get(key)
+            if raw:
+                with _cache_lock:
+                    _stats["l2_hits"] += 1
+                return json.loads(raw)
+        except Exception:
+            with _cache_lock:
+                _stats["redis_errors"] += 1
+
         # Fetch from database
         db = SessionLocal()
         try:
-            tenant = db.query(Tenant).filter(Tenant.tenant_id == tenant_id).first()
-            
-            if tenant:
-                tenant_data = {
-                    "id": tenant.tenant_id,
-                    "name": tenant.name,
-                    "email": tenant.email,
-                    "status": tenant.status,
-                    "plan": tenant.plan,
-                    "api_key": tenant.api_key,
-                    "company_name": tenant.company_name,
-                    "company_website": tenant.company_website,
-                    "company_phone": tenant.company_phone,
-                    "industry": tenant.industry,
-                    "address": tenant.address or {},
-                    "poc": tenant.poc or {},
-                    "tax_info": tenant.tax_info or {},
-                    "woocommerce": tenant.woocommerce or {},
-                    "created_at": tenant.created_at.isoformat() if tenant.created_at else None
-                }
-                
-                # Cache tenant data
-                _tenant_cache[tenant_id] = {
-                    'data': tenant_data,
-                    'expires_at': datetime.utcnow() + _cache_ttl
-                }
-                
-                return tenant_data
+            tenant = db.query(*_TENANT_COLUMNS).filter(Tenant.tenant_id == tenant_id).first()
         finally:
             db.close()
-        
-        return None
-    
+        with _cache_lock:
+            _stats["db_loads"] += 1
+
+        if not tenant:
+            return None
+
+        tenant_data = {
+            "id": tenant.tenant_id,
+            "name": tenant.name,
+            "email": tenant.email,
+            "status": tenant.status,
+            "plan": tenant.plan,
+            "api_key": tenant.api_key,
+            "company_name": tenant.company_name,
+            "company_website": tenant.company_website,
+            "company_phone": tenant.company_phone,
+            "industry": tenant.industry,
+            "address": tenant.address or {},
+            "poc": tenant.poc or {},
+            "tax_info": tenant.tax_info or {},
+            "woocommerce": tenant.woocommerce or {},
+            "created_at": tenant.created_at.isoformat() if tenant.created_at else None
+        }
+
+        with _cache_lock:
+            invalidated = generation != _invalidations
+        if invalidated:
+            # The row may predate the change; the next lookup reloads it
+            return tenant_data
+
+        try:
+            _redis_client().setex(key, _cache_ttl, json.dumps(tenant_data))
+        except Exception:
+            with _cache_lock:
+                _stats["redis_errors"] += 1
+        return tenant_data
+
+    @staticmethod
+    def _ensure_subscriber():
+        global _subscriber
+        if _subscriber is None:
+            with _cache_lock:
+                if _subscriber is None:
+                    _subscriber = threading.Thread(target=_listen, name="tenant-invalidation", daemon=True)
+                    _subscriber.start()
+
     @staticmethod
     def is_active(tenant_id: str) -> bool:
         """Check if tenant is active"""
         tenant = TenantResolver.get_tenant(tenant_id)
         return tenant is not None and tenant.get('status') == 'active'
-    
+
     @staticmethod
     def validate_tenant(tenant_id: str) -> tuple[bool, Optional[str]]:
         """Validate tenant exists and is active"""
         if not tenant_id:
             return False, "Tenant ID is required"
-        
-        tenant = TenantResolver.get_tenant(tenant_id)
-        
+
+        return TenantResolver._check_tenant(TenantResolver.get_tenant(tenant_id))
+
+    @staticmethod
+    async def validate_tenant_async(tenant_id: str) -> tuple[bool, Optional[str]]:
+        """validate_tenant without blocking the event loop"""
+        if not tenant_id:
+            return False, "Tenant ID is required"
+
+        return TenantResolver._check_tenant(await TenantResolver.get_tenant_async(tenant_id))
+
+    @staticmethod
+    def _check_tenant(tenant: Optional[Dict]) -> tuple[bool, Optional[str]]:
         if not tenant:
             return False, "Tenant not found"
-        
+
         if tenant.get('status') != 'active':
             return False, f"Tenant is {tenant.get('status')}"
-        
+
         return True, None
-    
+
     @staticmethod
     def invalidate_cache(tenant_id: str):
-        """Invalidate cached tenant data"""
-        if tenant_id in _tenant_cache:
-            del _tenant_cache[tenant_id]
-    
+        """Invalidate cached tenant data on every worker (call after the change is committed)"""
+        _drop_local(tenant_id)
+        try:
+            client = _redis_client()
+            client.delete(f"tenant:{tenant_id}")
+            client.publish(TENANT_INVALIDATION_CHANNEL, tenant_id)
+        except Exception as e:
+            with _cache_lock:
+                _stats["redis_errors"] += 1
+            print(f"Tenant cache invalidation not broadcast for {tenant_id}: {e}")
+
+    @staticmethod
+    def on_invalidate(callback: Callable[[str], None]):
+        """Call callback(tenant_id) whenever a tenant is invalidated on any worker"""
+        _invalidation_hooks.append(callback)
+
+    @staticmethod
+    def get_stats() -> Dict:
+        with _cache_lock:
+            stats = dict(_stats)
+            stats["l1_entries"] = len(_tenant_cache)
+        return stats
+
     @staticmethod
     def get_plan(tenant_id: str) -> Optional[str]:
         """Get tenant's subscription plan"""
@@ -10,31 +10,51 @@ from api.utils.usage_tracker import UsageTracker
 scheduler = BackgroundScheduler()
 
 
+def rollup_usage():
+    """Copy today's Redis usage counters into tenant_usage_daily"""
+    try:
+        rows = UsageTracker.rollup_daily()
+        print(f"📊 Rolled up usage for {rows} tenants")
+    except Exception as e:
+        print(f"❌ Usage rollup failed: {e}")
+
+
 def report_daily_usage():
     """Report daily usage to Stripe for all tenants"""
     print("📊 Running daily usage report...")
     
-    # TODO: Migrate to database
-    # for tenant_id, tenant_data in TENANTS_DB.items():
-    #     if tenant_data.get("status") != "active":
-    #         continue
-    #     
-    #     usage = UsageTracker.get_daily_usage(tenant_id)
-    #     customer_id = tenant_data.get("stripe_customer_id")
-    #     subscription_item_id = tenant_data.get("stripe_subscription_item_id")
-    #     
-    #     if not customer_id or not subscription_item_id:
-    #         continue
-    #     
-    #     # Report API calls
-    #     api_calls = usage.get("api_calls", 0)
-    #     if api_calls > 0:
-    #         UsageMeter.report_usage(tenant_id, subscription_item_id, api_calls, "api_calls")
-    #     
-    #     # Report ML inferences
-    #     ml_inferences = usage.get("ml_inferences", 0)
-    #     if ml_inferences > 0:
-    #         UsageMeter.report_usage(tenant_id, subscription_item_id, ml_inferences, "ml_inferences")
+    from datetime import datetime, timedelta
+    from api.models.database_models import Tenant, TenantUsageDaily
+    from config.database import SessionLocal
+    
+    # Final rollup of yesterday before reporting it
+    yesterday = datetime.utcnow().date() - timedelta(days=1)
+    try:
+        UsageTracker.rollup_daily(yesterday.isoformat())
+    except Exception as e:
+        # Report whatever the 5-minute rollups already stored
+        print(f"❌ Final usage rollup for {yesterday} failed: {e}")
+    
+    db = SessionLocal()
+    try:
+        rows = db.query(TenantUsageDaily, Tenant).join(
+            Tenant, Tenant.tenant_id == TenantUsageDaily.tenant_id
+        ).filter(
+            TenantUsageDaily.usage_date == yesterday,
+            Tenant.status == "active"
+        ).all()
+        
+        for usage, tenant in rows:
+            print(f"   {tenant.tenant_id}: {usage.api_calls} API calls, {usage.ml_inferences} ML inferences")
+            
+            # TODO: Stripe subscription items are not stored on Tenant yet
+            # subscription_item_id = ...
+            # if usage.api_calls > 0:
+            #     UsageMeter.report_usage(tenant.tenant_id, subscription_item_id, usage.api_calls, "api_calls")
+            # if usage.ml_inferences > 0:
+            #     UsageMeter.report_usage(tenant.tenant_id, subscription_item_id, usage.ml_inferences, "ml_inferences")
+    finally:
+        db.close()
 
 
 def generate_monthly_invoices():
@@ -57,8 +77,11 @@ def generate_monthly_invoices():
 
 def start_scheduler():
     """Start the usage metering scheduler"""
-    # Report usage daily at midnight
-    scheduler.add_job(report_daily_usage, 'cron', hour=0, minute=0)
+    # Roll today's counters into the database every 5 minutes
+    scheduler.add_job(rollup_usage, 'interval', minutes=5)
+    
+    # Report yesterday's usage shortly after midnight
+    scheduler.add_job(report_daily_usage, 'cron', hour=0, minute=5)
     
     # Generate invoices on 1st of each month
     scheduler.add_job(generate_monthly_invoices, 'cron', day=1, hour=0, minute=0)
@@ -70,3 +93,4 @@ def start_scheduler():
 def stop_scheduler():
     """Stop the scheduler"""
     scheduler.shutdown()
+    UsageTracker.flush()
@@ -1,95 +1,338 @@
 """
 Tenant Usage Tracker
 Copyright © 2024 Paksa IT Solutions
+
+Usage counters shared by every worker through Redis:
+
+    usage:{tenant}:{YYYY-MM-DD}   hash of daily counters (expires after USAGE_RETENTION_DAYS)
+    usage:{tenant}:total          hash of counters since the last reset, storage_bytes, last_reset
+    usage:tenants:{YYYY-MM-DD}    set of tenants with usage that day (drives the rollup)
+
+Increments are accumulated in process and flushed every FLUSH_INTERVAL
+seconds as one pipeline of HINCRBYs, so the request path never waits on
+Redis to count a call. rollup_daily() copies a day's counters into the
+tenant_usage_daily table for billing and history; days that have expired
+from Redis are read back from that table.
 """
 
-from typing import Dict, Optional
-from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from datetime import date as date_type, datetime, timedelta
 from collections import defaultdict
 import threading
+import time
+
+USAGE_METRICS = ("api_calls", "ml_inferences")
+USAGE_RETENTION_DAYS = 35
+USAGE_HISTORY_DAYS = 30  # days of daily_breakdown in the per-tenant admin views
+FLUSH_INTERVAL = 0.25  # seconds between pipelined flushes of local increments
+
+# (tenant_id, day, metric) -> increments not yet written to Redis
+_pending: Dict[Tuple[str, str, str], int] = defaultdict(int)
+_pending_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
+_redis = None
+
+
+def _redis_client():
+    global _redis
+    if _redis is None:
+        from config.redis_client import get_redis
+        _redis = get_redis()
+    return _redis
+
+
+def _today() -> str:
+    return datetime.utcnow().date().isoformat()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        UsageTracker.flush()
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
 
-# In-memory usage tracking (use Redis/DB in production)
-_usage_data: Dict[str, Dict] = defaultdict(lambda: {
-    "api_calls": 0,
-    "storage_bytes": 0,
-    "ml_inferences": 0,
-    "last_reset": datetime.utcnow().isoformat(),
-    "daily_breakdown": defaultdict(lambda: {
-        "api_calls": 0,
-        "storage_bytes": 0,
-        "ml_inferences": 0
-    })
-})
-_usage_lock = threading.Lock()
+
+def _decode(raw: Dict) -> Dict:
+    return {_text(k): _text(v) for k, v in (raw or {}).items()}
 
 
 class UsageTracker:
     """Tracks tenant resource usage"""
-    
+
+    @staticmethod
+    def _increment(tenant_id: str, metric: str, amount: int = 1):
+        global _flusher
+        with _pending_lock:
+            _pending[(tenant_id, _today(), metric)] += amount
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name="usage-flush", daemon=True)
+                _flusher.start()
+
     @staticmethod
     def track_api_call(tenant_id: str, endpoint: str = None):
         """Track API call for tenant"""
         if not tenant_id:
             return
-        
-        with _usage_lock:
-            today = datetime.utcnow().date().isoformat()
-            _usage_data[tenant_id]["api_calls"] += 1
-            _usage_data[tenant_id]["daily_breakdown"][today]["api_calls"] += 1
-    
+        UsageTracker._increment(tenant_id, "api_calls")
+
     @staticmethod
     def track_storage(tenant_id: str, bytes_used: int):
         """Track storage usage for tenant"""
         if not tenant_id:
             return
-        
-        with _usage_lock:
-            _usage_data[tenant_id]["storage_bytes"] = bytes_used
-    
+        try:
+            _redis_client().hset(f"usage:{tenant_id}:total", "storage_bytes", int(bytes_used))
+        except Exception as e:
+            print(f"Failed to record storage usage for {tenant_id}: {e}")
+
     @staticmethod
     def track_ml_inference(tenant_id: str, model_type: str = None):
         """Track ML model inference for tenant"""
         if not tenant_id:
             return
-        
-        with _usage_lock:
-            today = datetime.utcnow().date().isoformat()
-            _usage_data[tenant_id]["ml_inferences"] += 1
-            _usage_data[tenant_id]["daily_breakdown"][today]["ml_inferences"] += 1
-    
+        UsageTracker._increment(tenant_id, "ml_inferences")
+
+    @staticmethod
+    def flush() -> int:
+        """Write accumulated increments to Redis in one pipeline; returns counters written"""
+        with _pending_lock:
+            if not _pending:
+                return 0
+            batch = dict(_pending)
+            _pending.clear()
+
+        ttl = USAGE_RETENTION_DAYS * 86400
+        try:
+            pipe = _redis_client().pipeline(transaction=False)
+            for (tenant_id, day, metric), amount in batch.items():
+                pipe.hincrby(f"usage:{tenant_id}:{day}", metric, amount)
+                pipe.expire(f"usage:{tenant_id}:{day}", ttl)
+                pipe.hincrby(f"usage:{tenant_id}:total", metric, amount)
+                pipe.sadd(f"usage:tenants:{day}", tenant_id)
+                pipe.expire(f"usage:tenants:{day}", ttl)
+            pipe.execute()
+        except Exception as e:
+            # Keep the counts for the next flush rather than lose billable usage
+            with _pending_lock:
+                for key, amount in batch.items():
+                    _pending[key] += amount
+            print(f"Usage flush failed, {len(batch)} counters kept for retry: {e}")
+            return 0
+        return len(batch)
+
     @staticmethod
-    def get_usage(tenant_id: str) -> Dict:
-        """Get usage statistics for tenant"""
-        return dict(_usage_data.get(tenant_id, {}))
-    
+    def _pending_for(tenant_id: str, day: Optional[str] = None) -> Dict[str, int]:
+        counts = defaultdict(int)
+        with _pending_lock:
+            for (pending_tenant, pending_day, metric), amount in _pending.items():
+                if pending_tenant == tenant_id and (day is None or pending_day == day):
+                    counts[metric] += amount
+        return counts
+
+    @staticmethod
+    def get_usage(tenant_id: str, history_days: int = 0, db=None) -> Dict:
+        """Get usage statistics for tenant
+
+        daily_breakdown holds today from Redis plus, with history_days, the
+        previous days since the last reset from tenant_usage_daily.
+        """
+        today = _today()
+        try:
+            pipe = _redis_client().pipeline(transaction=False)
+            pipe.hgetall(f"usage:{tenant_id}:total")
+            pipe.hgetall(f"usage:{tenant_id}:{today}")
+            total, daily = (_decode(raw) for raw in pipe.execute())
+        except Exception as e:
+            print(f"Failed to read usage for {tenant_id}: {e}")
+            total, daily = {}, {}
+
+        pending_total = UsageTracker._pending_for(tenant_id)
+        pending_today = UsageTracker._pending_for(tenant_id, today)
+        usage = {metric: int(total.get(metric, 0)) + pending_total[metric] for metric in USAGE_METRICS}
+        usage["storage_bytes"] = int(total.get("storage_bytes", 0))
+        usage["last_reset"] = total.get("last_reset")
+        usage["daily_breakdown"] = {
+            today: {metric: int(daily.get(metric, 0)) + pending_today[metric] for metric in USAGE_METRICS}
+        }
+        usage["daily_breakdown"][today]["storage_bytes"] = usage["storage_bytes"]
+        if history_days > 0:
+            since = datetime.utcnow().date() - timedelta(days=history_days)
+            if usage["last_reset"]:
+                since = max(since, datetime.fromisoformat(usage["last_reset"]).date())
+            history = UsageTracker._stored_history(tenant_id, since, db)
+            history.pop(today, None)  # Redis is ahead of the last rollup
+            usage["daily_breakdown"] = dict(sorted({**history, **usage["daily_breakdown"]}.items()))
+        return usage
+
+    @staticmethod
+    def _stored_history(tenant_id: str, since: date_type, db=None) -> Dict[str, Dict]:
+        """Rolled-up daily usage from `since` on, keyed by ISO date, in one query"""
+        from api.models.database_models import TenantUsageDaily
+        from config.database import SessionLocal
+
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            rows = db.query(TenantUsageDaily).filter(
+                TenantUsageDaily.tenant_id == tenant_id,
+                TenantUsageDaily.usage_date >= since
+            ).all()
+            return {
+                row.usage_date.isoformat(): {
+                    "api_calls": row.api_calls,
+                    "ml_inferences": row.ml_inferences,
+                    "storage_bytes": row.storage_bytes
+                }
+                for row in rows
+            }
+        except Exception as e:
+            print(f"Failed to read stored usage for {tenant_id}: {e}")
+            return {}
+        finally:
+            if own_session:
+                db.close()
+
     @staticmethod
     def get_all_usage() -> Dict:
-        """Get usage statistics for all tenants"""
-        return {tid: dict(data) for tid, data in _usage_data.items()}
-    
+        """Get usage statistics for all tenants active today"""
+        try:
+            tenants = {_text(m) for m in _redis_client().smembers(f"usage:tenants:{_today()}")}
+        except Exception as e:
+            print(f"Failed to list tenants with usage: {e}")
+            tenants = set()
+        with _pending_lock:
+            tenants.update(tenant_id for tenant_id, _, _ in _pending)
+        return {tenant_id: UsageTracker.get_usage(tenant_id) for tenant_id in sorted(tenants)}
+
     @staticmethod
     def reset_usage(tenant_id: str):
         """Reset usage counters for tenant"""
-        with _usage_lock:
-            if tenant_id in _usage_data:
-                _usage_data[tenant_id] = {
-                    "api_calls": 0,
-                    "storage_bytes": 0,
-                    "ml_inferences": 0,
-                    "last_reset": datetime.utcnow().isoformat(),
-                    "daily_breakdown": defaultdict(lambda: {
-                        "api_calls": 0,
-                        "storage_bytes": 0,
-                        "ml_inferences": 0
-                    })
-                }
-    
+        today = _today()
+        with _pending_lock:
+            for key in [k for k in _pending if k[0] == tenant_id]:
+                del _pending[key]
+        pipe = _redis_client().pipeline()
+        pipe.delete(f"usage:{tenant_id}:total", f"usage:{tenant_id}:{today}")
+        pipe.hset(f"usage:{tenant_id}:total", "last_reset", datetime.utcnow().isoformat())
+        pipe.execute()
+
     @staticmethod
     def get_daily_usage(tenant_id: str, date: str = None) -> Dict:
         """Get usage for specific day"""
         if not date:
-            date = datetime.utcnow().date().isoformat()
-        
-        tenant_data = _usage_data.get(tenant_id, {})
-        daily = tenant_data.get("daily_breakdown", {})
-        return dict(daily.get(date, {"api_calls": 0, "storage_bytes": 0, "ml_inferences": 0}))
+            date = _today()
+
+        try:
+            pipe = _redis_client().pipeline(transaction=False)
+            pipe.hgetall(f"usage:{tenant_id}:{date}")
+            pipe.hget(f"usage:{tenant_id}:total", "storage_bytes")
+            daily, storage_bytes = pipe.execute()
+            daily = _decode(daily)
+        except Exception as e:
+            print(f"Failed to read daily usage for {tenant_id}: {e}")
+            daily, storage_bytes = {}, None
+
+        if not daily and date < _today():
+            # Expired from Redis: fall back to the rolled-up history
+            return UsageTracker._stored_daily_usage(tenant_id, date)
+
+        pending = UsageTracker._pending_for(tenant_id, date)
+        usage = {metric: int(daily.get(metric, 0)) + pending[metric] for metric in USAGE_METRICS}
+        usage["storage_bytes"] = int(storage_bytes or 0)
+        return usage
+
+    @staticmethod
+    def _stored_daily_usage(tenant_id: str, date: str) -> Dict:
+        from api.models.database_models import TenantUsageDaily
+        from config.database import SessionLocal
+
+        usage = {"api_calls": 0, "storage_bytes": 0, "ml_inferences": 0}
+        db = SessionLocal()
+        try:
+            row = db.query(TenantUsageDaily).filter(
+                TenantUsageDaily.tenant_id == tenant_id,
+                TenantUsageDaily.usage_date == date_type.fromisoformat(date)
+            ).first()
+            if row:
+                usage = {"api_calls": row.api_calls, "storage_bytes": row.storage_bytes, "ml_inferences": row.ml_inferences}
+        except Exception as e:
+            print(f"Failed to read stored usage for {tenant_id}: {e}")
+        finally:
+            db.close()
+        return usage
+
+    @staticmethod
+    def rollup_daily(date: str = None, db=None) -> int:
+        """Copy one day's Redis counters into tenant_usage_daily (idempotent); returns rows written"""
+        from api.models.database_models import TenantUsageDaily
+        from config.database import SessionLocal
+
+        date = date or _today()
+        UsageTracker.flush()
+        client = _redis_client()
+        tenants = sorted(_text(m) for m in client.smembers(f"usage:tenants:{date}"))
+        if not tenants:
+            return 0
+
+        pipe = client.pipeline(transaction=False)
+        for tenant_id in tenants:
+            pipe.hgetall(f"usage:{tenant_id}:{date}")
+            pipe.hget(f"usage:{tenant_id}:total", "storage_bytes")
+        results = pipe.execute()
+
+        now = datetime.utcnow()
+        rows = []
+        for i, tenant_id in enumerate(tenants):
+            daily = _decode(results[2 * i])
+            rows.append({
+                "tenant_id": tenant_id,
+                "usage_date": date_type.fromisoformat(date),
+                "api_calls": int(daily.get("api_calls", 0)),
+                "ml_inferences": int(daily.get("ml_inferences", 0)),
+                "storage_bytes": int(results[2 * i + 1] or 0),
+                "updated_at": now
+            })
+
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            table = TenantUsageDaily.__table__
+            dialect = db.get_bind().dialect.name
+            if dialect in ("postgresql", "sqlite"):
+                if dialect == "postgresql":
+                    from sqlalchemy.dialects.postgresql import insert
+                else:
+                    from sqlalchemy.dialects.sqlite import insert
+
+                # Redis holds the day's running totals, so the rollup overwrites rather than adds
+                stmt = insert(table).values(rows)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["tenant_id", "usage_date"],
+                    set_={column: stmt.excluded[column] for column in ("api_calls", "ml_inferences", "storage_bytes", "updated_at")}
+                )
+                db.execute(stmt)
+            else:
+                existing = {
+                    r.tenant_id: r for r in db.query(TenantUsageDaily).filter(
+                        TenantUsageDaily.usage_date == rows[0]["usage_date"],
+                        TenantUsageDaily.tenant_id.in_(tenants)
+                    ).all()
+                }
+                for row in rows:
+                    current = existing.get(row["tenant_id"])
+                    if current:
+                        for column in ("api_calls", "ml_inferences", "storage_bytes", "updated_at"):
+                            setattr(current, column, row[column])
+                    else:
+                        db.add(TenantUsageDaily(**row))
+            db.commit()
+            return len(rows)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if own_session:
+                db.close()
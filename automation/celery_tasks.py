@@ -4,6 +4,7 @@ Copyright © 2024 Paksa IT Solutions
 """
 
 from celery import Celery
+from celery.schedules import crontab
 from config.settings import settings
 
 celery_app = Celery(
@@ -18,6 +19,36 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    beat_schedule={
+        'rebuild-cooccurrence-index': {
+            'task': 'automation.celery_tasks.rebuild_cooccurrence_index',
+            'schedule': crontab(hour=2, minute=0),
+        },
+        'rebuild-interaction-matrix': {
+            'task': 'automation.celery_tasks.rebuild_interaction_matrix',
+            'schedule': crontab(minute=15),
+        },
+        'compact-visual-embeddings': {
+            'task': 'automation.celery_tasks.compact_visual_embeddings',
+            'schedule': crontab(hour=3, minute=0),
+        },
+        'refresh-customer-segments': {
+            'task': 'automation.celery_tasks.refresh_customer_segments',
+            'schedule': crontab(hour=1, minute=30),
+        },
+        'rebuild-sales-rollup': {
+            'task': 'automation.celery_tasks.rebuild_sales_rollup',
+            'schedule': crontab(hour=0, minute=30),
+        },
+        'plan-inventory-restock': {
+            'task': 'automation.celery_tasks.plan_inventory_restock',
+            'schedule': crontab(hour=4, minute=0),
+        },
+        'sweep-catalog-pricing': {
+            'task': 'automation.celery_tasks.sweep_catalog_pricing',
+            'schedule': crontab(hour=4, minute=30),
+        },
+    },
 )
 
 
@@ -38,6 +69,95 @@ def train_forecasting_model():
     return {"status": "completed"}
 
 
+@celery_app.task
+def rebuild_cooccurrence_index():
+    """Rebuild the cross-sell co-occurrence index from all orders and persist it"""
+    from ml_models.recommendation.cooccurrence import CoOccurrenceIndex
+    
+    index = CoOccurrenceIndex()
+    index.rebuild()
+    index.save()
+    return {"status": "completed", **index.get_stats()}
+
+
+@celery_app.task
+def rebuild_interaction_matrix():
+    """Rebuild the customer x product matrix used for personalized recommendations"""
+    from ml_models.recommendation.interaction_matrix import InteractionMatrix
+    
+    matrix = InteractionMatrix()
+    matrix.rebuild()
+    matrix.save()
+    return {"status": "completed", **matrix.get_stats()}
+
+
+@celery_app.task
+def export_recommendation_embeddings():
+    """Export product-tower embeddings of the active model for two-tower retrieval"""
+    from ml_models.recommendation.inference import RecommendationEngine
+    from ml_models.recommendation.retrieval import TwoTowerRetriever
+    
+    engine = RecommendationEngine()
+    if engine.model is None:
+        return {"status": "skipped", "reason": "model not trained"}
+    
+    exported = TwoTowerRetriever(engine.model).export_from_catalog()
+    return {"status": "completed", "products": exported}
+
+
+@celery_app.task
+def compact_visual_embeddings():
+    """Fold product embeddings updated since the last build into the visual search store"""
+    from ml_models.visual_search.embedding_store import EmbeddingStore
+    
+    store = EmbeddingStore()
+    store.load()
+    store.sync_from_db(since=store.built_at)
+    store.compact()
+    store.save()
+    return {"status": "completed", **store.get_stats()}
+
+
+@celery_app.task
+def refresh_customer_segments():
+    """Recompute RFM segment and lifetime value for every customer"""
+    from ml_models.segmentation.inference import SegmentationEngine
+    
+    return {"status": "completed", **SegmentationEngine().segment_all()}
+
+
+@celery_app.task
+def rebuild_sales_rollup(days: int = 7):
+    """Recompute the trailing days of product_daily_sales to pick up edited or late orders"""
+    from data_pipeline.sales_rollup import SalesRollup
+    from datetime import date, timedelta
+    
+    rows = SalesRollup.rebuild(since=date.today() - timedelta(days=days))
+    return {"status": "completed", "rows": rows}
+
+
+@celery_app.task
+def plan_inventory_restock():
+    """Nightly restock plan for the whole catalog from one batch forecast"""
+    from decision_engine.engine import DecisionEngine
+    
+    decisions = DecisionEngine().restock_decisions()
+    restock = {
+        product_id: decision["quantity"]
+        for product_id, decision in decisions.items() if decision["should_restock"]
+    }
+    return {"status": "completed", "products": len(decisions), "restock": restock}
+
+
+@celery_app.task
+def sweep_catalog_pricing(incremental: bool = True):
+    """Nightly pricing recommendations for products whose stock or sales changed"""
+    from ml_models.pricing.inference import PricingEngine
+    
+    result = PricingEngine().price_catalog(incremental=incremental)
+    return {"status": "completed", "products": result["products"], "repriced": result["repriced"]}
+
+
 @celery_app.task
 def send_abandoned_cart_email(customer_id: int, cart_items: list):
     """Send abandoned cart recovery email"""
@@ -7,6 +7,7 @@ Connects AI decisions to email, WhatsApp, and campaigns
 
 from typing import Dict, List
 from datetime import datetime, timedelta
+from sqlalchemy import func
 from automation.celery_tasks import celery_app
 from decision_engine.engine import DecisionEngine
 from config.database import SessionLocal
@@ -81,6 +82,9 @@ class MarketingAutomation:
         
         db = SessionLocal()
         
+        # Refresh stored segments in one pass before filtering on them
+        self.decision_engine.segmentation_engine.segment_all(db=db)
+        
         for segment in targeting['segments']:
             customers = db.query(Customer).filter(
                 Customer.segment == segment
@@ -115,15 +119,16 @@ class MarketingAutomation:
         # Find customers inactive for 60+ days
         cutoff_date = datetime.now() - timedelta(days=60)
         
-        inactive_customers = db.query(Customer).join(Order).filter(
-            Order.created_at < cutoff_date
+        # Refresh stored segments in one pass instead of predicting per customer
+        self.decision_engine.segmentation_engine.segment_all(db=db)
+        
+        inactive_customers = db.query(Customer).join(Order).group_by(Customer.id).having(
+            func.max(Order.created_at) < cutoff_date
         ).all()
         
         for customer in inactive_customers:
-            segment = self.decision_engine.segmentation_engine.predict(customer.id)
-            
             # High-value customers get bigger incentive
-            if segment['segment'] == 'segment_0':
+            if customer.segment == 'segment_0':
                 discount = 20
             else:
                 discount = 15
@@ -0,0 +1,115 @@
+"""
+Shared Redis Clients
+Copyright © 2024 Paksa IT Solutions
+
+Every subsystem talks to Redis through one sized connection pool per
+process instead of building its own client. get_redis() returns a client on
+the shared blocking pool: when all REDIS_MAX_CONNECTIONS are checked out,
+threads wait up to REDIS_POOL_TIMEOUT for one to come back rather than
+opening more (redis-py resets the pool in forked workers). get_async_redis()
+returns a redis.asyncio client for code running on the event loop; asyncio
+connections belong to the loop that opened them, so each running loop gets
+its own pool of the same size.
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from typing import Dict
+from config.settings import settings
+
+_sync_client = None
+# event loop -> redis.asyncio client; entries go away with their loop
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _pool_kwargs() -> Dict:
+    return {
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+        "timeout": settings.REDIS_POOL_TIMEOUT,
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": settings.REDIS_SOCKET_TIMEOUT,
+        "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL
+    }
+
+
+def get_redis():
+    """Process-wide sync client on the shared connection pool"""
+    global _sync_client
+    if _sync_client is None:
+        with _lock:
+            if _sync_client is None:
+                import redis
+                pool = redis.BlockingConnectionPool.from_url(settings.REDIS_URL, **_pool_kwargs())
+                _sync_client = redis.Redis(connection_pool=pool)
+    return _sync_client
+
+
+def get_async_redis():
+    """redis.asyncio client on the running event loop's connection pool"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        import redis.asyncio as aioredis
+        with _lock:
+            client = _async_clients.get(loop)
+            if client is None:
+                pool = aioredis.BlockingConnectionPool.from_url(settings.REDIS_URL, **_pool_kwargs())
+                client = _async_clients[loop] = aioredis.Redis(connection_pool=pool)
+    return client
+
+
+async def close_async_redis():
+    """Disconnect the running loop's pool (call on shutdown)"""
+    with _lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.connection_pool.disconnect()
+
+
+def check_health() -> Dict:
+    """Ping Redis through the shared pool"""
+    try:
+        start_time = time.perf_counter()
+        get_redis().ping()
+        latency = (time.perf_counter() - start_time) * 1000
+        return {"status": "healthy", "latency_ms": round(latency, 2)}
+    except Exception as e:
+        return {"status": "unhealthy", "error": str(e)}
+
+
+async def check_health_async() -> Dict:
+    """check_health without blocking the event loop"""
+    try:
+        start_time = time.perf_counter()
+        await get_async_redis().ping()
+        latency = (time.perf_counter() - start_time) * 1000
+        return {"status": "healthy", "latency_ms": round(latency, 2)}
+    except Exception as e:
+        return {"status": "unhealthy", "error": str(e)}
+
+
+def get_pool_stats() -> Dict:
+    """Connections opened, checked out and idle for the sync pool and each event loop's pool"""
+    stats = {
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+        "sync": None,
+        "async": []
+    }
+
+    if _sync_client is not None:
+        pool = _sync_client.connection_pool
+        created = len(pool._connections)
+        idle = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+        stats["sync"] = {"created": created, "in_use": created - idle, "idle": idle}
+
+    with _lock:
+        clients = list(_async_clients.values())
+    for client in clients:
+        pool = client.connection_pool
+        idle = len(pool._available_connections)
+        in_use = len(pool._in_use_connections)
+        stats["async"].append({"created": idle + in_use, "in_use": in_use, "idle": idle})
+    return stats
@@ -28,6 +28,7 @@ class Settings(BaseSettings):
     WOOCOMMERCE_URL: str
     WOOCOMMERCE_CONSUMER_KEY: str
     WOOCOMMERCE_CONSUMER_SECRET: str
+    WOOCOMMERCE_SYNC_CONCURRENCY: int = 4  # pages fetched in parallel during a full sync
     
     # Database
     DATABASE_URL: str
@@ -36,6 +37,10 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str
     REDIS_CACHE_TTL: int = 3600
+    REDIS_MAX_CONNECTIONS: int = 50  # per process, per pool (sync, and each event loop)
+    REDIS_POOL_TIMEOUT: float = 5.0  # seconds to wait for a free pooled connection
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30  # seconds idle before a pooled connection is pinged
     
     # Celery
     CELERY_BROKER_URL: str
@@ -54,6 +59,16 @@ class Settings(BaseSettings):
     # Models
     MODEL_RETRAIN_INTERVAL_DAYS: int = 7
     MIN_TRAINING_SAMPLES: int = 1000
+    RECOMMENDATION_SPARSE_CF_ENABLED: bool = True  # False falls back to per-request SQL CF
+    RECOMMENDATION_BATCH_MAX_SIZE: int = 64  # jobs scored together by the batch worker
+    RECOMMENDATION_BATCH_MAX_WAIT_MS: int = 20  # how long a batch waits to fill once its first job arrives
+    BATCH_WORKERS_MIN: int = 1
+    BATCH_WORKERS_MAX: int = 4
+    BATCH_WORKER_BACKLOG: int = 200  # queued jobs per worker process before scaling up
+    BATCH_WORKER_MAX_JOB_AGE: float = 10.0  # seconds the oldest job may wait before adding a worker
+    BATCH_RESULT_MAX_WAIT: float = 30.0  # longest a GET /batch/{job_id}?wait= request is held open
+    BATCH_STREAM_MAX_SECONDS: float = 300.0  # longest a batch result event stream stays open
+    BATCH_STREAM_MAX_JOBS: int = 500  # job IDs one event stream may watch
     
     # Email
     SMTP_HOST: Optional[str] = None
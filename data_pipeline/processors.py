@@ -6,6 +6,9 @@ Copyright © 2024 Paksa IT Solutions
 from typing import Dict
 from config.database import SessionLocal
 from api.models.database_models import Order, Customer, Product
+from ml_models.recommendation.cooccurrence import get_cooccurrence_index
+from ml_models.recommendation.product_cards import ProductCards
+from data_pipeline.sync_woocommerce import WooCommerceSync
 from datetime import datetime
 
 
@@ -16,7 +19,21 @@ def process_order(order_data: Dict):
         # Process order data
         print(f"Processing order: {order_data.get('id')}")
         
+        # Store the order and roll it into daily product sales
+        if WooCommerceSync.save_order(db, order_data):
+            db.commit()
+        
         # Trigger recommendation update
+        wc_product_ids = [
+            item.get('product_id') for item in order_data.get('line_items', [])
+            if item.get('product_id')
+        ]
+        if wc_product_ids:
+            product_ids = [p.id for p in db.query(Product.id).filter(
+                Product.woocommerce_id.in_(wc_product_ids)
+            ).all()]
+            get_cooccurrence_index().add_order(product_ids)
+        
         # Trigger inventory forecast update
         # Send confirmation email
         
@@ -43,8 +60,46 @@ def process_product(product_data: Dict):
     try:
         print(f"Processing product: {product_data.get('id')}")
         
-        # Update product embeddings
+        product = db.query(Product).filter(
+            Product.woocommerce_id == product_data.get('id')
+        ).first()
+        if product:
+            images = product_data.get('images') or [{}]
+            image_url = images[0].get('src') or product.image_url
+            ProductCards.upsert({
+                "id": product.id,
+                "name": product_data.get('name', product.name),
+                "price": product_data.get('price', product.price),
+                "image_url": image_url
+            })
+            
+            # Update product embeddings
+            if image_url and (product.embedding is None or image_url != product.image_url):
+                _update_product_embedding(db, product, image_url)
+        
         # Recalculate recommendations
         
     finally:
         db.close()
+
+
+def _update_product_embedding(db, product: Product, image_url: str):
+    """Embed the product image into the visual search store and keep the JSON copy"""
+    import requests
+    from ml_models.visual_search.inference import get_visual_search_engine
+    
+    engine = get_visual_search_engine()
+    if engine.model is None:
+        return
+    
+    try:
+        response = requests.get(image_url, timeout=10)
+        response.raise_for_status()
+        embedding = engine.index_product(product.id, response.content)
+        
+        product.image_url = image_url
+        product.embedding = embedding.tolist()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Embedding update failed for product {product.id}: {e}")
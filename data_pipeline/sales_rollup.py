@@ -0,0 +1,258 @@
+"""
+Product Daily Sales Rollup
+Copyright © 2024 Paksa IT Solutions
+
+Materialized (tenant, product, day) sales used by forecasting, pricing and
+trending recommendations instead of re-aggregating orders JOIN order_items
+on every call. Orders are added incrementally as they are stored; rebuild()
+recomputes the table (or a trailing window) in one INSERT ... SELECT.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+DEFAULT_TENANT = "default"
+
+
+class SalesRollup:
+    """Reads and writes the product_daily_sales table"""
+
+    @staticmethod
+    def record_order(
+        db,
+        created_at: datetime,
+        lines: Iterable[Tuple[int, int, float]],
+        tenant_id: str = DEFAULT_TENANT
+    ):
+        """Add an order's (product_id, quantity, price) lines to its sales day (caller commits)"""
+        SalesRollup.record_orders(db, [(created_at, lines)], tenant_id)
+
+    @staticmethod
+    def record_orders(
+        db,
+        orders: Iterable[Tuple[datetime, Iterable[Tuple[int, int, float]]]],
+        tenant_id: str = DEFAULT_TENANT
+    ):
+        """Add several orders' (created_at, lines) to their sales days in one statement (caller commits)"""
+        from api.models.database_models import Product, ProductDailySales
+
+        totals: Dict[Tuple[int, date], List[float]] = defaultdict(lambda: [0, 0, 0.0])
+        for created_at, lines in orders:
+            sales_date = (created_at or datetime.utcnow()).date()
+            for product_id, quantity, price in lines:
+                entry = totals[(product_id, sales_date)]
+                entry[0] += quantity or 0
+                entry[1] += 1
+                entry[2] += (quantity or 0) * (price or 0.0)
+        if not totals:
+            return
+
+        product_ids = list({product_id for product_id, _ in totals})
+        categories = dict(db.query(Product.id, Product.category).filter(Product.id.in_(product_ids)).all())
+        rows = [{
+            "tenant_id": tenant_id,
+            "product_id": product_id,
+            "category": categories.get(product_id),
+            "sales_date": sales_date,
+            "units": int(units),
+            "order_lines": int(order_lines),
+            "revenue": float(revenue)
+        } for (product_id, sales_date), (units, order_lines, revenue) in totals.items()]
+
+        table = ProductDailySales.__table__
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+
+            # Atomic increment so concurrent webhook workers cannot lose updates
+            stmt = insert(table).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["tenant_id", "product_id", "sales_date"],
+                set_={
+                    "units": table.c.units + stmt.excluded.units,
+                    "order_lines": table.c.order_lines + stmt.excluded.order_lines,
+                    "revenue": table.c.revenue + stmt.excluded.revenue
+                }
+            )
+            db.execute(stmt)
+            return
+
+        existing = {
+            (r.product_id, r.sales_date): r for r in db.query(ProductDailySales).filter(
+                ProductDailySales.tenant_id == tenant_id,
+                ProductDailySales.sales_date.in_(list({sales_date for _, sales_date in totals})),
+                ProductDailySales.product_id.in_(product_ids)
+            ).with_for_update().all()
+        }
+        for row in rows:
+            current = existing.get((row["product_id"], row["sales_date"]))
+            if current:
+                current.units += row["units"]
+                current.order_lines += row["order_lines"]
+                current.revenue += row["revenue"]
+            else:
+                db.add(ProductDailySales(**row))
+
+    @staticmethod
+    def rebuild(db=None, since: Optional[date] = None, tenant_id: str = DEFAULT_TENANT) -> int:
+        """Recompute the rollup from orders (only days on or after `since` if given)"""
+        from config.database import SessionLocal
+        from api.models.database_models import Order, OrderItem, Product, ProductDailySales
+        from sqlalchemy import func, literal, select, insert
+
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            delete = db.query(ProductDailySales).filter(ProductDailySales.tenant_id == tenant_id)
+            if since:
+                delete = delete.filter(ProductDailySales.sales_date >= since)
+            delete.delete(synchronize_session=False)
+
+            sales_date = func.date(Order.created_at)
+            aggregate = select(
+                literal(tenant_id),
+                OrderItem.product_id,
+                Product.category,
+                sales_date,
+                func.coalesce(func.sum(OrderItem.quantity), 0),
+                func.count(OrderItem.id),
+                func.coalesce(func.sum(OrderItem.quantity * OrderItem.price), 0.0)
+            ).select_from(Order).join(OrderItem).join(Product).group_by(
+                OrderItem.product_id, Product.category, sales_date
+            )
+            if since:
+                aggregate = aggregate.where(Order.created_at >= datetime.combine(since, datetime.min.time()))
+
+            result = db.execute(insert(ProductDailySales).from_select(
+                ["tenant_id", "product_id", "category", "sales_date", "units", "order_lines", "revenue"],
+                aggregate
+            ))
+            db.commit()
+            return result.rowcount
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if own_session:
+                db.close()
+
+    @staticmethod
+    def _window(db, days: int, tenant_id: str, *columns):
+        """Query over the trailing `days` days of the rollup"""
+        from api.models.database_models import ProductDailySales
+
+        start = (datetime.utcnow() - timedelta(days=days)).date()
+        return db.query(*columns).filter(
+            ProductDailySales.tenant_id == tenant_id,
+            ProductDailySales.sales_date >= start
+        )
+
+    @staticmethod
+    def daily_units(
+        db,
+        days: int = 90,
+        product_id: Optional[int] = None,
+        category: Optional[str] = None,
+        tenant_id: str = DEFAULT_TENANT
+    ) -> List[Tuple[date, float]]:
+        """(day, units) for a product, a category or the whole catalog, oldest first"""
+        from api.models.database_models import ProductDailySales
+        from sqlalchemy import func
+
+        query = SalesRollup._window(db, days, tenant_id, ProductDailySales.sales_date, func.sum(ProductDailySales.units))
+        if product_id:
+            query = query.filter(ProductDailySales.product_id == product_id)
+        elif category:
+            query = query.filter(ProductDailySales.category == category)
+
+        rows = query.group_by(ProductDailySales.sales_date).order_by(ProductDailySales.sales_date).all()
+        return [(d, float(units or 0)) for d, units in rows]
+
+    @staticmethod
+    def daily_matrix(
+        db,
+        days: int = 90,
+        product_ids: Optional[Iterable[int]] = None,
+        category: Optional[str] = None,
+        tenant_id: str = DEFAULT_TENANT
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Dense (products x days) units matrix, oldest day first
+
+        Returns (product_ids, units, has_sales). Requested products without
+        sales get all-zero rows; without product_ids, every product with
+        sales in the window (optionally in one category) is included.
+        """
+        from api.models.database_models import ProductDailySales
+
+        start = (datetime.utcnow() - timedelta(days=days)).date()
+        query = SalesRollup._window(
+            db, days, tenant_id,
+            ProductDailySales.product_id, ProductDailySales.sales_date, ProductDailySales.units
+        )
+        if product_ids is not None:
+            product_ids = np.unique(np.fromiter(product_ids, dtype=np.int64))
+            # Large id lists are filtered after the scan rather than sent as an IN clause
+            if len(product_ids) <= 1000:
+                query = query.filter(ProductDailySales.product_id.in_(product_ids.tolist()))
+        elif category:
+            query = query.filter(ProductDailySales.category == category)
+        rows = query.all()
+
+        row_products = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        day_offsets = np.fromiter(((r[1] - start).days for r in rows), dtype=np.int64, count=len(rows))
+        row_units = np.fromiter((r[2] or 0 for r in rows), dtype=np.float64, count=len(rows))
+
+        if product_ids is None:
+            product_ids = np.unique(row_products)
+        else:
+            keep = np.isin(row_products, product_ids)
+            row_products, day_offsets, row_units = row_products[keep], day_offsets[keep], row_units[keep]
+        positions = np.searchsorted(product_ids, row_products)
+
+        width = (datetime.utcnow().date() - start).days + 1
+        units = np.zeros((len(product_ids), width), dtype=np.float64)
+        has_sales = np.zeros((len(product_ids), width), dtype=bool)
+        np.add.at(units, (positions, day_offsets), row_units)
+        has_sales[positions, day_offsets] = True
+        return product_ids, units, has_sales
+
+    @staticmethod
+    def monthly_units(db, category: str, days: int = 365, tenant_id: str = DEFAULT_TENANT) -> Dict[int, float]:
+        """Units per calendar month for a category"""
+        months: Dict[int, float] = defaultdict(float)
+        for sales_date, units in SalesRollup.daily_units(db, days=days, category=category, tenant_id=tenant_id):
+            months[sales_date.month] += units
+        return dict(months)
+
+    @staticmethod
+    def units_by_product(
+        db,
+        days: int = 30,
+        product_ids: Optional[Iterable[int]] = None,
+        tenant_id: str = DEFAULT_TENANT
+    ) -> Dict[int, float]:
+        """Units sold per product over the window (products without sales are absent)"""
+        from api.models.database_models import ProductDailySales
+        from sqlalchemy import func
+
+        query = SalesRollup._window(db, days, tenant_id, ProductDailySales.product_id, func.sum(ProductDailySales.units))
+        if product_ids is not None:
+            query = query.filter(ProductDailySales.product_id.in_(list(product_ids)))
+        return {pid: float(units or 0) for pid, units in query.group_by(ProductDailySales.product_id).all()}
+
+    @staticmethod
+    def top_products(db, days: int = 30, limit: int = 10, tenant_id: str = DEFAULT_TENANT) -> List[Tuple[int, int]]:
+        """(product_id, order_lines) for the most frequently ordered products"""
+        from api.models.database_models import ProductDailySales
+        from sqlalchemy import func
+
+        lines = func.sum(ProductDailySales.order_lines)
+        rows = SalesRollup._window(db, days, tenant_id, ProductDailySales.product_id, lines).group_by(
+            ProductDailySales.product_id
+        ).order_by(lines.desc()).limit(limit).all()
+        return [(pid, int(count or 0)) for pid, count in rows]
@@ -1,136 +1,291 @@
 """
 WooCommerce Data Sync
 Copyright © 2024 Paksa IT Solutions
+
+A full sync reads the first page of a list endpoint to learn the page count
+(X-WP-TotalPages), then fetches the remaining pages on a bounded thread pool
+(WOOCOMMERCE_SYNC_CONCURRENCY) while the calling thread writes them. Each
+page is written in a few set-based statements:
+- one query per page loads the woocommerce_id -> id maps it needs
+- customers and products are upserted with INSERT ... ON CONFLICT
+- new orders are inserted with ON CONFLICT DO NOTHING ... RETURNING
+- their items go in with one executemany
+- the sales rollup is updated with one upsert
+Every page is committed on its own, so an interrupted sync can simply be run
+again.
 """
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 from woocommerce import API
 from config.settings import settings
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from api.models.database_models import Customer, Product, Order, OrderItem
+from data_pipeline.sales_rollup import SalesRollup
 from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+UPSERT_CHUNK = 500  # rows per INSERT statement
+
+
+def _dialect_insert(db: Session):
+    """The bind's INSERT construct if it supports ON CONFLICT, else None"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def _chunks(rows: List[Dict]) -> Iterator[List[Dict]]:
+    for start in range(0, len(rows), UPSERT_CHUNK):
+        yield rows[start:start + UPSERT_CHUNK]
+
+
+def _unique(records: List[Dict], key: str = "id") -> List[Dict]:
+    """Last copy of each record; pages can repeat one that moved while the sync was running"""
+    return list({record[key]: record for record in records}.values())
+
+
+def _parse_date(value: Optional[str]) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00')) if value else datetime.utcnow()
 
 
 class WooCommerceSync:
     """Sync data from WooCommerce to local database"""
-    
-    def __init__(self):
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        consumer_key: Optional[str] = None,
+        consumer_secret: Optional[str] = None,
+        concurrency: Optional[int] = None
+    ):
         self.wcapi = API(
-            url=settings.WOOCOMMERCE_URL,
-            consumer_key=settings.WOOCOMMERCE_CONSUMER_KEY,
-            consumer_secret=settings.WOOCOMMERCE_CONSUMER_SECRET,
+            url=url or settings.WOOCOMMERCE_URL,
+            consumer_key=consumer_key or settings.WOOCOMMERCE_CONSUMER_KEY,
+            consumer_secret=consumer_secret or settings.WOOCOMMERCE_CONSUMER_SECRET,
             version="wc/v3",
             timeout=30
         )
-    
-    def sync_customers(self, db: Session, page: int = 1, per_page: int = 100):
-        """Sync customers from WooCommerce"""
-        
-        response = self.wcapi.get("customers", params={"page": page, "per_page": per_page})
-        customers = response.json()
-        
-        for wc_customer in customers:
-            customer = db.query(Customer).filter(
-                Customer.woocommerce_id == wc_customer['id']
-            ).first()
-            
-            if not customer:
-                customer = Customer(woocommerce_id=wc_customer['id'])
-            
-            customer.email = wc_customer.get('email')
-            customer.first_name = wc_customer.get('first_name')
-            customer.last_name = wc_customer.get('last_name')
-            customer.total_spent = float(wc_customer.get('total_spent', 0))
-            customer.order_count = wc_customer.get('orders_count', 0)
-            customer.updated_at = datetime.utcnow()
-            
-            db.add(customer)
-        
-        db.commit()
-        return len(customers)
-    
-    def sync_products(self, db: Session, page: int = 1, per_page: int = 100):
-        """Sync products from WooCommerce"""
-        
-        response = self.wcapi.get("products", params={"page": page, "per_page": per_page})
-        products = response.json()
-        
-        for wc_product in products:
-            product = db.query(Product).filter(
-                Product.woocommerce_id == wc_product['id']
-            ).first()
-            
-            if not product:
-                product = Product(woocommerce_id=wc_product['id'])
-            
-            product.name = wc_product.get('name')
-            product.sku = wc_product.get('sku')
-            product.price = float(wc_product.get('price', 0))
-            product.sale_price = float(wc_product.get('sale_price', 0)) if wc_product.get('sale_price') else None
-            product.stock_quantity = wc_product.get('stock_quantity', 0)
-            product.image_url = wc_product['images'][0]['src'] if wc_product.get('images') else None
-            product.attributes = wc_product.get('attributes', [])
-            product.updated_at = datetime.utcnow()
-            
-            # Extract category
-            if wc_product.get('categories'):
-                product.category = wc_product['categories'][0]['name']
-            
-            db.add(product)
-        
-        db.commit()
-        return len(products)
-    
-    def sync_orders(self, db: Session, page: int = 1, per_page: int = 100):
-        """Sync orders from WooCommerce"""
-        
-        response = self.wcapi.get("orders", params={"page": page, "per_page": per_page})
-        orders = response.json()
-        
-        for wc_order in orders:
-            order = db.query(Order).filter(
-                Order.woocommerce_id == wc_order['id']
-            ).first()
-            
-            if order:
-                continue  # Skip existing orders
-            
-            # Find customer
-            customer = db.query(Customer).filter(
-                Customer.woocommerce_id == wc_order['customer_id']
-            ).first()
-            
-            if not customer:
+        self.concurrency = max(1, concurrency or settings.WOOCOMMERCE_SYNC_CONCURRENCY)
+
+    def _get_page(self, endpoint: str, page: int, per_page: int):
+        response = self.wcapi.get(endpoint, params={"page": page, "per_page": per_page})
+        response.raise_for_status()
+        return response
+
+    def fetch_pages(self, endpoint: str, per_page: int = 100) -> Iterator[List[Dict]]:
+        """Every page of a list endpoint, the first one first and the rest in completion order"""
+        first = self._get_page(endpoint, 1, per_page)
+        yield first.json()
+
+        total_pages = int(first.headers.get("X-WP-TotalPages") or 1)
+        if total_pages <= 1:
+            return
+
+        pages = iter(range(2, total_pages + 1))
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"wc-{endpoint}") as pool:
+            # Bounded read-ahead: fetched pages wait in memory only while the writer catches up
+            in_flight = {pool.submit(self._get_page, endpoint, page, per_page) for page in islice(pages, self.concurrency * 2)}
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result().json()
+                    page = next(pages, None)
+                    if page is not None:
+                        in_flight.add(pool.submit(self._get_page, endpoint, page, per_page))
+
+    def _sync(self, db: Session, endpoint: str, write: Callable, page: Optional[int], per_page: int) -> int:
+        pages = [self._get_page(endpoint, page, per_page).json()] if page else self.fetch_pages(endpoint, per_page)
+        count = 0
+        for records in pages:
+            write(db, records)
+            db.commit()
+            count += len(records)
+        return count
+
+    def sync_customers(self, db: Session, page: Optional[int] = None, per_page: int = 100) -> int:
+        """Sync customers from WooCommerce (one page, or all of them when page is None)"""
+        return self._sync(db, "customers", self.upsert_customers, page, per_page)
+
+    def sync_products(self, db: Session, page: Optional[int] = None, per_page: int = 100) -> int:
+        """Sync products from WooCommerce (one page, or all of them when page is None)"""
+        return self._sync(db, "products", self.upsert_products, page, per_page)
+
+    def sync_orders(self, db: Session, page: Optional[int] = None, per_page: int = 100) -> int:
+        """Sync orders from WooCommerce (one page, or all of them when page is None)"""
+        return self._sync(db, "orders", self.save_orders, page, per_page)
+
+    @staticmethod
+    def _upsert(db: Session, model, rows: List[Dict], update_columns: List[str]):
+        """Insert rows, updating update_columns of those whose woocommerce_id is already stored"""
+        rows = _unique(rows, "woocommerce_id")
+        if not rows:
+            return
+
+        dialect_insert = _dialect_insert(db)
+        if dialect_insert is not None:
+            for chunk in _chunks(rows):
+                stmt = dialect_insert(model.__table__).values(chunk)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["woocommerce_id"],
+                    set_={column: stmt.excluded[column] for column in update_columns}
+                )
+                db.execute(stmt)
+            return
+
+        existing = {
+            record.woocommerce_id: record for record in db.query(model).filter(
+                model.woocommerce_id.in_([row["woocommerce_id"] for row in rows])
+            ).all()
+        }
+        for row in rows:
+            record = existing.get(row["woocommerce_id"])
+            if record is None:
+                db.add(model(**row))
+            else:
+                for column in update_columns:
+                    setattr(record, column, row[column])
+
+    @staticmethod
+    def upsert_customers(db: Session, wc_customers: List[Dict]):
+        """Insert or update a page of customers (caller commits)"""
+        now = datetime.utcnow()
+        rows = [{
+            "woocommerce_id": wc_customer['id'],
+            "email": wc_customer.get('email'),
+            "first_name": wc_customer.get('first_name'),
+            "last_name": wc_customer.get('last_name'),
+            "total_spent": float(wc_customer.get('total_spent', 0)),
+            "order_count": wc_customer.get('orders_count', 0),
+            "updated_at": now
+        } for wc_customer in wc_customers]
+
+        WooCommerceSync._upsert(
+            db, Customer, rows,
+            ["email", "first_name", "last_name", "total_spent", "order_count", "updated_at"]
+        )
+
+    @staticmethod
+    def upsert_products(db: Session, wc_products: List[Dict]):
+        """Insert or update a page of products (caller commits)"""
+        now = datetime.utcnow()
+        rows = [{
+            "woocommerce_id": wc_product['id'],
+            "name": wc_product.get('name'),
+            "sku": wc_product.get('sku'),
+            "price": float(wc_product.get('price', 0)),
+            "sale_price": float(wc_product.get('sale_price', 0)) if wc_product.get('sale_price') else None,
+            "stock_quantity": wc_product.get('stock_quantity', 0),
+            "image_url": wc_product['images'][0]['src'] if wc_product.get('images') else None,
+            "attributes": wc_product.get('attributes', []),
+            "category": wc_product['categories'][0]['name'] if wc_product.get('categories') else None,
+            "updated_at": now
+        } for wc_product in wc_products]
+
+        # A product without categories keeps the one it has
+        update_columns = ["name", "sku", "price", "sale_price", "stock_quantity", "image_url", "attributes", "updated_at"]
+        WooCommerceSync._upsert(db, Product, [row for row in rows if row["category"] is None], update_columns)
+        WooCommerceSync._upsert(db, Product, [row for row in rows if row["category"] is not None], update_columns + ["category"])
+
+    @staticmethod
+    def _insert_new_orders(db: Session, rows: List[Dict]) -> Dict[int, int]:
+        """Insert orders not stored yet; woocommerce_id -> id of the ones inserted"""
+        dialect_insert = _dialect_insert(db)
+        if dialect_insert is not None:
+            table = Order.__table__
+            inserted = {}
+            for chunk in _chunks(rows):
+                # Skips orders a webhook stored since they were looked up
+                stmt = dialect_insert(table).values(chunk).on_conflict_do_nothing(
+                    index_elements=["woocommerce_id"]
+                ).returning(table.c.woocommerce_id, table.c.id)
+                inserted.update(db.execute(stmt).all())
+            return inserted
+
+        orders = [Order(**row) for row in rows]
+        db.add_all(orders)
+        db.flush()
+        return {order.woocommerce_id: order.id for order in orders}
+
+    @staticmethod
+    def save_orders(db: Session, wc_orders: List[Dict]) -> List[int]:
+        """Store new WooCommerce orders with their items and add them to the sales rollup
+
+        Orders already stored or whose customer is unknown are skipped.
+        Returns the ids of the orders stored. The caller commits.
+        """
+        wc_orders = _unique(wc_orders)
+        if not wc_orders:
+            return []
+
+        # All lookups for the batch up front instead of per order and per line item
+        stored = {
+            woocommerce_id for (woocommerce_id,) in db.query(Order.woocommerce_id).filter(
+                Order.woocommerce_id.in_([wc_order['id'] for wc_order in wc_orders])
+            )
+        }
+        customer_ids = dict(db.query(Customer.woocommerce_id, Customer.id).filter(
+            Customer.woocommerce_id.in_({wc_order.get('customer_id') for wc_order in wc_orders} - {None})
+        ).all())
+        product_ids = dict(db.query(Product.woocommerce_id, Product.id).filter(
+            Product.woocommerce_id.in_({
+                item.get('product_id') for wc_order in wc_orders for item in wc_order.get('line_items', [])
+            } - {None})
+        ).all())
+
+        rows = []
+        for wc_order in wc_orders:
+            customer_id = customer_ids.get(wc_order.get('customer_id'))
+            if wc_order['id'] in stored or not customer_id:
                 continue
-            
-            order = Order(
-                woocommerce_id=wc_order['id'],
-                customer_id=customer.id,
-                total=float(wc_order.get('total', 0)),
-                status=wc_order.get('status'),
-                payment_method=wc_order.get('payment_method'),
-                created_at=datetime.fromisoformat(wc_order['date_created'].replace('Z', '+00:00'))
+            rows.append({
+                "woocommerce_id": wc_order['id'],
+                "customer_id": customer_id,
+                "total": float(wc_order.get('total', 0)),
+                "status": wc_order.get('status'),
+                "payment_method": wc_order.get('payment_method'),
+                "created_at": _parse_date(wc_order.get('date_created'))
+            })
+        if not rows:
+            return []
+
+        order_ids = WooCommerceSync._insert_new_orders(db, rows)
+
+        by_woocommerce_id = {wc_order['id']: wc_order for wc_order in wc_orders}
+        created = {row["woocommerce_id"]: row["created_at"] for row in rows}
+        items, rollup = [], []
+        for woocommerce_id, order_id in order_ids.items():
+            lines = []
+            for item in by_woocommerce_id[woocommerce_id].get('line_items', []):
+                product_id = product_ids.get(item.get('product_id'))
+                if product_id:
+                    lines.append((product_id, item.get('quantity', 0), float(item.get('price', 0))))
+            items.extend(
+                {"order_id": order_id, "product_id": product_id, "quantity": quantity, "price": price}
+                for product_id, quantity, price in lines
             )
-            
-            db.add(order)
-            db.flush()
-            
-            # Add order items
-            for item in wc_order.get('line_items', []):
-                product = db.query(Product).filter(
-                    Product.woocommerce_id == item['product_id']
-                ).first()
-                
-                if product:
-                    order_item = OrderItem(
-                        order_id=order.id,
-                        product_id=product.id,
-                        quantity=item['quantity'],
-                        price=float(item['price'])
-                    )
-                    db.add(order_item)
-        
-        db.commit()
-        return len(orders)
+            rollup.append((created[woocommerce_id], lines))
+
+        for chunk in _chunks(items):
+            db.execute(insert(OrderItem), chunk)
+        SalesRollup.record_orders(db, rollup)
+        return list(order_ids.values())
+
+    @staticmethod
+    def save_order(db: Session, wc_order: dict) -> Optional[int]:
+        """Store a WooCommerce order with its items and add it to the sales rollup
+
+        Returns the new order's id, or None for orders already stored or
+        whose customer is unknown. The caller commits.
+        """
+        order_ids = WooCommerceSync.save_orders(db, [wc_order])
+        return order_ids[0] if order_ids else None
 
 
 if __name__ == "__main__":
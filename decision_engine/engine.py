@@ -148,7 +148,29 @@ class DecisionEngine:
             return decision
         
         total_predicted_demand = sum(f["predicted_demand"] for f in forecast)
+        return self._restock_from_demand(decision, total_predicted_demand)
+    
+    def restock_decisions(self, product_ids: Optional[List[int]] = None) -> Dict[int, Dict]:
+        """Restock decisions for many products (default: every product with recent sales) from one batch forecast"""
+        
+        batch = self.forecasting_engine.predict_many(product_ids=product_ids, days_ahead=30)
+        totals = batch.total_demand()
+        
+        decisions = {}
+        for product_id, total_predicted_demand in zip(batch.product_ids.tolist(), totals.tolist()):
+            decision = {
+                "should_restock": False,
+                "quantity": 0,
+                "urgency": "low",
+                "reason": ""
+            }
+            decisions[product_id] = self._restock_from_demand(decision, total_predicted_demand)
         
+        return decisions
+    
+    @staticmethod
+    def _restock_from_demand(decision: Dict, total_predicted_demand: float) -> Dict:
+        """Apply restock rules to a 30-day demand total"""
         if total_predicted_demand > 50:
             decision["should_restock"] = True
             decision["quantity"] = int(total_predicted_demand * 1.2)  # 20% buffer
@@ -0,0 +1,186 @@
+"""
+Vector Similarity Index
+Copyright © 2024 Paksa IT Solutions
+
+CPU-only inner-product top-K search over contiguous float32 (or float16) matrices.
+Exact search scans the matrix in fixed-size chunks; IVFIndex clusters the
+vectors with k-means and only scans the closest `n_probe` clusters per query.
+For cosine similarity, L2-normalize vectors and queries first.
+"""
+
+import os
+import numpy as np
+from typing import Optional, Tuple
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row (zero rows are left as zeros)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _merge_top_k(best_ids, best_scores, ids, scores, k):
+    """Merge a new block of candidates into the running per-query top-K"""
+    if best_ids is not None:
+        ids = np.concatenate([best_ids, ids], axis=1)
+        scores = np.concatenate([best_scores, scores], axis=1)
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        ids = np.take_along_axis(ids, top, axis=1)
+        scores = np.take_along_axis(scores, top, axis=1)
+    return ids, scores
+
+
+def _sort_top_k(ids, scores):
+    """Order each query's results by descending score"""
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def exact_top_k(
+    queries: np.ndarray,
+    matrix: np.ndarray,
+    k: int,
+    chunk_size: int = 65536
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Brute-force inner-product top-K; returns (row indices, scores) of shape (B, k)"""
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    k = min(k, len(matrix))
+    if k == 0:
+        empty = np.empty((len(queries), 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+
+    best_ids = best_scores = None
+    for start in range(0, len(matrix), chunk_size):
+        block = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+        scores = queries @ block.T
+        ids = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+        best_ids, best_scores = _merge_top_k(best_ids, best_scores, ids, scores, k)
+
+    return _sort_top_k(best_ids, best_scores)
+
+
+class IVFIndex:
+    """Inverted-file approximate index (k-means coarse quantizer)"""
+
+    def __init__(self, n_lists: Optional[int] = None, n_probe: int = 8, seed: int = 42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.seed = seed
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.vectors = np.empty((0, 0), dtype=np.float32)  # grouped by list
+        self.row_ids = np.empty(0, dtype=np.int64)          # grouped position -> source row
+        self.offsets = np.zeros(1, dtype=np.int64)          # list -> start in grouped arrays
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    def build(self, matrix: np.ndarray, iterations: int = 10, sample_size: int = 100_000):
+        """Train centroids on a sample, then assign every row to its list (storage dtype is kept)"""
+        matrix = np.asarray(matrix)
+        n = len(matrix)
+        n_lists = self.n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(self.seed)
+
+        sample_rows = np.sort(rng.choice(n, min(n, max(sample_size, n_lists * 4)), replace=False))
+        sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=n_lists)
+            empty = counts == 0
+            centroids[~empty] = sums[~empty] / counts[~empty, None]
+            # Re-seed empty clusters from random sample points
+            if empty.any():
+                centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+
+        assignment = self._assign(matrix, centroids)
+        order = np.argsort(assignment, kind="stable")
+
+        self.n_lists = n_lists
+        self.centroids = centroids
+        self.vectors = np.ascontiguousarray(matrix[order])
+        self.row_ids = order.astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+        return self
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        """Nearest centroid by inner product, in chunks"""
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            block = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignment
+
+    def search(self, queries: np.ndarray, k: int, n_probe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate inner-product top-K; returns (source row indices, scores), -1 padded"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        n_probe = min(n_probe or self.n_probe, self.n_lists or 1)
+
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if len(self) == 0:
+            return out_ids, out_scores
+
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, n_probe - 1, axis=1)[:, :n_probe]
+
+        for qi, query in enumerate(queries):
+            candidates = np.concatenate([
+                np.arange(self.offsets[lst], self.offsets[lst + 1]) for lst in probes[qi]
+            ])
+            if len(candidates) == 0:
+                continue
+            scores = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+            take = min(k, len(candidates))
+            top = np.argpartition(-scores, take - 1)[:take]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            out_ids[qi, :take] = self.row_ids[candidates[top]]
+            out_scores[qi, :take] = scores[top]
+
+        return out_ids, out_scores
+
+    def save(self, path: str, include_vectors: bool = True):
+        """Persist the index as NumPy arrays
+
+        With include_vectors=False only the quantizer and list layout are
+        written; the caller stores the grouped vectors and passes them back
+        to load().
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays = {
+            "centroids": self.centroids,
+            "row_ids": self.row_ids,
+            "offsets": self.offsets,
+            "n_probe": np.array(self.n_probe)
+        }
+        if include_vectors:
+            arrays["vectors"] = self.vectors
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str, vectors: Optional[np.ndarray] = None) -> "IVFIndex":
+        """Load an index written by save(), optionally over externally stored vectors"""
+        with np.load(path) as archive:
+            index = cls(n_lists=len(archive["centroids"]), n_probe=int(archive["n_probe"]))
+            index.centroids = archive["centroids"]
+            index.vectors = archive["vectors"] if vectors is None else vectors
+            index.row_ids = archive["row_ids"]
+            index.offsets = archive["offsets"]
+        return index
+
+
+def recall_at_k(approx_ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    """Mean fraction of the exact top-K recovered by the approximate search"""
+    hits = [
+        len(np.intersect1d(a[a >= 0], e)) / max(len(e), 1)
+        for a, e in zip(approx_ids, exact_ids)
+    ]
+    return float(np.mean(hits)) if hits else 0.0
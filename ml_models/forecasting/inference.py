@@ -5,10 +5,43 @@ Copyright © 2024 Paksa IT Solutions
 
 import tensorflow as tf
 import numpy as np
-from typing import Optional, List
+from typing import Dict, Iterable, Optional, List
 from datetime import datetime, timedelta
 
 
+class ForecastBatch:
+    """Array-backed forecasts for many products (rows follow product_ids)"""
+    
+    def __init__(self, product_ids: np.ndarray, start_date: datetime, predicted: np.ndarray, std: np.ndarray):
+        self.product_ids = product_ids
+        self.start_date = start_date
+        self.predicted = predicted  # (products, days_ahead)
+        self.lower = np.maximum(0, predicted - std[:, None])
+        self.upper = predicted + std[:, None]
+        self._rows = {int(pid): i for i, pid in enumerate(product_ids)}
+    
+    def __len__(self):
+        return len(self.product_ids)
+    
+    def total_demand(self) -> np.ndarray:
+        """Predicted units over the whole horizon per product"""
+        return self.predicted.sum(axis=1)
+    
+    def for_product(self, product_id: int) -> List[Dict]:
+        """Forecast rows for one product, in the same shape as ForecastingEngine.predict"""
+        row = self._rows.get(product_id)
+        if row is None:
+            return []
+        return [{
+            "forecast_date": (self.start_date + timedelta(days=day)).isoformat(),
+            "predicted_demand": round(float(self.predicted[row, day]), 2),
+            "confidence_interval": {
+                "lower": round(float(self.lower[row, day]), 2),
+                "upper": round(float(self.upper[row, day]), 2)
+            }
+        } for day in range(self.predicted.shape[1])]
+
+
 class ForecastingEngine:
     """Production forecasting engine"""
     
@@ -31,45 +64,18 @@ class ForecastingEngine:
     ):
         """Generate demand forecast using moving average and trend analysis"""
         from config.database import SessionLocal
-        from api.models.database_models import Product, OrderItem, Order
-        from sqlalchemy import func
-        from datetime import datetime, timedelta
+        from data_pipeline.sales_rollup import SalesRollup
         
         db = SessionLocal()
         try:
-            # Get historical sales data (last 90 days)
-            ninety_days_ago = datetime.utcnow() - timedelta(days=90)
-            
-            if product_id:
-                # Product-specific forecast
-                daily_sales = db.query(
-                    func.date(Order.created_at).label('date'),
-                    func.sum(OrderItem.quantity).label('quantity')
-                ).join(OrderItem).filter(
-                    OrderItem.product_id == product_id,
-                    Order.created_at >= ninety_days_ago
-                ).group_by(func.date(Order.created_at)).all()
-            elif category:
-                # Category-level forecast
-                daily_sales = db.query(
-                    func.date(Order.created_at).label('date'),
-                    func.sum(OrderItem.quantity).label('quantity')
-                ).join(OrderItem).join(Product).filter(
-                    Product.category == category,
-                    Order.created_at >= ninety_days_ago
-                ).group_by(func.date(Order.created_at)).all()
-            else:
-                # Overall forecast
-                daily_sales = db.query(
-                    func.date(Order.created_at).label('date'),
-                    func.sum(OrderItem.quantity).label('quantity')
-                ).join(OrderItem).filter(
-                    Order.created_at >= ninety_days_ago
-                ).group_by(func.date(Order.created_at)).all()
+            # Get historical sales data (last 90 days) from the daily rollup
+            daily_sales = SalesRollup.daily_units(
+                db, days=90, product_id=product_id, category=category
+            )
             
             # Calculate moving average and trend
             if daily_sales:
-                quantities = [float(s.quantity) for s in daily_sales]
+                quantities = [quantity for _, quantity in daily_sales]
                 avg_demand = np.mean(quantities)
                 std_demand = np.std(quantities)
                 
@@ -104,33 +110,57 @@ class ForecastingEngine:
         finally:
             db.close()
     
+    def predict_many(
+        self,
+        product_ids: Optional[Iterable[int]] = None,
+        category: Optional[str] = None,
+        days_ahead: int = 30
+    ) -> ForecastBatch:
+        """Forecast many products at once (the given ids, a category, or every product with sales)
+        
+        Same moving average and trend as predict, computed over a dense
+        (products x days) matrix loaded from the daily rollup in one query.
+        """
+        from config.database import SessionLocal
+        from data_pipeline.sales_rollup import SalesRollup
+        
+        db = SessionLocal()
+        try:
+            ids, units, has_sales = SalesRollup.daily_matrix(
+                db, days=90, product_ids=product_ids, category=category
+            )
+        finally:
+            db.close()
+        
+        # Statistics over the days each product actually sold, as in predict
+        counts = has_sales.sum(axis=1)
+        safe_counts = np.maximum(counts, 1)
+        mean = units.sum(axis=1) / safe_counts
+        std = np.sqrt((((units - mean[:, None]) ** 2) * has_sales).sum(axis=1) / safe_counts)
+        
+        rows = np.arange(len(ids))
+        first = units[rows, np.argmax(has_sales, axis=1)]
+        last = units[rows, has_sales.shape[1] - 1 - np.argmax(has_sales[:, ::-1], axis=1)]
+        trend = np.where(counts > 1, (last - first) / safe_counts, 0.0)
+        
+        predicted = np.maximum(0, mean[:, None] + trend[:, None] * np.arange(days_ahead)[None, :])
+        return ForecastBatch(ids, datetime.now(), predicted, std)
+    
     def seasonal_analysis(self, category: str):
         """Analyze seasonal trends"""
         from config.database import SessionLocal
-        from api.models.database_models import Product, OrderItem, Order
-        from sqlalchemy import func, extract
-        from datetime import datetime, timedelta
+        from data_pipeline.sales_rollup import SalesRollup
         
         db = SessionLocal()
         try:
             # Get sales by month for the category
-            one_year_ago = datetime.utcnow() - timedelta(days=365)
-            
-            monthly_sales = db.query(
-                extract('month', Order.created_at).label('month'),
-                func.sum(OrderItem.quantity).label('quantity')
-            ).join(OrderItem).join(Product).filter(
-                Product.category == category,
-                Order.created_at >= one_year_ago
-            ).group_by(extract('month', Order.created_at)).all()
+            sales_dict = SalesRollup.monthly_units(db, category, days=365)
             
             # Identify peak months
-            if monthly_sales:
-                sales_dict = {int(s.month): float(s.quantity) for s in monthly_sales}
+            if sales_dict:
                 avg_sales = np.mean(list(sales_dict.values()))
                 peak_months = [month for month, qty in sales_dict.items() if qty > avg_sales * 1.2]
             else:
-                sales_dict = {}
                 peak_months = []
             
             return {
@@ -3,13 +3,28 @@ Pricing Inference Engine
 Copyright © 2024 Paksa IT Solutions
 """
 
+import io
 import tensorflow as tf
 import numpy as np
+from typing import Dict, Optional, Tuple
+from config.redis_client import get_redis
+
+# Inputs of the last persisted sweep per tenant, shared by every API and Celery host
+SWEEP_STATE_KEY = "pricing:sweep_state:{tenant_id}"
 
 
 class PricingEngine:
     """Production pricing optimization engine"""
     
+    # Rule cascade, evaluated top to bottom; the last entry is the default
+    PRICING_REASONS = [
+        "Slow-moving inventory optimization",
+        "High demand - maintain price",
+        "Overstock clearance",
+        "Low stock - premium pricing",
+        "Standard promotional pricing"
+    ]
+    
     def __init__(self):
         self.model = None
         self._load_model()
@@ -24,9 +39,8 @@ class PricingEngine:
     def predict(self, product_id: int):
         """Get optimal pricing recommendation based on inventory and sales velocity"""
         from config.database import SessionLocal
-        from api.models.database_models import Product, OrderItem, Order
-        from sqlalchemy import func
-        from datetime import datetime, timedelta
+        from api.models.database_models import Product
+        from data_pipeline.sales_rollup import SalesRollup
         
         db = SessionLocal()
         try:
@@ -43,37 +57,15 @@ class PricingEngine:
             current_price = product.sale_price or product.price
             
             # Calculate sales velocity (units sold per day in last 30 days)
-            thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-            sales_count = db.query(func.sum(OrderItem.quantity)).join(Order).filter(
-                OrderItem.product_id == product_id,
-                Order.created_at >= thirty_days_ago
-            ).scalar() or 0
+            sales_count = SalesRollup.units_by_product(db, days=30, product_ids=[product_id]).get(product_id, 0)
             
             sales_velocity = sales_count / 30.0
             
             # Pricing logic
             stock_quantity = product.stock_quantity or 0
-            
-            # Slow-moving: low velocity, high stock
-            if sales_velocity < 1 and stock_quantity > 10:
-                discount_percentage = min(30.0, 15.0 + (stock_quantity / 10))
-                reason = "Slow-moving inventory optimization"
-            # Fast-moving: high velocity, low stock
-            elif sales_velocity > 5 and stock_quantity < 5:
-                discount_percentage = 0.0
-                reason = "High demand - maintain price"
-            # Overstocked
-            elif stock_quantity > 50:
-                discount_percentage = 20.0
-                reason = "Overstock clearance"
-            # Low stock
-            elif stock_quantity < 3:
-                discount_percentage = 0.0
-                reason = "Low stock - premium pricing"
-            # Normal
-            else:
-                discount_percentage = 10.0
-                reason = "Standard promotional pricing"
+            discounts, reasons = self.evaluate_rules(np.array([stock_quantity]), np.array([sales_velocity]))
+            discount_percentage = float(discounts[0])
+            reason = self.PRICING_REASONS[reasons[0]]
             
             recommended_price = current_price * (1 - discount_percentage / 100)
             
@@ -91,49 +83,171 @@ class PricingEngine:
         finally:
             db.close()
     
-    def identify_slow_movers(self, threshold_days: int = 30):
-        """Identify slow-moving products that need price optimization"""
-        from config.database import SessionLocal
-        from api.models.database_models import Product, OrderItem, Order
+    @staticmethod
+    def evaluate_rules(stock: np.ndarray, velocity: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Discount percentage and PRICING_REASONS index for each product"""
+        conditions = [
+            (velocity < 1) & (stock > 10),   # Slow-moving: low velocity, high stock
+            (velocity > 5) & (stock < 5),    # Fast-moving: high velocity, low stock
+            stock > 50,                      # Overstocked
+            stock < 3                        # Low stock
+        ]
+        discounts = np.select(
+            conditions,
+            [np.minimum(30.0, 15.0 + stock / 10), 0.0, 20.0, 0.0],
+            default=10.0
+        )
+        reasons = np.select(conditions, [0, 1, 2, 3], default=4)
+        return discounts, reasons
+    
+    @staticmethod
+    def _catalog_snapshot(db, days: int = 30, tenant_id: str = "default") -> Dict[str, np.ndarray]:
+        """Price, stock and units sold in the window for every product, in one query"""
+        from api.models.database_models import Product, ProductDailySales
         from sqlalchemy import func
         from datetime import datetime, timedelta
         
-        db = SessionLocal()
+        start = (datetime.utcnow() - timedelta(days=days)).date()
+        units = db.query(
+            ProductDailySales.product_id,
+            func.sum(ProductDailySales.units).label('units')
+        ).filter(
+            ProductDailySales.tenant_id == tenant_id,
+            ProductDailySales.sales_date >= start
+        ).group_by(ProductDailySales.product_id).subquery()
+        
+        rows = db.query(
+            Product.id,
+            Product.name,
+            Product.price,
+            Product.sale_price,
+            Product.stock_quantity,
+            func.coalesce(units.c.units, 0)
+        ).outerjoin(units, units.c.product_id == Product.id).order_by(Product.id).all()
+        
+        count = len(rows)
+        return {
+            "ids": np.fromiter((r[0] for r in rows), dtype=np.int64, count=count),
+            "names": [r[1] for r in rows],
+            "list_price": np.fromiter((r[2] or 0.0 for r in rows), dtype=np.float64, count=count),
+            "current_price": np.fromiter((r[3] or r[2] or 0.0 for r in rows), dtype=np.float64, count=count),
+            "stock": np.fromiter((r[4] or 0 for r in rows), dtype=np.int64, count=count),
+            "units": np.fromiter((r[5] or 0 for r in rows), dtype=np.float64, count=count)
+        }
+    
+    def price_catalog(
+        self,
+        tenant_id: str = "default",
+        incremental: bool = False,
+        persist: bool = True,
+        db=None
+    ) -> Dict:
+        """Re-price the whole catalog with one query and vectorized rules
+        
+        In incremental mode only products whose price, stock or 30-day units
+        changed since the last sweep for this tenant are re-priced.
+        """
+        from config.database import SessionLocal
+        from api.models.database_models import PricingRecommendation
+        from datetime import datetime
+        
+        own_session = db is None
+        db = db or SessionLocal()
         try:
-            threshold_date = datetime.utcnow() - timedelta(days=threshold_days)
+            snapshot = self._catalog_snapshot(db, days=30, tenant_id=tenant_id)
+            ids, price, stock, units = snapshot["ids"], snapshot["current_price"], snapshot["stock"], snapshot["units"]
             
-            # Get products with sales in the period
-            products_with_sales = db.query(
-                Product.id,
-                Product.name,
-                Product.price,
-                Product.stock_quantity,
-                func.sum(OrderItem.quantity).label('units_sold')
-            ).outerjoin(OrderItem).outerjoin(Order).filter(
-                Order.created_at >= threshold_date
-            ).group_by(Product.id).all()
+            selected = np.ones(len(ids), dtype=bool)
+            previous = self._load_sweep_state(tenant_id) if incremental else None
+            if previous is not None:
+                # Products whose inputs match the last sweep keep their recommendation
+                _, current, last = np.intersect1d(ids, previous["ids"], assume_unique=True, return_indices=True)
+                unchanged = (previous["stock"][last] == stock[current]) & \
+                    (previous["units"][last] == units[current]) & \
+                    (previous["price"][last] == price[current])
+                selected[current[unchanged]] = False
             
-            # Identify slow movers (less than 1 unit per week)
-            slow_movers = []
-            weeks = threshold_days / 7.0
+            velocity = units / 30.0
+            discounts, reasons = self.evaluate_rules(stock[selected], velocity[selected])
+            recommended = price[selected] * (1 - discounts / 100)
             
-            for p in products_with_sales:
-                units_sold = p.units_sold or 0
-                velocity = units_sold / weeks
+            recommendations = [{
+                "product_id": int(pid),
+                "current_price": round(float(current), 2),
+                "recommended_price": round(float(new_price), 2),
+                "discount_percentage": round(float(discount), 2),
+                "reason": self.PRICING_REASONS[reason]
+            } for pid, current, new_price, discount, reason in zip(
+                ids[selected], price[selected], recommended, discounts, reasons
+            )]
+            
+            if persist:
+                if recommendations:
+                    created_at = datetime.utcnow()
+                    db.bulk_insert_mappings(PricingRecommendation, [
+                        {**r, "applied": False, "created_at": created_at} for r in recommendations
+                    ])
+                    db.commit()
                 
-                if velocity < 1 and p.stock_quantity > 5:
-                    slow_movers.append({
-                        "id": p.id,
-                        "name": p.name,
-                        "price": p.price,
-                        "stock_quantity": p.stock_quantity,
-                        "units_sold": units_sold,
-                        "velocity": round(velocity, 2)
-                    })
+                self._save_sweep_state(tenant_id, ids=ids, stock=stock, units=units, price=price)
             
             return {
-                "products": slow_movers,
-                "count": len(slow_movers)
+                "tenant_id": tenant_id,
+                "products": len(ids),
+                "repriced": len(recommendations),
+                "recommendations": recommendations
             }
+        finally:
+            if own_session:
+                db.close()
+    
+    @staticmethod
+    def _load_sweep_state(tenant_id: str) -> Optional[Dict[str, np.ndarray]]:
+        """Arrays saved by the last persisted sweep, or None (the next sweep is then a full one)"""
+        try:
+            raw = get_redis().get(SWEEP_STATE_KEY.format(tenant_id=tenant_id))
+        except Exception as e:
+            print(f"Pricing sweep state unavailable, re-pricing everything: {e}")
+            return None
+        if not raw:
+            return None
+        with np.load(io.BytesIO(raw)) as state:
+            return {name: state[name] for name in state.files}
+    
+    @staticmethod
+    def _save_sweep_state(tenant_id: str, **arrays: np.ndarray):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        try:
+            get_redis().set(SWEEP_STATE_KEY.format(tenant_id=tenant_id), buffer.getvalue())
+        except Exception as e:
+            print(f"Pricing sweep state not saved: {e}")
+    
+    def identify_slow_movers(self, threshold_days: int = 30):
+        """Identify slow-moving products that need price optimization"""
+        from config.database import SessionLocal
+        
+        db = SessionLocal()
+        try:
+            snapshot = self._catalog_snapshot(db, days=threshold_days)
         finally:
             db.close()
+        
+        # Identify slow movers (less than 1 unit per week)
+        weeks = threshold_days / 7.0
+        velocity = snapshot["units"] / weeks
+        slow = np.flatnonzero((velocity < 1) & (snapshot["stock"] > 5))
+        
+        slow_movers = [{
+            "id": int(snapshot["ids"][i]),
+            "name": snapshot["names"][i],
+            "price": float(snapshot["list_price"][i]),
+            "stock_quantity": int(snapshot["stock"][i]),
+            "units_sold": float(snapshot["units"][i]),
+            "velocity": round(float(velocity[i]), 2)
+        } for i in slow]
+        
+        return {
+            "products": slow_movers,
+            "count": len(slow_movers)
+        }
@@ -1,25 +1,53 @@
 """
 Batch Inference for Recommendations
 Copyright © 2024 Paksa IT Solutions
+
+Micro-batching worker side of the recommendation queue. Jobs live on the
+reliable "batch" queue (api.utils.reliable_queue), so a worker that dies
+mid-batch loses nothing: its jobs are redelivered after the visibility
+timeout, failures are retried with backoff and then dead-lettered. A batch
+starts when the first job arrives (blocking read, no polling sleep) and
+closes after max_wait seconds or max_batch jobs, whichever comes first.
+Each batch is grouped by tenant and recommendation type and every group is
+scored in one vectorized pass (RecommendationEngine.predict_many), then all
+results are stored and acknowledged in one transaction.
 """
 
-import redis
-import json
+import threading
+import time
 import uuid
+from collections import defaultdict
 from typing import List, Dict, Optional
-from datetime import datetime, timedelta
+from datetime import datetime
+from api.utils.reliable_queue import QueuedJob, ReliableQueue, batch_jobs
 from ml_models.recommendation.inference import RecommendationEngine
+from config.settings import settings
 
 
 class BatchInferenceQueue:
     """Queue and process recommendation requests in batches"""
-    
-    def __init__(self):
-        self.redis_client = redis.from_url("redis://localhost:6379/0")
-        self.engine = RecommendationEngine()
-        self.batch_size = 10
-        self.timeout = 300  # 5 minutes
-    
+
+    def __init__(
+        self,
+        engine: Optional[RecommendationEngine] = None,
+        queue: Optional[ReliableQueue] = None,
+        max_batch: Optional[int] = None,
+        max_wait: Optional[float] = None
+    ):
+        self.queue = queue or batch_jobs
+        self._engine = engine
+        self.max_batch = max_batch or settings.RECOMMENDATION_BATCH_MAX_SIZE
+        self.max_wait = settings.RECOMMENDATION_BATCH_MAX_WAIT_MS / 1000 if max_wait is None else max_wait
+        self._stats_lock = threading.Lock()
+        self._stats = {"batches": 0, "jobs": 0, "groups": 0, "failed_groups": 0}
+
+    @property
+    def engine(self) -> RecommendationEngine:
+        # Created on first use so the API process (which only enqueues) doesn't load the model twice
+        if self._engine is None:
+            self._engine = RecommendationEngine()
+        return self._engine
+
     def enqueue(
         self,
         customer_id: Optional[int],
@@ -31,7 +59,6 @@ class BatchInferenceQueue:
         """Add request to queue, return job_id"""
         job_id = str(uuid.uuid4())
         request = {
-            "job_id": job_id,
             "customer_id": customer_id,
             "session_id": session_id,
             "limit": limit,
@@ -39,73 +66,89 @@ class BatchInferenceQueue:
             "tenant_id": tenant_id,
             "created_at": datetime.utcnow().isoformat()
         }
-        
-        # Add to queue
-        self.redis_client.lpush("batch_queue:recommendations", json.dumps(request))
-        
-        # Set status
-        self.redis_client.setex(f"job:{job_id}:status", self.timeout, "pending")
-        
-        return job_id
-    
+        return self.queue.enqueue(request, job_id)
+
     def get_result(self, job_id: str) -> Optional[Dict]:
         """Get result for job_id"""
-        status = self.redis_client.get(f"job:{job_id}:status")
-        if not status:
+        return self.format_result(job_id, self.queue.get(job_id))
+
+    @staticmethod
+    def format_result(job_id: str, job: Optional[Dict]) -> Dict:
+        """API response for a job's state (as returned by ReliableQueue.get)"""
+        if not job:
             return {"status": "expired"}
-        
-        status = status.decode()
-        if status == "pending":
-            return {"status": "pending"}
-        elif status == "processing":
-            return {"status": "processing"}
-        elif status == "completed":
-            result = self.redis_client.get(f"job:{job_id}:result")
-            return json.loads(result) if result else {"status": "error"}
-        
+
+        status = job["status"]
+        if status == "completed":
+            return job.get("result") or {"status": "error"}
+        elif status == "dead":
+            return {"status": "error", "error": job.get("error"), "job_id": job_id, "attempts": job["attempts"]}
+        elif status in ("pending", "processing", "retrying"):
+            return {"status": status}
+
         return {"status": "unknown"}
-    
-    def process_batch(self):
-        """Process batch of requests"""
-        batch = []
-        
-        # Pop batch_size items from queue
-        for _ in range(self.batch_size):
-            item = self.redis_client.rpop("batch_queue:recommendations")
-            if not item:
-                break
-            batch.append(json.loads(item))
-        
+
+    def next_batch(self, block_timeout: float = 1.0) -> List[QueuedJob]:
+        """Wait up to block_timeout for a first job, then up to max_wait for the batch to fill"""
+        batch = self.queue.claim(self.max_batch, block_ms=int(block_timeout * 1000))
         if not batch:
+            return []
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            # XREADGROUP reads BLOCK 0 as forever
+            if remaining_ms < 1:
+                break
+            more = self.queue.claim(self.max_batch - len(batch), block_ms=remaining_ms)
+            if not more:
+                break
+            batch.extend(more)
+        return batch
+
+    def process_batch(self, block_timeout: float = 1.0) -> int:
+        """Score one micro-batch; returns the number of jobs processed"""
+        jobs = self.next_batch(block_timeout)
+        if not jobs:
             return 0
-        
-        # Process each request
-        for request in batch:
-            job_id = request["job_id"]
-            
+
+        groups = defaultdict(list)
+        for job in jobs:
+            groups[(job.payload.get("tenant_id"), job.payload.get("recommendation_type") or "personalized")].append(job)
+
+        completed, failed = [], []
+        for (tenant_id, recommendation_type), group in groups.items():
             try:
-                # Update status
-                self.redis_client.setex(f"job:{job_id}:status", self.timeout, "processing")
-                
-                # Generate recommendations
-                result = self.engine.predict(
-                    customer_id=request["customer_id"],
-                    session_id=request["session_id"],
-                    limit=request["limit"],
-                    recommendation_type=request["recommendation_type"],
-                    tenant_id=request["tenant_id"]
+                outputs = self.engine.predict_many(
+                    [job.payload.get("customer_id") for job in group],
+                    [job.payload.get("limit") or 10 for job in group],
+                    recommendation_type=recommendation_type,
+                    tenant_id=tenant_id
                 )
-                
-                # Store result
-                result["status"] = "completed"
-                result["job_id"] = job_id
-                self.redis_client.setex(f"job:{job_id}:result", self.timeout, json.dumps(result))
-                self.redis_client.setex(f"job:{job_id}:status", self.timeout, "completed")
-                
+                for job, result in zip(group, outputs):
+                    completed.append((job, dict(result, status="completed", job_id=job.job_id)))
             except Exception as e:
-                # Store error
-                error_result = {"status": "error", "error": str(e), "job_id": job_id}
-                self.redis_client.setex(f"job:{job_id}:result", self.timeout, json.dumps(error_result))
-                self.redis_client.setex(f"job:{job_id}:status", self.timeout, "completed")
-        
-        return len(batch)
+                self._count("failed_groups", 1)
+                failed.extend((job, str(e)) for job in group)
+
+        # Results and acknowledgements in one transaction; failures go back for retry or dead-letter
+        self.queue.complete_many(completed)
+        self.queue.fail_many(failed)
+
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["jobs"] += len(jobs)
+            self._stats["groups"] += len(groups)
+        return len(jobs)
+
+    def _count(self, name: str, amount: int):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_batch_size"] = round(stats["jobs"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["max_batch"] = self.max_batch
+        stats["max_wait_ms"] = round(self.max_wait * 1000, 1)
+        return stats
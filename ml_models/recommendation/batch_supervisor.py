@@ -0,0 +1,320 @@
+"""
+Batch Inference Supervisor
+Copyright © 2024 Paksa IT Solutions
+
+Runs the batch inference worker as a pool of processes, so a batch node uses
+all of its cores. Workers are started with the spawn method: each one
+imports TensorFlow, loads the model and opens its own database and Redis
+pools before it takes its first job. Nothing is inherited across a fork.
+
+Every SCALE_INTERVAL seconds the supervisor sizes the pool between
+BATCH_WORKERS_MIN and BATCH_WORKERS_MAX:
+- one worker per BATCH_WORKER_BACKLOG unacknowledged jobs
+- one more whenever the oldest job has waited longer than
+  BATCH_WORKER_MAX_JOB_AGE
+Scaling up is immediate. Scaling down retires one worker per
+SCALE_DOWN_DELAY, so short lulls don't churn processes.
+
+On SIGTERM every worker finishes its current batch and exits. Jobs left
+with a worker that is killed are redelivered by the queue's visibility
+timeout. Per-worker throughput is published to the WORKERS_KEY hash for
+the batch admin API.
+
+Usage: python -m ml_models.recommendation.batch_supervisor
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from config.settings import settings
+
+REPORT_INTERVAL = 5.0  # seconds between worker throughput reports
+SCALE_INTERVAL = 5.0
+SCALE_DOWN_DELAY = 60.0
+WORKERS_KEY = "batch:workers"
+STALE_AFTER = 30.0  # seconds without an update before a published worker is ignored
+
+
+def desired_workers(
+    current: int,
+    depth: int,
+    oldest_age: float,
+    min_workers: int,
+    max_workers: int,
+    backlog_per_worker: int,
+    max_job_age: float
+) -> int:
+    """Pool size for the current backlog: enough workers for the depth, one more while jobs wait too long"""
+    desired = math.ceil(depth / backlog_per_worker)
+    if depth and oldest_age > max_job_age:
+        desired = max(desired, current + 1)
+    return max(min_workers, min(max_workers, desired))
+
+
+def _worker_main(worker_id: int, stop, reports, threads: int):
+    """Worker process: preload the model, then process micro-batches until asked to stop"""
+    # Split the cores between workers; must be set before TensorFlow is imported
+    os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(threads))
+    os.environ.setdefault("TF_NUM_INTEROP_THREADS", "1")
+    # The supervisor decides when workers stop; a group-wide signal only starts the drain
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    from ml_models.recommendation.batch_inference import BatchInferenceQueue
+
+    batch_queue = BatchInferenceQueue()
+    batch_queue.engine  # load the model before taking jobs
+    pid = os.getpid()
+    jobs = batches = errors = 0
+    reports.put((worker_id, pid, jobs, batches, errors))
+    next_report = time.monotonic() + REPORT_INTERVAL
+
+    while not stop.is_set():
+        try:
+            processed = batch_queue.process_batch(block_timeout=1.0)
+            if processed:
+                jobs += processed
+                batches += 1
+        except Exception as e:
+            errors += 1
+            print(f"Batch worker {worker_id} error: {e}")
+            stop.wait(5.0)
+        if time.monotonic() >= next_report:
+            reports.put((worker_id, pid, jobs, batches, errors))
+            next_report = time.monotonic() + REPORT_INTERVAL
+
+    reports.put((worker_id, pid, jobs, batches, errors))
+
+
+class BatchSupervisor:
+    """Process pool for batch inference, autoscaled on queue depth and job age"""
+
+    def __init__(
+        self,
+        min_workers: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        backlog_per_worker: Optional[int] = None,
+        max_job_age: Optional[float] = None,
+        drain_timeout: float = 60.0,
+        jobs_queue=None,
+        redis_client=None
+    ):
+        if jobs_queue is None:
+            from api.utils.reliable_queue import batch_jobs
+            jobs_queue = batch_jobs
+        if redis_client is None:
+            from config.redis_client import get_redis
+            redis_client = get_redis()
+
+        self.min_workers = settings.BATCH_WORKERS_MIN if min_workers is None else min_workers
+        self.max_workers = max(self.min_workers, max_workers or settings.BATCH_WORKERS_MAX)
+        self.backlog_per_worker = backlog_per_worker or settings.BATCH_WORKER_BACKLOG
+        self.max_job_age = settings.BATCH_WORKER_MAX_JOB_AGE if max_job_age is None else max_job_age
+        self.drain_timeout = drain_timeout
+        self.jobs_queue = jobs_queue
+        self.redis_client = redis_client
+        self.host = socket.gethostname()
+        self.threads_per_worker = max(1, (os.cpu_count() or 1) // self.max_workers)
+
+        self._context = multiprocessing.get_context("spawn")
+        self._reports = self._context.Queue()
+        # worker_id -> {"process", "stop", "started_at", "pid", "jobs", "batches", "errors", "jobs_per_sec", ...}
+        self._workers: Dict[int, Dict] = {}
+        self._next_id = 1
+        self._stopping = False
+        self._low_since: Optional[float] = None
+        self._published: set = set()
+        self.restarts = 0
+        self.last_backlog = (0, 0.0)
+
+    def _spawn(self, worker_id: int):
+        """Start one worker process; returns (process, stop event)"""
+        stop = self._context.Event()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, stop, self._reports, self.threads_per_worker),
+            name=f"batch-worker-{worker_id}",
+            daemon=False
+        )
+        process.start()
+        return process, stop
+
+    def _start_workers(self, count: int):
+        for _ in range(count):
+            worker_id = self._next_id
+            self._next_id += 1
+            process, stop = self._spawn(worker_id)
+            self._workers[worker_id] = {
+                "process": process,
+                "stop": stop,
+                "started_at": time.time(),
+                "pid": process.pid,
+                "jobs": 0,
+                "batches": 0,
+                "errors": 0,
+                "jobs_per_sec": 0.0,
+                "reported_at": None
+            }
+
+    def running(self) -> List[int]:
+        """Workers not asked to stop"""
+        return [worker_id for worker_id, worker in self._workers.items() if not worker["stop"].is_set()]
+
+    def request_stop(self, *_):
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        print(f"Batch supervisor started ({self.min_workers}-{self.max_workers} workers, {self.threads_per_worker} threads each)")
+
+        self._start_workers(self.min_workers)
+        while not self._stopping:
+            self._collect_reports(time.monotonic() + SCALE_INTERVAL)
+            self._reap()
+            if not self._stopping:
+                self._autoscale()
+            self._publish()
+
+        self._drain()
+
+    def _collect_reports(self, until: float):
+        while not self._stopping:
+            remaining = until - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                report = self._reports.get(timeout=min(0.5, remaining))
+            except queue.Empty:
+                continue
+            self._record(*report)
+
+    def _record(self, worker_id: int, pid: int, jobs: int, batches: int, errors: int):
+        worker = self._workers.get(worker_id)
+        if worker is None:
+            return
+        now = time.time()
+        if worker["reported_at"] is not None and now > worker["reported_at"]:
+            worker["jobs_per_sec"] = round((jobs - worker["jobs"]) / (now - worker["reported_at"]), 2)
+        worker.update(pid=pid, jobs=jobs, batches=batches, errors=errors, reported_at=now)
+
+    def _reap(self):
+        """Forget exited workers; a worker that exits without being asked to has crashed"""
+        for worker_id, worker in list(self._workers.items()):
+            process = worker["process"]
+            if process.is_alive():
+                continue
+            process.join()
+            del self._workers[worker_id]
+            if not worker["stop"].is_set():
+                self.restarts += 1
+                print(f"Batch worker {worker_id} (pid {worker['pid']}) exited with code {process.exitcode}")
+
+    def _autoscale(self):
+        try:
+            depth, oldest_age = self.jobs_queue.backlog()
+        except Exception as e:
+            print(f"Batch supervisor could not read the queue backlog: {e}")
+            depth, oldest_age = self.last_backlog
+        self.last_backlog = (depth, oldest_age)
+
+        running = self.running()
+        target = desired_workers(
+            len(running), depth, oldest_age,
+            self.min_workers, self.max_workers, self.backlog_per_worker, self.max_job_age
+        )
+
+        if target > len(running):
+            self._low_since = None
+            self._start_workers(target - len(running))
+        elif target < len(running):
+            now = time.monotonic()
+            if self._low_since is None:
+                self._low_since = now
+            elif now - self._low_since >= SCALE_DOWN_DELAY:
+                # Retire the newest worker; it finishes its batch and exits
+                self._workers[max(running)]["stop"].set()
+                self._low_since = now
+        else:
+            self._low_since = None
+
+    def _drain(self):
+        """Let every worker finish its current batch, then stop"""
+        print(f"Batch supervisor draining {len(self._workers)} workers...")
+        for worker in self._workers.values():
+            worker["stop"].set()
+        deadline = time.monotonic() + self.drain_timeout
+        for worker in self._workers.values():
+            worker["process"].join(max(0.0, deadline - time.monotonic()))
+            if worker["process"].is_alive():
+                # Its unacknowledged jobs are redelivered after the visibility timeout
+                worker["process"].terminate()
+                worker["process"].join()
+        self._workers.clear()
+        self._publish()
+        print("Batch supervisor stopped")
+
+    def get_stats(self) -> Dict:
+        depth, oldest_age = self.last_backlog
+        return {
+            "host": self.host,
+            "running": len(self.running()),
+            "draining": len(self._workers) - len(self.running()),
+            "min_workers": self.min_workers,
+            "max_workers": self.max_workers,
+            "queue_depth": depth,
+            "oldest_job_age": round(oldest_age, 1),
+            "restarts": self.restarts,
+            "workers": [
+                {
+                    "worker_id": worker_id,
+                    "pid": worker["pid"],
+                    "jobs": worker["jobs"],
+                    "batches": worker["batches"],
+                    "errors": worker["errors"],
+                    "jobs_per_sec": worker["jobs_per_sec"],
+                    "ready": worker["reported_at"] is not None,
+                    "draining": worker["stop"].is_set(),
+                    "uptime_seconds": int(time.time() - worker["started_at"])
+                }
+                for worker_id, worker in sorted(self._workers.items())
+            ]
+        }
+
+    def _publish(self):
+        """Share this node's pool stats through Redis (one field per supervisor host)"""
+        stats = self.get_stats()
+        stats["updated_at"] = time.time()
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            if self._workers:
+                pipe.hset(WORKERS_KEY, self.host, json.dumps(stats))
+            else:
+                pipe.hdel(WORKERS_KEY, self.host)
+            pipe.expire(WORKERS_KEY, int(STALE_AFTER * 4))
+            pipe.execute()
+        except Exception as e:
+            print(f"Batch supervisor could not publish stats: {e}")
+
+
+def parse_worker_stats(raw: Dict) -> List[Dict]:
+    """Supervisor stats from the WORKERS_KEY hash, dropping hosts that stopped reporting"""
+    now = time.time()
+    pools = []
+    for value in (raw or {}).values():
+        stats = json.loads(value)
+        if now - stats.get("updated_at", 0) <= STALE_AFTER:
+            stats["updated_at"] = datetime.utcfromtimestamp(stats["updated_at"]).isoformat()
+            pools.append(stats)
+    return sorted(pools, key=lambda stats: stats["host"])
+
+
+if __name__ == "__main__":
+    BatchSupervisor().run()
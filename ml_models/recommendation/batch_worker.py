@@ -7,23 +7,27 @@ import time
 from ml_models.recommendation.batch_inference import BatchInferenceQueue
 
 
-def run_worker(interval: int = 5):
-    """Run batch processor worker"""
+def run_worker(block_timeout: float = 1.0, error_backoff: float = 5.0):
+    """Run batch processor worker
+
+    Batches are paced by the queue's max-wait/max-batch policy
+    (RECOMMENDATION_BATCH_MAX_WAIT_MS, RECOMMENDATION_BATCH_MAX_SIZE); the
+    worker only sleeps after an error.
+    """
     queue = BatchInferenceQueue()
-    print("Batch inference worker started...")
+    print(f"Batch inference worker started (max batch {queue.max_batch}, max wait {queue.max_wait * 1000:.0f} ms)...")
     
     while True:
         try:
-            processed = queue.process_batch()
+            processed = queue.process_batch(block_timeout)
             if processed > 0:
                 print(f"Processed {processed} recommendations")
-            time.sleep(interval)
         except KeyboardInterrupt:
             print("Worker stopped")
             break
         except Exception as e:
             print(f"Error: {e}")
-            time.sleep(interval)
+            time.sleep(error_backoff)
 
 
 if __name__ == "__main__":
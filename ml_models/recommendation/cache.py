@@ -0,0 +1,302 @@
+"""
+Recommendation Cache
+Copyright © 2024 Paksa IT Solutions
+
+Two-tier cache for recommendation responses: a bounded in-process LRU (L1)
+in front of Redis (L2). Entries are keyed by tenant, model version, subject,
+recommendation type and limit, and carry the tenant and customer generation
+they were computed under, so invalidation is a single INCR instead of a
+keyspace scan. Concurrent misses for the same key are collapsed into one
+computation (in-process single-flight plus a short Redis lock across
+workers), and hot entries are refreshed probabilistically before they expire.
+L1 entries live for l1_ttl seconds, which bounds how long another worker's
+invalidation can take to reach this process.
+
+Lookups block while another caller computes the same key, so callers on an
+event loop run get_or_compute in a worker thread (the recommendation routes
+go through run_in_threadpool).
+"""
+
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_TENANT = "default"
+
+# KEYS: lock key
+# ARGV: token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class _Flight:
+    """One in-progress computation that other callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class RecommendationCache:
+    """L1 LRU + Redis cache with single-flight misses and early refresh"""
+
+    def __init__(
+        self,
+        redis_client,
+        ttl: int = 3600,
+        l1_size: int = 10_000,
+        l1_ttl: float = 30.0,
+        lock_timeout: float = 10.0,
+        beta: float = 1.0
+    ):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.l1_size = l1_size
+        self.l1_ttl = l1_ttl
+        self.lock_timeout = lock_timeout
+        self.beta = beta
+        self._release_script = redis_client.register_script(RELEASE_LOCK_SCRIPT)
+
+        self._l1: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._l1_lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._flights_lock = threading.Lock()
+        self._stats = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "misses": 0,
+            "early_refreshes": 0,
+            "lock_waits": 0,
+            "redis_errors": 0
+        }
+        self._latency = {"hit": [0, 0.0], "miss": [0, 0.0]}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def _generation_keys(tenant_id: str, subject: str) -> Tuple[str, str]:
+        return f"recgen:{tenant_id}", f"recgen:{tenant_id}:{subject}"
+
+    def get_or_compute(
+        self,
+        compute: Callable[[], Any],
+        tenant_id: Optional[str],
+        subject: Any,
+        recommendation_type: str,
+        limit: int,
+        model_version: str = "default"
+    ) -> Any:
+        """Cached recommendations, computing them at most once per key on a miss"""
+        started = time.perf_counter()
+        tenant_id = tenant_id or DEFAULT_TENANT
+        subject = str(subject if subject is not None else "anon")
+        key = f"rec:{tenant_id}:{model_version}:{subject}:{recommendation_type}:{limit}"
+
+        value = self._l1_get(key)
+        if value is not None:
+            self._record("l1_hits", "hit", started)
+            return value
+
+        tenant_gen_key, subject_gen_key = self._generation_keys(tenant_id, subject)
+        generation = None
+        try:
+            tenant_gen, subject_gen, raw = self.redis_client.mget(tenant_gen_key, subject_gen_key, key)
+            generation = f"{int(tenant_gen or 0)}.{int(subject_gen or 0)}"
+            entry = json.loads(raw) if raw else None
+        except Exception as e:
+            print(f"Recommendation cache read failed: {e}")
+            self._count("redis_errors")
+            entry = None
+
+        if entry and entry["generation"] == generation:
+            # XFetch: the closer to expiry and the slower the computation, the likelier an early refresh
+            early = time.time() - entry["delta"] * self.beta * math.log(1.0 - random.random()) >= entry["expiry"]
+            token = self._acquire_lock(key) if early else None
+            if token is None:
+                self._l1_put(key, entry["value"])
+                self._record("l2_hits", "hit", started)
+                return entry["value"]
+            self._count("early_refreshes")
+            value = self._single_flight(key, lambda: self._compute_and_store(key, generation, compute, token))
+            self._record("misses", "miss", started)
+            return value
+
+        value = self._single_flight(key, lambda: self._compute_across_workers(key, generation, compute))
+        self._record("misses", "miss", started)
+        return value
+
+    def _single_flight(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Run compute once per key in this process; concurrent callers share the result"""
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _compute_across_workers(self, key: str, generation: Optional[str], compute: Callable[[], Any]) -> Any:
+        """Take the Redis lock for the key, or wait briefly for the worker that holds it"""
+        if generation is None:
+            # Redis unavailable: serve uncached
+            return compute()
+
+        token = self._acquire_lock(key)
+        if token is not None:
+            return self._compute_and_store(key, generation, compute, token)
+
+        self._count("lock_waits")
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            try:
+                raw = self.redis_client.get(key)
+            except Exception:
+                break
+            entry = json.loads(raw) if raw else None
+            if entry and entry["generation"] == generation:
+                self._l1_put(key, entry["value"])
+                return entry["value"]
+
+        # The lock holder died or is too slow; compute rather than fail the request
+        return self._compute_and_store(key, generation, compute)
+
+    def _acquire_lock(self, key: str) -> Optional[str]:
+        """Token for the recompute lock on key, or None if another worker holds it"""
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.redis_client.set(f"{key}:lock", token, nx=True, px=int(self.lock_timeout * 1000))
+        except Exception:
+            self._count("redis_errors")
+            return None
+        return token if acquired else None
+
+    def _compute_and_store(
+        self,
+        key: str,
+        generation: Optional[str],
+        compute: Callable[[], Any],
+        token: Optional[str] = None
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            value = compute()
+            delta = time.perf_counter() - started
+            self._l1_put(key, value)
+            if generation is not None:
+                try:
+                    self.redis_client.setex(key, self.ttl, json.dumps({
+                        "generation": generation,
+                        "delta": delta,
+                        "expiry": time.time() + self.ttl,
+                        "value": value
+                    }))
+                except Exception as e:
+                    print(f"Recommendation cache write failed: {e}")
+                    self._count("redis_errors")
+            return value
+        finally:
+            if token is not None:
+                self._release_lock(key, token)
+
+    def _release_lock(self, key: str, token: str):
+        try:
+            # Only delete the lock if it is still ours (it may have expired and been re-taken);
+            # compare and delete in one script so no other worker can take it in between
+            self._release_script(keys=[f"{key}:lock"], args=[token])
+        except Exception:
+            self._count("redis_errors")
+
+    def _l1_get(self, key: str) -> Any:
+        with self._l1_lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return entry[1]
+
+    def _l1_put(self, key: str, value: Any):
+        with self._l1_lock:
+            self._l1[key] = (time.monotonic() + self.l1_ttl, value)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+
+    def _l1_drop(self, prefix: str):
+        with self._l1_lock:
+            for key in [k for k in self._l1 if k.startswith(prefix)]:
+                del self._l1[key]
+
+    def invalidate_tenant(self, tenant_id: Optional[str] = None):
+        """Invalidate every cached response for a tenant (one INCR)"""
+        tenant_id = tenant_id or DEFAULT_TENANT
+        self._l1_drop(f"rec:{tenant_id}:")
+        try:
+            self.redis_client.incr(f"recgen:{tenant_id}")
+        except Exception as e:
+            print(f"Recommendation cache invalidation failed: {e}")
+            self._count("redis_errors")
+
+    def invalidate_subject(self, subject: Any, tenant_id: Optional[str] = None):
+        """Invalidate cached responses for one customer across types and limits"""
+        tenant_id = tenant_id or DEFAULT_TENANT
+        subject = str(subject)
+        with self._l1_lock:
+            for key in [k for k in self._l1 if k.startswith(f"rec:{tenant_id}:") and k.split(":")[3] == subject]:
+                del self._l1[key]
+        try:
+            self.redis_client.incr(self._generation_keys(tenant_id, subject)[1])
+        except Exception as e:
+            print(f"Recommendation cache invalidation failed: {e}")
+            self._count("redis_errors")
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _record(self, name: str, outcome: str, started: float):
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self._stats[name] += 1
+            self._latency[outcome][0] += 1
+            self._latency[outcome][1] += elapsed
+
+    def get_stats(self) -> Dict:
+        """Hit/miss counters and mean latency per outcome"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            latency = {outcome: list(values) for outcome, values in self._latency.items()}
+        lookups = stats["l1_hits"] + stats["l2_hits"] + stats["misses"]
+        with self._l1_lock:
+            stats["l1_entries"] = len(self._l1)
+        stats["hit_rate"] = round((stats["l1_hits"] + stats["l2_hits"]) / lookups, 4) if lookups else 0.0
+        for outcome, (count, total) in latency.items():
+            stats[f"avg_{outcome}_ms"] = round(total / count * 1000, 3) if count else 0.0
+        return stats
@@ -0,0 +1,277 @@
+"""
+Item-Item Co-occurrence Index
+Copyright © 2024 Paksa IT Solutions
+
+Precomputed "frequently bought together" table for cross-sell.
+Counts are held as a sparse CSR matrix built in bulk from order_items, plus a
+small delta of orders seen since the last rebuild. Lookups read a fixed-width
+top-K row, so serving a product page never touches the database.
+"""
+
+import os
+import threading
+import time
+import numpy as np
+import scipy.sparse as sp
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from ml_models.recommendation.product_cards import ProductCards
+
+DEFAULT_INDEX_PATH = "models/trained/cooccurrence_index.npz"
+
+
+class CoOccurrenceIndex:
+    """Sparse top-K co-purchase neighbour table per product"""
+
+    def __init__(self, top_k: int = 20):
+        self.top_k = top_k
+        self.built_at: Optional[datetime] = None
+
+        # Bulk-built state (replaced atomically on rebuild/load)
+        self._ids = np.empty(0, dtype=np.int64)           # position -> product id
+        self._positions: Dict[int, int] = {}               # product id -> position
+        self._counts = sp.csr_matrix((0, 0), dtype=np.int32)
+        self._topk_ids = np.empty((0, top_k), dtype=np.int64)
+        self._topk_scores = np.empty((0, top_k), dtype=np.float32)
+
+        # Incremental state since the last rebuild
+        self._delta: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self._overrides: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+        self._lock = threading.Lock()
+
+    @property
+    def is_built(self) -> bool:
+        return self.built_at is not None
+
+    def rebuild(self, db=None):
+        """Rebuild the whole index from order_items in one pass"""
+        from config.database import SessionLocal
+        from api.models.database_models import OrderItem
+
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            rows = db.query(OrderItem.order_id, OrderItem.product_id).filter(
+                OrderItem.product_id.isnot(None)
+            ).all()
+            ProductCards.load_all(db)
+        finally:
+            if own_session:
+                db.close()
+
+        order_ids = np.fromiter((r.order_id for r in rows), dtype=np.int64, count=len(rows))
+        product_ids = np.fromiter((r.product_id for r in rows), dtype=np.int64, count=len(rows))
+
+        self.build_from_pairs(order_ids, product_ids)
+
+    def build_from_pairs(self, order_ids: np.ndarray, product_ids: np.ndarray):
+        """Build counts from parallel (order_id, product_id) arrays"""
+        ids, product_pos = np.unique(product_ids, return_inverse=True)
+        _, order_pos = np.unique(order_ids, return_inverse=True)
+
+        # Binary order x product incidence; duplicate line items count once
+        incidence = sp.csr_matrix(
+            (np.ones(len(product_pos), dtype=np.int32), (order_pos, product_pos)),
+            shape=(int(order_pos.max()) + 1 if len(order_pos) else 0, len(ids))
+        )
+        incidence.data[:] = 1
+
+        counts = (incidence.T @ incidence).tocsr()
+        counts.setdiag(0)
+        counts.eliminate_zeros()
+
+        topk_ids, topk_scores = self._topk_table(ids, counts)
+
+        with self._lock:
+            self._ids = ids
+            self._positions = {int(pid): i for i, pid in enumerate(ids)}
+            self._counts = counts
+            self._topk_ids = topk_ids
+            self._topk_scores = topk_scores
+            self._delta.clear()
+            self._overrides.clear()
+            self.built_at = datetime.utcnow()
+
+    def _topk_table(self, ids: np.ndarray, counts: sp.csr_matrix) -> Tuple[np.ndarray, np.ndarray]:
+        """Compute the fixed-width top-K neighbour table (-1 padded)"""
+        n = len(ids)
+        topk_ids = np.full((n, self.top_k), -1, dtype=np.int64)
+        topk_scores = np.zeros((n, self.top_k), dtype=np.float32)
+
+        for row in range(n):
+            start, end = counts.indptr[row], counts.indptr[row + 1]
+            if start == end:
+                continue
+            neighbour_ids, scores = self._select_top(
+                ids[counts.indices[start:end]], counts.data[start:end]
+            )
+            topk_ids[row, :len(neighbour_ids)] = neighbour_ids
+            topk_scores[row, :len(scores)] = scores
+
+        return topk_ids, topk_scores
+
+    def _select_top(self, neighbour_ids: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Pick the K highest-scoring neighbours, ties broken by product id"""
+        if len(scores) > self.top_k:
+            keep = np.argpartition(-scores, self.top_k - 1)[:self.top_k]
+            # Pull in every neighbour tied with the cut-off so tie-breaking is deterministic
+            cutoff = scores[keep].min()
+            keep = np.flatnonzero(scores >= cutoff)
+            neighbour_ids, scores = neighbour_ids[keep], scores[keep]
+
+        order = np.lexsort((neighbour_ids, -scores))[:self.top_k]
+        return neighbour_ids[order], scores[order].astype(np.float32)
+
+    def add_order(self, product_ids: Iterable[int]):
+        """Fold a newly placed order into the index"""
+        unique_ids = sorted({int(pid) for pid in product_ids if pid is not None})
+        if len(unique_ids) < 2:
+            return
+
+        with self._lock:
+            for pid in unique_ids:
+                for other in unique_ids:
+                    if other != pid:
+                        self._delta[pid][other] += 1
+                self._overrides.pop(pid, None)
+
+    def neighbours(self, product_id: int, limit: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (product_ids, scores) of the top co-purchased products"""
+        limit = min(limit, self.top_k)
+
+        if product_id in self._delta:
+            cached = self._overrides.get(product_id)
+            if cached is None:
+                cached = self._merge_delta(product_id)
+            neighbour_ids, scores = cached
+        else:
+            with self._lock:
+                row = self._positions.get(product_id)
+                if row is None:
+                    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+                neighbour_ids, scores = self._topk_ids[row], self._topk_scores[row]
+
+        valid = neighbour_ids[:limit] >= 0
+        return neighbour_ids[:limit][valid], scores[:limit][valid]
+
+    def _merge_delta(self, product_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Combine the bulk row with incremental counts and cache the result"""
+        with self._lock:
+            merged = dict(self._delta.get(product_id, {}))
+            row = self._positions.get(product_id)
+            if row is not None:
+                start, end = self._counts.indptr[row], self._counts.indptr[row + 1]
+                for pos, count in zip(self._counts.indices[start:end], self._counts.data[start:end]):
+                    pid = int(self._ids[pos])
+                    merged[pid] = merged.get(pid, 0) + int(count)
+
+            neighbour_ids = np.fromiter(merged.keys(), dtype=np.int64, count=len(merged))
+            scores = np.fromiter(merged.values(), dtype=np.float32, count=len(merged))
+            result = self._select_top(neighbour_ids, scores)
+            self._overrides[product_id] = result
+            return result
+
+    def product_details(self, product_ids: Iterable[int]) -> List[Dict]:
+        """Product cards for the given neighbour ids"""
+        return ProductCards.get_many(product_ids)
+
+    def save(self, path: str = DEFAULT_INDEX_PATH):
+        """Persist the bulk index as compressed NumPy arrays"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            np.savez_compressed(
+                path,
+                ids=self._ids,
+                indptr=self._counts.indptr,
+                indices=self._counts.indices,
+                data=self._counts.data,
+                topk_ids=self._topk_ids,
+                topk_scores=self._topk_scores,
+                built_at=np.array(self.built_at.isoformat() if self.built_at else "")
+            )
+
+    def load(self, path: str = DEFAULT_INDEX_PATH) -> bool:
+        """Load a previously saved index; returns False if none exists"""
+        if not os.path.exists(path):
+            return False
+
+        with np.load(path) as archive:
+            ids = archive["ids"]
+            counts = sp.csr_matrix(
+                (archive["data"], archive["indices"], archive["indptr"]),
+                shape=(len(ids), len(ids))
+            )
+            topk_ids = archive["topk_ids"]
+            topk_scores = archive["topk_scores"]
+            built_at = str(archive["built_at"])
+
+        with self._lock:
+            self.top_k = topk_ids.shape[1]
+            self._ids = ids
+            self._positions = {int(pid): i for i, pid in enumerate(ids)}
+            self._counts = counts
+            self._topk_ids = topk_ids
+            self._topk_scores = topk_scores
+            self._delta.clear()
+            self._overrides.clear()
+            self.built_at = datetime.fromisoformat(built_at) if built_at else datetime.utcnow()
+        return True
+
+    def get_stats(self) -> Dict:
+        """Index statistics for monitoring"""
+        return {
+            "products": len(self._ids),
+            "pairs": int(self._counts.nnz),
+            "top_k": self.top_k,
+            "pending_delta_products": len(self._delta),
+            "built_at": self.built_at.isoformat() if self.built_at else None
+        }
+
+
+# Process-wide index shared by the recommendation engine and webhook processors
+_index = CoOccurrenceIndex()
+_index_lock = threading.Lock()
+_reload_state = {"next_check": 0.0, "mtime": 0.0, "builder": None}
+RELOAD_CHECK_SECONDS = 300
+
+
+def _build_from_db():
+    try:
+        _index.rebuild()
+        print(f"Co-occurrence index built from the database ({len(_index._ids)} products)")
+    except Exception as e:
+        print(f"Co-occurrence index build failed, retrying in {RELOAD_CHECK_SECONDS}s: {e}")
+
+
+def get_cooccurrence_index(path: str = DEFAULT_INDEX_PATH) -> CoOccurrenceIndex:
+    """Get the shared index, loading it from disk on first use.
+
+    Picks up the file written by the nightly rebuild task within
+    RELOAD_CHECK_SECONDS so every API worker converges on the same table.
+    Without a file the index is built from the database on a background
+    thread; until it is ready the returned index is empty (is_built False)
+    and callers fall back to SQL.
+    """
+    now = time.time()
+    if now < _reload_state["next_check"]:
+        return _index
+
+    with _index_lock:
+        if now < _reload_state["next_check"]:
+            return _index
+        _reload_state["next_check"] = now + RELOAD_CHECK_SECONDS
+        mtime = os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+        if mtime > _reload_state["mtime"] and _index.load(path):
+            _reload_state["mtime"] = mtime
+        elif not _index.is_built:
+            builder = _reload_state["builder"]
+            if builder is None or not builder.is_alive():
+                print(f"No co-occurrence index at {path}; building it in the background")
+                builder = threading.Thread(target=_build_from_db, name="cooccurrence-build", daemon=True)
+                _reload_state["builder"] = builder
+                builder.start()
+
+    return _index
@@ -3,14 +3,21 @@ Recommendation Engine - Inference
 Copyright © 2024 Paksa IT Solutions
 """
 
+import os
 import tensorflow as tf
 import numpy as np
 from typing import List, Optional
-import redis
-import json
 from api.utils.usage_tracker import UsageTracker
+from api.utils.quota import tenant_quota
 from ml_models.model_version_manager import ModelVersionManager
 from ml_models.tenant_model_isolation import TenantModelIsolation
+from ml_models.recommendation.cache import RecommendationCache
+from ml_models.recommendation.cooccurrence import get_cooccurrence_index
+from ml_models.recommendation.interaction_matrix import get_interaction_matrix
+from ml_models.recommendation.product_cards import ProductCards
+from ml_models.recommendation.retrieval import TwoTowerRetriever
+from config.redis_client import get_redis
+from config.settings import settings
 
 
 class RecommendationEngine:
@@ -18,7 +25,10 @@ class RecommendationEngine:
     
     def __init__(self):
         self.model = None
-        self.redis_client = redis.from_url("redis://localhost:6379/0")
+        self._retriever = None
+        self.model_version = "default"
+        self.redis_client = get_redis()
+        self.cache = RecommendationCache(self.redis_client, ttl=settings.REDIS_CACHE_TTL)
         self.version_manager = ModelVersionManager("recommendation")
         self.isolation = TenantModelIsolation("recommendation")
         self._load_model()
@@ -31,12 +41,14 @@ class RecommendationEngine:
                 tenant_model = self.isolation.get_model_path(tenant_id)
                 if tenant_model:
                     self.model = tf.keras.models.load_model(tenant_model)
+                    self.model_version = os.path.basename(os.path.normpath(tenant_model))
                     return
             
             # Use version manager for shared model
             model_path = self.version_manager.get_active_version(user_id)
             if model_path:
                 self.model = tf.keras.models.load_model(model_path)
+                self.model_version = os.path.basename(os.path.normpath(model_path))
             else:
                 # Fallback to default
                 self.model = tf.keras.models.load_model("models/trained/recommendation_model")
@@ -53,35 +65,144 @@ class RecommendationEngine:
     ):
         """Generate recommendations"""
         
-        # Track ML inference
+        # Track ML inference; past the daily quota only the non-personalized list is served
         if tenant_id:
+            if not tenant_quota.consume(tenant_id, "ml_inferences"):
+                return self._popular_products(limit)
             UsageTracker.track_ml_inference(tenant_id, "recommendation")
         
         # Cold-start detection: check if tenant has enough data
         if tenant_id and self._is_cold_start(tenant_id):
             return self._popular_products(limit)
         
-        # Check cache first
-        cache_key = f"rec:{customer_id}:{recommendation_type}"
-        cached = self.redis_client.get(cache_key)
-        if cached:
-            return json.loads(cached)
-        
-        # Generate recommendations
+        return self.cache.get_or_compute(
+            lambda: self._generate(customer_id, limit, recommendation_type),
+            tenant_id=tenant_id,
+            subject=customer_id,
+            recommendation_type=recommendation_type,
+            limit=limit,
+            model_version=self.model_version
+        )
+    
+    def predict_many(
+        self,
+        customer_ids: List[Optional[int]],
+        limits: List[int],
+        recommendation_type: str = "personalized",
+        tenant_id: Optional[str] = None
+    ) -> List[dict]:
+        """predict() for a group of requests sharing tenant and type, scored in one pass"""
+        # Non-personal lists are computed once for the whole group
+        shared = {}
+
+        def fallback(kind: str, limit: int):
+            if kind not in shared:
+                shared[kind] = self._trending_products(max(limits)) if kind == "trending" else self._popular_products(max(limits))
+            return self._truncate(shared[kind], limit)
+
+        if tenant_id:
+            if not tenant_quota.consume(tenant_id, "ml_inferences", len(customer_ids)):
+                return [fallback("popular", limit) for limit in limits]
+            for _ in customer_ids:
+                UsageTracker.track_ml_inference(tenant_id, "recommendation")
+
+        if tenant_id and self._is_cold_start(tenant_id):
+            return [fallback("popular", limit) for limit in limits]
+        if recommendation_type not in ("personalized", "two_tower"):
+            kind = "trending" if recommendation_type == "trending" else "popular"
+            return [fallback(kind, limit) for limit in limits]
+
+        known = [i for i, customer_id in enumerate(customer_ids) if customer_id]
+        scored_by, ranked = self._rank_many([customer_ids[i] for i in known], max(limits), recommendation_type)
+
+        results = [None if customer_id else fallback("popular", limit) for customer_id, limit in zip(customer_ids, limits)]
+        if ranked is None:
+            # No batched scorer available: fall back to one _generate per request
+            for i in known:
+                results[i] = self._generate(customer_ids[i], limits[i], recommendation_type)
+            return results
+
+        cards = {p["id"]: p for p in ProductCards.get_many(
+            {int(pid) for product_ids, _ in ranked for pid in product_ids}
+        )}
+        for i, (product_ids, scores) in zip(known, ranked):
+            if len(product_ids) == 0:
+                # Same fallbacks as _generate: popular without history, trending when nothing unseen is similar
+                if scored_by == "personalized":
+                    has_history = get_interaction_matrix().has_history(customer_ids[i])
+                    results[i] = fallback("trending" if has_history else "popular", limits[i])
+                else:
+                    results[i] = self._generate(customer_ids[i], limits[i], "personalized")
+                continue
+            products = [cards[pid] for pid in product_ids.tolist() if pid in cards][:limits[i]]
+            score_by_id = dict(zip(product_ids.tolist(), scores.tolist()))
+            results[i] = {
+                "products": products,
+                "scores": [float(score_by_id[p["id"]]) for p in products],
+                "recommendation_type": scored_by
+            }
+        return results
+
+    def _rank_many(self, customer_ids: List[int], limit: int, recommendation_type: str):
+        """(scorer, [(product_ids, scores) per customer]); the list is None when no batched scorer is available"""
+        if recommendation_type == "two_tower":
+            retriever = self._get_retriever()
+            if retriever is not None:
+                return "two_tower", retriever.retrieve(customer_ids, limit)
+        if settings.RECOMMENDATION_SPARSE_CF_ENABLED:
+            try:
+                return "personalized", get_interaction_matrix().recommend_many(customer_ids, limit)
+            except Exception as e:
+                print(f"Sparse CF unavailable, falling back to SQL: {e}")
+        return recommendation_type, None
+
+    @staticmethod
+    def _truncate(result: dict, limit: int) -> dict:
+        return dict(result, products=result["products"][:limit], scores=result["scores"][:limit])
+
+    def _generate(self, customer_id: Optional[int], limit: int, recommendation_type: str):
+        """Generate recommendations (uncached)"""
         if recommendation_type == "personalized" and customer_id:
-            recommendations = self._personalized_recommendations(customer_id, limit)
+            return self._personalized_recommendations(customer_id, limit)
+        elif recommendation_type == "two_tower" and customer_id:
+            return self._two_tower_recommendations(customer_id, limit)
         elif recommendation_type == "trending":
-            recommendations = self._trending_products(limit)
-        else:
-            recommendations = self._popular_products(limit)
-        
-        # Cache results
-        self.redis_client.setex(cache_key, 3600, json.dumps(recommendations))
-        
-        return recommendations
+            return self._trending_products(limit)
+        return self._popular_products(limit)
     
     def _personalized_recommendations(self, customer_id: int, limit: int):
         """Generate personalized recommendations using collaborative filtering"""
+        if settings.RECOMMENDATION_SPARSE_CF_ENABLED:
+            try:
+                return self._personalized_from_matrix(customer_id, limit)
+            except Exception as e:
+                print(f"Sparse CF unavailable, falling back to SQL: {e}")
+        
+        return self._personalized_from_db(customer_id, limit)
+    
+    def _personalized_from_matrix(self, customer_id: int, limit: int):
+        """Item-based CF over the offline interaction matrix (one sparse dot product)"""
+        matrix = get_interaction_matrix()
+        
+        # Also the case while the matrix is still being built after a cold start
+        if not matrix.has_history(customer_id):
+            return self._popular_products(limit)
+        
+        product_ids, scores = matrix.recommend(customer_id, limit)
+        if len(product_ids) == 0:
+            return self._trending_products(limit)
+        
+        products = ProductCards.get_many(product_ids)
+        score_by_id = dict(zip(product_ids.tolist(), scores.tolist()))
+        
+        return {
+            "products": products,
+            "scores": [float(score_by_id[p["id"]]) for p in products],
+            "recommendation_type": "personalized"
+        }
+    
+    def _personalized_from_db(self, customer_id: int, limit: int):
+        """Collaborative filtering via per-request SQL (legacy path)"""
         from config.database import SessionLocal
         from api.models.database_models import Customer, Order, OrderItem, Product
         from sqlalchemy import func
@@ -133,8 +254,64 @@ class RecommendationEngine:
         finally:
             db.close()
     
+    def _get_retriever(self) -> Optional[TwoTowerRetriever]:
+        """Two-tower retriever over exported product embeddings, if available"""
+        if self._retriever is None:
+            if self.model is None:
+                return None
+            try:
+                self._retriever = TwoTowerRetriever(self.model)
+            except Exception as e:
+                print(f"Two-tower retrieval unavailable: {e}")
+                self._retriever = False
+        
+        if not self._retriever:
+            return None
+        if not self._retriever.is_ready:
+            self._retriever.load()
+        return self._retriever if self._retriever.is_ready else None
+    
+    def _two_tower_recommendations(self, customer_id: int, limit: int):
+        """Retrieve candidates with the two-tower model and re-rank them"""
+        retriever = self._get_retriever()
+        if retriever is None:
+            return self._personalized_recommendations(customer_id, limit)
+        
+        product_ids, scores = retriever.retrieve([customer_id], limit)[0]
+        if len(product_ids) == 0:
+            return self._personalized_recommendations(customer_id, limit)
+        
+        products = ProductCards.get_many(product_ids)
+        score_by_id = dict(zip(product_ids.tolist(), scores.tolist()))
+        
+        return {
+            "products": products,
+            "scores": [float(score_by_id[p["id"]]) for p in products],
+            "recommendation_type": "two_tower"
+        }
+    
     def cross_sell(self, product_id: int, limit: int = 5):
         """Cross-sell recommendations - products frequently bought together"""
+        try:
+            index = get_cooccurrence_index()
+        except Exception as e:
+            print(f"Co-occurrence index unavailable, falling back to SQL: {e}")
+            return self._cross_sell_from_db(product_id, limit)
+        if not index.is_built:
+            # Still being built after a cold start
+            return self._cross_sell_from_db(product_id, limit)
+        
+        neighbour_ids, scores = index.neighbours(product_id, limit)
+        products = index.product_details(neighbour_ids)
+        score_by_id = dict(zip(neighbour_ids.tolist(), scores.tolist()))
+        
+        return {
+            "products": products,
+            "scores": [float(score_by_id[p["id"]]) for p in products]
+        }
+    
+    def _cross_sell_from_db(self, product_id: int, limit: int = 5):
+        """Cross-sell via a self-join over order_items (used when the index is unavailable)"""
         from config.database import SessionLocal
         from api.models.database_models import Product, OrderItem
         from sqlalchemy import func
@@ -201,35 +378,22 @@ class RecommendationEngine:
     def _trending_products(self, limit: int):
         """Get trending products based on recent sales"""
         from config.database import SessionLocal
-        from api.models.database_models import Product, OrderItem, Order
-        from sqlalchemy import func
-        from datetime import datetime, timedelta
+        from data_pipeline.sales_rollup import SalesRollup
         
         db = SessionLocal()
         try:
             # Get products with most sales in last 30 days
-            thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-            trending = db.query(
-                Product.id,
-                Product.name,
-                Product.price,
-                Product.image_url,
-                func.count(OrderItem.id).label('sales_count')
-            ).join(OrderItem).join(Order).filter(
-                Order.created_at >= thirty_days_ago
-            ).group_by(Product.id).order_by(func.count(OrderItem.id).desc()).limit(limit).all()
-            
-            return {
-                "products": [{
-                    "id": p.id,
-                    "name": p.name,
-                    "price": p.price,
-                    "image_url": p.image_url
-                } for p in trending],
-                "scores": [float(p.sales_count) for p in trending]
-            }
+            trending = SalesRollup.top_products(db, days=30, limit=limit)
         finally:
             db.close()
+        
+        products = ProductCards.get_many([pid for pid, _ in trending])
+        sales_count = dict(trending)
+        
+        return {
+            "products": products,
+            "scores": [float(sales_count[p["id"]]) for p in products]
+        }
     
     def _popular_products(self, limit: int):
         """Get popular products based on total sales"""
@@ -261,15 +425,12 @@ class RecommendationEngine:
         finally:
             db.close()
     
-    def invalidate_cache(self, customer_id: Optional[int] = None):
-        """Invalidate recommendation cache"""
+    def invalidate_cache(self, customer_id: Optional[int] = None, tenant_id: Optional[str] = None):
+        """Invalidate recommendation cache for one customer or a whole tenant"""
         if customer_id:
-            self.redis_client.delete(f"rec:{customer_id}:personalized")
-            self.redis_client.delete(f"rec:{customer_id}:trending")
+            self.cache.invalidate_subject(customer_id, tenant_id)
         else:
-            # Invalidate all caches
-            for key in self.redis_client.scan_iter("rec:*"):
-                self.redis_client.delete(key)
+            self.cache.invalidate_tenant(tenant_id)
     
     def _is_cold_start(self, tenant_id: str, min_orders: int = 10) -> bool:
         """Detect if tenant is in cold-start phase (insufficient data)"""
@@ -0,0 +1,277 @@
+"""
+Sparse Interaction Matrix - Item-Based Collaborative Filtering
+Copyright © 2024 Paksa IT Solutions
+
+Offline-built customer x product purchase matrix and a pruned item-item
+cosine similarity matrix. Serving a customer is one sparse row-times-matrix
+product followed by an argpartition top-K; no SQL on the request path.
+"""
+
+import os
+import threading
+import time
+import numpy as np
+import scipy.sparse as sp
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_MATRIX_PATH = "models/trained/interaction_matrix.npz"
+
+
+class InteractionMatrix:
+    """Customer x product interactions with item-item similarity scoring"""
+
+    def __init__(self, neighbours_per_item: int = 100):
+        self.neighbours_per_item = neighbours_per_item
+        self.built_at: Optional[datetime] = None
+
+        self._customer_ids = np.empty(0, dtype=np.int64)
+        self._product_ids = np.empty(0, dtype=np.int64)
+        self._customer_rows: Dict[int, int] = {}
+        self._interactions = sp.csr_matrix((0, 0), dtype=np.float32)
+        self._similarity = sp.csr_matrix((0, 0), dtype=np.float32)
+
+        self._lock = threading.Lock()
+
+    @property
+    def is_built(self) -> bool:
+        return self.built_at is not None
+
+    def rebuild(self, db=None):
+        """Build the matrix from one aggregate query over orders"""
+        from config.database import SessionLocal
+        from api.models.database_models import Order, OrderItem
+        from sqlalchemy import func
+
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            rows = db.query(
+                Order.customer_id,
+                OrderItem.product_id,
+                func.count(OrderItem.id).label('purchases')
+            ).join(OrderItem).filter(
+                Order.customer_id.isnot(None),
+                OrderItem.product_id.isnot(None)
+            ).group_by(Order.customer_id, OrderItem.product_id).all()
+        finally:
+            if own_session:
+                db.close()
+
+        self.build_from_triples(
+            np.fromiter((r.customer_id for r in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((r.product_id for r in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((r.purchases for r in rows), dtype=np.float32, count=len(rows))
+        )
+
+    def build_from_triples(self, customer_ids: np.ndarray, product_ids: np.ndarray, purchases: np.ndarray):
+        """Build from parallel (customer_id, product_id, purchase_count) arrays"""
+        customers, rows = np.unique(customer_ids, return_inverse=True)
+        products, cols = np.unique(product_ids, return_inverse=True)
+
+        # Dampen repeat purchases so one heavy buyer does not dominate similarity
+        interactions = sp.csr_matrix(
+            (np.log1p(purchases).astype(np.float32), (rows, cols)),
+            shape=(len(customers), len(products))
+        )
+        similarity = self._item_similarity(interactions)
+
+        with self._lock:
+            self._customer_ids = customers
+            self._product_ids = products
+            self._customer_rows = {int(cid): i for i, cid in enumerate(customers)}
+            self._interactions = interactions
+            self._similarity = similarity
+            self.built_at = datetime.utcnow()
+
+    def _item_similarity(self, interactions: sp.csr_matrix) -> sp.csr_matrix:
+        """Cosine similarity between product columns, pruned to the top neighbours per item"""
+        norms = np.sqrt(np.asarray(interactions.multiply(interactions).sum(axis=0))).ravel()
+        norms[norms == 0] = 1.0
+        normalized = interactions @ sp.diags(1.0 / norms).astype(np.float32)
+
+        similarity = (normalized.T @ normalized).tocsr()
+        similarity.setdiag(0)
+        similarity.eliminate_zeros()
+
+        return self._prune_rows(similarity, self.neighbours_per_item)
+
+    @staticmethod
+    def _prune_rows(matrix: sp.csr_matrix, keep: int) -> sp.csr_matrix:
+        """Keep only the `keep` largest entries of each row"""
+        indptr = np.zeros(matrix.shape[0] + 1, dtype=np.int64)
+        indices, data = [], []
+
+        for row in range(matrix.shape[0]):
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            row_idx, row_data = matrix.indices[start:end], matrix.data[start:end]
+            if len(row_data) > keep:
+                top = np.argpartition(-row_data, keep - 1)[:keep]
+                row_idx, row_data = row_idx[top], row_data[top]
+            indices.append(row_idx)
+            data.append(row_data)
+            indptr[row + 1] = indptr[row] + len(row_data)
+
+        return sp.csr_matrix(
+            (
+                np.concatenate(data) if data else np.empty(0, dtype=np.float32),
+                np.concatenate(indices) if indices else np.empty(0, dtype=np.int32),
+                indptr
+            ),
+            shape=matrix.shape
+        )
+
+    def has_history(self, customer_id: int) -> bool:
+        """Whether the customer has any purchases in the matrix"""
+        row = self._customer_rows.get(customer_id)
+        return row is not None and self._interactions.indptr[row + 1] > self._interactions.indptr[row]
+
+    def recommend(self, customer_id: int, limit: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (product_ids, scores) of unseen products ranked for the customer"""
+        with self._lock:
+            row = self._customer_rows.get(customer_id)
+            if row is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            history = self._interactions[row]
+            similarity = self._similarity
+            product_ids = self._product_ids
+
+        scores = (history @ similarity).toarray().ravel()
+        scores[history.indices] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        return product_ids[candidates], scores[candidates].astype(np.float32)
+
+    def recommend_many(self, customer_ids: List[int], limit: int = 10) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """recommend() for many customers with one sparse matrix product; empty for unknown customers"""
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        with self._lock:
+            rows = [self._customer_rows.get(cid) for cid in customer_ids]
+            known = [i for i, row in enumerate(rows) if row is not None]
+            if not known:
+                return [empty] * len(customer_ids)
+            history = self._interactions[[rows[i] for i in known]]
+            similarity = self._similarity
+            product_ids = self._product_ids
+
+        # Scores stay sparse: only products similar to something in the history are stored
+        scored = (history @ similarity).tocsr()
+        scored.sort_indices()
+
+        results = [empty] * len(customer_ids)
+        for slot, i in enumerate(known):
+            start, end = scored.indptr[slot], scored.indptr[slot + 1]
+            candidates, scores = scored.indices[start:end], scored.data[start:end]
+            seen = history.indices[history.indptr[slot]:history.indptr[slot + 1]]
+            keep = (scores > 0) & ~np.isin(candidates, seen)
+            candidates, scores = candidates[keep], scores[keep]
+            if len(candidates) > limit:
+                top = np.argpartition(-scores, limit - 1)[:limit]
+                candidates, scores = candidates[top], scores[top]
+            order = np.argsort(-scores, kind="stable")
+            results[i] = (product_ids[candidates[order]], scores[order].astype(np.float32))
+        return results
+
+    def save(self, path: str = DEFAULT_MATRIX_PATH):
+        """Persist both matrices as compressed NumPy arrays"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            np.savez_compressed(
+                path,
+                customer_ids=self._customer_ids,
+                product_ids=self._product_ids,
+                x_indptr=self._interactions.indptr,
+                x_indices=self._interactions.indices,
+                x_data=self._interactions.data,
+                s_indptr=self._similarity.indptr,
+                s_indices=self._similarity.indices,
+                s_data=self._similarity.data,
+                built_at=np.array(self.built_at.isoformat() if self.built_at else "")
+            )
+
+    def load(self, path: str = DEFAULT_MATRIX_PATH) -> bool:
+        """Load a previously saved matrix; returns False if none exists"""
+        if not os.path.exists(path):
+            return False
+
+        with np.load(path) as archive:
+            customers = archive["customer_ids"]
+            products = archive["product_ids"]
+            interactions = sp.csr_matrix(
+                (archive["x_data"], archive["x_indices"], archive["x_indptr"]),
+                shape=(len(customers), len(products))
+            )
+            similarity = sp.csr_matrix(
+                (archive["s_data"], archive["s_indices"], archive["s_indptr"]),
+                shape=(len(products), len(products))
+            )
+            built_at = str(archive["built_at"])
+
+        with self._lock:
+            self._customer_ids = customers
+            self._product_ids = products
+            self._customer_rows = {int(cid): i for i, cid in enumerate(customers)}
+            self._interactions = interactions
+            self._similarity = similarity
+            self.built_at = datetime.fromisoformat(built_at) if built_at else datetime.utcnow()
+        return True
+
+    def get_stats(self) -> Dict:
+        """Matrix statistics for monitoring"""
+        return {
+            "customers": len(self._customer_ids),
+            "products": len(self._product_ids),
+            "interactions": int(self._interactions.nnz),
+            "similarity_entries": int(self._similarity.nnz),
+            "built_at": self.built_at.isoformat() if self.built_at else None
+        }
+
+
+# Process-wide matrix used by RecommendationEngine
+_matrix = InteractionMatrix()
+_matrix_lock = threading.Lock()
+_reload_state = {"next_check": 0.0, "mtime": 0.0, "builder": None}
+RELOAD_CHECK_SECONDS = 300
+
+
+def _build_from_db():
+    try:
+        _matrix.rebuild()
+        print(f"Interaction matrix built from the database ({len(_matrix._customer_ids)} customers)")
+    except Exception as e:
+        print(f"Interaction matrix build failed, retrying in {RELOAD_CHECK_SECONDS}s: {e}")
+
+
+def get_interaction_matrix(path: str = DEFAULT_MATRIX_PATH) -> InteractionMatrix:
+    """Get the shared matrix, picking up the periodic offline rebuild when it lands.
+
+    Without a file the matrix is built from the database on a background
+    thread; until it is ready the returned matrix is empty (is_built False),
+    so no customer has history and personalized requests get popular
+    products.
+    """
+    now = time.time()
+    if now < _reload_state["next_check"]:
+        return _matrix
+
+    with _matrix_lock:
+        if now < _reload_state["next_check"]:
+            return _matrix
+        _reload_state["next_check"] = now + RELOAD_CHECK_SECONDS
+        mtime = os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+        if mtime > _reload_state["mtime"] and _matrix.load(path):
+            _reload_state["mtime"] = mtime
+        elif not _matrix.is_built:
+            builder = _reload_state["builder"]
+            if builder is None or not builder.is_alive():
+                print(f"No interaction matrix at {path}; building it in the background")
+                builder = threading.Thread(target=_build_from_db, name="interaction-matrix-build", daemon=True)
+                _reload_state["builder"] = builder
+                builder.start()
+
+    return _matrix
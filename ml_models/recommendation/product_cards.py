@@ -0,0 +1,78 @@
+"""
+Product Card Cache
+Copyright © 2024 Paksa IT Solutions
+
+In-process id -> {id, name, price, image_url} map shared by the precomputed
+recommendation indexes, so they can return products without a SQL round trip.
+"""
+
+import threading
+from typing import Dict, Iterable, List
+
+_cards: Dict[int, Dict] = {}
+_cards_lock = threading.Lock()
+
+
+class ProductCards:
+    """Lightweight product metadata used in recommendation responses"""
+
+    @staticmethod
+    def load_all(db=None):
+        """Replace the cache with every product in the catalog"""
+        from config.database import SessionLocal
+        from api.models.database_models import Product
+
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            products = db.query(
+                Product.id, Product.name, Product.price, Product.image_url
+            ).all()
+        finally:
+            if own_session:
+                db.close()
+
+        cards = {
+            p.id: {"id": p.id, "name": p.name, "price": p.price, "image_url": p.image_url}
+            for p in products
+        }
+        with _cards_lock:
+            _cards.clear()
+            _cards.update(cards)
+
+    @staticmethod
+    def upsert(product: Dict):
+        """Insert or refresh a single product card"""
+        with _cards_lock:
+            _cards[product["id"]] = {
+                "id": product["id"],
+                "name": product.get("name"),
+                "price": product.get("price"),
+                "image_url": product.get("image_url")
+            }
+
+    @staticmethod
+    def get_many(product_ids: Iterable[int]) -> List[Dict]:
+        """Cards for the given ids in order, loading unknown ids in one query"""
+        product_ids = [int(pid) for pid in product_ids]
+        missing = [pid for pid in product_ids if pid not in _cards]
+        if missing:
+            ProductCards._load(missing)
+        return [_cards[pid] for pid in product_ids if pid in _cards]
+
+    @staticmethod
+    def _load(product_ids: List[int]):
+        """Fetch cards for products not seen yet"""
+        from config.database import SessionLocal
+        from api.models.database_models import Product
+
+        db = SessionLocal()
+        try:
+            products = db.query(
+                Product.id, Product.name, Product.price, Product.image_url
+            ).filter(Product.id.in_(product_ids)).all()
+        finally:
+            db.close()
+
+        for p in products:
+            ProductCards.upsert({"id": p.id, "name": p.name, "price": p.price, "image_url": p.image_url})
@@ -0,0 +1,159 @@
+"""
+Two-Tower Retrieval
+Copyright © 2024 Paksa IT Solutions
+
+Serves the trained two-tower model from train.py. Product-tower outputs are
+exported once into a contiguous float32 matrix (memory-mapped .npy), the user
+tower runs once per request batch, and candidates come from a batched
+inner-product top-K (IVF index for large catalogs, exact scan otherwise).
+
+The model joins the towers with an MLP rather than a dot product, so the
+inner product is only used for candidate generation; the shortlist is
+re-scored with the full model in a single batched predict.
+Embedding rows are indexed by database id, as in training.
+"""
+
+import os
+import numpy as np
+import tensorflow as tf
+from typing import List, Optional, Sequence, Tuple
+from ml_models.common.vector_index import IVFIndex, exact_top_k
+
+DEFAULT_EMBEDDINGS_PATH = "models/trained/product_tower_embeddings.npy"
+DEFAULT_IDS_PATH = "models/trained/product_tower_ids.npy"
+DEFAULT_IVF_PATH = "models/trained/product_tower_ivf.npz"
+
+
+class TwoTowerRetriever:
+    """Batched top-K retrieval over exported product-tower embeddings"""
+
+    def __init__(
+        self,
+        model,
+        embeddings_path: str = DEFAULT_EMBEDDINGS_PATH,
+        ids_path: str = DEFAULT_IDS_PATH,
+        ivf_path: str = DEFAULT_IVF_PATH,
+        ann_threshold: int = 50_000,
+        rerank_factor: int = 5
+    ):
+        self.model = model
+        self.embeddings_path = embeddings_path
+        self.ids_path = ids_path
+        self.ivf_path = ivf_path
+        self.ann_threshold = ann_threshold
+        self.rerank_factor = rerank_factor
+
+        self.user_tower, self.product_tower = self._split_towers(model)
+        self.num_users = model.get_layer('user_embedding').input_dim
+        self.num_products = model.get_layer('product_embedding').input_dim
+
+        self.embeddings: Optional[np.ndarray] = None
+        self.product_ids: Optional[np.ndarray] = None
+        self.ivf: Optional[IVFIndex] = None
+
+    @staticmethod
+    def _split_towers(model):
+        """Sub-models mapping an id to its tower output"""
+        user_tower = tf.keras.Model(
+            model.get_layer('user_id').output, model.get_layer('user_vector').output
+        )
+        product_tower = tf.keras.Model(
+            model.get_layer('product_id').output, model.get_layer('product_vector').output
+        )
+        return user_tower, product_tower
+
+    @property
+    def is_ready(self) -> bool:
+        return self.embeddings is not None
+
+    def export_product_embeddings(self, product_ids: Sequence[int], batch_size: int = 8192) -> int:
+        """Run the product tower over the catalog and write the embedding matrix"""
+        ids = np.asarray(sorted(set(int(p) for p in product_ids if 0 <= int(p) < self.num_products)), dtype=np.int64)
+        vectors = self.product_tower.predict(ids.reshape(-1, 1), batch_size=batch_size, verbose=0)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+        os.makedirs(os.path.dirname(self.embeddings_path) or ".", exist_ok=True)
+        np.save(self.embeddings_path, vectors)
+        np.save(self.ids_path, ids)
+
+        if len(ids) >= self.ann_threshold:
+            IVFIndex().build(vectors).save(self.ivf_path)
+        elif os.path.exists(self.ivf_path):
+            os.remove(self.ivf_path)
+
+        return len(ids)
+
+    def export_from_catalog(self) -> int:
+        """Export embeddings for every product in the database"""
+        from config.database import SessionLocal
+        from api.models.database_models import Product
+
+        db = SessionLocal()
+        try:
+            product_ids = [p.id for p in db.query(Product.id).all()]
+        finally:
+            db.close()
+
+        return self.export_product_embeddings(product_ids)
+
+    def load(self) -> bool:
+        """Memory-map exported embeddings; returns False if none were exported"""
+        if not (os.path.exists(self.embeddings_path) and os.path.exists(self.ids_path)):
+            return False
+
+        self.embeddings = np.load(self.embeddings_path, mmap_mode='r')
+        self.product_ids = np.load(self.ids_path)
+        self.ivf = IVFIndex.load(self.ivf_path) if os.path.exists(self.ivf_path) else None
+        return True
+
+    def retrieve(
+        self,
+        customer_ids: Sequence[int],
+        limit: int = 10,
+        rerank: bool = True
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Top products per customer as (product_ids, scores); empty for unknown customers"""
+        results = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))] * len(customer_ids)
+        known = [i for i, cid in enumerate(customer_ids) if cid is not None and 0 <= cid < self.num_users]
+        if not known or not self.is_ready:
+            return results
+
+        users = np.asarray([customer_ids[i] for i in known], dtype=np.int64)
+        user_vectors = self.user_tower.predict(users.reshape(-1, 1), verbose=0).astype(np.float32)
+
+        n_candidates = min(limit * self.rerank_factor if rerank else limit, len(self.product_ids))
+        if self.ivf is not None:
+            rows, scores = self.ivf.search(user_vectors, n_candidates)
+        else:
+            rows, scores = exact_top_k(user_vectors, self.embeddings, n_candidates)
+
+        if rerank:
+            rows, scores = self._rerank(users, rows)
+
+        for slot, i in enumerate(known):
+            valid = rows[slot] >= 0
+            top_rows, top_scores = rows[slot][valid][:limit], scores[slot][valid][:limit]
+            results[i] = (self.product_ids[top_rows], top_scores.astype(np.float32))
+
+        return results
+
+    def _rerank(self, users: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Score every (user, candidate) pair with the full model in one predict call"""
+        valid = rows >= 0
+        user_col = np.repeat(users, rows.shape[1])[valid.ravel()]
+        product_col = self.product_ids[rows[valid]]
+
+        scores = np.full(rows.shape, -np.inf, dtype=np.float32)
+        if len(user_col):
+            predicted = self.model.predict(
+                [user_col.reshape(-1, 1), product_col.reshape(-1, 1)],
+                batch_size=4096,
+                verbose=0
+            ).ravel()
+            scores[valid] = predicted
+
+        order = np.argsort(-scores, axis=1, kind="stable")
+        rows = np.take_along_axis(rows, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        rows[~np.isfinite(scores)] = -1
+        return rows, scores
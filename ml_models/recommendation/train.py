@@ -32,7 +32,7 @@ class RecommendationModel:
         user_vec = tf.keras.layers.Flatten()(user_embedding)
         user_vec = tf.keras.layers.Dense(128, activation='relu')(user_vec)
         user_vec = tf.keras.layers.Dropout(0.3)(user_vec)
-        user_vec = tf.keras.layers.Dense(64, activation='relu')(user_vec)
+        user_vec = tf.keras.layers.Dense(64, activation='relu', name='user_vector')(user_vec)
         
         # Product tower
         product_input = tf.keras.Input(shape=(1,), name='product_id')
@@ -42,7 +42,7 @@ class RecommendationModel:
         product_vec = tf.keras.layers.Flatten()(product_embedding)
         product_vec = tf.keras.layers.Dense(128, activation='relu')(product_vec)
         product_vec = tf.keras.layers.Dropout(0.3)(product_vec)
-        product_vec = tf.keras.layers.Dense(64, activation='relu')(product_vec)
+        product_vec = tf.keras.layers.Dense(64, activation='relu', name='product_vector')(product_vec)
         
         # Interaction
         concat = tf.keras.layers.Concatenate()([user_vec, product_vec])
@@ -5,6 +5,8 @@ Copyright © 2024 Paksa IT Solutions
 
 import tensorflow as tf
 import numpy as np
+import time
+from typing import Dict, Optional, Sequence
 
 
 class SegmentationEngine:
@@ -108,6 +110,98 @@ class SegmentationEngine:
         else:
             return 4
     
+    @staticmethod
+    def calculate_segments(recency: np.ndarray, frequency: np.ndarray, monetary: np.ndarray) -> np.ndarray:
+        """Vectorized _calculate_segment over RFM arrays"""
+        return np.select(
+            [
+                (recency <= 30) & (frequency >= 5) & (monetary >= 500),
+                (recency <= 60) & (frequency >= 3),
+                (frequency >= 3) & (monetary < 200),
+                (frequency >= 1) & (recency <= 180)
+            ],
+            [0, 1, 2, 3],
+            default=4
+        )
+    
+    def segment_all(
+        self,
+        db=None,
+        customer_ids: Optional[Sequence[int]] = None,
+        write_back: bool = True,
+        batch_size: int = 10_000
+    ) -> Dict:
+        """Segment every customer (or the given ids) from one aggregate query
+        
+        Pass a tenant session (TenantConnectionPool.get_session) as db to run
+        against a tenant's data. Only customers whose segment or lifetime value
+        changed are written back.
+        """
+        from config.database import SessionLocal
+        from api.models.database_models import Customer, Order
+        from sqlalchemy import func
+        from datetime import datetime
+        
+        started = time.perf_counter()
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            query = db.query(
+                Customer.id,
+                Customer.order_count,
+                Customer.total_spent,
+                Customer.segment,
+                Customer.lifetime_value,
+                func.max(Order.created_at).label('last_order_at')
+            ).outerjoin(Order, Order.customer_id == Customer.id).group_by(Customer.id)
+            if customer_ids is not None:
+                query = query.filter(Customer.id.in_(list(customer_ids)))
+            rows = db.execute(query.statement).all()
+            
+            count = len(rows)
+            now = datetime.utcnow()
+            ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=count)
+            frequency = np.fromiter((r[1] or 0 for r in rows), dtype=np.int64, count=count)
+            monetary = np.fromiter((r[2] or 0.0 for r in rows), dtype=np.float64, count=count)
+            current_segments = np.array([r[3] or "" for r in rows], dtype=object)
+            current_ltv = np.fromiter((r[4] or 0.0 for r in rows), dtype=np.float64, count=count)
+            seconds_since = np.fromiter(
+                ((now - r[5]).total_seconds() if r[5] else np.nan for r in rows),
+                dtype=np.float64, count=count
+            )
+            
+            # Recency: whole days since last order, 999 for customers without orders
+            recency = np.where(np.isnan(seconds_since), 999, np.floor(seconds_since / 86400)).astype(np.int64)
+            
+            segment_ids = self.calculate_segments(recency, frequency, monetary)
+            segments = np.char.add("segment_", segment_ids.astype(str)).astype(object)
+            lifetime_value = np.round(np.where(frequency > 0, monetary * 1.5, 0.0), 2)  # Simple LTV estimate
+            
+            updated = 0
+            if write_back:
+                changed = np.flatnonzero((segments != current_segments) | ~np.isclose(lifetime_value, current_ltv))
+                for start in range(0, len(changed), batch_size):
+                    chunk = changed[start:start + batch_size]
+                    db.bulk_update_mappings(Customer, [
+                        {"id": int(ids[i]), "segment": segments[i], "lifetime_value": float(lifetime_value[i])}
+                        for i in chunk
+                    ])
+                    db.commit()
+                updated = len(changed)
+            
+            labels, counts = np.unique(segment_ids, return_counts=True)
+            return {
+                "customers": count,
+                "updated": updated,
+                "segment_counts": {
+                    self.SEGMENT_DESCRIPTIONS[int(label)]: int(n) for label, n in zip(labels, counts)
+                },
+                "seconds": round(time.perf_counter() - started, 2)
+            }
+        finally:
+            if own_session:
+                db.close()
+    
     def get_segment_members(self, segment_name: str, limit: int = 100):
         """Get customers in a segment"""
         from config.database import SessionLocal
@@ -0,0 +1,344 @@
+"""
+Visual Embedding Store
+Copyright © 2024 Paksa IT Solutions
+
+Product image embeddings for similarity search. The compacted base is a
+memory-mapped float16 matrix plus an id array (grouped by IVF list once the
+catalog is large enough); upserts since the last compaction live in a small
+in-memory delta that is always searched exactly. All scores are cosine
+similarities: vectors and queries are L2-normalized on the way in.
+
+Product.embedding (JSON) remains the durable per-product record; the
+nightly compaction folds rows updated since the last build into the base.
+"""
+
+import os
+import threading
+import time
+import numpy as np
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from ml_models.common.vector_index import IVFIndex, exact_top_k, normalize_rows
+
+DEFAULT_STORE_PATH = "models/trained/visual_embeddings"
+EMBEDDING_DIM = 256
+
+
+class EmbeddingStore:
+    """Id-addressed embedding matrix with exact and IVF cosine search"""
+
+    def __init__(
+        self,
+        dim: int = EMBEDDING_DIM,
+        dtype=np.float16,
+        ann_threshold: int = 50_000,
+        n_probe: int = 8
+    ):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.ann_threshold = ann_threshold
+        self.n_probe = n_probe
+        self.built_at: Optional[datetime] = None
+
+        # Compacted base
+        self._matrix = np.empty((0, dim), dtype=self.dtype)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._id_order = np.empty(0, dtype=np.int64)  # argsort of _ids for lookups
+        self._stale = np.zeros(0, dtype=bool)         # base rows superseded or removed
+        self._ivf: Optional[IVFIndex] = None
+
+        # Upserts since the last compaction
+        self._delta: Dict[int, np.ndarray] = {}
+        self._delta_at: Dict[int, datetime] = {}
+        self._delta_arrays: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids) - int(self._stale.sum()) + len(self._delta)
+
+    @property
+    def is_built(self) -> bool:
+        return self.built_at is not None
+
+    def _base_row(self, product_id: int) -> int:
+        """Row of a product in the base matrix, or -1"""
+        if len(self._ids) == 0:
+            return -1
+        pos = np.searchsorted(self._ids, product_id, sorter=self._id_order)
+        if pos < len(self._ids) and self._ids[self._id_order[pos]] == product_id:
+            return int(self._id_order[pos])
+        return -1
+
+    def upsert(self, product_ids: Sequence[int], vectors: np.ndarray):
+        """Insert or replace embeddings for the given products"""
+        vectors = normalize_rows(np.asarray(vectors).reshape(len(product_ids), -1))
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d embeddings, got {vectors.shape[1]}")
+
+        now = datetime.utcnow()
+        with self._lock:
+            for pid, vector in zip(product_ids, vectors):
+                pid = int(pid)
+                self._delta[pid] = vector
+                self._delta_at[pid] = now
+                row = self._base_row(pid)
+                if row >= 0:
+                    self._stale[row] = True
+            self._delta_arrays = None
+
+    def remove(self, product_ids: Iterable[int]):
+        """Drop products from search results"""
+        with self._lock:
+            for pid in product_ids:
+                pid = int(pid)
+                self._delta.pop(pid, None)
+                self._delta_at.pop(pid, None)
+                row = self._base_row(pid)
+                if row >= 0:
+                    self._stale[row] = True
+            self._delta_arrays = None
+
+    def get(self, product_id: int) -> Optional[np.ndarray]:
+        """Normalized float32 embedding of a product, if stored"""
+        with self._lock:
+            if product_id in self._delta:
+                return self._delta[product_id].copy()
+            row = self._base_row(product_id)
+            if row < 0 or self._stale[row]:
+                return None
+            return np.asarray(self._matrix[row], dtype=np.float32)
+
+    def _delta_snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Delta as (ids, matrix) arrays, rebuilt only after writes"""
+        if self._delta_arrays is None:
+            ids = np.fromiter(self._delta.keys(), dtype=np.int64, count=len(self._delta))
+            matrix = (
+                np.stack(list(self._delta.values())) if self._delta
+                else np.empty((0, self.dim), dtype=np.float32)
+            )
+            self._delta_arrays = (ids, matrix)
+        return self._delta_arrays
+
+    def search(
+        self,
+        queries: np.ndarray,
+        limit: int = 10,
+        exact: bool = False,
+        exclude: Optional[Iterable[int]] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Top products per query as (product_ids, cosine scores)"""
+        queries = normalize_rows(np.atleast_2d(queries))
+        exclude = np.asarray(list(exclude or []), dtype=np.int64)
+
+        with self._lock:
+            matrix, ids, stale, ivf = self._matrix, self._ids, self._stale.copy(), self._ivf
+            delta_ids, delta_matrix = self._delta_snapshot()
+
+        # Over-fetch from the base so stale and excluded rows cannot crowd out the top-K
+        fetch = min(limit + int(stale.sum()) + len(exclude), len(ids))
+        if ivf is not None and not exact:
+            rows, base_scores = ivf.search(queries, fetch)
+        else:
+            rows, base_scores = exact_top_k(queries, matrix, fetch)
+
+        valid = rows >= 0
+        valid[valid] = ~stale[rows[valid]]
+        base_ids = np.where(valid, ids[np.maximum(rows, 0)], -1)
+        base_scores = np.where(valid, base_scores, -np.inf)
+
+        rows, scores = exact_top_k(queries, delta_matrix, min(limit, len(delta_ids)))
+        candidate_ids = np.concatenate([base_ids, delta_ids[rows]], axis=1)
+        candidate_scores = np.concatenate([base_scores, scores], axis=1).astype(np.float32)
+        if len(exclude):
+            candidate_scores[np.isin(candidate_ids, exclude)] = -np.inf
+
+        order = np.argsort(-candidate_scores, axis=1, kind="stable")[:, :limit]
+        results = []
+        for qi in range(len(queries)):
+            top = order[qi][np.isfinite(candidate_scores[qi, order[qi]])]
+            results.append((candidate_ids[qi, top], candidate_scores[qi, top]))
+        return results
+
+    def sync_from_db(self, db=None, since: Optional[datetime] = None) -> int:
+        """Upsert embeddings stored on Product rows (optionally only rows updated since a time)"""
+        from config.database import SessionLocal
+        from api.models.database_models import Product
+
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            query = db.query(Product.id, Product.embedding).filter(Product.embedding.isnot(None))
+            if since is not None:
+                query = query.filter(Product.updated_at >= since)
+
+            count = 0
+            batch_ids, batch_vectors = [], []
+            for row in query.yield_per(10_000):
+                if not row.embedding or len(row.embedding) != self.dim:
+                    continue
+                batch_ids.append(row.id)
+                batch_vectors.append(row.embedding)
+                if len(batch_ids) == 10_000:
+                    self.upsert(batch_ids, np.asarray(batch_vectors, dtype=np.float32))
+                    count += len(batch_ids)
+                    batch_ids, batch_vectors = [], []
+            if batch_ids:
+                self.upsert(batch_ids, np.asarray(batch_vectors, dtype=np.float32))
+                count += len(batch_ids)
+        finally:
+            if own_session:
+                db.close()
+
+        return count
+
+    def compact(self):
+        """Fold the delta into a new base matrix and rebuild the IVF index if large enough"""
+        with self._lock:
+            live = ~self._stale
+            delta_ids, delta_matrix = self._delta_snapshot()
+            ids = np.concatenate([self._ids[live], delta_ids])
+            matrix = np.concatenate([
+                np.asarray(self._matrix[live], dtype=self.dtype),
+                delta_matrix.astype(self.dtype)
+            ]) if len(ids) else np.empty((0, self.dim), dtype=self.dtype)
+            pending_at = dict(self._delta_at)
+
+        ivf = None
+        if len(ids) >= self.ann_threshold:
+            # Store the base grouped by IVF list so the index can scan it in place
+            ivf = IVFIndex(n_probe=self.n_probe).build(matrix)
+            matrix = ivf.vectors
+            ids = ids[ivf.row_ids]
+            ivf.row_ids = np.arange(len(ids), dtype=np.int64)
+
+        with self._lock:
+            # Keep anything upserted while the new base was being built
+            late = {
+                pid: vector for pid, vector in self._delta.items()
+                if self._delta_at.get(pid) != pending_at.get(pid)
+            }
+            self._delta, self._delta_at = {}, {}
+            self._delta_arrays = None
+            self._set_base(matrix, ids, ivf, datetime.utcnow())
+
+        if late:
+            self.upsert(list(late.keys()), np.stack(list(late.values())))
+        return self
+
+    def _set_base(self, matrix: np.ndarray, ids: np.ndarray, ivf: Optional[IVFIndex], built_at: datetime):
+        """Swap in a new base (caller holds the lock) and re-mark rows the delta overrides"""
+        self._matrix = matrix
+        self._ids = ids
+        self._id_order = np.argsort(ids, kind="stable")
+        self._stale = np.zeros(len(ids), dtype=bool)
+        self._ivf = ivf
+        self.built_at = built_at
+        for pid in self._delta:
+            row = self._base_row(pid)
+            if row >= 0:
+                self._stale[row] = True
+
+    def save(self, path: str = DEFAULT_STORE_PATH):
+        """Write the compacted base (call compact() first to include the delta)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            matrix, ids, ivf, built_at = self._matrix, self._ids, self._ivf, self.built_at
+
+        # Matrix and index first, id file last: readers key their reload on the id file
+        with open(f"{path}.tmp.npy", "wb") as f:
+            np.save(f, np.ascontiguousarray(matrix))
+        os.replace(f"{path}.tmp.npy", f"{path}.npy")
+
+        if ivf is not None:
+            ivf.save(f"{path}_ivf.tmp.npz", include_vectors=False)
+            os.replace(f"{path}_ivf.tmp.npz", f"{path}_ivf.npz")
+        elif os.path.exists(f"{path}_ivf.npz"):
+            os.remove(f"{path}_ivf.npz")
+
+        with open(f"{path}_ids.tmp.npz", "wb") as f:
+            np.savez(f, ids=ids, built_at=np.array((built_at or datetime.utcnow()).isoformat()))
+        os.replace(f"{path}_ids.tmp.npz", f"{path}_ids.npz")
+
+    def load(self, path: str = DEFAULT_STORE_PATH) -> bool:
+        """Memory-map a saved base; returns False if none exists or files are mid-write"""
+        if not (os.path.exists(f"{path}.npy") and os.path.exists(f"{path}_ids.npz")):
+            return False
+
+        matrix = np.load(f"{path}.npy", mmap_mode='r')
+        with np.load(f"{path}_ids.npz") as archive:
+            ids = archive["ids"]
+            built_at = datetime.fromisoformat(str(archive["built_at"]))
+        ivf = IVFIndex.load(f"{path}_ivf.npz", vectors=matrix) if os.path.exists(f"{path}_ivf.npz") else None
+
+        if len(ids) != len(matrix) or (ivf is not None and ivf.offsets[-1] != len(matrix)):
+            return False
+
+        with self._lock:
+            # Upserts older than the new base are already part of it
+            for pid in [p for p, at in self._delta_at.items() if at < built_at]:
+                del self._delta[pid]
+                del self._delta_at[pid]
+            self._delta_arrays = None
+            self.dim = matrix.shape[1]
+            self.dtype = matrix.dtype
+            self._set_base(matrix, ids, ivf, built_at)
+        return True
+
+    def get_stats(self) -> Dict:
+        """Store statistics for monitoring"""
+        return {
+            "products": len(self),
+            "base_rows": len(self._ids),
+            "pending_upserts": len(self._delta),
+            "ivf_lists": self._ivf.n_lists if self._ivf is not None else 0,
+            "dtype": str(self.dtype),
+            "built_at": self.built_at.isoformat() if self.built_at else None
+        }
+
+
+# Process-wide store used by VisualSearchEngine
+_store = EmbeddingStore()
+_store_lock = threading.Lock()
+_reload_state = {"next_check": 0.0, "mtime": 0.0, "builder": None}
+RELOAD_CHECK_SECONDS = 300
+
+
+def _build_from_db():
+    try:
+        _store.sync_from_db()
+        _store.compact()
+        print(f"Visual embedding store built from the database ({len(_store)} products)")
+    except Exception as e:
+        print(f"Visual embedding store build failed, retrying in {RELOAD_CHECK_SECONDS}s: {e}")
+
+
+def get_embedding_store(path: str = DEFAULT_STORE_PATH) -> EmbeddingStore:
+    """Get the shared store, picking up the nightly compaction when it lands.
+
+    Without a saved store the embeddings are synced from the database and
+    compacted on a background thread; until then is_built is False and
+    VisualSearchEngine returns empty results.
+    """
+    now = time.time()
+    if now < _reload_state["next_check"]:
+        return _store
+
+    with _store_lock:
+        if now < _reload_state["next_check"]:
+            return _store
+        _reload_state["next_check"] = now + RELOAD_CHECK_SECONDS
+        ids_path = f"{path}_ids.npz"
+        mtime = os.path.getmtime(ids_path) if os.path.exists(ids_path) else 0.0
+
+        if mtime > _reload_state["mtime"] and _store.load(path):
+            _reload_state["mtime"] = mtime
+        elif not _store.is_built:
+            builder = _reload_state["builder"]
+            if builder is None or not builder.is_alive():
+                print(f"No visual embedding store at {path}; building it in the background")
+                builder = threading.Thread(target=_build_from_db, name="embedding-store-build", daemon=True)
+                _reload_state["builder"] = builder
+                builder.start()
+
+    return _store
@@ -5,8 +5,11 @@ Copyright © 2024 Paksa IT Solutions
 
 import tensorflow as tf
 import numpy as np
-from PIL import Image
-import io
+import threading
+from ml_models.common.vector_index import normalize_rows
+from ml_models.visual_search.embedding_store import get_embedding_store
+from ml_models.visual_search.ingest import decode_image
+from ml_models.recommendation.product_cards import ProductCards
 
 
 class VisualSearchEngine:
@@ -25,30 +28,64 @@ class VisualSearchEngine:
     
     def _preprocess_image(self, image_bytes):
         """Preprocess image for model"""
-        image = Image.open(io.BytesIO(image_bytes))
-        image = image.resize((224, 224))
-        image = np.array(image)
-        return image
+        return decode_image(image_bytes)
+    
+    def embed_images(self, images: np.ndarray) -> np.ndarray:
+        """Batched embeddings, L2-normalized per row (VisualSearchModel.extract_embedding contract)"""
+        if images.ndim == 3:
+            images = np.expand_dims(images, axis=0)
+        return normalize_rows(self.model.predict(images, batch_size=64, verbose=0))
     
     def search(self, image_bytes, limit: int = 10):
         """Search products by image"""
+        if self.model is None:
+            return {"products": [], "similarities": []}
         
-        # Preprocess image
-        image = self._preprocess_image(image_bytes)
-        
-        # Extract embedding (placeholder)
-        # In production, compare with stored product embeddings
+        store = get_embedding_store()
+        if not store.is_built:
+            # Still building after a cold start
+            return {"products": [], "similarities": []}
         
-        return {
-            "products": [],
-            "similarities": []
-        }
+        embedding = self.embed_images(self._preprocess_image(image_bytes))
+        product_ids, scores = store.search(embedding, limit)[0]
+        return self._format_results(product_ids, scores)
     
     def find_similar(self, product_id: int, limit: int = 10):
         """Find visually similar products"""
+        store = get_embedding_store()
+        embedding = store.get(product_id) if store.is_built else None
+        if embedding is None:
+            return {"products": [], "similarities": []}
         
-        # Placeholder - fetch product embedding and compare
+        product_ids, scores = store.search(embedding, limit, exclude=[product_id])[0]
+        return self._format_results(product_ids, scores)
+    
+    def index_product(self, product_id: int, image_bytes) -> np.ndarray:
+        """Embed a product image and upsert it into the shared store"""
+        embedding = self.embed_images(self._preprocess_image(image_bytes))
+        get_embedding_store().upsert([product_id], embedding)
+        return embedding[0]
+    
+    @staticmethod
+    def _format_results(product_ids, scores):
+        """Attach product cards to ranked ids"""
+        cards = {card["id"]: card for card in ProductCards.get_many(product_ids)}
+        ranked = [(cards[int(pid)], float(score)) for pid, score in zip(product_ids, scores) if int(pid) in cards]
         return {
-            "products": [],
-            "similarities": []
+            "products": [card for card, _ in ranked],
+            "similarities": [score for _, score in ranked]
         }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_visual_search_engine() -> VisualSearchEngine:
+    """Shared engine, so the model is loaded once per process"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = VisualSearchEngine()
+    return _engine
@@ -0,0 +1,189 @@
+"""
+Visual Search Ingestion Pipeline
+Copyright © 2024 Paksa IT Solutions
+
+Bulk backfill of product image embeddings. Worker processes fetch, decode
+and resize images; the parent packs them into fixed-size uint8 batches and
+runs one model call per batch while the pool decodes the next window.
+Results are upserted into the EmbeddingStore, which is saved together with
+a JSON checkpoint so an interrupted run resumes after the last saved product.
+"""
+
+import io
+import json
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from PIL import Image
+from ml_models.common.vector_index import normalize_rows
+from ml_models.visual_search.embedding_store import EmbeddingStore, DEFAULT_STORE_PATH
+
+IMAGE_SIZE = 224
+DEFAULT_CHECKPOINT_PATH = "models/trained/visual_ingest_checkpoint.json"
+
+_http_session = None
+
+
+def decode_image(image_bytes: bytes, size: int = IMAGE_SIZE) -> np.ndarray:
+    """Decode to a (size, size, 3) uint8 RGB array"""
+    image = Image.open(io.BytesIO(image_bytes))
+    # Let the JPEG decoder downscale by a power of two before the full resize
+    image.draft('RGB', (size, size))
+    image = image.convert('RGB').resize((size, size), Image.BILINEAR)
+    return np.asarray(image, dtype=np.uint8)
+
+
+def load_image(item: Tuple[int, str], size: int = IMAGE_SIZE) -> Tuple[int, Optional[np.ndarray]]:
+    """Fetch (URL or local path) and decode one product image; None on failure"""
+    global _http_session
+    product_id, source = item
+    try:
+        if source.startswith(("http://", "https://")):
+            if _http_session is None:
+                import requests
+                _http_session = requests.Session()
+            response = _http_session.get(source, timeout=10)
+            response.raise_for_status()
+            image_bytes = response.content
+        else:
+            with open(source, "rb") as f:
+                image_bytes = f.read()
+        return product_id, decode_image(image_bytes, size)
+    except Exception as e:
+        print(f"Image load failed for product {product_id}: {e}")
+        return product_id, None
+
+
+def catalog_images(db=None, after_id: int = 0) -> Iterator[Tuple[int, str]]:
+    """(product_id, image_url) for every product with an image, in id order"""
+    from config.database import SessionLocal
+    from api.models.database_models import Product
+
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        query = db.query(Product.id, Product.image_url).filter(
+            Product.image_url.isnot(None),
+            Product.id > after_id
+        ).order_by(Product.id)
+        for row in query.yield_per(10_000):
+            yield row.id, row.image_url
+    finally:
+        if own_session:
+            db.close()
+
+
+class EmbeddingIngestor:
+    """Checkpointed bulk image -> embedding -> store pipeline"""
+
+    def __init__(
+        self,
+        model,
+        store: Optional[EmbeddingStore] = None,
+        store_path: str = DEFAULT_STORE_PATH,
+        checkpoint_path: str = DEFAULT_CHECKPOINT_PATH,
+        batch_size: int = 64,
+        workers: Optional[int] = None,
+        window_size: int = 4096,
+        save_every: int = 10
+    ):
+        self.model = model
+        self.store_path = store_path
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.workers = os.cpu_count() if workers is None else workers
+        self.window_size = window_size
+        self.save_every = save_every
+
+        if store is None:
+            store = EmbeddingStore()
+            store.load(store_path)
+        self.store = store
+
+        self._batch = np.zeros((batch_size, IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8)
+
+    def load_checkpoint(self) -> Dict:
+        """Progress of the last saved run"""
+        if not os.path.exists(self.checkpoint_path):
+            return {"last_product_id": 0, "processed": 0, "failed": 0}
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def _save(self, checkpoint: Dict):
+        """Persist the store first, then the checkpoint that points past it"""
+        self.store.compact().save(self.store_path)
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        with open(f"{self.checkpoint_path}.tmp", "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(f"{self.checkpoint_path}.tmp", self.checkpoint_path)
+
+    def _embed(self, images: List[np.ndarray]) -> np.ndarray:
+        """One model call per fixed-size batch; the last batch is zero-padded"""
+        embeddings = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            for i, image in enumerate(chunk):
+                self._batch[i] = image
+            self._batch[len(chunk):] = 0
+            output = np.asarray(self.model.predict_on_batch(self._batch))
+            embeddings.append(output[:len(chunk)])
+        return normalize_rows(np.concatenate(embeddings))
+
+    def run(self, items: Optional[Iterable[Tuple[int, str]]] = None, resume: bool = True) -> Dict:
+        """Embed every (product_id, image source) in ascending id order"""
+        checkpoint = self.load_checkpoint() if resume else {"last_product_id": 0, "processed": 0, "failed": 0}
+        last_id = checkpoint["last_product_id"]
+        items = catalog_images(after_id=last_id) if items is None else (
+            item for item in items if item[0] > last_id
+        )
+        windows = iter(lambda: list(islice(items, self.window_size)), [])
+
+        started = time.perf_counter()
+        processed = 0
+        pool = ProcessPoolExecutor(self.workers) if self.workers > 0 else None
+        try:
+            decode = (lambda window: pool.map(load_image, window, chunksize=16)) if pool else \
+                (lambda window: map(load_image, window))
+
+            window = next(windows, None)
+            pending = decode(window) if window else None
+            windows_done = 0
+            while window:
+                # Queue the next window so workers decode while this one is embedded
+                next_window = next(windows, None)
+                loaded = list(pending)
+                pending = decode(next_window) if next_window else None
+
+                ids = [pid for pid, image in loaded if image is not None]
+                images = [image for _, image in loaded if image is not None]
+                if images:
+                    self.store.upsert(ids, self._embed(images))
+
+                processed += len(images)
+                checkpoint["processed"] += len(images)
+                checkpoint["failed"] += len(loaded) - len(images)
+                checkpoint["last_product_id"] = window[-1][0]
+                windows_done += 1
+
+                rate = processed / (time.perf_counter() - started)
+                print(f"Ingested {checkpoint['processed']:,} images (last id {window[-1][0]}, {rate:.1f} images/sec)")
+
+                if windows_done % self.save_every == 0:
+                    self._save(checkpoint)
+                window = next_window
+
+            if windows_done % self.save_every:
+                self._save(checkpoint)
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+        elapsed = time.perf_counter() - started
+        return {
+            **checkpoint,
+            "seconds": round(elapsed, 2),
+            "images_per_second": round(processed / elapsed, 2) if elapsed else 0.0
+        }
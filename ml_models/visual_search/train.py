@@ -36,7 +36,7 @@ class VisualSearchModel:
             image = np.expand_dims(image, axis=0)
         
         embedding = self.model.predict(image, verbose=0)
-        return embedding / np.linalg.norm(embedding)  # Normalize
+        return embedding / np.linalg.norm(embedding, axis=1, keepdims=True)  # Normalize per image
     
     def compute_similarity(self, embedding1, embedding2):
         """Compute cosine similarity"""
@@ -0,0 +1,46 @@
+"""
+Visual Embedding Backfill
+Copyright © 2024 Paksa IT Solutions
+
+Embeds every catalog image into the visual search store. Safe to interrupt:
+rerunning resumes after the last checkpoint.
+
+Usage:
+    python scripts/backfill_visual_embeddings.py
+    python scripts/backfill_visual_embeddings.py --workers 8 --batch-size 128
+    python scripts/backfill_visual_embeddings.py --restart
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ml_models.visual_search.inference import VisualSearchEngine
+from ml_models.visual_search.ingest import EmbeddingIngestor
+
+
+def backfill(batch_size: int, workers: int, restart: bool):
+    engine = VisualSearchEngine()
+    if engine.model is None:
+        print("No trained visual search model found; aborting.")
+        return
+
+    ingestor = EmbeddingIngestor(engine.model, batch_size=batch_size, workers=workers)
+    stats = ingestor.run(resume=not restart)
+
+    print("=" * 60)
+    print(f"Processed: {stats['processed']:,} | Failed: {stats['failed']:,}")
+    print(f"Elapsed: {stats['seconds']}s | Throughput: {stats['images_per_second']} images/sec")
+    print(f"Store: {ingestor.store.get_stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill visual search embeddings")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    args = parser.parse_args()
+
+    backfill(args.batch_size, args.workers, args.restart)
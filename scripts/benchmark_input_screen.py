@@ -0,0 +1,89 @@
+"""
+Input Screening Benchmark
+Copyright © 2024 Paksa IT Solutions
+
+Compares the compiled single-pass screens against the per-pattern re.search
+loops they replaced, on realistic storefront query strings and user agents.
+
+Usage:
+    python scripts/benchmark_input_screen.py --requests 20000
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from urllib.parse import parse_qsl
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.utils.input_screen import BOT_RULES, INJECTION_RULES, injection_screen, screen_user_agent
+
+QUERY_TEMPLATES = [
+    "q={term}&page={page}&sort=price_asc&category=dresses",
+    "customer_id={id}&limit=10&recommendation_type=personalized",
+    "utm_source=google&utm_medium=cpc&utm_campaign=summer_sale_{page}&q={term}",
+    "size=M&color={term}&min_price=20&max_price=150&in_stock=true",
+    "session_id=sess_{id}&product_id={id}&ref=homepage_carousel",
+]
+TERMS = ["red+dress", "linen%20blazer", "silk scarf", "evening gown", "boho maxi", "wrap skirt"]
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_4) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15",
+    "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Mobile Safari/537.36",
+]
+
+
+def legacy_is_safe(value: str) -> bool:
+    value_lower = value.lower()
+    for pattern in INJECTION_RULES.values():
+        if re.search(pattern, value_lower):
+            return False
+    return True
+
+
+def legacy_is_bot(user_agent: str) -> bool:
+    user_agent = user_agent.lower()
+    return any(re.search(pattern, user_agent) for pattern in BOT_RULES.values())
+
+
+def build_requests(n: int):
+    rng = random.Random(7)
+    requests = []
+    for _ in range(n):
+        query = rng.choice(QUERY_TEMPLATES).format(term=rng.choice(TERMS), page=rng.randint(1, 40), id=rng.randint(1, 10**6))
+        requests.append((parse_qsl(query), rng.choice(USER_AGENTS)))
+    return requests
+
+
+def _time(screen_params, screen_agent, requests) -> float:
+    start = time.perf_counter()
+    for params, user_agent in requests:
+        screen_agent(user_agent)
+        for key, value in params:
+            screen_params(key)
+            screen_params(value)
+    return (time.perf_counter() - start) / len(requests) * 1e6
+
+
+def run_benchmark(n: int):
+    requests = build_requests(n)
+    print("=" * 60)
+    print(f"{n:,} requests | avg {sum(len(p) for p, _ in requests) / n:.1f} query params each")
+    print("=" * 60)
+
+    legacy = _time(legacy_is_safe, legacy_is_bot, requests)
+    compiled = _time(injection_screen.is_clean, screen_user_agent, requests)
+    print(f"per-pattern loops: {legacy:7.2f}us/request")
+    print(f"compiled screens:  {compiled:7.2f}us/request ({legacy / compiled:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark request input screening")
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    run_benchmark(args.requests)
@@ -0,0 +1,162 @@
+"""
+Middleware Overhead Benchmark
+Copyright © 2024 Paksa IT Solutions
+
+Per-request overhead of the middleware stack on an empty endpoint (/health):
+    bare      - no middleware
+    layered   - every stage as its own BaseHTTPMiddleware (how the stack used to be built)
+    pipeline  - all stages in one RequestPipeline
+
+Requests are driven straight through the ASGI interface, so the numbers
+exclude the server and socket.
+
+Usage:
+    python scripts/benchmark_middleware.py --requests 5000
+    python scripts/benchmark_middleware.py --with-logging   # include request logging (ApiLog rows go to the log sink)
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.makedirs("logs", exist_ok=True)
+
+from fastapi import FastAPI
+from starlette.middleware.base import BaseHTTPMiddleware
+from api.middleware.pipeline import RequestContext, RequestPipeline
+from api.middleware.request_id import RequestIDStage
+from api.middleware.performance import PerformanceStage
+from api.middleware.security_headers import SecurityHeadersStage
+from api.middleware.deprecation import DeprecationStage
+from api.middleware.bot_detection import BotDetectionStage
+from api.middleware.rate_limiter import RateLimitStage
+from api.middleware.validation import InputValidationStage
+from api.middleware.logging import RequestLoggingStage
+from api.middleware.auth import AuthStage
+from api.middleware.tenant_context import TenantContextStage
+from api.middleware.tenant_isolation import TenantIsolationStage
+from api.middleware.csrf import CSRFStage
+from api.middleware.plan_limits import PlanLimitsStage
+from api.middleware.usage_tracking import UsageTrackingStage
+
+
+class LayeredStage(BaseHTTPMiddleware):
+    """One stage wrapped in its own BaseHTTPMiddleware, re-parsing the request like the old classes"""
+
+    def __init__(self, app, stage):
+        super().__init__(app)
+        self.stage = stage
+
+    async def dispatch(self, request, call_next):
+        ctx = RequestContext(request.scope)
+        response = self.stage.before(ctx)
+        if response is None:
+            response = await call_next(request)
+        ctx.status_code = response.status_code
+        ctx.response_time = ctx.elapsed
+        self.stage.after(ctx, response.headers)
+        ctx.run_deferred()
+        return response
+
+
+def build_stages(with_logging: bool):
+    stages = [
+        RequestIDStage(),
+        PerformanceStage(slow_threshold=1.0),
+        SecurityHeadersStage(),
+        DeprecationStage(),
+        BotDetectionStage(),
+        RateLimitStage(),
+        InputValidationStage(),
+        RequestLoggingStage(),
+        AuthStage(),
+        TenantContextStage(),
+        TenantIsolationStage(),
+        CSRFStage(),
+        PlanLimitsStage(),
+        UsageTrackingStage(),
+    ]
+    if not with_logging:
+        stages = [s for s in stages if not isinstance(s, RequestLoggingStage)]
+    return stages
+
+
+def build_app(mode: str, with_logging: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health_check():
+        return {"status": "healthy", "timestamp": time.time()}
+
+    stages = build_stages(with_logging)
+    if mode == "layered":
+        # add_middleware wraps outward, so add innermost first
+        for stage in reversed(stages):
+            app.add_middleware(LayeredStage, stage=stage)
+    elif mode == "pipeline":
+        app.add_middleware(RequestPipeline, stages=stages)
+    return app
+
+
+async def _drive(app, n: int) -> np.ndarray:
+    """Issue n GET /health requests directly through the ASGI interface"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/health",
+        "raw_path": b"/health",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64) benchmark")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 8000),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start" and message["status"] != 200:
+            raise RuntimeError(f"Unexpected status {message['status']}")
+
+    timings = np.empty(n)
+    for i in range(n):
+        start = time.perf_counter()
+        await app(dict(scope), receive, send)
+        timings[i] = (time.perf_counter() - start) * 1e6
+    return timings
+
+
+def run_benchmark(n: int, with_logging: bool):
+    print("=" * 60)
+    print(f"GET /health x {n:,} | {len(build_stages(with_logging))} stages | logging={'on' if with_logging else 'off'}")
+    print("=" * 60)
+
+    results = {}
+    for mode in ("bare", "layered", "pipeline"):
+        app = build_app(mode, with_logging)
+        asyncio.run(_drive(app, min(n, 200)))  # warm up
+        timings = asyncio.run(_drive(app, n))
+        results[mode] = timings
+        print(f"{mode:>9}: mean={timings.mean():8.1f}us p50={np.percentile(timings, 50):8.1f}us p99={np.percentile(timings, 99):8.1f}us")
+
+    bare = results["bare"].mean()
+    print()
+    for mode in ("layered", "pipeline"):
+        print(f"{mode:>9} overhead: {results[mode].mean() - bare:8.1f}us/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark middleware overhead per request")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--with-logging", action="store_true", help="Include RequestLoggingStage (queues ApiLog rows)")
+    args = parser.parse_args()
+
+    run_benchmark(args.requests, args.with_logging)
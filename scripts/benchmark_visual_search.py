@@ -0,0 +1,83 @@
+"""
+Visual Search Benchmark
+Copyright © 2024 Paksa IT Solutions
+
+Recall@K and latency of the visual embedding store (exact vs IVF) at
+several catalog sizes, on CPU, with 256-d float16 embeddings.
+
+Usage:
+    python scripts/benchmark_visual_search.py
+    python scripts/benchmark_visual_search.py --sizes 10000 100000 1000000 --n-probe 16
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ml_models.common.vector_index import recall_at_k
+from ml_models.visual_search.embedding_store import EmbeddingStore, EMBEDDING_DIM
+
+
+def synthetic_embeddings(n: int, dim: int, rng, chunk_size: int = 100_000) -> np.ndarray:
+    """Clustered float16 vectors, generated in chunks to bound peak memory"""
+    centers = rng.normal(size=(1024, dim)).astype(np.float32)
+    matrix = np.empty((n, dim), dtype=np.float16)
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        block = centers[rng.integers(0, len(centers), size)] + 0.6 * rng.normal(size=(size, dim)).astype(np.float32)
+        matrix[start:start + size] = block
+    return matrix
+
+
+def _timed_search(store, queries, k, exact):
+    """Per-query latency (ms) and ranked ids"""
+    timings, ids = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found, _ = store.search(query, k, exact=exact)[0]
+        timings.append((time.perf_counter() - start) * 1000)
+        ids.append(np.pad(found, (0, k - len(found)), constant_values=-1))
+    return np.array(timings), np.array(ids)
+
+
+def run_benchmark(size: int, n_queries: int, k: int, n_probe: int, rng):
+    matrix = synthetic_embeddings(size, EMBEDDING_DIM, rng)
+    queries = matrix[rng.choice(size, n_queries, replace=False)].astype(np.float32) + \
+        0.1 * rng.normal(size=(n_queries, EMBEDDING_DIM)).astype(np.float32)
+
+    store = EmbeddingStore(ann_threshold=min(size, 50_000), n_probe=n_probe)
+    store.upsert(np.arange(size), matrix)
+    del matrix
+
+    start = time.perf_counter()
+    store.compact()
+    build_seconds = time.perf_counter() - start
+
+    exact_ms, exact_ids = _timed_search(store, queries, k, exact=True)
+    ivf_ms, ivf_ids = _timed_search(store, queries, k, exact=False)
+
+    print(f"\n{size:,} products | build {build_seconds:.1f}s | {store.get_stats()['ivf_lists']} lists, n_probe={n_probe}")
+    print(f"  exact: p50={np.percentile(exact_ms, 50):.2f}ms p99={np.percentile(exact_ms, 99):.2f}ms")
+    print(f"    ivf: p50={np.percentile(ivf_ms, 50):.2f}ms p99={np.percentile(ivf_ms, 99):.2f}ms "
+          f"recall@{k}={recall_at_k(ivf_ids, exact_ids):.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark visual search")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-probe", type=int, default=8)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Visual search benchmark ({EMBEDDING_DIM}-d float16, CPU)")
+    print("=" * 60)
+
+    rng = np.random.default_rng(7)
+    for size in args.sizes:
+        run_benchmark(size, args.queries, args.k, args.n_probe, rng)
@@ -0,0 +1,30 @@
+"""
+Migration: Add product_daily_sales table
+Copyright © 2024 Paksa IT Solutions. All Rights Reserved.
+"""
+
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from config.database import Base, engine
+from api.models.database_models import ProductDailySales
+
+def migrate():
+    """Add product_daily_sales table and backfill it from existing orders"""
+    print("Creating product_daily_sales table...")
+    
+    try:
+        Base.metadata.create_all(bind=engine, tables=[ProductDailySales.__table__])
+        print("✅ product_daily_sales table created successfully")
+        
+        from data_pipeline.sales_rollup import SalesRollup
+        rows = SalesRollup.rebuild()
+        print(f"✅ Backfilled {rows} product-day rows")
+    except Exception as e:
+        print(f"❌ Error creating table: {e}")
+        raise
+
+if __name__ == "__main__":
+    migrate()
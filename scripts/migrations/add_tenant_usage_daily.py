@@ -0,0 +1,35 @@
+"""
+Migration: Add tenant_usage_daily table
+Copyright © 2024 Paksa IT Solutions. All Rights Reserved.
+"""
+
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from sqlalchemy import text
+from config.database import Base, engine
+from api.models.database_models import TenantUsageDaily
+
+def migrate():
+    """Add tenant_usage_daily table"""
+    print("Creating tenant_usage_daily table...")
+    
+    try:
+        Base.metadata.create_all(bind=engine, tables=[TenantUsageDaily.__table__])
+        if engine.dialect.name == "postgresql":
+            # Tables created before the counters were widened still have int4 columns
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "ALTER TABLE tenant_usage_daily "
+                    "ALTER COLUMN api_calls TYPE BIGINT, "
+                    "ALTER COLUMN storage_bytes TYPE BIGINT"
+                ))
+        print("✅ tenant_usage_daily table created successfully")
+    except Exception as e:
+        print(f"❌ Error creating table: {e}")
+        raise
+
+if __name__ == "__main__":
+    migrate()
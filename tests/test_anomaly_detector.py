@@ -0,0 +1,62 @@
+"""
+Anomaly Detector Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import asyncio
+import time
+from api.utils import anomaly_detector
+from api.utils.anomaly_detector import AlertDispatcher, AnomalyDetector
+
+
+def test_dispatcher_retries_failed_deliveries(monkeypatch):
+    """Test a failing alert is retried in the background and submit() never blocks"""
+    monkeypatch.setattr(anomaly_detector, "ALERT_RETRY_DELAYS", (0.01, 0.01))
+    dispatcher = AlertDispatcher()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("slack unavailable")
+
+    def always_down():
+        raise TimeoutError("sendgrid timeout")
+
+    started = time.perf_counter()
+    dispatcher.submit("slack_alert", flaky)
+    dispatcher.submit("email_alert", always_down)
+    assert time.perf_counter() - started < 0.05
+
+    deadline = time.monotonic() + 2
+    while dispatcher.get_stats()["delivered"] + dispatcher.get_stats()["failed"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    stats = dispatcher.get_stats()
+    assert len(attempts) == 3
+    assert stats["delivered"] == 1 and stats["failed"] == 1 and stats["retried"] == 4
+
+
+def test_async_rate_check_is_one_round_trip(monkeypatch):
+    """Test the async check counts through one script call and flags only over the threshold"""
+    detector = AnomalyDetector()
+    client = object()
+    monkeypatch.setattr(anomaly_detector, "get_async_redis", lambda: client)
+    counts = {}
+    calls = []
+
+    async def window_count(keys, args):
+        calls.append(keys[0])
+        counts[keys[0]] = counts.get(keys[0], 0) + 1
+        return counts[keys[0]]
+
+    detector._async_client = client
+    detector._async_window_count = window_count
+
+    async def run():
+        return [await detector.check_api_rate_anomaly_async("tenant_a") for _ in range(101)]
+
+    results = asyncio.run(run())
+    assert results[:100] == [None] * 100
+    assert results[100]["type"] == "high_api_rate" and results[100]["count"] == 101
+    assert calls == ["anomaly:api:tenant_a"] * 101
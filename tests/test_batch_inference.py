@@ -0,0 +1,123 @@
+"""
+Batch Inference Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import numpy as np
+from api.utils.reliable_queue import QueuedJob
+from ml_models.recommendation.batch_inference import BatchInferenceQueue
+from ml_models.recommendation.interaction_matrix import InteractionMatrix
+
+
+class _MemoryQueue:
+    """ReliableQueue stand-in: FIFO claims, results and failures recorded in memory"""
+
+    def __init__(self):
+        self.ready, self.jobs = [], {}
+        self.claims, self.completed, self.failed = 0, 0, []
+
+    def enqueue(self, payload, job_id):
+        self.jobs[job_id] = {"status": "pending", "payload": payload, "attempts": 0}
+        self.ready.append(job_id)
+        return job_id
+
+    def claim(self, count, block_ms=0):
+        self.claims += 1
+        taken, self.ready = self.ready[:count], self.ready[count:]
+        return [QueuedJob(job_id, f"{i}-0", self.jobs[job_id]["payload"], 1) for i, job_id in enumerate(taken)]
+
+    def complete_many(self, results):
+        self.completed += 1
+        for job, result in results:
+            self.jobs[job.job_id].update(status="completed", result=result)
+
+    def fail_many(self, failures):
+        for job, error in failures:
+            self.failed.append(job.job_id)
+            self.jobs[job.job_id].update(status="dead", error=error, attempts=3)
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+
+class _Engine:
+    def __init__(self):
+        self.calls = []
+
+    def predict_many(self, customer_ids, limits, recommendation_type="personalized", tenant_id=None):
+        self.calls.append((tenant_id, recommendation_type, list(customer_ids)))
+        return [{"products": [], "scores": [], "customer": cid} for cid in customer_ids]
+
+
+def test_jobs_grouped_and_completed_together():
+    """Test a batch is scored once per (tenant, type) group and all results are stored in one call"""
+    jobs_queue, engine = _MemoryQueue(), _Engine()
+    queue = BatchInferenceQueue(engine=engine, queue=jobs_queue, max_batch=10, max_wait=0)
+    jobs = [
+        queue.enqueue(1, None, tenant_id="a"),
+        queue.enqueue(2, None, tenant_id="b"),
+        queue.enqueue(3, None, tenant_id="a"),
+        queue.enqueue(None, "s1", recommendation_type="trending", tenant_id="a"),
+    ]
+
+    assert queue.process_batch() == 4
+    assert jobs_queue.claims == 1 and jobs_queue.completed == 1
+    assert sorted(engine.calls) == [("a", "personalized", [1, 3]), ("a", "trending", [None]), ("b", "personalized", [2])]
+
+    result = queue.get_result(jobs[2])
+    assert result["status"] == "completed" and result["customer"] == 3 and result["job_id"] == jobs[2]
+    assert queue.get_stats()["groups"] == 3
+
+
+def test_batch_respects_max_size_and_fifo_order():
+    """Test the oldest jobs are taken first and a batch never exceeds max_batch"""
+    jobs_queue, engine = _MemoryQueue(), _Engine()
+    queue = BatchInferenceQueue(engine=engine, queue=jobs_queue, max_batch=3, max_wait=0)
+    for customer_id in range(1, 6):
+        queue.enqueue(customer_id, None, tenant_id="a")
+
+    assert queue.process_batch() == 3
+    assert queue.process_batch() == 2
+    assert queue.process_batch(block_timeout=0.01) == 0
+    assert [call[2] for call in engine.calls] == [[1, 2, 3], [4, 5]]
+    assert jobs_queue.ready == []
+
+
+def test_failed_group_fails_only_its_jobs():
+    """Test an exception in one group hands only that group's jobs back to the queue as failures"""
+    jobs_queue, engine = _MemoryQueue(), _Engine()
+    original = engine.predict_many
+
+    def predict_many(customer_ids, limits, recommendation_type="personalized", tenant_id=None):
+        if tenant_id == "bad":
+            raise RuntimeError("model unavailable")
+        return original(customer_ids, limits, recommendation_type, tenant_id)
+
+    engine.predict_many = predict_many
+    queue = BatchInferenceQueue(engine=engine, queue=jobs_queue, max_wait=0)
+    good = queue.enqueue(1, None, tenant_id="good")
+    bad = queue.enqueue(2, None, tenant_id="bad")
+
+    assert queue.process_batch() == 2
+    assert jobs_queue.failed == [bad]
+    assert queue.get_result(good)["status"] == "completed"
+    assert queue.get_result(bad) == {"status": "error", "error": "model unavailable", "job_id": bad, "attempts": 3}
+    assert queue.get_result("missing") == {"status": "expired"}
+
+
+def test_recommend_many_matches_recommend():
+    """Test the batched sparse scorer ranks exactly like the per-customer path"""
+    matrix = InteractionMatrix()
+    matrix.build_from_triples(
+        np.array([1, 1, 2, 2, 2, 3, 3, 4]),
+        np.array([10, 11, 10, 11, 12, 12, 13, 13]),
+        np.array([1, 2, 1, 1, 3, 1, 1, 2], dtype=np.float32)
+    )
+
+    customers = [1, 99, 3, 2, 4]
+    batched = matrix.recommend_many(customers, limit=2)
+    for customer_id, (product_ids, scores) in zip(customers, batched):
+        expected_ids, expected_scores = matrix.recommend(customer_id, limit=2)
+        assert product_ids.tolist() == expected_ids.tolist()
+        assert np.allclose(scores, expected_scores)
+    assert len(batched[1][0]) == 0
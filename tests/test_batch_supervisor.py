@@ -0,0 +1,146 @@
+"""
+Batch Supervisor Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import threading
+from ml_models.recommendation import batch_supervisor
+from ml_models.recommendation.batch_supervisor import BatchSupervisor, desired_workers, parse_worker_stats
+
+
+class _Process:
+    def __init__(self, pid):
+        self.pid = pid
+        self.alive = True
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self, timeout=None):
+        pass
+
+    def terminate(self):
+        self.alive = False
+
+
+class _Backlog:
+    def __init__(self):
+        self.depth, self.age = 0, 0.0
+
+    def backlog(self):
+        return self.depth, self.age
+
+
+class _Pipeline:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def hset(self, key, field, value):
+        self.redis.hashes.setdefault(key, {})[field] = value
+
+    def hdel(self, key, field):
+        self.redis.hashes.get(key, {}).pop(field, None)
+
+    def expire(self, key, ttl):
+        pass
+
+    def execute(self):
+        pass
+
+
+class _Redis:
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+
+class _Supervisor(BatchSupervisor):
+    """Supervisor whose workers are fake processes"""
+
+    def _spawn(self, worker_id):
+        return _Process(1000 + worker_id), threading.Event()
+
+
+def _supervisor(**kwargs):
+    options = dict(min_workers=1, max_workers=4, backlog_per_worker=100, max_job_age=10.0)
+    options.update(kwargs)
+    return _Supervisor(jobs_queue=_Backlog(), redis_client=_Redis(), **options)
+
+
+def test_desired_workers_policy():
+    """Test pool sizing on depth and oldest-job age, clamped to the configured range"""
+    assert desired_workers(1, 0, 0.0, 1, 4, 100, 10.0) == 1
+    assert desired_workers(1, 250, 1.0, 1, 4, 100, 10.0) == 3
+    assert desired_workers(1, 5000, 1.0, 1, 4, 100, 10.0) == 4
+    # A small queue that is aging gets one more worker than it has
+    assert desired_workers(2, 20, 30.0, 1, 4, 100, 10.0) == 3
+    assert desired_workers(4, 20, 30.0, 1, 4, 100, 10.0) == 4
+    assert desired_workers(3, 0, 0.0, 0, 4, 100, 10.0) == 0
+
+
+def test_scales_up_at_once_and_down_after_delay(monkeypatch):
+    """Test scale-up is immediate and scale-down retires one worker per delay"""
+    supervisor = _supervisor()
+    supervisor._start_workers(1)
+
+    supervisor.jobs_queue.depth = 350
+    supervisor._autoscale()
+    assert len(supervisor.running()) == 4
+
+    supervisor.jobs_queue.depth = 0
+    supervisor._autoscale()
+    assert len(supervisor.running()) == 4  # the low backlog has to last SCALE_DOWN_DELAY
+
+    monkeypatch.setattr(batch_supervisor, "SCALE_DOWN_DELAY", 0.0)
+    supervisor._autoscale()
+    assert supervisor.running() == [1, 2, 3]
+    assert supervisor._workers[4]["stop"].is_set()  # newest drains first
+
+
+def test_crashed_worker_is_replaced():
+    """Test a worker that exits on its own is counted as a restart and replaced"""
+    supervisor = _supervisor(min_workers=2)
+    supervisor._start_workers(2)
+    supervisor._workers[1]["process"].alive = False
+
+    supervisor._reap()
+    supervisor._autoscale()
+    assert supervisor.restarts == 1
+    assert supervisor.running() == [2, 3]
+
+
+def test_throughput_published_per_worker(monkeypatch):
+    """Test worker reports become per-worker rates visible through the shared hash"""
+    clock = [1000.0]
+    monkeypatch.setattr(batch_supervisor.time, "time", lambda: clock[0])
+    supervisor = _supervisor()
+    supervisor._start_workers(1)
+
+    supervisor._record(1, 4242, 0, 0, 0)
+    clock[0] += 5
+    supervisor._record(1, 4242, 50, 5, 0)
+    supervisor._publish()
+
+    pools = parse_worker_stats(supervisor.redis_client.hashes[batch_supervisor.WORKERS_KEY])
+    assert len(pools) == 1
+    worker = pools[0]["workers"][0]
+    assert worker["pid"] == 4242 and worker["jobs"] == 50 and worker["jobs_per_sec"] == 10.0
+
+    clock[0] += batch_supervisor.STALE_AFTER + 1
+    assert parse_worker_stats(supervisor.redis_client.hashes[batch_supervisor.WORKERS_KEY]) == []
+
+
+def test_drain_stops_every_worker():
+    """Test shutdown signals all workers, terminates stragglers and unpublishes the host"""
+    supervisor = _supervisor(drain_timeout=0.0)
+    supervisor._start_workers(2)
+    supervisor._publish()
+    workers = list(supervisor._workers.values())
+
+    supervisor._drain()
+    assert all(worker["stop"].is_set() for worker in workers)
+    assert not any(worker["process"].is_alive() for worker in workers)
+    assert supervisor.redis_client.hashes[batch_supervisor.WORKERS_KEY] == {}
@@ -0,0 +1,84 @@
+"""
+Co-occurrence Index Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import threading
+import numpy as np
+from ml_models.recommendation import cooccurrence
+from ml_models.recommendation.cooccurrence import CoOccurrenceIndex
+
+
+def _build_index(top_k: int = 3):
+    index = CoOccurrenceIndex(top_k=top_k)
+    # order 1: 10, 11, 12 | order 2: 10, 11 | order 3: 10, 11 (duplicate line item)
+    index.build_from_pairs(
+        np.array([1, 1, 1, 2, 2, 3, 3, 3]),
+        np.array([10, 11, 12, 10, 11, 10, 11, 11])
+    )
+    return index
+
+
+def test_neighbours_ranked_by_co_purchases():
+    """Test products are ranked by number of shared orders"""
+    index = _build_index()
+    ids, scores = index.neighbours(10, limit=5)
+    assert ids.tolist() == [11, 12]
+    assert scores.tolist() == [3.0, 1.0]
+
+
+def test_unknown_product_has_no_neighbours():
+    """Test lookup for a product never ordered"""
+    index = _build_index()
+    ids, scores = index.neighbours(999)
+    assert len(ids) == 0 and len(scores) == 0
+
+
+def test_incremental_order_updates_neighbours():
+    """Test new orders are reflected without a rebuild"""
+    index = _build_index()
+    index.add_order([12, 13])
+    index.add_order([12, 13])
+    ids, scores = index.neighbours(12, limit=2)
+    assert ids.tolist() == [13, 10]
+    assert scores.tolist() == [2.0, 1.0]
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    """Test the on-disk format restores the same table"""
+    index = _build_index()
+    path = str(tmp_path / "cooccurrence.npz")
+    index.save(path)
+
+    loaded = CoOccurrenceIndex()
+    assert loaded.load(path)
+    assert loaded.neighbours(10)[0].tolist() == [11, 12]
+
+
+def test_cold_start_builds_in_background(monkeypatch, tmp_path):
+    """Test a missing index file returns at once and builds once off the request path"""
+    started, release = threading.Event(), threading.Event()
+    index = CoOccurrenceIndex()
+    builds = []
+
+    def slow_rebuild(db=None):
+        builds.append(1)
+        started.set()
+        release.wait(5)
+        index.build_from_pairs(np.array([1, 1]), np.array([10, 11]))
+
+    index.rebuild = slow_rebuild
+    monkeypatch.setattr(cooccurrence, "_index", index)
+    monkeypatch.setattr(cooccurrence, "_reload_state", {"next_check": 0.0, "mtime": 0.0, "builder": None})
+    path = str(tmp_path / "missing.npz")
+
+    assert cooccurrence.get_cooccurrence_index(path) is index
+    assert started.wait(5) and not index.is_built
+    # Past the recheck window the running build is not started twice
+    cooccurrence._reload_state["next_check"] = 0.0
+    cooccurrence.get_cooccurrence_index(path)
+    assert len(builds) == 1
+
+    release.set()
+    cooccurrence._reload_state["builder"].join(5)
+    assert index.is_built and index.neighbours(10)[0].tolist() == [11]
@@ -0,0 +1,91 @@
+"""
+Visual Embedding Store Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import threading
+import numpy as np
+from ml_models.common.vector_index import recall_at_k
+from ml_models.visual_search import embedding_store
+from ml_models.visual_search.embedding_store import EmbeddingStore
+
+
+def _clustered(n: int, dim: int = 32, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dim)).astype(np.float32)
+    return centers[rng.integers(0, 20, n)] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def test_upserted_product_is_its_own_nearest_neighbour():
+    """Test exact search over pending upserts"""
+    vectors = _clustered(200)
+    store = EmbeddingStore(dim=32)
+    store.upsert(list(range(100, 300)), vectors)
+
+    results = store.search(vectors[:5], limit=3)
+    assert [ids[0] for ids, _ in results] == [100, 101, 102, 103, 104]
+    assert np.allclose([scores[0] for _, scores in results], 1.0, atol=1e-5)
+
+
+def test_ivf_search_matches_exact_after_compaction():
+    """Test the approximate path recalls the exact top-K on clustered data"""
+    vectors = _clustered(3000)
+    store = EmbeddingStore(dim=32, ann_threshold=1000)
+    store.upsert(list(range(3000)), vectors)
+    store.compact()
+
+    queries = vectors[:50]
+    approx = np.array([ids for ids, _ in store.search(queries, limit=10)])
+    exact = np.array([ids for ids, _ in store.search(queries, limit=10, exact=True)])
+    assert store.get_stats()["ivf_lists"] > 0
+    assert recall_at_k(approx, exact) >= 0.9
+
+
+def test_upsert_overrides_and_exclude_after_reload(tmp_path):
+    """Test replaced vectors shadow the saved base and excluded ids are skipped"""
+    vectors = _clustered(100)
+    store = EmbeddingStore(dim=32)
+    store.upsert(list(range(100)), vectors)
+    store.compact().save(str(tmp_path / "visual"))
+
+    reloaded = EmbeddingStore(dim=32)
+    assert reloaded.load(str(tmp_path / "visual"))
+    reloaded.upsert([0], -vectors[0])
+
+    ids, _ = reloaded.search(-vectors[0], limit=1)[0]
+    assert ids.tolist() == [0]
+    ids, _ = reloaded.search(vectors[0], limit=5, exclude=[1])[0]
+    assert 0 not in ids and 1 not in ids
+    assert len(reloaded) == 100
+
+
+def test_cold_start_builds_in_background(monkeypatch, tmp_path):
+    """Test a missing store returns at once unbuilt and is synced and compacted once off the request path"""
+    started, release = threading.Event(), threading.Event()
+    store = EmbeddingStore(dim=32)
+    vectors = _clustered(10)
+    syncs = []
+
+    def slow_sync(db=None, since=None):
+        syncs.append(1)
+        started.set()
+        release.wait(5)
+        store.upsert(list(range(10)), vectors)
+        return 10
+
+    store.sync_from_db = slow_sync
+    monkeypatch.setattr(embedding_store, "_store", store)
+    monkeypatch.setattr(embedding_store, "_reload_state", {"next_check": 0.0, "mtime": 0.0, "builder": None})
+    path = str(tmp_path / "missing")
+
+    assert embedding_store.get_embedding_store(path) is store
+    assert started.wait(5) and not store.is_built
+
+    # Past the recheck window the running build is not started twice
+    embedding_store._reload_state["next_check"] = 0.0
+    embedding_store.get_embedding_store(path)
+    assert len(syncs) == 1
+
+    release.set()
+    embedding_store._reload_state["builder"].join(5)
+    assert store.is_built and store.search(vectors[3], limit=1)[0][0].tolist() == [3]
@@ -0,0 +1,42 @@
+"""
+Batch Forecasting Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from config.database import Base
+from api.models.database_models import Product, ProductDailySales
+from ml_models.forecasting.inference import ForecastingEngine
+
+
+def test_predict_many_matches_single_product_forecasts(monkeypatch):
+    """Test the vectorized batch reproduces predict for every product"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine, tables=[Product.__table__, ProductDailySales.__table__])
+    session_factory = sessionmaker(bind=engine)
+    monkeypatch.setattr("config.database.SessionLocal", session_factory)
+
+    today = datetime.utcnow().date()
+    db = session_factory()
+    db.add_all([Product(id=pid, sku=f"sku-{pid}") for pid in (1, 2, 3)])
+    db.add_all([
+        ProductDailySales(product_id=1, sales_date=today - timedelta(days=d), units=u, order_lines=1)
+        for d, u in [(40, 3), (20, 8), (5, 2), (1, 6)]
+    ] + [
+        ProductDailySales(product_id=2, sales_date=today - timedelta(days=10), units=4, order_lines=1)
+    ])
+    db.commit()
+    db.close()
+
+    forecasting = ForecastingEngine()
+    batch = forecasting.predict_many(product_ids=[1, 2, 3], days_ahead=14)
+
+    assert batch.product_ids.tolist() == [1, 2, 3]
+    for product_id in (1, 2, 3):
+        expected = forecasting.predict(product_id=product_id, days_ahead=14)
+        actual = batch.for_product(product_id)
+        assert [f["predicted_demand"] for f in actual] == [f["predicted_demand"] for f in expected]
+        assert [f["confidence_interval"] for f in actual] == [f["confidence_interval"] for f in expected]
+    assert batch.total_demand()[2] == 0
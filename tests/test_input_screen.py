@@ -0,0 +1,36 @@
+"""
+Input Screening Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import re
+from api.utils.input_screen import (
+    INJECTION_RULES, injection_screen, screen_user_agent, sql_fragment_screen
+)
+
+
+def test_compiled_screen_matches_per_pattern_loop():
+    """Test the single alternation flags exactly what the per-pattern loop did and names the rule"""
+    samples = [
+        "red dress", "../../etc/passwd", "1 UNION  SELECT password", "<ScRiPt>alert(1)",
+        "javascript:void(0)", "img onerror=x", "eval (x)", "drop table users", "summer_sale_12",
+    ]
+    for value in samples:
+        legacy = any(re.search(p, value.lower()) for p in INJECTION_RULES.values())
+        assert injection_screen.is_clean(value) is not legacy
+
+    before = injection_screen.get_stats()["path_traversal"]
+    assert injection_screen.match("../secret") == "path_traversal"
+    assert injection_screen.get_stats()["path_traversal"] == before + 1
+    assert sql_fragment_screen.match("1; Drop users") == "statement_separator"
+
+
+def test_user_agent_verdicts():
+    """Test bot, good-bot and suspicious verdicts"""
+    assert screen_user_agent("curl/8.4.0").bot_rule == "curl"
+    assert screen_user_agent("curl/8.4.0").scraper_rule == "curl"
+    googlebot = screen_user_agent("Mozilla/5.0 (compatible; Googlebot/2.1)")
+    assert googlebot.bot_rule == "bot" and googlebot.scraper_rule is None
+    browser = screen_user_agent("Mozilla/5.0 (X11; Linux x86_64) Firefox/126.0")
+    assert browser.bot_rule is None and not browser.suspicious
+    assert screen_user_agent("Mozilla/5.0").suspicious
@@ -0,0 +1,141 @@
+"""
+Interaction Matrix Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import threading
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from config.database import Base
+from config.settings import settings
+from api.models.database_models import Product, Order, OrderItem
+from ml_models.recommendation import inference, interaction_matrix, product_cards
+from ml_models.recommendation.inference import RecommendationEngine
+from ml_models.recommendation.interaction_matrix import InteractionMatrix
+
+# customer -> products bought (one order each; customer 1 buys 10 twice)
+PURCHASES = {
+    1: [10, 11, 10],
+    2: [10, 11, 12],
+    3: [10, 12, 14],
+    4: [13],
+    6: [11, 12],
+}
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine, tables=[Product.__table__, Order.__table__, OrderItem.__table__])
+    session_factory = sessionmaker(bind=engine)
+    monkeypatch.setattr("config.database.SessionLocal", session_factory)
+    monkeypatch.setattr(product_cards, "_cards", {})
+
+    db = session_factory()
+    db.add_all([Product(id=pid, sku=f"sku-{pid}", name=f"Product {pid}", price=10.0) for pid in range(10, 15)])
+    for customer_id, product_ids in PURCHASES.items():
+        order = Order(customer_id=customer_id, total=10.0 * len(product_ids), status="completed")
+        db.add(order)
+        db.flush()
+        db.add_all([OrderItem(order_id=order.id, product_id=pid, quantity=1, price=10.0) for pid in product_ids])
+    db.commit()
+    db.close()
+    return session_factory
+
+
+@pytest.fixture
+def matrix(session_factory):
+    matrix = InteractionMatrix()
+    db = session_factory()
+    try:
+        matrix.rebuild(db)
+    finally:
+        db.close()
+    return matrix
+
+
+def test_rebuild_from_orders(matrix):
+    """Test the matrix is built from stored order items and knows who has history"""
+    assert matrix.is_built
+    assert matrix.get_stats()["customers"] == 5
+    assert matrix.has_history(1) and matrix.has_history(4)
+    assert not matrix.has_history(5)
+
+
+def test_recommend_ranks_unseen_similar_products(matrix):
+    """Test products bought with the customer's history rank first and bought ones are excluded"""
+    product_ids, scores = matrix.recommend(1, limit=10)
+    # 12 was bought alongside both 10 and 11, 14 only alongside 10; 13 shares no buyers
+    assert product_ids.tolist() == [12, 14]
+    assert scores[0] > scores[1] > 0
+
+    assert matrix.recommend(5)[0].tolist() == []
+
+
+def test_recommend_many_top_k(matrix):
+    """Test the batched path keeps the top K per customer and matches recommend"""
+    results = matrix.recommend_many([1, 5, 6, 4], limit=1)
+    assert [product_ids.tolist() for product_ids, _ in results] == [[12], [], [10], []]
+
+    for customer_id, (product_ids, scores) in zip([1, 6], matrix.recommend_many([1, 6], limit=3)):
+        expected_ids, expected_scores = matrix.recommend(customer_id, limit=3)
+        assert product_ids.tolist() == expected_ids.tolist()
+        assert scores.tolist() == pytest.approx(expected_scores.tolist())
+
+
+def test_sql_fallback_when_sparse_cf_disabled(monkeypatch, session_factory, matrix):
+    """Test RECOMMENDATION_SPARSE_CF_ENABLED=False serves from SQL and agrees with the matrix on the top pick"""
+    engine = RecommendationEngine.__new__(RecommendationEngine)
+    monkeypatch.setattr(inference, "get_interaction_matrix", lambda: matrix)
+
+    monkeypatch.setattr(settings, "RECOMMENDATION_SPARSE_CF_ENABLED", True)
+    from_matrix = engine._personalized_recommendations(1, 1)
+
+    def no_matrix():
+        raise AssertionError("matrix used with sparse CF disabled")
+
+    monkeypatch.setattr(inference, "get_interaction_matrix", no_matrix)
+    monkeypatch.setattr(settings, "RECOMMENDATION_SPARSE_CF_ENABLED", False)
+    from_db = engine._personalized_recommendations(1, 1)
+
+    assert [p["id"] for p in from_matrix["products"]] == [12]
+    assert [p["id"] for p in from_db["products"]] == [12]
+    assert from_db["recommendation_type"] == "personalized"
+    # Batched scoring has no SQL path; predict_many falls back to one query per customer
+    assert engine._rank_many([1], 1, "personalized") == ("personalized", None)
+
+
+def test_cold_start_builds_in_background(monkeypatch, tmp_path):
+    """Test a missing matrix file returns at once, builds once off the request path and serves popular meanwhile"""
+    started, release = threading.Event(), threading.Event()
+    matrix = InteractionMatrix()
+    builds = []
+
+    def slow_rebuild(db=None):
+        builds.append(1)
+        started.set()
+        release.wait(5)
+        matrix.build_from_triples(np.array([1, 1, 2, 2]), np.array([10, 11, 10, 12]), np.array([1.0, 1.0, 1.0, 1.0]))
+
+    matrix.rebuild = slow_rebuild
+    monkeypatch.setattr(interaction_matrix, "_matrix", matrix)
+    monkeypatch.setattr(interaction_matrix, "_reload_state", {"next_check": 0.0, "mtime": 0.0, "builder": None})
+    monkeypatch.setattr(settings, "RECOMMENDATION_SPARSE_CF_ENABLED", True)
+    path = str(tmp_path / "missing.npz")
+    monkeypatch.setattr(inference, "get_interaction_matrix", lambda: interaction_matrix.get_interaction_matrix(path))
+
+    engine = RecommendationEngine.__new__(RecommendationEngine)
+    engine._popular_products = lambda limit: {"products": [], "scores": [], "source": "popular"}
+    assert engine._personalized_recommendations(1, 5)["source"] == "popular"
+    assert started.wait(5) and not matrix.is_built
+
+    # Past the recheck window the running build is not started twice
+    interaction_matrix._reload_state["next_check"] = 0.0
+    interaction_matrix.get_interaction_matrix(path)
+    assert len(builds) == 1
+
+    release.set()
+    interaction_matrix._reload_state["builder"].join(5)
+    assert matrix.is_built and matrix.recommend(1)[0].tolist() == [12]
@@ -0,0 +1,149 @@
+"""
+Job Notifier Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import asyncio
+import pytest
+from api.utils import job_notifier
+from api.utils.job_notifier import JobNotifier
+
+
+class _PubSub:
+    def __init__(self, redis):
+        self.redis = redis
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        await asyncio.sleep(self.redis.subscribe_delay)
+        self.redis.subscribers.setdefault(channel, []).append(self)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            return await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def aclose(self):
+        for subscribers in self.redis.subscribers.values():
+            if self in subscribers:
+                subscribers.remove(self)
+
+
+class _AsyncRedis:
+    def __init__(self):
+        self.subscribers = {}
+        self.subscribe_delay = 0.0
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return _PubSub(self)
+
+    async def publish(self, channel, message):
+        for pubsub in self.subscribers.get(channel, []):
+            pubsub.messages.put_nowait({"type": "message", "channel": channel.encode(), "data": message.encode()})
+
+
+class _Jobs:
+    """ReliableQueue stand-in holding job states in memory"""
+
+    done_channel = "test:done"
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.jobs = {}
+        self.reads = 0
+
+    async def get_many_async(self, job_ids, redis_client):
+        self.reads += 1
+        return [self.jobs.get(job_id) for job_id in job_ids]
+
+    async def finish(self, job_id, status="completed"):
+        self.jobs[job_id] = {"status": status, "result": {"job": job_id}}
+        await self.redis.publish(self.done_channel, job_id)
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    redis = _AsyncRedis()
+    monkeypatch.setattr(job_notifier, "get_async_redis", lambda: redis)
+    return _Jobs(redis)
+
+
+def test_wait_returns_when_job_finishes(jobs):
+    """Test a waiting request returns on the completion message, not at its timeout"""
+    notifier = JobNotifier(jobs)
+    jobs.jobs["job-1"] = {"status": "processing"}
+
+    async def scenario():
+        waiter = asyncio.create_task(notifier.wait("job-1", 5.0))
+        await asyncio.sleep(0.05)
+        start = asyncio.get_running_loop().time()
+        await jobs.finish("job-1")
+        job = await waiter
+        return job, asyncio.get_running_loop().time() - start
+
+    job, elapsed = asyncio.run(scenario())
+    assert job["status"] == "completed"
+    assert elapsed < 1.0
+    # Initial read, re-read once the loop's subscription is up, read after the wake-up
+    assert jobs.reads == 3
+
+
+def test_wait_timeout_and_finished_jobs(jobs):
+    """Test an unfinished job is returned as it stands at the timeout; finished and expired ones at once"""
+    notifier = JobNotifier(jobs)
+    jobs.jobs["job-1"] = {"status": "pending"}
+    jobs.jobs["job-2"] = {"status": "dead", "error": "model unavailable"}
+
+    async def scenario():
+        return (
+            await notifier.wait("job-1", 0.1),
+            await notifier.wait("job-2", 5.0),
+            await notifier.wait("missing", 5.0),
+            await notifier.wait("job-1", 0)
+        )
+
+    pending, dead, missing, immediate = asyncio.run(scenario())
+    assert pending == {"status": "pending"} and immediate == {"status": "pending"}
+    assert dead["status"] == "dead"
+    assert missing is None
+
+
+def test_completion_before_subscription_is_not_missed(jobs):
+    """Test a job that finishes while the subscription is still connecting is read once it is up"""
+    notifier = JobNotifier(jobs)
+    jobs.redis.subscribe_delay = 0.1
+    jobs.jobs["job-1"] = {"status": "processing"}
+
+    async def scenario():
+        waiter = asyncio.create_task(notifier.wait("job-1", 5.0))
+        await asyncio.sleep(0.02)
+        await jobs.finish("job-1")  # nobody is subscribed yet
+        return await asyncio.wait_for(waiter, 1.0)
+
+    assert asyncio.run(scenario())["status"] == "completed"
+
+
+def test_watch_streams_jobs_in_finish_order(jobs):
+    """Test watch yields each job as it finishes, heartbeats while idle, and stops at the timeout"""
+    notifier = JobNotifier(jobs)
+    for job_id in ("a", "b", "c"):
+        jobs.jobs[job_id] = {"status": "pending"}
+    jobs.jobs["d"] = {"status": "completed"}
+
+    async def scenario():
+        async def finish_later():
+            await asyncio.sleep(0.05)
+            await jobs.finish("c")
+            await asyncio.sleep(0.05)
+            await jobs.finish("a", status="dead")
+
+        task = asyncio.create_task(finish_later())
+        updates = [update async for update in notifier.watch(["a", "b", "c", "d", "a"], 0.3, heartbeat=0.12)]
+        await task
+        return updates
+
+    updates = asyncio.run(scenario())
+    finished = [(job_id, job["status"]) for job_id, job in filter(None, updates)]
+    assert finished == [("d", "completed"), ("c", "completed"), ("a", "dead")]
+    assert None in updates  # "b" never finished; idle heartbeats were sent
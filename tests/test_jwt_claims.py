@@ -0,0 +1,43 @@
+"""
+JWT Claims Cache Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import time
+import jwt
+import pytest
+from config.settings import settings
+from api.utils.jwt_claims import JWTClaims
+
+
+def _token(**claims):
+    return jwt.encode(claims, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+
+
+def test_repeat_tokens_skip_verification_until_exp():
+    """Test a verified token is served from cache and expires with its exp claim"""
+    token = _token(user_id="42", tenant_id="tenant-001", exp=int(time.time()) + 60)
+    before = JWTClaims.get_stats()
+
+    first = JWTClaims.decode(token)
+    first["tenant_id"] = "mutated"
+    second = JWTClaims.decode(token)
+
+    after = JWTClaims.get_stats()
+    assert second["tenant_id"] == "tenant-001"
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+
+    expired = _token(user_id="42", exp=int(time.time()) - 1)
+    assert JWTClaims.verify(expired) is None
+
+
+def test_tampered_tokens_are_rejected_and_not_cached():
+    """Test a bad signature raises like jwt.decode and is not remembered"""
+    token = _token(user_id="7", exp=int(time.time()) + 60)
+    forged = token[:-2] + ("AA" if not token.endswith("AA") else "BB")
+
+    with pytest.raises(jwt.InvalidTokenError):
+        JWTClaims.decode(forged)
+    assert JWTClaims.verify(forged) is None
+    assert JWTClaims.verify(token)["user_id"] == "7"
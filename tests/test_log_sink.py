@@ -0,0 +1,49 @@
+"""
+Log Sink Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import threading
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from config.database import Base
+from api.models.database_models import ApiLog, RateLimitLog
+from api.utils.log_sink import LogSink
+
+
+def test_rows_are_flushed_in_bulk_and_overflow_is_dropped():
+    """Test queued rows reach their tables on stop() and a full queue drops instead of blocking"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[ApiLog.__table__, RateLimitLog.__table__])
+    session_factory = sessionmaker(bind=engine)
+
+    sink = LogSink(session_factory=session_factory, batch_size=100, flush_interval=0.05, max_queue=1000)
+    for i in range(250):
+        sink.write(ApiLog, {"method": "GET", "endpoint": f"/api/v1/items/{i}", "status_code": 200, "response_time": 0.01})
+    sink.write(RateLimitLog, {"ip_address": "10.0.0.1", "user_agent": "", "endpoint": "", "request_count": 101})
+    sink.stop()
+
+    db = session_factory()
+    assert db.query(ApiLog).count() == 250
+    assert db.query(RateLimitLog).one().created_at is not None
+    db.close()
+
+    stats = sink.get_stats()
+    assert stats["written"] == 251 and stats["dropped"] == 0 and not stats["running"]
+    assert stats["batches"] < 251
+
+    # A stalled database: the worker holds one row while the queue (2 slots) fills up
+    gate = threading.Event()
+    stalled = LogSink(session_factory=lambda: gate.wait() and session_factory(), flush_interval=0.01, max_queue=2)
+    stalled.write(ApiLog, {"method": "GET"})
+    while stalled.get_stats()["pending"]:
+        time.sleep(0.01)
+    results = [stalled.write(ApiLog, {"method": "GET"}) for _ in range(5)]
+    gate.set()
+    stalled.stop()
+
+    assert results == [True, True, False, False, False]
+    assert stalled.get_stats()["dropped"] == 3
+    assert stalled.get_stats()["written"] == 3
@@ -0,0 +1,69 @@
+"""
+Catalog Pricing Sweep Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from config.database import Base
+from api.models.database_models import Product, ProductDailySales, PricingRecommendation
+from ml_models.pricing import inference
+from ml_models.pricing.inference import PricingEngine
+
+
+class _KeyValueRedis:
+    """Single-process stand-in for the get/set calls the sweep state makes"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+
+def test_catalog_sweep_matches_single_product_pricing(monkeypatch):
+    """Test the vectorized sweep reproduces predict and skips unchanged products"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine, tables=[
+        Product.__table__, ProductDailySales.__table__, PricingRecommendation.__table__
+    ])
+    session_factory = sessionmaker(bind=engine)
+    monkeypatch.setattr("config.database.SessionLocal", session_factory)
+    redis_client = _KeyValueRedis()
+    monkeypatch.setattr(inference, "get_redis", lambda: redis_client)
+
+    today = datetime.utcnow().date()
+    db = session_factory()
+    db.add_all([
+        Product(id=pid, sku=f"sku-{pid}", price=100.0, sale_price=sale, stock_quantity=stock)
+        for pid, sale, stock in [(1, None, 40), (2, 80.0, 4), (3, None, 60), (4, None, 2), (5, None, 8)]
+    ])
+    db.add_all([
+        ProductDailySales(product_id=2, sales_date=today - timedelta(days=1), units=200, order_lines=20),
+        ProductDailySales(product_id=3, sales_date=today - timedelta(days=3), units=90, order_lines=9)
+    ])
+    db.commit()
+    db.close()
+
+    pricing = PricingEngine()
+    sweep = pricing.price_catalog()
+    assert sweep["repriced"] == 5
+    for recommendation in sweep["recommendations"]:
+        expected = pricing.predict(recommendation["product_id"])
+        for key in ("current_price", "recommended_price", "discount_percentage", "reason"):
+            assert recommendation[key] == expected[key]
+
+    db = session_factory()
+    assert db.query(PricingRecommendation).count() == 5
+    db.query(Product).filter(Product.id == 5).update({"stock_quantity": 70})
+    db.commit()
+    db.close()
+
+    # Another host runs the next sweep from the shared state
+    incremental = PricingEngine().price_catalog(incremental=True)
+    assert [r["product_id"] for r in incremental["recommendations"]] == [5]
+    assert incremental["recommendations"][0]["discount_percentage"] == 22.0
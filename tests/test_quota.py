@@ -0,0 +1,148 @@
+"""
+Quota Lease Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import asyncio
+import time
+from api.utils import quota
+from api.utils.quota import TenantQuota
+from api.utils.tenant_resolver import TenantResolver
+
+
+class _CounterRedis:
+    """Runs the lease script's logic in Python over a shared counter dict"""
+
+    def __init__(self):
+        self.counters = {}
+        self.calls = 0
+
+    def register_script(self, source):
+        def run(keys, args):
+            self.calls += 1
+            limit, wanted = int(args[0]), int(args[1])
+            remaining = limit - self.counters.get(keys[0], 0)
+            if remaining <= 0:
+                return 0
+            grant = min(wanted, max(1, remaining // 4))
+            self.counters[keys[0]] = self.counters.get(keys[0], 0) + grant
+            return grant
+        return run
+
+    def get(self, key):
+        return self.counters.get(key)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.counters.pop(key, None)
+
+    def hget(self, key, field):
+        return None
+
+
+class _Clock:
+    """time stand-in whose monotonic clock the test can move forward"""
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def monotonic(self):
+        return time.monotonic() + self.offset
+
+
+class _AsyncCounterRedis:
+    """redis.asyncio-style view of a _CounterRedis"""
+
+    def __init__(self, server: _CounterRedis):
+        self.server = server
+
+    def register_script(self, source):
+        run = self.server.register_script(source)
+
+        async def run_async(keys, args, client=None):
+            return run(keys, args)
+        return run_async
+
+
+def test_workers_never_exceed_the_shared_limit(monkeypatch):
+    """Test two workers leasing from one counter admit exactly the daily limit between them"""
+    monkeypatch.setattr(TenantResolver, "get_plan", staticmethod(lambda tenant_id: "basic"))
+    redis_client = _CounterRedis()
+    workers = [TenantQuota(redis_client), TenantQuota(redis_client)]
+
+    admitted = sum(workers[i % 2].check("tenant_a")[0] for i in range(1500))
+
+    assert admitted == 1000
+    assert redis_client.calls < 200
+    allowed, message = workers[0].check("tenant_a")
+    assert not allowed and "API call limit" in message
+    assert workers[1].check("tenant_b")[0]
+
+
+def test_async_checks_lease_from_the_same_counter(monkeypatch):
+    """Test the event-loop path and a sync worker together still admit exactly the daily limit"""
+    monkeypatch.setattr(TenantResolver, "get_plan", staticmethod(lambda tenant_id: "basic"))
+    redis_client = _CounterRedis()
+    loop_worker = TenantQuota(redis_client, async_redis_client=_AsyncCounterRedis(redis_client))
+    sync_worker = TenantQuota(redis_client)
+
+    async def scenario():
+        admitted = 0
+        for i in range(1500):
+            admitted += (await loop_worker.check_async("tenant_a"))[0] if i % 2 else sync_worker.check("tenant_a")[0]
+        return admitted, await loop_worker.check_async("tenant_a")
+
+    admitted, (allowed, message) = asyncio.run(scenario())
+    assert admitted == 1000
+    assert not allowed and "API call limit" in message
+
+
+def test_spent_ml_quota_refuses_on_every_worker(monkeypatch):
+    """Test a tenant whose ML quota another worker spent is refused, also after the local recheck window"""
+    monkeypatch.setattr(TenantResolver, "get_plan", staticmethod(lambda tenant_id: "basic"))
+    clock = _Clock()
+    monkeypatch.setattr(quota, "time", clock)
+    redis_client = _CounterRedis()
+    ml_worker, api_worker = TenantQuota(redis_client), TenantQuota(redis_client)
+
+    assert api_worker.check("tenant_a")[0]
+    spent = 0
+    while ml_worker.consume("tenant_a", "ml_inferences"):
+        spent += 1
+    assert spent == 100
+
+    clock.offset += max(quota.EXHAUSTED_RECHECK, quota.PEEK_TTL) + 1
+    for worker in (ml_worker, api_worker):
+        allowed, message = worker.check("tenant_a")
+        assert not allowed and "ML inference limit" in message
+        assert not worker.check("tenant_a", consume=False)[0]
+        assert not worker.consume("tenant_a", "ml_inferences")
+    assert api_worker.check("tenant_b")[0]
+
+    # An admin reset clears the shared counter; other workers see it once their refusal and read expire
+    ml_worker.reset("tenant_a")
+    clock.offset += max(quota.EXHAUSTED_RECHECK, quota.PEEK_TTL) + 1
+    assert api_worker.check("tenant_a", consume=False) == (True, None)
+    assert asyncio.run(api_worker.exhausted_async("tenant_a", "ml_inferences")) is False
+
+
+def test_inference_past_quota_serves_popular(monkeypatch):
+    """Test predict and predict_many fall back to popular products once the ML quota is refused"""
+    from ml_models.recommendation import inference
+    from ml_models.recommendation.inference import RecommendationEngine
+
+    class _Refusing:
+        def consume(self, tenant_id, metric, amount=1):
+            return False
+
+    tracked = []
+    monkeypatch.setattr(inference, "tenant_quota", _Refusing())
+    monkeypatch.setattr(inference.UsageTracker, "track_ml_inference", staticmethod(lambda *args: tracked.append(args)))
+    engine = RecommendationEngine.__new__(RecommendationEngine)
+    engine._popular_products = lambda limit: {"products": [{"id": i} for i in range(limit)], "scores": [1.0] * limit}
+    engine._generate = lambda *args: (_ for _ in ()).throw(AssertionError("model used past the quota"))
+
+    assert len(engine.predict(7, None, limit=3, tenant_id="tenant_a")["products"]) == 3
+    results = engine.predict_many([7, 8], [2, 4], tenant_id="tenant_a")
+    assert [len(r["products"]) for r in results] == [2, 4]
+    assert tracked == []
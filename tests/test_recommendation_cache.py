@@ -0,0 +1,108 @@
+"""
+Recommendation Cache Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import threading
+import time
+from ml_models.recommendation.cache import RecommendationCache
+
+
+class _DictRedis:
+    """Single-process stand-in for the handful of Redis commands the cache uses"""
+
+    def __init__(self):
+        self.data = {}
+
+    def mget(self, *keys):
+        return [self.data.get(k) for k in keys]
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value.encode()
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def register_script(self, source):
+        def compare_and_delete(keys, args):
+            if self.data.get(keys[0]) == args[0].encode():
+                self.delete(keys[0])
+                return 1
+            return 0
+        return compare_and_delete
+
+
+def test_concurrent_misses_compute_once():
+    """Test single-flight collapses a stampede and later reads hit L1"""
+    cache = RecommendationCache(_DictRedis())
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"products": [1, 2, 3]}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute(compute, "t1", 7, "personalized", 10)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"products": [1, 2, 3]}] * 8
+    cache.get_or_compute(compute, "t1", 7, "personalized", 10)
+    assert cache.get_stats()["l1_hits"] == 1
+
+
+def test_generation_invalidation_is_scoped():
+    """Test tenant and customer invalidation only drop their own entries"""
+    redis_client = _DictRedis()
+    writer = RecommendationCache(redis_client)
+    reader = RecommendationCache(redis_client, l1_ttl=0)
+    values = iter(range(100))
+
+    def lookup(tenant_id, customer_id, limit=10):
+        return reader.get_or_compute(lambda: next(values), tenant_id, customer_id, "personalized", limit)
+
+    first = {key: lookup(*key) for key in [("t1", 1), ("t1", 2), ("t2", 1)]}
+    assert lookup("t1", 1, limit=5) != first[("t1", 1)]
+
+    writer.invalidate_subject(1, "t1")
+    assert lookup("t1", 1) != first[("t1", 1)]
+    assert lookup("t1", 2) == first[("t1", 2)]
+
+    writer.invalidate_tenant("t1")
+    assert lookup("t1", 2) != first[("t1", 2)]
+    assert lookup("t2", 1) == first[("t2", 1)]
+
+
+def test_lock_release_keeps_a_lock_taken_by_another_worker():
+    """Test a worker whose lock expired does not delete the lock another worker took since"""
+    redis_client = _DictRedis()
+    cache = RecommendationCache(redis_client)
+
+    token = cache._acquire_lock("rec:t1:k")
+    assert token is not None and cache._acquire_lock("rec:t1:k") is None
+
+    redis_client.data["rec:t1:k:lock"] = b"other-worker"  # ours expired and was re-taken
+    cache._release_lock("rec:t1:k", token)
+    assert redis_client.data["rec:t1:k:lock"] == b"other-worker"
+
+    cache._release_lock("rec:t1:k", "other-worker")
+    assert "rec:t1:k:lock" not in redis_client.data
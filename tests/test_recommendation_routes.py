@@ -0,0 +1,42 @@
+"""
+Recommendation Route Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from api.routes import recommendations
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def test_blocking_engine_calls_run_off_the_event_loop(monkeypatch):
+    """Test predict, cross-sell and batch enqueue (sync Redis and model work) run in worker threads"""
+    calls = []
+
+    def record(name, result):
+        def call(*args, **kwargs):
+            calls.append((name, _on_event_loop()))
+            return result
+        return call
+
+    empty = {"products": [], "scores": [], "recommendation_type": "personalized"}
+    monkeypatch.setattr(recommendations.recommendation_engine, "predict", record("predict", empty))
+    monkeypatch.setattr(recommendations.recommendation_engine, "cross_sell", record("cross_sell", empty))
+    monkeypatch.setattr(recommendations.batch_queue, "enqueue", record("enqueue", "job-1"))
+
+    app = FastAPI()
+    app.include_router(recommendations.router)
+    client = TestClient(app)
+
+    assert client.post("/", json={"customer_id": 7}).status_code == 200
+    assert client.get("/cross-sell/3").status_code == 200
+    assert client.post("/batch", json={"customer_id": 7}).json() == {"job_id": "job-1", "status": "pending"}
+    assert calls == [("predict", False), ("cross_sell", False), ("enqueue", False)]
@@ -0,0 +1,50 @@
+"""
+Tests for the shared Redis client registry
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import asyncio
+import weakref
+import pytest
+from config import redis_client
+from config.settings import settings
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # Nothing listens on port 1, so connections fail fast
+    monkeypatch.setattr(settings, "REDIS_URL", "redis://127.0.0.1:1/0")
+    monkeypatch.setattr(settings, "REDIS_MAX_CONNECTIONS", 7)
+    monkeypatch.setattr(redis_client, "_sync_client", None)
+    monkeypatch.setattr(redis_client, "_async_clients", weakref.WeakKeyDictionary())
+    return redis_client
+
+
+def test_sync_client_is_shared_and_sized(registry):
+    """Test every caller gets the same client on one bounded pool"""
+    client = registry.get_redis()
+    assert registry.get_redis() is client
+    assert client.connection_pool.max_connections == 7
+    assert registry.get_pool_stats()["sync"] == {"created": 0, "in_use": 0, "idle": 0}
+
+
+def test_async_client_per_event_loop(registry):
+    """Test one asyncio client per running loop, reused within it"""
+    async def pair():
+        return registry.get_async_redis(), registry.get_async_redis()
+
+    first, again = asyncio.run(pair())
+    second, _ = asyncio.run(pair())
+    assert first is again
+    assert second is not first
+    assert first.connection_pool.max_connections == 7
+
+
+def test_health_reports_unreachable_redis(registry):
+    """Test health checks report failures instead of raising"""
+    assert registry.check_health()["status"] == "unhealthy"
+    assert asyncio.run(registry.check_health_async())["status"] == "unhealthy"
+
+    stats = registry.get_pool_stats()
+    assert stats["max_connections"] == 7
+    assert stats["sync"]["in_use"] == 0
@@ -0,0 +1,259 @@
+"""
+Reliable Queue Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import asyncio
+import pytest
+from api.utils import reliable_queue
+from api.utils.reliable_queue import ReliableQueue
+
+
+def _b(value):
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+class _Pipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return record
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class _AsyncPipeline(_Pipeline):
+    async def execute(self):
+        return super().execute()
+
+
+class _StreamRedis:
+    """In-memory streams, consumer groups, hashes and sorted sets; `clock` drives idle times"""
+
+    def __init__(self):
+        self.clock = 0.0
+        self.hashes, self.zsets, self.strings = {}, {}, {}
+        self.streams, self.groups = {}, {}
+        self.published = []
+        self._seq = 0
+
+    # Streams
+    def xgroup_create(self, name, group, id="0", mkstream=False):
+        if (name, group) in self.groups:
+            raise Exception("BUSYGROUP Consumer Group name already exists")
+        self.streams.setdefault(name, [])
+        self.groups[(name, group)] = {"delivered": set(), "pending": {}}
+
+    def xadd(self, name, fields, maxlen=None):
+        self._seq += 1
+        entry_id = f"{1700000000000 + self._seq}-0".encode()
+        self.streams.setdefault(name, []).append((entry_id, {_b(k): _b(v) for k, v in fields.items()}))
+        if maxlen is not None:
+            del self.streams[name][:-maxlen]
+        return entry_id
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        (name, _), = streams.items()
+        state = self.groups[(name, group)]
+        fresh = [e for e in self.streams[name] if e[0] not in state["delivered"]][:count]
+        for entry_id, _ in fresh:
+            state["delivered"].add(entry_id)
+            state["pending"][entry_id] = [consumer, self.clock]
+        return [[name.encode(), fresh]] if fresh else []
+
+    def xautoclaim(self, name, group, consumer, min_idle_time, start_id="0-0", count=None):
+        state = self.groups[(name, group)]
+        entries = dict(self.streams[name])
+        claimed = []
+        for entry_id, (_, delivered_at) in list(state["pending"].items()):
+            if (self.clock - delivered_at) * 1000 >= min_idle_time and len(claimed) < (count or 100):
+                state["pending"][entry_id] = [consumer, self.clock]
+                claimed.append((entry_id, entries.get(entry_id)))
+        return [b"0-0", claimed, []]
+
+    def xack(self, name, group, *ids):
+        pending = self.groups[(name, group)]["pending"]
+        return sum(pending.pop(_b(i), None) is not None for i in ids)
+
+    def xdel(self, name, *ids):
+        ids = {_b(i) for i in ids}
+        self.streams[name] = [e for e in self.streams.get(name, []) if e[0] not in ids]
+
+    def xlen(self, name):
+        return len(self.streams.get(name, []))
+
+    def xrange(self, name, count=None):
+        return self.streams.get(name, [])[:count]
+
+    def xrevrange(self, name, count=None):
+        return list(reversed(self.streams.get(name, [])))[:count]
+
+    def xpending(self, name, group):
+        if (name, group) not in self.groups:
+            raise Exception("NOGROUP No such key or consumer group")
+        return {"pending": len(self.groups[(name, group)]["pending"])}
+
+    # Hashes, sorted sets, strings
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({_b(k): _b(v) for k, v in mapping.items()})
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(_b(field))
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hincrby(self, key, field, amount=1):
+        value = int(self.hashes.setdefault(key, {}).get(_b(field), 0)) + amount
+        self.hashes[key][_b(field)] = _b(value)
+        return value
+
+    def expire(self, key, ttl):
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def incrby(self, key, amount):
+        self.strings[key] = self.strings.get(key, 0) + amount
+
+    def mget(self, *keys):
+        return [self.strings.get(key) for key in keys]
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def register_script(self, script):
+        def promote(keys, args):
+            zset = self.zsets.get(keys[0], {})
+            due = sorted(job for job, at in zset.items() if at <= float(args[0]))
+            for job_id in due:
+                del zset[job_id]
+                self.xadd(keys[1], {"job": job_id})
+            return len(due)
+        return promote
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(reliable_queue, "MAINTENANCE_INTERVAL", 0.0)
+    monkeypatch.setattr(reliable_queue, "RETRY_DELAYS", (0, 0))
+    return ReliableQueue("test", redis_client=_StreamRedis(), consumer="w1", visibility_timeout=30, max_attempts=3)
+
+
+def test_claim_and_complete(queue):
+    """Test a completed job stores its result and leaves nothing pending"""
+    queue.enqueue({"customer_id": 7}, "job-1")
+    jobs = queue.claim(10)
+    assert [(j.job_id, j.payload, j.attempts) for j in jobs] == [("job-1", {"customer_id": 7}, 1)]
+    assert queue.get("job-1")["status"] == "processing"
+
+    queue.complete_many([(jobs[0], {"products": [1]})])
+    job = queue.get("job-1")
+    assert job["status"] == "completed" and job["result"] == {"products": [1]}
+    assert queue.claim(10) == []
+
+    stats = queue.get_stats()
+    assert stats["queue_length"] == 0 and stats["processing"] == 0
+    assert stats["counters"]["enqueued"] == 1 and stats["counters"]["completed"] == 1
+    assert stats["completed_last_hour"] == 1
+    assert queue.redis_client.published == [("test:done", "job-1")]
+
+
+def test_crashed_worker_job_is_redelivered_after_visibility_timeout(queue):
+    """Test a claimed job that is never acknowledged goes to another worker once idle long enough"""
+    queue.enqueue({"n": 1}, "job-1")
+    assert len(queue.claim(10)) == 1  # worker dies without acking
+
+    other = ReliableQueue("test", redis_client=queue.redis_client, consumer="w2", visibility_timeout=30)
+    assert other.claim(10) == []
+    queue.redis_client.clock += 31
+    jobs = other.claim(10)
+    assert [(j.job_id, j.attempts) for j in jobs] == [("job-1", 2)]
+
+
+def test_failures_retry_then_dead_letter_and_requeue(queue):
+    """Test bounded retries end in the dead-letter stream, and an admin requeue resets attempts"""
+    queue.enqueue({"n": 1}, "job-1")
+    for attempt in (1, 2, 3):
+        jobs = queue.claim(10)
+        assert [(j.job_id, j.attempts) for j in jobs] == [("job-1", attempt)]
+        queue.fail_many([(jobs[0], "model unavailable")])
+        expected = "dead" if attempt == 3 else "retrying"
+        assert queue.get("job-1")["status"] == expected
+
+    assert queue.claim(10) == []
+    # Only the final failure finishes the job
+    assert queue.redis_client.published == [("test:done", "job-1")]
+    stats = queue.get_stats()
+    assert stats["counters"]["retried"] == 2 and stats["counters"]["dead_lettered"] == 1
+    assert stats["dead_letters"][0]["job_id"] == "job-1"
+    assert stats["dead_letters"][0]["attempts"] == 3
+
+    assert queue.requeue("job-1") is True
+    assert queue.requeue("job-1") is False
+    assert [(j.job_id, j.attempts) for j in queue.claim(10)] == [("job-1", 1)]
+
+
+def test_poison_job_dead_lettered_after_repeated_timeouts(queue):
+    """Test a job that keeps timing out is dead-lettered instead of redelivered forever"""
+    queue.enqueue({"n": 1}, "job-1")
+    for _ in range(3):
+        assert len(queue.claim(10)) == 1
+        queue.redis_client.clock += 31
+    assert queue.claim(10) == []
+    assert queue.get("job-1")["status"] == "dead"
+    assert queue.get("job-1")["error"] == "visibility timeout exceeded"
+
+
+def test_expired_job_state_is_dropped(queue):
+    """Test a stream entry whose job hash expired is acknowledged, not run or recreated"""
+    queue.enqueue({"n": 1}, "job-1")
+    queue.redis_client.delete(queue.job_key("job-1"))
+    assert queue.claim(10) == []
+    assert queue.get("job-1") is None
+    assert queue.get_stats()["processing"] == 0
+
+
+def test_async_stats_before_any_worker(queue):
+    """Test admin stats work through an async client before the consumer group exists"""
+    client = queue.redis_client
+    queue.enqueue({"n": 1}, "job-1")
+
+    class _Async:
+        async def xpending(self, name, group):
+            return client.xpending(name, group)
+
+        def pipeline(self, transaction=True):
+            return _AsyncPipeline(client)
+
+    stats = asyncio.run(queue.get_stats_async(_Async()))
+    assert stats["queue_length"] == 1 and stats["processing"] == 0
+
+
+def test_backlog_reports_depth_and_oldest_age(queue, monkeypatch):
+    """Test backlog counts unacknowledged jobs and ages the oldest from its stream ID"""
+    assert queue.backlog() == (0, 0.0)
+    queue.enqueue({"n": 1}, "job-1")
+    queue.enqueue({"n": 2}, "job-2")
+    queue.claim(1)
+
+    added_at = int(queue.redis_client.streams[queue.stream_key][0][0].split(b"-")[0]) / 1000
+    monkeypatch.setattr(reliable_queue.time, "time", lambda: added_at + 12.5)
+    assert queue.backlog() == (2, 12.5)
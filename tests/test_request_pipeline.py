@@ -0,0 +1,123 @@
+"""
+Request Pipeline Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from api.middleware import deprecation
+from api.middleware.deprecation import DeprecationStage
+from api.middleware.pipeline import RequestPipeline, Stage, error_response
+from api.middleware.request_id import RequestIDStage
+from api.middleware.validation import InputValidationStage
+
+
+class _RecordingStage(Stage):
+    def __init__(self):
+        self.completed = []
+
+    def before(self, ctx):
+        ctx.defer(lambda: self.completed.append((ctx.path, ctx.status_code)))
+
+
+class _AsyncTenantStage(Stage):
+    async def before(self, ctx):
+        await asyncio.sleep(0)
+        if ctx.headers.get("x-tenant-id") == "suspended":
+            return error_response(403, "Tenant is suspended")
+        ctx.tenant_id = ctx.headers.get("x-tenant-id")
+
+
+class _RejectAdminStage(Stage):
+    def before(self, ctx):
+        if ctx.path.startswith("/admin"):
+            return error_response(401, "Missing or invalid token")
+
+
+def _client(*stages):
+    app = FastAPI()
+
+    @app.get("/items")
+    async def items():
+        return {"items": []}
+
+    @app.get("/admin/items")
+    async def admin_items():
+        return {"items": []}
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    app.add_middleware(RequestPipeline, stages=list(stages))
+    return TestClient(app, raise_server_exceptions=False)
+
+
+def test_short_circuit_still_runs_outer_stages():
+    """Test a rejecting stage skips the app but earlier stages still add headers and deferred work"""
+    recorder = _RecordingStage()
+    client = _client(RequestIDStage(), recorder, _RejectAdminStage())
+
+    ok = client.get("/items")
+    rejected = client.get("/admin/items")
+
+    assert ok.status_code == 200 and "X-Request-ID" in ok.headers
+    assert rejected.status_code == 401
+    assert rejected.json() == {"detail": "Missing or invalid token"}
+    assert "X-Request-ID" in rejected.headers
+    assert recorder.completed == [("/items", 200), ("/admin/items", 401)]
+
+
+def test_async_stages_are_awaited():
+    """Test a coroutine before() is awaited, can short-circuit, and later stages see its effects"""
+    recorder = _RecordingStage()
+    seen = []
+
+    class _TenantRecorder(Stage):
+        def before(self, ctx):
+            seen.append(ctx.tenant_id)
+
+    client = _client(RequestIDStage(), _AsyncTenantStage(), _TenantRecorder(), recorder)
+
+    assert client.get("/items", headers={"X-Tenant-ID": "tenant_a"}).status_code == 200
+    rejected = client.get("/items", headers={"X-Tenant-ID": "suspended"})
+    assert rejected.status_code == 403 and "X-Request-ID" in rejected.headers
+    assert seen == ["tenant_a"]
+    assert recorder.completed == [("/items", 200)]
+
+
+def test_stage_errors_are_client_errors_and_app_errors_are_tracked():
+    """Test validation rejections keep their status and unhandled errors become a tracked 500"""
+    client = _client(RequestIDStage(), InputValidationStage())
+
+    assert client.get("/items?q=<script>alert(1)</script>").status_code == 400
+    assert client.get("/items", headers={"User-Agent": "curl/8.0"}).status_code == 403
+
+    response = client.get("/boom")
+    assert response.status_code == 500
+    assert "error_id" in response.json()
+    assert "X-Request-ID" in response.headers
+
+
+def test_deprecated_usage_is_queued_on_the_log_sink(monkeypatch):
+    """Test a deprecated endpoint gets its headers and its audit row goes through the log sink"""
+    written = []
+
+    class _Sink:
+        def write(self, model, row):
+            written.append((model.__tablename__, row))
+            return True
+
+    monkeypatch.setattr(deprecation, "log_sink", _Sink())
+    monkeypatch.setitem(deprecation.DEPRECATED_ENDPOINTS, "/items", {
+        "sunset_date": "2025-06-01", "replacement": "/v2/items", "message": ""
+    })
+    client = _client(DeprecationStage())
+
+    response = client.get("/items", headers={"X-Tenant-ID": "tenant_a"})
+    assert response.headers["X-API-Replacement"] == "/v2/items"
+    assert client.get("/admin/items").headers.get("X-API-Deprecated") is None
+    assert [(table, row["endpoint"], row["tenant_id"]) for table, row in written] == [
+        ("deprecated_api_logs", "/items", "tenant_a")
+    ]
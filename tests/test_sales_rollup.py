@@ -0,0 +1,72 @@
+"""
+Sales Rollup Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from config.database import Base
+from api.models.database_models import Customer, Product, Order, OrderItem, ProductDailySales
+from data_pipeline.sales_rollup import SalesRollup
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine, tables=[
+        Customer.__table__, Product.__table__, Order.__table__,
+        OrderItem.__table__, ProductDailySales.__table__
+    ])
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        Customer(id=1, email="a@example.com"),
+        Product(id=10, sku="dress", category="dresses", price=100.0),
+        Product(id=11, sku="bag", category="bags", price=50.0),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+def _order(db, created_at, lines):
+    order = Order(customer_id=1, total=0.0, created_at=created_at)
+    db.add(order)
+    db.flush()
+    for product_id, quantity, price in lines:
+        db.add(OrderItem(order_id=order.id, product_id=product_id, quantity=quantity, price=price))
+    SalesRollup.record_order(db, created_at, lines)
+    db.commit()
+
+
+def test_incremental_updates_match_rebuild(db):
+    """Test per-order increments equal a full recompute from orders"""
+    now = datetime.utcnow()
+    _order(db, now, [(10, 2, 100.0), (11, 1, 50.0)])
+    _order(db, now, [(10, 1, 100.0)])
+    _order(db, now - timedelta(days=3), [(11, 4, 50.0)])
+
+    def snapshot():
+        return sorted(
+            (r.product_id, str(r.sales_date), r.units, r.order_lines, r.revenue)
+            for r in db.query(ProductDailySales).all()
+        )
+
+    incremental = snapshot()
+    SalesRollup.rebuild(db)
+    assert snapshot() == incremental
+    assert (10, str(now.date()), 3, 2, 300.0) in incremental
+
+
+def test_readers_aggregate_the_window(db):
+    """Test daily, per-product and top-product reads over the rollup"""
+    now = datetime.utcnow()
+    _order(db, now, [(10, 2, 100.0)])
+    _order(db, now - timedelta(days=1), [(10, 1, 100.0), (11, 5, 50.0)])
+    _order(db, now - timedelta(days=60), [(11, 7, 50.0)])
+
+    assert [units for _, units in SalesRollup.daily_units(db, days=30, product_id=10)] == [1.0, 2.0]
+    assert SalesRollup.units_by_product(db, days=30) == {10: 3.0, 11: 5.0}
+    assert SalesRollup.top_products(db, days=30, limit=1) == [(10, 2)]
+    assert sum(SalesRollup.monthly_units(db, "bags", days=365).values()) == 12.0
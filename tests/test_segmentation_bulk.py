@@ -0,0 +1,49 @@
+"""
+Bulk Segmentation Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import itertools
+import numpy as np
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from config.database import Base
+from api.models.database_models import Customer, Order
+from ml_models.segmentation.inference import SegmentationEngine
+
+
+def test_vectorized_segments_match_scalar_rules():
+    """Test calculate_segments agrees with _calculate_segment on rule boundaries"""
+    engine = SegmentationEngine()
+    grid = list(itertools.product([0, 30, 31, 60, 61, 180, 181, 999], [0, 1, 2, 3, 5], [0.0, 199.0, 200.0, 500.0]))
+    recency, frequency, monetary = (np.array(column) for column in zip(*grid))
+
+    expected = [engine._calculate_segment(r, f, m) for r, f, m in grid]
+    assert engine.calculate_segments(recency, frequency, monetary).tolist() == expected
+
+
+def test_segment_all_writes_back_changed_customers():
+    """Test one pass segments every customer and updates segment and lifetime value"""
+    db_engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=db_engine, tables=[Customer.__table__, Order.__table__])
+    db = sessionmaker(bind=db_engine)()
+
+    now = datetime.utcnow()
+    db.add_all([
+        Customer(id=1, email="vip@example.com", order_count=6, total_spent=900.0),
+        Customer(id=2, email="lapsed@example.com", order_count=1, total_spent=40.0),
+        Customer(id=3, email="new@example.com", order_count=0, total_spent=0.0, segment="segment_4"),
+        Order(customer_id=1, total=150.0, created_at=now - timedelta(days=3)),
+        Order(customer_id=2, total=40.0, created_at=now - timedelta(days=400)),
+    ])
+    db.commit()
+
+    stats = SegmentationEngine().segment_all(db=db)
+    assert stats["customers"] == 3 and stats["updated"] == 2
+
+    customers = {c.id: c for c in db.query(Customer).all()}
+    assert customers[1].segment == "segment_0" and customers[1].lifetime_value == 1350.0
+    assert customers[2].segment == "segment_4"
+    assert customers[3].segment == "segment_4"
+    db.close()
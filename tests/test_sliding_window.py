@@ -0,0 +1,88 @@
+"""
+Sliding-Window Limiter Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import asyncio
+import time
+from api.utils.sliding_window import SlidingWindowLimiter
+
+
+class _ScriptRedis:
+    """Runs the limiter script's logic in Python so the client-side fast path can be tested without Redis"""
+
+    def __init__(self):
+        self.logs = {}
+        self.blocks = {}
+        self.calls = 0
+
+    def register_script(self, source):
+        def run(keys, args):
+            self.calls += 1
+            log_key, block_key, _ = keys
+            now = time.time() * 1000
+            if self.blocks.get(block_key, 0) > now:
+                return [-1, int(self.blocks[block_key] - now)]
+            limit, window, block = int(args[0]), int(args[1]), int(args[2])
+            log = [t for t in self.logs.get(log_key, []) if t > now - window]
+            log.extend(now - int(age) for age in args[5:])
+            if len(log) >= limit:
+                if block:
+                    self.blocks[block_key] = now + block
+                self.logs[log_key] = log
+                return [0, len(log)]
+            log.append(now)
+            self.logs[log_key] = log
+            return [1, len(log)]
+        return run
+
+
+class _AsyncScriptRedis:
+    """redis.asyncio-style view of a _ScriptRedis, as another connection to the same server"""
+
+    def __init__(self, server: _ScriptRedis):
+        self.server = server
+
+    def register_script(self, source):
+        run = self.server.register_script(source)
+
+        async def run_async(keys, args, client=None):
+            return run(keys, args)
+        return run_async
+
+    async def exists(self, key):
+        return int(self.server.blocks.get(key, 0) > time.time() * 1000)
+
+
+def test_local_fast_path_is_bounded_and_synced():
+    """Test locally admitted hits skip Redis but are recorded, so the limit still holds"""
+    redis_client = _ScriptRedis()
+    limiter = SlidingWindowLimiter("test", limit=40, window_seconds=60, block_seconds=60,
+                                   redis_client=redis_client, local_burst=4, sync_interval=60)
+
+    results = [limiter.hit("10.0.0.1") for _ in range(60)]
+    allowed = [r for r in results if r[0]]
+
+    assert len(allowed) == 40
+    assert redis_client.calls < 60
+    assert sum(1 for r in results if r[2]) == 1
+    assert len(redis_client.logs["ratelimit:test:log:10.0.0.1"]) == 40
+    assert limiter.get_stats()["local_hits"] > 0
+    assert limiter.hit("10.0.0.2")[0]
+
+
+def test_async_hits_share_the_window_with_sync_hits():
+    """Test the event-loop path enforces the same limit and block as the sync path"""
+    redis_client = _ScriptRedis()
+    limiter = SlidingWindowLimiter("test", limit=10, window_seconds=60, block_seconds=60, redis_client=redis_client,
+                                   async_redis_client=_AsyncScriptRedis(redis_client), local_burst=0)
+
+    async def scenario():
+        results = [await limiter.hit_async("10.0.0.1") for _ in range(8)]
+        results += [limiter.hit("10.0.0.1") for _ in range(4)]
+        return results, await limiter.is_blocked_async("10.0.0.1"), await limiter.is_blocked_async("10.0.0.2")
+
+    results, blocked, other_blocked = asyncio.run(scenario())
+    assert [r[0] for r in results] == [True] * 10 + [False] * 2
+    assert results[10][2] and not results[11][2]
+    assert blocked and not other_blocked
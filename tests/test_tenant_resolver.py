@@ -0,0 +1,155 @@
+"""
+Tenant Resolver Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import asyncio
+import threading
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from config.database import Base
+from api.models.database_models import Tenant
+from api.utils import tenant_resolver
+from api.utils.tenant_resolver import TenantResolver
+
+
+class _KeyValueRedis:
+    """Single-process stand-in for the get/setex/delete/publish calls the resolver makes"""
+
+    def __init__(self):
+        self.data = {}
+        self.published = []
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value.encode()
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+class _AsyncKeyValueRedis:
+    """redis.asyncio-style GET over a _KeyValueRedis"""
+
+    def __init__(self, server: _KeyValueRedis):
+        self.server = server
+        self.gets = 0
+
+    async def get(self, key):
+        self.gets += 1
+        return self.server.get(key)
+
+
+def _tenant_db(status: str = "active"):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Tenant.__table__])
+    session_factory = sessionmaker(bind=engine)
+    db = session_factory()
+    db.add(Tenant(tenant_id="tenant_a", name="A", status=status, plan="premium", api_key="key_a"))
+    db.commit()
+    db.close()
+    return session_factory
+
+
+def test_misses_are_coalesced_and_invalidation_is_broadcast(monkeypatch):
+    """Test concurrent misses load once, L2 serves other workers, and invalidation reaches hooks"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Tenant.__table__])
+    session_factory = sessionmaker(bind=engine)
+    db = session_factory()
+    db.add(Tenant(tenant_id="tenant_a", name="A", status="active", plan="premium", api_key="key_a"))
+    db.commit()
+
+    slow_factory = lambda: (time.sleep(0.1), session_factory())[1]
+    redis_client = _KeyValueRedis()
+    monkeypatch.setattr(tenant_resolver, "SessionLocal", slow_factory)
+    monkeypatch.setattr(tenant_resolver, "_redis", redis_client)
+    monkeypatch.setattr(tenant_resolver, "_subscriber", threading.current_thread())
+    TenantResolver.invalidate_cache("tenant_a")
+    loads_before = TenantResolver.get_stats()["db_loads"]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(TenantResolver.get_plan("tenant_a"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["premium"] * 8
+    assert TenantResolver.get_stats()["db_loads"] == loads_before + 1
+    assert "tenant:tenant_a" in redis_client.data
+
+    # Another worker's L1 is empty, but L2 has the tenant
+    tenant_resolver._tenant_cache.clear()
+    assert TenantResolver.is_active("tenant_a")
+    assert TenantResolver.get_stats()["db_loads"] == loads_before + 1
+
+    invalidated = []
+    monkeypatch.setattr(tenant_resolver, "_invalidation_hooks", [invalidated.append])
+    db.query(Tenant).update({"status": "suspended"})
+    db.commit()
+    TenantResolver.invalidate_cache("tenant_a")
+
+    assert invalidated == ["tenant_a"]
+    assert redis_client.published[-1] == (tenant_resolver.TENANT_INVALIDATION_CHANNEL, "tenant_a")
+    assert TenantResolver.validate_tenant("tenant_a") == (False, "Tenant is suspended")
+    db.close()
+
+
+def test_async_lookup_reads_l2_on_the_loop(monkeypatch):
+    """Test the event-loop lookup serves L2 through the async client and loads the database off the loop"""
+    redis_client = _KeyValueRedis()
+    async_client = _AsyncKeyValueRedis(redis_client)
+    monkeypatch.setattr(tenant_resolver, "SessionLocal", _tenant_db("suspended"))
+    monkeypatch.setattr(tenant_resolver, "_redis", redis_client)
+    monkeypatch.setattr(tenant_resolver, "get_async_redis", lambda: async_client)
+    monkeypatch.setattr(tenant_resolver, "_subscriber", threading.current_thread())
+    TenantResolver.invalidate_cache("tenant_a")
+    loads_before = TenantResolver.get_stats()["db_loads"]
+
+    async def lookup():
+        return await TenantResolver.get_tenant_async("tenant_a"), await TenantResolver.validate_tenant_async("tenant_a")
+
+    # Cold: L2 misses, the database load fills L2 and L1
+    tenant, verdict = asyncio.run(lookup())
+    assert tenant["plan"] == "premium" and verdict == (False, "Tenant is suspended")
+    assert TenantResolver.get_stats()["db_loads"] == loads_before + 1
+    assert async_client.gets == 1  # the second lookup was an L1 hit
+
+    # Another worker: L1 empty, served from L2 without touching the database
+    tenant_resolver._tenant_cache.clear()
+    tenant, _ = asyncio.run(lookup())
+    assert tenant["status"] == "suspended"
+    assert async_client.gets == 2
+    assert TenantResolver.get_stats()["db_loads"] == loads_before + 1
+
+
+def test_load_raced_by_invalidation_is_not_written_to_l2(monkeypatch):
+    """Test a database load that overlaps an invalidation is returned but not cached in L1 or L2"""
+    session_factory = _tenant_db()
+    redis_client = _KeyValueRedis()
+
+    def invalidating_factory():
+        # The tenant changes while this lookup is reading the old row
+        TenantResolver.invalidate_cache("tenant_a")
+        return session_factory()
+
+    monkeypatch.setattr(tenant_resolver, "SessionLocal", invalidating_factory)
+    monkeypatch.setattr(tenant_resolver, "_redis", redis_client)
+    monkeypatch.setattr(tenant_resolver, "_subscriber", threading.current_thread())
+    TenantResolver.invalidate_cache("tenant_a")
+
+    assert TenantResolver.get_plan("tenant_a") == "premium"
+    assert "tenant:tenant_a" not in redis_client.data
+    assert "tenant_a" not in tenant_resolver._tenant_cache
+
+    monkeypatch.setattr(tenant_resolver, "SessionLocal", session_factory)
+    assert TenantResolver.get_plan("tenant_a") == "premium"
+    assert "tenant:tenant_a" in redis_client.data
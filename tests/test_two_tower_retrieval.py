@@ -0,0 +1,123 @@
+"""
+Two-Tower Retrieval Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import numpy as np
+import tensorflow as tf
+from ml_models.common.vector_index import IVFIndex, exact_top_k, normalize_rows, recall_at_k
+from ml_models.recommendation.inference import RecommendationEngine
+from ml_models.recommendation.retrieval import TwoTowerRetriever
+
+
+def _two_tower_model(num_users: int = 20, num_products: int = 50, dim: int = 8):
+    """Small model with the layer names train.py gives the towers"""
+    user_input = tf.keras.Input(shape=(1,), name='user_id')
+    user_vec = tf.keras.layers.Embedding(num_users, dim, name='user_embedding')(user_input)
+    user_vec = tf.keras.layers.Dense(dim, name='user_vector')(tf.keras.layers.Flatten()(user_vec))
+    product_input = tf.keras.Input(shape=(1,), name='product_id')
+    product_vec = tf.keras.layers.Embedding(num_products, dim, name='product_embedding')(product_input)
+    product_vec = tf.keras.layers.Dense(dim, name='product_vector')(tf.keras.layers.Flatten()(product_vec))
+    output = tf.keras.layers.Dense(1, activation='sigmoid', name='rating')(
+        tf.keras.layers.Concatenate()([user_vec, product_vec])
+    )
+    return tf.keras.Model([user_input, product_input], output)
+
+
+def _retriever(tmp_path, **kwargs):
+    return TwoTowerRetriever(
+        _two_tower_model(),
+        embeddings_path=str(tmp_path / "embeddings.npy"),
+        ids_path=str(tmp_path / "ids.npy"),
+        ivf_path=str(tmp_path / "ivf.npz"),
+        **kwargs
+    )
+
+
+def _clustered(n: int, dim: int = 16, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dim)).astype(np.float32)
+    return normalize_rows(centers[rng.integers(0, 20, n)] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32))
+
+
+def test_towers_split_at_vector_layers(tmp_path):
+    """Test each tower maps an id to the output of its *_vector layer"""
+    retriever = _retriever(tmp_path)
+    model = retriever.model
+    assert retriever.num_users == 20 and retriever.num_products == 50
+
+    ids = np.array([[3], [7]])
+    full_user = tf.keras.Model(model.inputs, model.get_layer('user_vector').output)
+    full_product = tf.keras.Model(model.inputs, model.get_layer('product_vector').output)
+    np.testing.assert_allclose(
+        retriever.user_tower.predict(ids, verbose=0), full_user.predict([ids, ids], verbose=0), rtol=1e-5
+    )
+    np.testing.assert_allclose(
+        retriever.product_tower.predict(ids, verbose=0), full_product.predict([ids, ids], verbose=0), rtol=1e-5
+    )
+
+
+def test_exact_top_k_matches_brute_force():
+    """Test the chunked scan returns the same rows and order as a full argsort"""
+    rng = np.random.default_rng(1)
+    matrix = rng.normal(size=(1000, 16)).astype(np.float32)
+    queries = rng.normal(size=(5, 16)).astype(np.float32)
+
+    rows, scores = exact_top_k(queries, matrix, 10, chunk_size=128)
+    expected = np.argsort(-(queries @ matrix.T), axis=1)[:, :10]
+    assert rows.tolist() == expected.tolist()
+    np.testing.assert_allclose(scores, np.take_along_axis(queries @ matrix.T, expected, axis=1), rtol=1e-5)
+
+    rows, _ = exact_top_k(queries, matrix[:3], 10)
+    assert rows.shape == (5, 3)
+
+
+def test_ivf_recall_on_clustered_corpus(tmp_path):
+    """Test the IVF index recalls the exact top-K and probing every list is exact"""
+    vectors = _clustered(3000)
+    queries = vectors[:50]
+    exact, _ = exact_top_k(queries, vectors, 10)
+
+    index = IVFIndex(n_probe=8).build(vectors)
+    approx, _ = index.search(queries, 10)
+    assert recall_at_k(approx, exact) >= 0.9
+    assert recall_at_k(index.search(queries, 10, n_probe=index.n_lists)[0], exact) == 1.0
+
+    index.save(str(tmp_path / "ivf.npz"))
+    assert IVFIndex.load(str(tmp_path / "ivf.npz")).search(queries, 10)[0].tolist() == approx.tolist()
+
+
+def test_retrieve_exported_embeddings(tmp_path):
+    """Test retrieval over exported embeddings ranks by tower inner product; unknown customers get nothing"""
+    retriever = _retriever(tmp_path)
+    assert not retriever.load()
+    assert retriever.export_product_embeddings(range(60)) == 50  # ids past the embedding table are skipped
+    assert retriever.load()
+
+    results = retriever.retrieve([1, 99, None], limit=5, rerank=False)
+    user_vector = retriever.user_tower.predict(np.array([[1]]), verbose=0)
+    expected = np.argsort(-(user_vector @ np.asarray(retriever.embeddings).T).ravel(), kind="stable")[:5]
+    assert results[0][0].tolist() == retriever.product_ids[expected].tolist()
+    assert len(results[1][0]) == 0 and len(results[2][0]) == 0
+
+    product_ids, scores = retriever.retrieve([1], limit=5)[0]
+    assert len(product_ids) == 5 and np.all(np.diff(scores) <= 0)
+
+
+def test_falls_back_to_personalized_without_embeddings(tmp_path):
+    """Test two-tower requests are served by personalized CF until embeddings are exported"""
+    engine = RecommendationEngine.__new__(RecommendationEngine)
+    calls = []
+    engine._personalized_recommendations = lambda customer_id, limit: calls.append((customer_id, limit)) or {
+        "products": [], "scores": [], "recommendation_type": "personalized"
+    }
+
+    # No trained model
+    engine.model, engine._retriever = None, None
+    assert engine._two_tower_recommendations(1, 5)["recommendation_type"] == "personalized"
+
+    # Model loaded, embeddings never exported
+    engine._retriever = _retriever(tmp_path)
+    engine.model = engine._retriever.model
+    assert engine._two_tower_recommendations(2, 5)["recommendation_type"] == "personalized"
+    assert calls == [(1, 5), (2, 5)]
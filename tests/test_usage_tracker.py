@@ -0,0 +1,126 @@
+"""
+Usage Tracker Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import threading
+from datetime import datetime, timedelta
+from collections import defaultdict
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from config.database import Base
+from api.models.database_models import TenantUsageDaily
+from api.utils import usage_tracker
+from api.utils.usage_tracker import UsageTracker
+
+
+class _HashRedis:
+    """Single-process stand-in for the hash/set commands the usage tracker pipelines"""
+
+    def __init__(self):
+        self.hashes = defaultdict(dict)
+        self.sets = defaultdict(set)
+        self.executes = 0
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+    def hincrby(self, key, field, amount):
+        self.hashes[key][field] = self.hashes[key].get(field, 0) + amount
+
+    def hgetall(self, key):
+        return {k.encode(): str(v).encode() for k, v in self.hashes.get(key, {}).items()}
+
+    def hget(self, key, field):
+        value = self.hashes.get(key, {}).get(field)
+        return None if value is None else str(value).encode()
+
+    def sadd(self, key, member):
+        self.sets[key].add(member)
+
+    def smembers(self, key):
+        return {m.encode() for m in self.sets.get(key, set())}
+
+    def expire(self, key, ttl):
+        pass
+
+
+class _Pipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        self.client.executes += 1
+        return [getattr(self.client, name)(*args) for name, args in self.calls]
+
+
+def test_counts_are_batched_and_rolled_up(monkeypatch):
+    """Test concurrent increments reach Redis in one pipeline and the rollup is idempotent"""
+    redis_client = _HashRedis()
+    monkeypatch.setattr(usage_tracker, "_redis", redis_client)
+    monkeypatch.setattr(usage_tracker, "FLUSH_INTERVAL", 3600)
+    UsageTracker.flush()
+    redis_client.executes = 0
+
+    threads = [
+        threading.Thread(target=lambda: [UsageTracker.track_api_call("tenant_a") for _ in range(100)])
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    UsageTracker.track_ml_inference("tenant_a")
+
+    # Unflushed counts are still visible to this process
+    assert UsageTracker.get_daily_usage("tenant_a")["api_calls"] == 500
+
+    redis_client.executes = 0
+    assert UsageTracker.flush() == 2
+    assert redis_client.executes == 1
+    daily = UsageTracker.get_daily_usage("tenant_a")
+    assert daily["api_calls"] == 500 and daily["ml_inferences"] == 1
+    assert UsageTracker.get_usage("tenant_a")["api_calls"] == 500
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[TenantUsageDaily.__table__])
+    db = sessionmaker(bind=engine)()
+    assert UsageTracker.rollup_daily(db=db) == 1
+    UsageTracker.track_api_call("tenant_a")
+    assert UsageTracker.rollup_daily(db=db) == 1
+
+    row = db.query(TenantUsageDaily).one()
+    assert (row.tenant_id, row.api_calls, row.ml_inferences) == ("tenant_a", 501, 1)
+    db.close()
+
+
+def test_daily_breakdown_includes_rolled_up_history(monkeypatch):
+    """Test past days come from tenant_usage_daily and today from Redis"""
+    redis_client = _HashRedis()
+    monkeypatch.setattr(usage_tracker, "_redis", redis_client)
+    monkeypatch.setattr(usage_tracker, "FLUSH_INTERVAL", 3600)
+    UsageTracker.flush()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[TenantUsageDaily.__table__])
+    db = sessionmaker(bind=engine)()
+    today = datetime.utcnow().date()
+    db.add_all([
+        TenantUsageDaily(tenant_id="tenant_b", usage_date=today - timedelta(days=2), api_calls=40, ml_inferences=4, storage_bytes=5 * 2**30),
+        TenantUsageDaily(tenant_id="tenant_b", usage_date=today - timedelta(days=60), api_calls=9, ml_inferences=0, storage_bytes=0),
+        TenantUsageDaily(tenant_id="tenant_b", usage_date=today, api_calls=1, ml_inferences=0, storage_bytes=0),
+    ])
+    db.commit()
+    UsageTracker.track_api_call("tenant_b")
+    UsageTracker.track_api_call("tenant_b")
+    UsageTracker.flush()
+
+    breakdown = UsageTracker.get_usage("tenant_b", history_days=30, db=db)["daily_breakdown"]
+    assert list(breakdown) == [(today - timedelta(days=2)).isoformat(), today.isoformat()]
+    assert breakdown[(today - timedelta(days=2)).isoformat()]["storage_bytes"] == 5 * 2**30
+    assert breakdown[today.isoformat()]["api_calls"] == 2
+    db.close()
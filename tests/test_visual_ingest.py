@@ -0,0 +1,60 @@
+"""
+Visual Search Ingestion Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import io
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+from ml_models.visual_search.embedding_store import EmbeddingStore
+from ml_models.visual_search.ingest import EmbeddingIngestor, decode_image
+
+
+def _write_image(path, color, mode="RGB"):
+    Image.new(mode, (300, 200), color).save(path)
+    return str(path)
+
+
+def _tiny_model():
+    inputs = tf.keras.Input(shape=(224, 224, 3))
+    x = tf.keras.layers.GlobalAveragePooling2D()(tf.keras.layers.Rescaling(1 / 255)(inputs))
+    return tf.keras.Model(inputs, tf.keras.layers.Dense(8)(x))
+
+
+def test_decode_image_converts_to_rgb():
+    """Test RGBA and grayscale images decode to 224x224x3 uint8"""
+    for mode, color in [("RGBA", (10, 20, 30, 128)), ("L", 200)]:
+        buffer = io.BytesIO()
+        Image.new(mode, (500, 400), color).save(buffer, format="PNG")
+        image = decode_image(buffer.getvalue())
+        assert image.shape == (224, 224, 3) and image.dtype == np.uint8
+
+
+def test_ingest_resumes_from_checkpoint(tmp_path):
+    """Test a second run only embeds products after the saved checkpoint"""
+    colors = ["red", "green", "blue", "white", "yellow"]
+    items = [(i + 1, _write_image(tmp_path / f"{i}.png", c)) for i, c in enumerate(colors)]
+    items.append((6, str(tmp_path / "missing.png")))
+
+    def ingestor():
+        return EmbeddingIngestor(
+            _tiny_model(),
+            store=EmbeddingStore(dim=8),
+            store_path=str(tmp_path / "store"),
+            checkpoint_path=str(tmp_path / "checkpoint.json"),
+            batch_size=2,
+            workers=0,
+            window_size=3,
+            save_every=1
+        )
+
+    first = ingestor().run(items[:3])
+    assert first["processed"] == 3 and first["last_product_id"] == 3
+
+    second = ingestor()
+    second.store.load(str(tmp_path / "store"))
+    stats = second.run(items)
+    assert stats["processed"] == 5 and stats["failed"] == 1
+    assert stats["last_product_id"] == 6
+    assert len(second.store) == 5
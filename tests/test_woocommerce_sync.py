@@ -0,0 +1,152 @@
+"""
+WooCommerce Sync Tests
+Copyright © 2024 Paksa IT Solutions
+"""
+
+import json
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from config.database import Base
+from api.models.database_models import Customer, Product, Order, OrderItem, ProductDailySales
+from data_pipeline.sync_woocommerce import WooCommerceSync
+
+
+class _Store:
+    """Records served by the stub WooCommerce REST API"""
+
+    def __init__(self):
+        self.customers = [
+            {"id": i, "email": f"c{i}@example.com", "first_name": f"C{i}", "last_name": "Test", "total_spent": "10.0"}
+            for i in range(1, 251)
+        ]
+        self.products = [
+            {"id": 1000 + i, "name": f"Product {i}", "sku": f"sku-{i}", "price": "20.0",
+             "categories": [{"name": "dresses" if i % 2 else "bags"}], "images": []}
+            for i in range(1, 121)
+        ]
+        self.orders = [
+            {"id": 5000 + i, "customer_id": i + 30, "total": "40.0", "status": "completed",
+             "date_created": "2024-05-01T10:00:00",
+             "line_items": [{"product_id": 1001, "quantity": 1, "price": "20.0"},
+                            {"product_id": 1000 + i % 120 + 1, "quantity": 1, "price": "20.0"}]}
+            for i in range(1, 231)
+        ]
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+def _stub_server(store: _Store):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            endpoint = url.path.rsplit("/", 1)[-1]
+            query = parse_qs(url.query)
+            page, per_page = int(query["page"][0]), int(query["per_page"][0])
+            with store.lock:
+                store.requests += 1
+                store.in_flight += 1
+                store.max_in_flight = max(store.max_in_flight, store.in_flight)
+            time.sleep(0.02)
+            records = getattr(store, endpoint)
+            body = json.dumps(records[(page - 1) * per_page:page * per_page]).encode()
+            with store.lock:
+                store.in_flight -= 1
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("X-WP-Total", str(len(records)))
+            self.send_header("X-WP-TotalPages", str(-(-len(records) // per_page)))
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def store():
+    store = _Store()
+    server = _stub_server(store)
+    store.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield store
+    server.shutdown()
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine, tables=[
+        Customer.__table__, Product.__table__, Order.__table__,
+        OrderItem.__table__, ProductDailySales.__table__
+    ])
+    session = sessionmaker(bind=engine)()
+    session.statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: session.statements.append(args[2]))
+    yield session
+    session.close()
+
+
+def test_full_sync_fetches_pages_concurrently(store, db):
+    """Test every page is synced, with later pages fetched in parallel"""
+    sync = WooCommerceSync(url=store.url, consumer_key="ck", consumer_secret="cs", concurrency=3)
+
+    assert sync.sync_customers(db, per_page=50) == 250
+    assert store.requests == 5 and store.max_in_flight > 1
+    assert sync.sync_products(db, per_page=50) == 120
+    assert sync.sync_orders(db, per_page=50) == 230
+
+    assert db.query(Customer).count() == 250
+    assert db.query(Product).count() == 120
+    # Customers 251-260 are unknown, so their orders are skipped
+    assert db.query(Order).count() == 230 - 10
+    assert db.query(OrderItem).count() == 2 * (230 - 10)
+    assert db.query(Customer).filter(Customer.woocommerce_id == 7).one().created_at is not None
+
+
+def test_page_written_in_bulk_statements(store, db):
+    """Test a page costs a fixed number of statements, not one query per row or line item"""
+    sync = WooCommerceSync(url=store.url, consumer_key="ck", consumer_secret="cs")
+    sync.sync_customers(db, per_page=100)
+    sync.sync_products(db, per_page=100)
+
+    db.statements.clear()
+    assert sync.sync_orders(db, page=1, per_page=100) == 100
+    # Three lookups, the order insert, the item executemany, the rollup's category lookup and upsert
+    assert len([s for s in db.statements if not s.startswith(("BEGIN", "COMMIT"))]) <= 7
+
+    rollup = db.query(ProductDailySales).filter(ProductDailySales.product_id == db.query(Product.id).filter(
+        Product.woocommerce_id == 1001).scalar_subquery()).one()
+    assert rollup.order_lines == 100  # the first line of every order on the page
+
+
+def test_resync_updates_without_duplicates(store, db):
+    """Test running the sync again updates changed records and stores no order twice"""
+    sync = WooCommerceSync(url=store.url, consumer_key="ck", consumer_secret="cs")
+    sync.sync_customers(db)
+    sync.sync_products(db)
+    sync.sync_orders(db)
+
+    store.customers[0]["first_name"] = "Renamed"
+    store.products[0].update(price="25.0", categories=[])
+    sync.sync_customers(db)
+    sync.sync_products(db)
+    sync.sync_orders(db)
+
+    assert db.query(Customer).count() == 250
+    assert db.query(Customer).filter(Customer.woocommerce_id == 1).one().first_name == "Renamed"
+    product = db.query(Product).filter(Product.woocommerce_id == 1001).one()
+    assert product.price == 25.0 and product.category == "dresses"  # no categories keeps the old one
+    assert db.query(Order).count() == 220
+    assert WooCommerceSync.save_order(db, store.orders[0]) is None